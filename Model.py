@@ -1,12 +1,36 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Date, Boolean, ForeignKey, Text, Numeric, Time, SmallInteger
-from sqlalchemy.orm import declarative_base, relationship, backref
-from sqlalchemy import Enum
-from datetime import datetime
-import random
+from sqlalchemy import Column, String, Integer, DateTime, Date, Boolean, ForeignKey, Text, Numeric, Time, SmallInteger
+from sqlalchemy.orm import declarative_base, relationship, backref, object_session, Session
+from sqlalchemy import Enum, Index, text, event, inspect, case, insert, update, select, bindparam
+from collections import Counter
+from datetime import datetime, timedelta
+import logging
+import os
+import secrets
+import threading
 import uuid
+import weakref
+
+from conexao import criar_engine, criar_engine_leitura
+from diagnostico import ativar_se_debug
+from instrumentacao import ativar_se_configurado
+from seguranca import conferir_senha, gerar_hash_senha
 
 DB_FILE = "tcc.db"
-engine = create_engine(f"sqlite:///{DB_FILE}")
+# A URL do banco pode ser trocada por variável de ambiente (ex: outro arquivo ou Postgres)
+DATABASE_URL = os.environ.get("TCC_DATABASE_URL", f"sqlite:///{DB_FILE}")
+# Engine de leitura para relatórios (por padrão, o mesmo banco em modo somente leitura)
+DATABASE_REPLICA_URL = os.environ.get("TCC_DATABASE_REPLICA_URL", DATABASE_URL)
+# Usuário da equipe de plantão que recebe na caixa de entrada os alertas de emergência
+USUARIO_PLANTAO_ID = int(os.environ["TCC_USUARIO_PLANTAO"]) if os.environ.get("TCC_USUARIO_PLANTAO") else None
+
+logger = logging.getLogger("tcc.model")
+
+engine = criar_engine(DATABASE_URL)
+engine_leitura = criar_engine_leitura(DATABASE_REPLICA_URL)
+# Histogramas de latência e log de consultas lentas, só com TCC_INSTRUMENTAR_SQL definida (ver instrumentacao.py)
+instrumentacao_sql = ativar_se_configurado(engine)
+# Detector de N+1, só com TCC_DEBUG_SQL definida (ver diagnostico.py)
+detector_n_mais_1 = ativar_se_debug(engine)
 Base = declarative_base()
 
 
@@ -18,7 +42,7 @@ class Usuario(Base):
     nome = Column(String(255), nullable=False)
     #email do usuario
     email = Column(String(255), unique=True, nullable=False)
-    # senha
+    # hash da senha (algoritmo, custo e sal vão junto, ver seguranca.py)
     senha = Column(String(255), nullable=False)
     #data do cadastro
     data_cadastro = Column(DateTime, default=datetime.utcnow)
@@ -51,7 +75,7 @@ class Usuario(Base):
     def __init__(self, email, senha, termos_aceitos=False, nome=None, data_de_nascimento=None, RG=None, CPF=None, genero=None, telefone=None, url_foto_perfil=None):
         self.nome = nome
         self.email = email
-        self.senha = senha
+        self.senha = gerar_hash_senha(senha)
         self.termos_aceitos = termos_aceitos
         self.data_de_nascimento = data_de_nascimento
         self.RG = RG
@@ -67,11 +91,20 @@ class Usuario(Base):
 
     # Métodos (Lógica da Aplicação)
     def fazer_login(self, senha_informada):
-    return self.senha == senha_informada # Simulação simples
+        # Se o hash estiver com custo antigo (ou a senha ainda em texto puro), já regrava com o custo atual.
+        # Para muitos logins simultâneos, use seguranca.VerificadorSenhas, que não bloqueia quem chama.
+        confere, hash_novo = conferir_senha(senha_informada, self.senha)
+        if hash_novo:
+            self.senha = hash_novo
+        return confere
 
 
 class Endereco(Base):
     __tablename__ = 'ENDERECO'
+    # Busca de profissionais por localização (busca_profissionais.py)
+    __table_args__ = (
+        Index('ix_endereco_estado_cidade', 'estado', 'cidade', 'id_endereco'),
+    )
 
     # Atributos (Colunas da Tabela)
     id_endereco = Column(Integer, primary_key=True)
@@ -119,17 +152,36 @@ class Paciente(Base):
     # Relacionamento de volta para Usuario (para acessar email, senha, etc.)
     usuario = relationship('Usuario', backref=backref('paciente', uselist=False))
 
+    # Endereço do paciente (N:1)
+    endereco = relationship('Endereco')
+
     def __init__(self, id_paciente):
         self.id_paciente = id_paciente
 
     def agendar_consulta(self, profissional_id, data, hora):
-        # Lógica para criar um novo objeto Agendamento
-        pass
+        """
+        Cria um novo objeto Agendamento para este paciente.
+        A gravação (com proteção contra reserva dupla) fica em reservas.reservar_consulta.
+        """
+        return Agendamento(
+            profissional_id=profissional_id,
+            paciente_id=self.id_paciente,
+            data_consulta=data,
+            hora_consulta=hora
+        )
 
 
 class Profissional(Base):
     __tablename__ = 'PROFISSIONAL'
-    __table_args__ = {'extend_existing': True}
+    # Índices da listagem de profissionais (busca_profissionais.py): filtro por
+    # especialidade (e verificação) com ordenação/faixa de preço, e junção com ENDERECO
+    __table_args__ = (
+        Index('ix_profissional_especialidade_verificado_preco',
+              'tipo_de_especialidade', 'crp_cnr_cref_verificado', 'valor_consulta', 'id_profissional'),
+        Index('ix_profissional_especialidade_preco', 'tipo_de_especialidade', 'valor_consulta', 'id_profissional'),
+        Index('ix_profissional_endereco', 'endereco_id'),
+        {'extend_existing': True},
+    )
 
     # 1. Chaves
     # PK e FK para a tabela USUARIO (Herança)
@@ -160,6 +212,7 @@ class Profissional(Base):
 
     # Relacionamento de volta para Usuario (para acessar email, senha, etc.)
     usuario = relationship('Usuario', backref=backref('profissional', uselist=False))
+    endereco = relationship('Endereco')
     valor_consulta = Column(Numeric(10, 2), default=0.00)
 
     # Relacionamento 1:1 com DadosBancarios (Composição)
@@ -194,10 +247,21 @@ class Profissional(Base):
 
     def definir_disponibilidade(self, dia, hora_inicio, hora_fim):
         """
-        Cria um novo objeto AgendaProfissional para definir horários.
+        Cria um novo objeto AgendaProfissional para definir horários e o
+        adiciona à agenda do profissional (gravado no próximo commit da sessão).
+        `dia` pode ser o nome ("Segunda") ou o número de date.weekday() (0 a 6).
+        A expansão em datas concretas fica em calendario.py.
         """
-        # Lógica para interagir com a classe AgendaProfissional
+        if isinstance(dia, int):
+            dia = AgendaProfissional.OPCOES_DIA_SEMANA[dia]
+        if dia not in AgendaProfissional.OPCOES_DIA_SEMANA:
+            raise ValueError(f"Dia da semana inválido: {dia!r}")
+        if hora_inicio >= hora_fim:
+            raise ValueError(f"Horário inválido: {hora_inicio} deve ser antes de {hora_fim}")
+        slot = AgendaProfissional(self.id_profissional, dia, hora_inicio, hora_fim)
+        self.agenda.append(slot)
         print(f"Disponibilidade em {dia} das {hora_inicio} às {hora_fim} adicionada.")
+        return slot
 
 # Exemplo de como criar um novo profissional:
 # (Supondo que o id_usuario 5 já foi criado na tabela USUARIO)
@@ -237,9 +301,14 @@ class DadosBancarios(Base):
         Simula a validação dos dados bancários em um serviço de repasse financeiro.
         (Ex: Garantir que o CPF/CNPJ seja do titular da conta).
         """
-        if len(self.cpf_cnpj_titular) < 11: # Checagem básica de CPF
+        return DadosBancarios.dados_validos(self.cpf_cnpj_titular, self.agencia, self.conta)
+
+    @staticmethod
+    def dados_validos(cpf_cnpj_titular, agencia, conta):
+        """ A mesma validação, sem precisar carregar o objeto (usada em repasses.py). """
+        if not cpf_cnpj_titular or len(cpf_cnpj_titular) < 11: # Checagem básica de CPF
             return False
-        return True
+        return bool(agencia) and bool(conta)
 
     def processar_repasse(self, valor):
         """ Simula a transferência de fundos para a conta do profissional. """
@@ -248,10 +317,49 @@ class DadosBancarios(Base):
             return True
         print("Erro: Dados bancários inválidos. Repasse falhou.")
         return False
+
+
+class Repasse(Base):
+    """
+    Repasse mensal a um profissional: a soma dos pagamentos aprovados de uma
+    competência (ver repasses.py). Cada pagamento repassado aponta para o
+    seu repasse em Pagamento.repasse_id.
+    """
+    __tablename__ = 'REPASSE'
+    # Um repasse por profissional e competência: rodar o fechamento de novo não duplica
+    __table_args__ = (
+        Index('uq_repasse_profissional_competencia', 'profissional_id', 'competencia', unique=True),
+        Index('ix_repasse_competencia_status', 'competencia', 'status'),
+    )
+
+    id_repasse = Column(Integer, primary_key=True)
+    profissional_id = Column(Integer, ForeignKey('PROFISSIONAL.id_profissional'), nullable=False)
+    # Mês de referência no formato AAAA-MM
+    competencia = Column(String(7), nullable=False)
+
+    quantidade_pagamentos = Column(Integer, nullable=False, default=0)
+    valor_total = Column(Numeric(12, 2), nullable=False, default=0)
+
+    # Gerado: calculado; Exportado: já foi para o arquivo do banco
+    OPCOES_STATUS_REPASSE = ["Gerado", "Exportado"]
+    status = Column(Enum(*OPCOES_STATUS_REPASSE, name='status_repasse_options'), nullable=False, default="Gerado")
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    exportado_em = Column(DateTime)
       
 
 class Pagamento(Base):
     __tablename__ = 'PAGAMENTO'
+    # Fechamento dos repasses (repasses.py): pagamentos aprovados ainda sem
+    # repasse, por data, e os pagamentos de um repasse
+    __table_args__ = (
+        Index('ix_pagamento_repasse', 'repasse_id', 'status', 'data_pagamento', 'agendamento_id'),
+        # Extração incremental dos relatórios (relatorios.py)
+        Index('ix_pagamento_atualizado_em', 'atualizado_em'),
+        # Aprovações que chegaram depois da expiração da reserva, à espera do reembolso
+        Index('ix_pagamento_reembolso_pendente', 'reembolso_pendente_desde',
+              sqlite_where=text("reembolso_pendente_desde IS NOT NULL"),
+              postgresql_where=text("reembolso_pendente_desde IS NOT NULL")),
+    )
 
     # 1. Chaves
     # PK (ID de transação geralmente é uma string longa do gateway, mas INTEGER/VARCHAR serve)
@@ -272,10 +380,29 @@ class Pagamento(Base):
     OPCOES_STATUS_PAGAMENTO = ["Pendente", "Aprovado", "Falhou", "Reembolsado"]
     OPCOES_METODO_PAGAMENTO = ["Cartao_Credito", "PIX", "Boleto"]
 
+    # Transições permitidas de status (Falhou e Reembolsado são finais)
+    TRANSICOES_STATUS = {
+        "Pendente": ("Aprovado", "Falhou"),
+        "Aprovado": ("Reembolsado",),
+        "Falhou": (),
+        "Reembolsado": (),
+    }
+
     # Status e Método (Usando Enum para garantir integridade)
     status = Column(Enum(*OPCOES_STATUS_PAGAMENTO, name='status_pag_options'), default="Pendente", nullable=False)
     metodo = Column(Enum(*OPCOES_METODO_PAGAMENTO, name='metodo_pag_options'), nullable=False)
 
+    # FK para o repasse ao profissional (vazio enquanto o pagamento não foi repassado)
+    repasse_id = Column(Integer, ForeignKey('REPASSE.id_repasse'), nullable=True)
+
+    # Última alteração (também em UPDATEs do Core, via onupdate): marca d'água dos relatórios
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Valor cobrado que tem que ser devolvido: aprovação recebida depois de a reserva expirar
+    # (pagamento já "Falhou") ou pagamento aprovado de consulta cancelada, sinalizado pelo
+    # fechamento dos repasses. Volta a vazio quando o gateway confirma o reembolso.
+    reembolso_pendente_desde = Column(DateTime, nullable=True)
+
     # -------------------------------------------------------------------------
     # Método Construtor (__init__)
     # -------------------------------------------------------------------------
@@ -287,7 +414,48 @@ class Pagamento(Base):
         self.valor = valor
         self.metodo = metodo
         self.status = "Pendente"
-        
+
+    # -------------------------------------------------------------------------
+    # Métodos de Lógica (Comportamento)
+    # -------------------------------------------------------------------------
+
+    def mudar_status(self, novo_status, quando=None):
+        """
+        Aplica uma transição de status validada por TRANSICOES_STATUS.
+        Retorna False (sem alterar nada) se a transição não for permitida.
+        """
+        if novo_status not in self.TRANSICOES_STATUS.get(self.status, ()):
+            return False
+        self.status = novo_status
+        if novo_status == "Aprovado":
+            self.data_pagamento = quando or datetime.utcnow()
+        return True
+
+
+class EventoPagamento(Base):
+    """
+    Eventos de webhook do gateway de pagamento já recebidos (webhooks_pagamento.py).
+    O índice único em (id_transacao, status) descarta eventos repetidos.
+    """
+    __tablename__ = 'EVENTO_PAGAMENTO'
+    __table_args__ = (
+        Index('uq_evento_pagamento_transicao', 'id_transacao', 'status', unique=True),
+        # Eventos adiados (chegaram antes da transição anterior) de uma transação
+        Index('ix_evento_pagamento_resultado', 'resultado', 'id_transacao'),
+    )
+
+    id_evento = Column(Integer, primary_key=True)
+    # Sem FK: o gateway pode avisar de transações que ainda não existem aqui
+    id_transacao = Column(String(50), nullable=False)
+    status = Column(Enum(*Pagamento.OPCOES_STATUS_PAGAMENTO, name='status_pag_options'), nullable=False)
+    ocorrido_em = Column(DateTime)
+    recebido_em = Column(DateTime, default=datetime.utcnow)
+
+    # Aplicado: transição feita; Adiado: espera a transição anterior (ou o
+    # PAGAMENTO) chegar; Invalido: não há caminho até o status
+    OPCOES_RESULTADO = ["Aplicado", "Adiado", "Invalido"]
+    resultado = Column(Enum(*OPCOES_RESULTADO, name='resultado_evento_options'), nullable=False)
+
 
 class ContatoEmergencia(Base):
     __tablename__ = 'CONTATO_EMERGENCIA'
@@ -304,7 +472,7 @@ class ContatoEmergencia(Base):
     relacionamento = Column(String(50)) # Ex: Mãe, Cônjuge, Amigo
 
     # 3. Relacionamento (Para acessar os dados do paciente)
-    # paciente = relationship('Paciente', backref='contatos_emergencia')
+    paciente = relationship('Paciente', backref=backref('contatos_emergencia', cascade="all, delete-orphan"))
 
 
     # -------------------------------------------------------------------------
@@ -322,21 +490,70 @@ class ContatoEmergencia(Base):
     # Métodos de Lógica (Comportamento)
     # -------------------------------------------------------------------------
 
-    def notificar_emergencia(self, mensagem=""):
+    def notificar_emergencia(self, mensagem="", usuario_plantao_id=None):
         """
-        Simula o envio de uma notificação ou SMS para o contato de emergência.
+        Coloca um SMS para o contato de emergência na fila de saída, com
+        prioridade máxima (o despachante de notificacoes.py envia antes de
+        qualquer outra notificação). Devolve a Notificacao criada.
+
+        O SMS vai para o telefone do contato; a notificação fica na caixa de
+        entrada do usuário de plantão (usuario_plantao_id ou
+        TCC_USUARIO_PLANTAO). Sem plantão configurado, o SMS sai do mesmo jeito
+        e a notificação fica na caixa de entrada do próprio paciente, com um
+        aviso no log.
         """
+        usuario_plantao_id = usuario_plantao_id or USUARIO_PLANTAO_ID
+        if usuario_plantao_id is None:
+            logger.warning("Alerta de emergência do paciente %s sem usuário de plantão (defina TCC_USUARIO_PLANTAO); "
+                           "notificação gravada na caixa de entrada do paciente.", self.paciente_id)
+            usuario_plantao_id = self.paciente_id
         if not mensagem:
             mensagem = "URGENTE: Foi acionada uma emergência relacionada ao paciente."
 
-        print("-----------------------------------------")
-        print(f"ALERTA DE EMERGÊNCIA ENVIADO:")
-        print(f"Destinatário: {self.nome} ({self.relacionamento})")
-        print(f"Telefone: {self.telefone}")
-        
+        notificacao = Notificacao(
+            usuario_id=usuario_plantao_id,
+            tipo_notificacao="Alerta Emergencia",
+            mensagem=f"{mensagem} (Paciente {self.paciente_id}; contato: {self.nome} - {self.relacionamento})",
+            canal="SMS",
+            prioridade=Notificacao.PRIORIDADE_EMERGENCIA,
+            destino=self.telefone,
+        )
+        session = object_session(self)
+        if session is not None:
+            session.add(notificacao)
+        return notificacao
+
+
+# Letras dos códigos de sala (sem "l", que se confunde com "i" e "1" no link)
+ALFABETO_SALA = 'abcdefghijkmnopqrstuvwxyz'
+TAMANHO_CODIGO_SALA = 10
+
+
+def gerar_codigo_sala():
+    """ Código aleatório de sala de reunião (gerador criptográfico do módulo secrets). """
+    return ''.join(secrets.choice(ALFABETO_SALA) for _ in range(TAMANHO_CODIGO_SALA))
+
 
 class Agendamento(Base):
     __tablename__ = 'AGENDAMENTO'
+    # Um mesmo horário do profissional só pode ter um agendamento ativo.
+    # Agendamentos cancelados ficam fora do índice, liberando o horário.
+    __table_args__ = (
+        Index('uq_agendamento_horario', 'profissional_id', 'data_consulta', 'hora_consulta',
+              unique=True,
+              sqlite_where=text("status != 'Cancelado'"),
+              postgresql_where=text("status != 'Cancelado'")),
+        # Varredura por faixa de data/hora (lembretes.py)
+        Index('ix_agendamento_data_hora_status', 'data_consulta', 'hora_consulta', 'status'),
+        # Extração incremental dos relatórios (relatorios.py)
+        Index('ix_agendamento_atualizado_em', 'atualizado_em'),
+        # Reservas pendentes vencidas (expiracao_reservas.py): faixa status = 'Pendente' AND prazo < agora
+        Index('ix_agendamento_prazo_reserva', 'status', 'prazo_reserva'),
+        # Agendamentos ainda sem link (pool de links vazio na reserva, links_reuniao.py)
+        Index('ix_agendamento_sem_link', 'id_agendamento',
+              sqlite_where=text("link_meet IS NULL"),
+              postgresql_where=text("link_meet IS NULL")),
+    )
 
     # 1. Chaves
     id_agendamento = Column(Integer, primary_key=True)
@@ -355,6 +572,24 @@ class Agendamento(Base):
     # Definição das Opções para o Status do Agendamento
     # ----------------------------------------------------
     OPCOES_STATUS_AGENDAMENTO = ["Pendente", "Confirmado", "Concluido", "Cancelado"]
+
+    # Transições permitidas de status (Concluido e Cancelado são finais).
+    # Vale para os métodos abaixo e para as transições em lote (ciclo_agendamento.py).
+    TRANSICOES_STATUS = {
+        "Pendente": ("Confirmado", "Cancelado"),
+        "Confirmado": ("Concluido", "Cancelado"),
+        "Concluido": (),
+        "Cancelado": (),
+    }
+    # Colunas acertadas junto com o status ao entrar em cada um
+    VALORES_AO_ENTRAR = {
+        "Confirmado": {"pagamento_confirmado": True, "prazo_reserva": None},
+        "Cancelado": {"pagamento_confirmado": False, "prazo_reserva": None},
+    }
+    # Quanto tempo um agendamento novo segura o horário esperando o pagamento
+    PRAZO_RESERVA = timedelta(minutes=15)
+    # Função sem argumentos que devolve o link de um agendamento novo (links_reuniao.PoolLinks.instalar)
+    fornecedor_links = None
     # ----------------------------------------------------
     # Status e Link
     status = Column(Enum(*OPCOES_STATUS_AGENDAMENTO, name='status_agendamento_options'), default="Pendente", nullable=False)
@@ -363,13 +598,24 @@ class Agendamento(Base):
     # Atributo que confirma o recebimento do pagamento (libera a consulta)
     pagamento_confirmado = Column(Boolean, default=False)
 
+    # Até quando o horário fica reservado sem pagamento (só enquanto Pendente);
+    # depois disso o agendamento é cancelado por expiracao_reservas.py
+    prazo_reserva = Column(DateTime, nullable=True)
+
+    # Última alteração (também em UPDATEs do Core, via onupdate): marca d'água dos relatórios
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
     # 3. Relacionamentos
 
     # Relacionamento 1:1 com Pagamento (O pagamento que valida este agendamento)
     # O 'cascade' garante que se o agendamento for deletado, o pagamento associado também seja.
     pagamento = relationship('Pagamento', backref='agendamento', uselist=False, cascade="all, delete-orphan")
 
-    # Relacionamentos de volta (backref) para Paciente e Profissional (assumindo que foram definidos nessas classes)
+    # Paciente e profissional da consulta, carregados sob demanda: listagens escolhem o
+    # carregamento nas opções da consulta (ver consultas_agendamento.py). Os backrefs não
+    # mexem nos agendamentos ao remover o paciente/profissional (passive_deletes).
+    paciente = relationship('Paciente', backref=backref('agendamentos', passive_deletes=True))
+    profissional = relationship('Profissional', backref=backref('agendamentos', passive_deletes=True))
 
     # -------------------------------------------------------------------------
     # Método Construtor (__init__)
@@ -380,6 +626,7 @@ class Agendamento(Base):
         self.paciente_id = paciente_id
         self.data_consulta = data_consulta
         self.hora_consulta = hora_consulta
+        self.prazo_reserva = datetime.utcnow() + self.PRAZO_RESERVA
         self.link_meet = self._gerar_link_meet() # Gera o link ao criar o agendamento
 
 
@@ -389,35 +636,55 @@ class Agendamento(Base):
 
     def _gerar_link_meet(self):
         """
-        Simula a geração de um link de reunião.
-        Em um ambiente real, seria uma chamada a API do Google Calendar/Meet.
+        Link da sala de reunião. Com um PoolLinks instalado
+        (links_reuniao.py), vem do pool de salas já criadas no provedor de
+        vídeo, sem esperar a API (None se o pool estiver vazio; o link é
+        completado pelo pool depois). Sem o pool, um código aleatório do
+        módulo secrets, sem conferência de colisão.
         """
-        reuniao_id = ''.join(random.choices('abcdefghijkmnopqrstuvwxyz', k=10))
-        return f"https://meet.google.com/{reuniao_id}"
+        if Agendamento.fornecedor_links is not None:
+            return Agendamento.fornecedor_links()
+        return f"https://meet.google.com/{gerar_codigo_sala()}"
 
-    def liberar_consulta(self):
+    def mudar_status(self, novo_status, por=None, motivo=None):
+        """
+        Aplica uma transição de status validada por TRANSICOES_STATUS.
+        Retorna False (sem alterar nada) se a transição não for permitida.
+        `por` (id do usuário) e `motivo` vão para o histórico no flush.
+        """
+        if novo_status not in self.TRANSICOES_STATUS.get(self.status, ()):
+            return False
+        self.status = novo_status
+        for coluna, valor in self.VALORES_AO_ENTRAR.get(novo_status, {}).items():
+            setattr(self, coluna, valor)
+        self._alteracao_status = (por, motivo)
+        return True
+
+    def liberar_consulta(self, por=None):
         """
         Método chamado após a aprovação do Pagamento.
-        Confirma o agendamento e muda o status.
+        Confirma o agendamento e muda o status; False se a transição não é permitida.
         """
-        self.pagamento_confirmado = True
-        self.status = "Confirmado"
-        print(f"Agendamento {self.id_agendamento} LIBERADO e status alterado para {self.status}.")
+        return self.mudar_status("Confirmado", por, "pagamento aprovado")
 
-    def registrar_conclusao(self):
+    def registrar_conclusao(self, por=None):
         """
         Marca a consulta como concluída. Permite que o paciente faça a avaliação.
         """
-        if self.status == "Confirmado":
-            self.status = "Concluido"
-            print(f"Agendamento {self.id_agendamento} marcado como CONCLUÍDO.")
-            return True
-        return False
+        return self.mudar_status("Concluido", por)
+
+    def cancelar(self, por=None, motivo=None):
+        """ Cancela a consulta (libera o horário); só antes de ela ser concluída. False se não for possível. """
+        return self.mudar_status("Cancelado", por, motivo)
 
 # ----------------------------------------------------
 
 class AgendaProfissional(Base):
     __tablename__ = 'AGENDA_PROFISSIONAL'
+    __table_args__ = (
+        # Agendas de uma faixa de profissionais (busca de disponibilidade) e de um dia (reservas)
+        Index('ix_agenda_profissional_dia', 'profissional_id', 'dia_semana'),
+    )
 
     # 1. Chaves
     id_disponibilidade = Column(Integer, primary_key=True)
@@ -448,7 +715,7 @@ class AgendaProfissional(Base):
     disponivel = Column(Boolean, default=True)
 
     # 3. Relacionamento (para acessar o profissional)
-    # profissional = relationship('Profissional', backref='agenda')
+    profissional = relationship('Profissional', backref=backref('agenda', cascade="all, delete-orphan"))
 
 
     # -------------------------------------------------------------------------
@@ -493,6 +760,12 @@ class AgendaProfissional(Base):
 
 class Avaliacao(Base):
     __tablename__ = 'AVALIACAO' 
+    # Fila de moderação (moderacao.py): pendentes em ordem de chegada
+    __table_args__ = (
+        Index('ix_avaliacao_moderacao', 'status', 'data_avaliacao', 'id_avaliacao'),
+        # Extração incremental dos relatórios (relatorios.py)
+        Index('ix_avaliacao_atualizado_em', 'atualizado_em'),
+    )
     # 1. Chaves
     id_avaliacao = Column(Integer, primary_key=True)
 
@@ -517,6 +790,11 @@ class Avaliacao(Base):
 
     # Status para moderação (garante que comentários ofensivos sejam revisados)
     status = Column(Enum(*OPCOES_STATUS_AVALIACAO, name='status_avaliacao_options'), default="Pendente", nullable=False)
+    # Por que a triagem automática denunciou (termos/padrões encontrados), para o moderador
+    motivo_moderacao = Column(String(255), nullable=True)
+
+    # Última alteração (também em UPDATEs do Core, via onupdate): marca d'água dos relatórios
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # -------------------------------------------------------------------------
     # Método Construtor (__init__)
@@ -548,18 +826,223 @@ class Avaliacao(Base):
         Calcula a média das notas de avaliação para um profissional específico.
         Em um aplicativo real, essa seria uma consulta ao banco de dados.
         """
-        # Simulação: Buscar todas as avaliações do profissional e calcular a média
-        # from sqlalchemy import func
-        # media = session.query(func.avg(Avaliacao.nota)).filter_by(profissional_id=profissional_id).scalar()
-        # return media if media is not None else 0
+        # A média vem da tabela AVALIACAO_AGREGADA (mantida a cada aprovação/denúncia),
+        # então é uma leitura por chave primária em vez de um AVG sobre AVALIACAO.
+        session = object_session(self)
+        if session is None:
+            return 0
+        agregado = session.get(AvaliacaoAgregada, profissional_id)
+        return agregado.media_float() if agregado is not None else 0
+
+
+class AvaliacaoAgregada(Base):
+    """
+    Agregado das avaliações APROVADAS de cada profissional.
+    Atualizado incrementalmente pelos eventos de Avaliacao (abaixo) e
+    reconstruído do zero por avaliacoes.recalcular_agregados().
+    """
+    __tablename__ = 'AVALIACAO_AGREGADA'
+    # Ordenação da listagem de profissionais por avaliação
+    __table_args__ = (
+        Index('ix_avaliacao_agregada_media', 'media', 'profissional_id'),
+    )
+
+    profissional_id = Column(Integer, ForeignKey('PROFISSIONAL.id_profissional'), primary_key=True)
+
+    # Quantidade e soma das notas aprovadas
+    quantidade = Column(Integer, nullable=False, default=0)
+    soma = Column(Integer, nullable=False, default=0)
+    media = Column(Numeric(3, 2))
+
+    # Histograma das notas (1 a 5)
+    nota_1 = Column(Integer, nullable=False, default=0)
+    nota_2 = Column(Integer, nullable=False, default=0)
+    nota_3 = Column(Integer, nullable=False, default=0)
+    nota_4 = Column(Integer, nullable=False, default=0)
+    nota_5 = Column(Integer, nullable=False, default=0)
+
+    def media_float(self):
+        """ Média como float (0 se ainda não há avaliações aprovadas). """
+        return float(self.media) if self.media is not None else 0
+
+    def histograma(self):
+        """ Retorna {nota: quantidade} para as notas de 1 a 5. """
+        return {nota: getattr(self, f"nota_{nota}") for nota in range(1, 6)}
+
+
+def ajustar_agregado_avaliacao(connection, profissional_id, nota, delta):
+    """
+    Soma `delta` (+1 ou -1) avaliações aprovadas com a `nota` no agregado do
+    profissional, com um UPDATE (ou INSERT, se ainda não houver linha).
+    """
+    tabela = AvaliacaoAgregada.__table__
+    valores = {
+        'quantidade': tabela.c.quantidade + delta,
+        'soma': tabela.c.soma + delta * nota,
+        # Os valores à direita são os antigos: a média usa os novos totais explicitamente
+        'media': case(
+            (tabela.c.quantidade + delta > 0,
+             (tabela.c.soma + delta * nota) * 1.0 / (tabela.c.quantidade + delta)),
+            else_=None),
+    }
+    if 1 <= nota <= 5:
+        valores[f'nota_{nota}'] = tabela.c[f'nota_{nota}'] + delta
+
+    resultado = connection.execute(
+        update(tabela).where(tabela.c.profissional_id == profissional_id).values(valores))
+    if resultado.rowcount == 0 and delta > 0:
+        linha = dict(profissional_id=profissional_id, quantidade=delta, soma=delta * nota, media=nota)
+        if 1 <= nota <= 5:
+            linha[f'nota_{nota}'] = delta
+        connection.execute(insert(tabela).values(linha))
+
+
+def _valor_anterior(estado, atributo):
+    """ Valor do atributo antes das alterações pendentes do flush. """
+    historico = estado.attrs[atributo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    if historico.added:
+        # Não havia valor anterior (atributo definido pela primeira vez)
+        return None
+    return getattr(estado.object, atributo)
+
+
+@event.listens_for(Avaliacao, 'after_insert')
+def _agregado_apos_inserir(mapper, connection, avaliacao):
+    if avaliacao.status == "Aprovada":
+        ajustar_agregado_avaliacao(connection, avaliacao.profissional_id, avaliacao.nota, 1)
+
+
+@event.listens_for(Avaliacao, 'after_update')
+def _agregado_apos_atualizar(mapper, connection, avaliacao):
+    estado = inspect(avaliacao)
+    if not any(estado.attrs[a].history.has_changes() for a in ('status', 'nota', 'profissional_id')):
+        return
+    # Retira a contribuição antiga (se estava aprovada) e soma a nova (se está aprovada)
+    if _valor_anterior(estado, 'status') == "Aprovada":
+        ajustar_agregado_avaliacao(connection, _valor_anterior(estado, 'profissional_id'),
+                                   _valor_anterior(estado, 'nota'), -1)
+    if avaliacao.status == "Aprovada":
+        ajustar_agregado_avaliacao(connection, avaliacao.profissional_id, avaliacao.nota, 1)
+
+
+@event.listens_for(Avaliacao, 'before_delete')
+def _agregado_antes_remover(mapper, connection, avaliacao):
+    if _valor_anterior(inspect(avaliacao), 'status') == "Aprovada":
+        ajustar_agregado_avaliacao(connection, _valor_anterior(inspect(avaliacao), 'profissional_id'),
+                                   _valor_anterior(inspect(avaliacao), 'nota'), -1)
+
+
+def _manter_valor(avaliacao, valor, antigo, iniciador):
+    return valor
+
+
+# active_history=True faz o SQLAlchemy carregar o valor antigo antes de uma
+# alteração (mesmo com o objeto expirado após um commit), para que os eventos
+# acima saibam qual contribuição retirar do agregado.
+for _atributo in (Avaliacao.status, Avaliacao.nota, Avaliacao.profissional_id):
+    event.listen(_atributo, 'set', _manter_valor, active_history=True)
+
+
+class HistoricoStatusAgendamento(Base):
+    """
+    Histórico (só inserção) das mudanças de status dos agendamentos: quem
+    mudou, de que status para qual e quando. Os status são gravados como o
+    índice em OPCOES_STATUS_AGENDAMENTO (SmallInteger), para a tabela ficar
+    pequena; ciclo_agendamento.py traduz de volta nas consultas.
+    """
+    __tablename__ = 'HISTORICO_STATUS_AGENDAMENTO'
+    __table_args__ = (
+        # "O que aconteceu com este agendamento" e "o que este usuário alterou e quando"
+        Index('ix_historico_status_agendamento', 'agendamento_id', 'id_historico'),
+        Index('ix_historico_status_autor', 'alterado_por', 'alterado_em'),
+    )
+
+    id_historico = Column(Integer, primary_key=True)
+    agendamento_id = Column(Integer, ForeignKey('AGENDAMENTO.id_agendamento'), nullable=False)
+    # Vazio na criação do agendamento
+    status_anterior = Column(SmallInteger, nullable=True)
+    status_novo = Column(SmallInteger, nullable=False)
+    alterado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Usuário que fez a mudança (vazio para processos automáticos: webhooks, fim do dia)
+    alterado_por = Column(Integer, ForeignKey('USUARIO.id_usuario'), nullable=True)
+    motivo = Column(String(40), nullable=True)
+
+    CODIGO_STATUS = {status: codigo for codigo, status in enumerate(Agendamento.OPCOES_STATUS_AGENDAMENTO)}
+
+
+def linha_historico_status(agendamento_id, anterior, novo, quando, por=None, motivo=None):
+    """ Linha (dict) para um INSERT em lote no HISTORICO_STATUS_AGENDAMENTO. """
+    codigos = HistoricoStatusAgendamento.CODIGO_STATUS
+    return dict(agendamento_id=agendamento_id, status_anterior=codigos.get(anterior), status_novo=codigos[novo],
+                alterado_em=quando, alterado_por=por, motivo=motivo)
+
+
+@event.listens_for(Session, 'after_flush')
+def _historico_status_apos_flush(session, contexto):
+    """
+    Mudanças de status feitas pelo ORM (inclusive a criação): um INSERT em
+    lote por conexão ao fim de cada flush, em vez de um por agendamento.
+    """
+    agora = datetime.utcnow()
+    por_conexao = {}
+    for agendamento in (*session.new, *session.dirty):
+        if not isinstance(agendamento, Agendamento):
+            continue
+        estado = inspect(agendamento)
+        if agendamento in session.new:
+            anterior = None
+        elif estado.attrs.status.history.has_changes():
+            anterior = _valor_anterior(estado, 'status')
+        else:
+            continue
+        por, motivo = agendamento.__dict__.pop('_alteracao_status', (None, None))
+        conexao = session.connection(bind_arguments={"mapper": estado.mapper, "instance": agendamento})
+        por_conexao.setdefault(conexao, []).append(
+            linha_historico_status(agendamento.id_agendamento, anterior, agendamento.status, agora, por, motivo))
+    for conexao, linhas in por_conexao.items():
+        conexao.execute(insert(HistoricoStatusAgendamento.__table__), linhas)
+
+
+# Valor antigo do status disponível no flush mesmo com o objeto expirado (ver acima)
+event.listen(Agendamento.status, 'set', _manter_valor, active_history=True)
+
+
+class SalaReuniao(Base):
+    """
+    Salas de reunião criadas no provedor de vídeo pelo pool de links
+    (links_reuniao.py). O índice único em codigo garante que um código
+    nunca é entregue duas vezes, nem por processos diferentes.
+    """
+    __tablename__ = 'SALA_REUNIAO'
+    __table_args__ = (
+        Index('uq_sala_reuniao_codigo', 'codigo', unique=True),
+    )
+
+    id_sala = Column(Integer, primary_key=True)
+    codigo = Column(String(20), nullable=False)
+    # Provedor que criou a sala (ProvedorVideo.nome)
+    provedor = Column(String(20), nullable=False)
+    url = Column(String(500), nullable=False)
+    criada_em = Column(DateTime, default=datetime.utcnow)
+
 
-        print(f"Simulando cálculo da média de avaliações para o Profissional ID {profissional_id}.")
-        return 4.5 # Exemplo de retorno simulado
-      
-      
 class Notificacao(Base):
     __tablename__ = 'NOTIFICACAO'
 
+    # Fila de saída: o despachante busca as pendentes por prioridade e
+    # horário da próxima tentativa (ver notificacoes.py)
+    __table_args__ = (
+        Index('ix_notificacao_fila', 'status_entrega', 'prioridade', 'proxima_tentativa', 'id_notificacao'),
+        # Caixa de entrada (caixa_entrada.py): listagem por usuário, da mais recente para a mais antiga
+        Index('ix_notificacao_caixa', 'usuario_id', 'data_envio', 'id_notificacao'),
+        # Só as não lidas: listagem "não lidas" e "marcar todas como lidas" sem percorrer as lidas
+        Index('ix_notificacao_nao_lidas', 'usuario_id', 'data_envio', 'id_notificacao',
+              sqlite_where=text("lida = 0"),
+              postgresql_where=text("lida = false")),
+    )
+
     # 1. Chaves
     id_notificacao = Column(Integer, primary_key=True)
 
@@ -573,7 +1056,8 @@ class Notificacao(Base):
 
     # Definição dos Tipos de Notificação
 
-    OPCOES_TIPO_NOTIFICACAO = ["Lembrete Consulta", "Pagamento Status", "Alerta Sistema", "Feedback Avaliacao"]
+    OPCOES_TIPO_NOTIFICACAO = ["Lembrete Consulta", "Pagamento Status", "Alerta Sistema", "Feedback Avaliacao",
+                               "Alerta Emergencia"]
     # Tipo (limitado por Enum)
     tipo_notificacao = Column(Enum(*OPCOES_TIPO_NOTIFICACAO, name='tipo_notificacao_options'), nullable=False)
 
@@ -583,16 +1067,45 @@ class Notificacao(Base):
     # Status de leitura
     lida = Column(Boolean, default=False)
 
+    # 3. Entrega (fila de saída)
+
+    OPCOES_CANAL = ["Push", "Email", "SMS"]
+    canal = Column(Enum(*OPCOES_CANAL, name='canal_notificacao_options'), nullable=False,
+                   default="Push", server_default="Push")
+
+    # Destino explícito (telefone/e-mail); se vazio, usa os contatos do usuário
+    destino = Column(String(255), nullable=True)
+
+    OPCOES_STATUS_ENTREGA = ["Pendente", "Enviando", "Enviada", "Falhou"]
+    status_entrega = Column(Enum(*OPCOES_STATUS_ENTREGA, name='status_entrega_options'), nullable=False,
+                            default="Pendente", server_default="Pendente")
+
+    # Menor valor sai primeiro; emergências usam 0
+    PRIORIDADE_EMERGENCIA = 0
+    PRIORIDADE_NORMAL = 5
+    prioridade = Column(SmallInteger, nullable=False, default=PRIORIDADE_NORMAL,
+                        server_default=str(PRIORIDADE_NORMAL))
+
+    tentativas = Column(Integer, nullable=False, default=0, server_default="0")
+    # Pendente: quando pode ser enviada; Enviando: até quando a reserva do despachante vale
+    proxima_tentativa = Column(DateTime, default=datetime.utcnow)
+    enviada_em = Column(DateTime, nullable=True)
+    ultimo_erro = Column(Text, nullable=True)
+
 
     # -------------------------------------------------------------------------
     # Método Construtor (__init__)
     # -------------------------------------------------------------------------
 
-    def __init__(self, usuario_id, tipo_notificacao, mensagem, agendamento_id=None):
+    def __init__(self, usuario_id, tipo_notificacao, mensagem, agendamento_id=None,
+                 canal="Push", prioridade=PRIORIDADE_NORMAL, destino=None):
         self.usuario_id = usuario_id
         self.tipo_notificacao = tipo_notificacao
         self.mensagem = mensagem
         self.agendamento_id = agendamento_id
+        self.canal = canal
+        self.prioridade = prioridade
+        self.destino = destino
 
 
     # -------------------------------------------------------------------------
@@ -601,21 +1114,227 @@ class Notificacao(Base):
 
     def enviar_notificacao(self):
         """
-        Simula o envio real da notificação (SMS, E-mail ou Push Notification).
+        Coloca a notificação na fila de saída (SMS, E-mail ou Push Notification).
+
+        O envio real é feito em segundo plano pelo despachante de
+        notificacoes.py; aqui só o estado de entrega é (re)iniciado, e a
+        gravação acontece no próximo commit da sessão.
         """
-        # Aqui, a lógica real de envio seria implementada.
-        print(f"--- Envio de Notificação ---")
-        print(f"Para Usuário ID {self.usuario_id} | Tipo: {self.tipo_notificacao}")
-        print(f"Conteúdo: {self.mensagem[:50]}...")
+        self.status_entrega = "Pendente"
+        self.tentativas = 0
+        self.proxima_tentativa = datetime.utcnow()
+        self.ultimo_erro = None
 
     def marcar_como_lida(self):
-        """ Atualiza o status de leitura no banco de dados. """
+        """
+        Atualiza o status de leitura no banco de dados (o contador de não
+        lidas acompanha pelo evento abaixo). Para várias de uma vez, use
+        caixa_entrada.marcar_como_lidas, que faz um único UPDATE.
+        """
         self.lida = True
         print(f"Notificação {self.id_notificacao} marcada como lida.")
-        
 
 
-Base.metadata.create_all(engine)
-#criação do banco de dados e das tabelas
+class ContadorNaoLidas(Base):
+    """
+    Quantidade de notificações não lidas de cada usuário (o número do sino).
+    Atualizado incrementalmente pelos eventos de Notificacao (abaixo) e por
+    quem grava notificações via Core (somar_nao_lidas); reconstruído do zero
+    por caixa_entrada.recalcular_contadores().
+    """
+    __tablename__ = 'CONTADOR_NAO_LIDAS'
+
+    usuario_id = Column(Integer, ForeignKey('USUARIO.id_usuario'), primary_key=True)
+    nao_lidas = Column(Integer, nullable=False, default=0)
+
+
+def somar_nao_lidas(connection, contagens):
+    """
+    Soma {usuario_id: delta} aos contadores de não lidas: um UPDATE em lote
+    para quem já tem contador e um INSERT em lote para os demais.
+    """
+    contagens = {usuario_id: delta for usuario_id, delta in contagens.items() if delta}
+    if not contagens:
+        return
+    tabela = ContadorNaoLidas.__table__
+    existentes = set(connection.execute(
+        select(tabela.c.usuario_id).where(tabela.c.usuario_id.in_(list(contagens)))).scalars())
+    if existentes:
+        connection.execute(
+            update(tabela).where(tabela.c.usuario_id == bindparam('b_usuario'))
+            .values(nao_lidas=case((tabela.c.nao_lidas + bindparam('b_delta') > 0,
+                                    tabela.c.nao_lidas + bindparam('b_delta')), else_=0)),
+            [dict(b_usuario=usuario_id, b_delta=contagens[usuario_id]) for usuario_id in existentes])
+    novos = [dict(usuario_id=usuario_id, nao_lidas=delta) for usuario_id, delta in contagens.items()
+             if usuario_id not in existentes and delta > 0]
+    if novos:
+        connection.execute(insert(tabela), novos)
+
+
+def _nao_lida(lida):
+    return not lida
+
+
+@event.listens_for(Notificacao, 'after_insert')
+def _contador_apos_inserir(mapper, connection, notificacao):
+    if _nao_lida(notificacao.lida):
+        somar_nao_lidas(connection, {notificacao.usuario_id: 1})
+
+
+@event.listens_for(Notificacao, 'after_update')
+def _contador_apos_atualizar(mapper, connection, notificacao):
+    estado = inspect(notificacao)
+    if not any(estado.attrs[a].history.has_changes() for a in ('lida', 'usuario_id')):
+        return
+    contagens = Counter()
+    if _nao_lida(_valor_anterior(estado, 'lida')):
+        contagens[_valor_anterior(estado, 'usuario_id')] -= 1
+    if _nao_lida(notificacao.lida):
+        contagens[notificacao.usuario_id] += 1
+    somar_nao_lidas(connection, contagens)
+
+
+@event.listens_for(Notificacao, 'before_delete')
+def _contador_antes_remover(mapper, connection, notificacao):
+    estado = inspect(notificacao)
+    if _nao_lida(_valor_anterior(estado, 'lida')):
+        somar_nao_lidas(connection, {_valor_anterior(estado, 'usuario_id'): -1})
+
+
+for _atributo in (Notificacao.lida, Notificacao.usuario_id):
+    event.listen(_atributo, 'set', _manter_valor, active_history=True)
+
+
+class NotificacaoArquivada(Base):
+    """
+    Notificações lidas e antigas, movidas da NOTIFICACAO pela compactação de
+    caixa_entrada.py para que a tabela quente (fila de saída e caixa de
+    entrada) continue pequena. Sem chaves estrangeiras: o arquivo não impede
+    a remoção de usuários e agendamentos.
+    """
+    __tablename__ = 'NOTIFICACAO_ARQUIVADA'
+    __table_args__ = (
+        Index('ix_notificacao_arquivada_usuario', 'usuario_id', 'data_envio', 'id_notificacao'),
+    )
+
+    id_notificacao = Column(Integer, primary_key=True, autoincrement=False)
+    usuario_id = Column(Integer, nullable=False)
+    agendamento_id = Column(Integer)
+    tipo_notificacao = Column(Enum(*Notificacao.OPCOES_TIPO_NOTIFICACAO, name='tipo_notificacao_options'),
+                              nullable=False)
+    mensagem = Column(Text, nullable=False)
+    data_envio = Column(DateTime)
+    canal = Column(Enum(*Notificacao.OPCOES_CANAL, name='canal_notificacao_options'), nullable=False)
+    status_entrega = Column(Enum(*Notificacao.OPCOES_STATUS_ENTREGA, name='status_entrega_options'),
+                            nullable=False)
+    enviada_em = Column(DateTime)
+    arquivada_em = Column(DateTime, default=datetime.utcnow)
+
+
+
+class LembreteConsulta(Base):
+    """
+    Lembretes de consulta já gerados, um por agendamento e antecedência.
+    A chave primária impede que o agendador (lembretes.py) gere o mesmo
+    lembrete duas vezes, inclusive depois de reiniciar.
+    """
+    __tablename__ = 'LEMBRETE_CONSULTA'
+
+    agendamento_id = Column(Integer, ForeignKey('AGENDAMENTO.id_agendamento'), primary_key=True)
+    antecedencia_minutos = Column(Integer, primary_key=True)
+
+    # A notificação criada na fila de saída
+    notificacao_id = Column(Integer, ForeignKey('NOTIFICACAO.id_notificacao'))
+    criado_em = Column(DateTime, default=datetime.utcnow)
+
+
+# -------------------------------------------------------------------------
+# Criação do banco de dados e das tabelas
+# -------------------------------------------------------------------------
+
+# Versão do esquema gravada no banco (PRAGMA user_version no SQLite).
+# Incremente sempre que uma tabela ou índice novo for adicionado aos modelos.
+SCHEMA_VERSION = 15
+
+_trava_init_db = threading.Lock()
+_engines_inicializadas = weakref.WeakSet()
+
+
+def _versao_esquema(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _adicionar_colunas_novas(conn, tabelas):
+    """
+    create_all não altera tabelas existentes: colunas novas nos modelos são
+    acrescentadas com ALTER TABLE ADD COLUMN (precisam ser anuláveis ou ter
+    server_default).
+    """
+    inspetor = inspect(conn)
+    tabelas_existentes = set(inspetor.get_table_names())
+    for tabela in tabelas:
+        if tabela.name not in tabelas_existentes:
+            continue
+        existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in existentes:
+                continue
+            tipo = coluna.type.compile(dialect=conn.dialect)
+            ddl = f'ALTER TABLE "{tabela.name}" ADD COLUMN "{coluna.name}" {tipo}'
+            if coluna.server_default is not None:
+                ddl += f" DEFAULT '{coluna.server_default.arg}'"
+            if not coluna.nullable:
+                ddl += " NOT NULL"
+            conn.exec_driver_sql(ddl)
+
+
+def _criar_esquema(conn, tabelas=None):
+    """ Cria as tabelas (todas, ou só as informadas), colunas e índices que ainda não existem. """
+    tabelas = [tabela for tabela in Base.metadata.sorted_tables if tabelas is None or tabela in tabelas]
+    _adicionar_colunas_novas(conn, tabelas)
+    Base.metadata.create_all(conn, tables=tabelas)
+    # create_all não adiciona índices novos em tabelas que já existiam
+    for tabela in tabelas:
+        for indice in tabela.indexes:
+            indice.create(conn, checkfirst=True)
+
+
+def init_db(bind=None, tabelas=None):
+    """
+    Cria o esquema do banco, no máximo uma vez por processo e por engine.
+    `tabelas` restringe o esquema a algumas tabelas (ex: os shards de
+    shards.py, que só têm as tabelas por profissional).
+
+    Substitui o antigo create_all executado na importação do módulo. No
+    SQLite, se o PRAGMA user_version já for igual a SCHEMA_VERSION, nenhuma
+    reflexão é feita; caso contrário o esquema é criado dentro de uma
+    transação BEGIN IMMEDIATE, de modo que dois processos iniciando juntos
+    não disputem o DDL. Retorna True se esta chamada inicializou a engine.
+    """
+    bind = bind or engine
+    if bind in _engines_inicializadas:
+        return False
+
+    with _trava_init_db:
+        if bind in _engines_inicializadas:
+            return False
+
+        if bind.dialect.name != "sqlite":
+            # Sem um contador de versão barato: create_all já verifica o que existe
+            with bind.begin() as conn:
+                _criar_esquema(conn, tabelas)
+        else:
+            with bind.connect() as conn:
+                if _versao_esquema(conn) != SCHEMA_VERSION:
+                    conn.rollback()
+                    # Trava de escrita antes de conferir de novo: outro processo pode ter criado
+                    conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    if _versao_esquema(conn) != SCHEMA_VERSION:
+                        _criar_esquema(conn, tabelas)
+                        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    conn.commit()
+
+        _engines_inicializadas.add(bind)
+        return True
 
 
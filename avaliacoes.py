@@ -0,0 +1,74 @@
+"""
+Leitura e reconstrução dos agregados de avaliação (AVALIACAO_AGREGADA).
+
+O agregado de cada profissional (quantidade, soma, média e histograma das
+notas aprovadas) é mantido incrementalmente pelos eventos de Avaliacao em
+Model.py. Este módulo oferece a leitura O(1) usada na página de perfil e
+um comando para recalcular tudo do zero.
+
+Uso: python avaliacoes.py --recalcular
+"""
+import argparse
+
+from sqlalchemy import case, delete, func, insert, select
+
+from Model import engine, init_db, Avaliacao, AvaliacaoAgregada
+
+
+def obter_agregado(session, profissional_id):
+    """ Agregado do profissional (ou None se ele não tem avaliações aprovadas). """
+    return session.get(AvaliacaoAgregada, profissional_id)
+
+
+def media_profissional(session, profissional_id):
+    """ Média das notas aprovadas do profissional (0 se não houver). """
+    agregado = obter_agregado(session, profissional_id)
+    return agregado.media_float() if agregado is not None else 0
+
+
+def recalcular_agregados(bind=None):
+    """
+    Recalcula AVALIACAO_AGREGADA a partir de AVALIACAO em uma única passada
+    (INSERT ... SELECT ... GROUP BY dentro do banco, sem trazer linhas para o Python).
+    Retorna o número de profissionais com agregado.
+    """
+    bind = bind or engine
+    agregados = AvaliacaoAgregada.__table__
+    avaliacoes = Avaliacao.__table__
+
+    colunas = [
+        avaliacoes.c.profissional_id,
+        func.count(),
+        func.sum(avaliacoes.c.nota),
+        func.avg(avaliacoes.c.nota),
+    ] + [func.sum(case((avaliacoes.c.nota == nota, 1), else_=0)) for nota in range(1, 6)]
+
+    consulta = (
+        select(*colunas)
+        .where(avaliacoes.c.status == "Aprovada")
+        .group_by(avaliacoes.c.profissional_id)
+    )
+
+    with bind.begin() as conn:
+        conn.execute(delete(agregados))
+        resultado = conn.execute(insert(agregados).from_select(
+            ["profissional_id", "quantidade", "soma", "media",
+             "nota_1", "nota_2", "nota_3", "nota_4", "nota_5"],
+            consulta))
+    return resultado.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recalcular", action="store_true", help="reconstrói todos os agregados")
+    args = parser.parse_args()
+
+    if args.recalcular:
+        init_db()
+        print(f"Agregados recalculados para {recalcular_agregados()} profissionais.")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
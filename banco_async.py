@@ -0,0 +1,171 @@
+"""
+Acesso ao banco para a camada web em asyncio.
+
+As operações mais chamadas da API em versão async, sobre a extensão
+asyncio do SQLAlchemy (aiosqlite no SQLite), com os mesmos modelos de
+Model.py e as mesmas consultas dos serviços síncronos:
+
+  - reservar_consulta: como reservas.reservar_consulta (HorarioIndisponivel,
+    ReservaNaoConcluida, nova tentativa com espera quando o banco está
+    travado), mas a espera é um asyncio.sleep;
+  - buscar_horarios_disponiveis: as consultas em blocos de disponibilidade.py,
+    com o cálculo dos horários livres em asyncio.to_thread;
+  - fazer_login: busca por email e confere a senha no pool do
+    VerificadorSenhas, fora do loop (o hash custa dezenas de ms);
+  - listar_notificacoes: as notificações mais recentes de um usuário.
+
+    fabrica = criar_fabrica_sessoes("sqlite:///tcc.db")
+    async with fabrica() as session:
+        horarios = await buscar_horarios_disponiveis(session, "Psicólogo", inicio, fim)
+
+Uma chamada ao banco não trava o loop: enquanto o aiosqlite espera o
+SQLite em sua thread, o loop atende outras requisições. Relações que não
+foram carregadas não podem ser lidas depois (não há lazy load em
+AsyncSession); as funções devolvem objetos com as colunas já carregadas.
+"""
+import asyncio
+import random
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from conexao import criar_engine_async
+from disponibilidade import DURACAO_PADRAO_MINUTOS, BuscaPaginada, consultas_disponibilidade
+from Model import DATABASE_URL, Agendamento, Notificacao, Usuario
+from reservas import ESPERA_INICIAL, TENTATIVAS_PADRAO, HorarioIndisponivel, ReservaNaoConcluida, \
+    _banco_travado, _conflito_de_horario, consulta_conflitos, consulta_horario_na_agenda, consulta_trava_agenda, \
+    opcoes_conexao
+from seguranca import VerificadorSenhas
+
+LIMITE_NOTIFICACOES_PADRAO = 50
+
+_fabrica_padrao = None
+_verificador_padrao = None
+
+
+def criar_fabrica_sessoes(dsn_ou_config=None, **opcoes):
+    """ async_sessionmaker sobre uma engine de criar_engine_async (sem expirar objetos no commit). """
+    engine = criar_engine_async(dsn_ou_config or DATABASE_URL, **opcoes)
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+def fabrica_padrao():
+    """ Fábrica de sessões do banco da aplicação (DATABASE_URL), criada no primeiro uso. """
+    global _fabrica_padrao
+    if _fabrica_padrao is None:
+        _fabrica_padrao = criar_fabrica_sessoes()
+    return _fabrica_padrao
+
+
+def _verificador():
+    global _verificador_padrao
+    if _verificador_padrao is None:
+        _verificador_padrao = VerificadorSenhas()
+    return _verificador_padrao
+
+
+async def reservar_consulta(paciente_id, profissional_id, data, hora, fabrica=None,
+                            validar_agenda=True, tentativas=TENTATIVAS_PADRAO):
+    """
+    Grava um novo agendamento e devolve o objeto Agendamento.
+
+    Mesmas regras de reservas.reservar_consulta (trava de escrita e
+    conferência de sobreposição antes do INSERT): HorarioIndisponivel se o
+    horário estiver ocupado ou fora da agenda, ReservaNaoConcluida se o
+    banco continuar travado depois de `tentativas` tentativas.
+    """
+    fabrica = fabrica or fabrica_padrao()
+    espera = ESPERA_INICIAL
+
+    for _ in range(tentativas):
+        async with fabrica() as session:
+            try:
+                conflitos = consulta_conflitos(profissional_id, data, hora)
+                conn = await session.connection(bind_arguments=opcoes_conexao(conflitos))
+                if conn.dialect.name == "sqlite":
+                    await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                else:
+                    (await conn.execute(consulta_trava_agenda(profissional_id, data))).all()
+                if validar_agenda:
+                    slot = (await session.execute(
+                        consulta_horario_na_agenda(profissional_id, data, hora))).first()
+                    if slot is None:
+                        raise HorarioIndisponivel(
+                            f"Horário {data} {hora} fora da agenda do profissional {profissional_id}.")
+                if (await session.execute(conflitos)).first() is not None:
+                    raise HorarioIndisponivel(
+                        f"Horário {data} {hora} do profissional {profissional_id} já está reservado.")
+
+                agendamento = Agendamento(profissional_id, paciente_id, data, hora)
+                session.add(agendamento)
+                await session.commit()
+                return agendamento
+            except IntegrityError as erro:
+                await session.rollback()
+                if not _conflito_de_horario(erro):
+                    raise
+                raise HorarioIndisponivel(
+                    f"Horário {data} {hora} do profissional {profissional_id} já está reservado.")
+            except OperationalError as erro:
+                await session.rollback()
+                if not _banco_travado(erro):
+                    raise
+                # Outro escritor está com a trava: espera (sem bloquear o loop) e tenta de novo
+                await asyncio.sleep(espera * (1 + random.random()))
+                espera *= 2
+
+    raise ReservaNaoConcluida(f"Banco ocupado após {tentativas} tentativas.")
+
+
+async def buscar_horarios_disponiveis(session, tipo_de_especialidade, data_inicio, data_fim,
+                                      duracao_minutos=DURACAO_PADRAO_MINUTOS, passo_minutos=None, limite=None):
+    """
+    Versão async de disponibilidade.buscar_horarios_disponiveis (lista de
+    HorarioLivre). As consultas esperam no aiosqlite; o cálculo dos horários
+    de cada bloco (CPU) roda em asyncio.to_thread para não travar o loop.
+    """
+    consulta_profissionais, consulta_agendas, consulta_ocupados = consultas_disponibilidade(tipo_de_especialidade)
+    conn = await session.connection()
+    busca = BuscaPaginada(data_inicio, data_fim, duracao_minutos, passo_minutos, limite)
+    livres = []
+    for bloco in busca.blocos():
+        if bloco.ler_apos is not None:
+            ids = (await conn.execute(consulta_profissionais, {"b_apos": bloco.ler_apos,
+                                                               "b_limite": bloco.ler_quantos})).scalars().all()
+            agendas = (await conn.execute(consulta_agendas, {"b_ids": ids})).all() if ids else []
+            busca.adicionar_profissionais(ids, agendas, bloco.ler_quantos)
+        ids = busca.profissionais(bloco)
+        if ids:
+            ocupados = (await conn.execute(consulta_ocupados, {"b_data": bloco.data, "b_ids": ids})).all()
+            livres += await asyncio.to_thread(busca.horarios_do_bloco, bloco, ocupados)
+    return livres
+
+
+async def fazer_login(session, email, senha_informada, verificador=None):
+    """
+    Devolve o Usuario se email e senha conferem, senão None. O hash é
+    conferido no pool do verificador; se estiver com custo antigo, a senha
+    é regravada com o custo atual na mesma chamada.
+    """
+    usuario = (await session.execute(select(Usuario).where(Usuario.email == email))).scalars().first()
+    # Para email inexistente, autenticar confere um hash fictício (mesmo tempo de resposta)
+    confere = await (verificador or _verificador()).autenticar(usuario, senha_informada)
+    if usuario is None or not confere:
+        return None
+    if session.is_modified(usuario):
+        await session.commit()
+    return usuario
+
+
+def consulta_notificacoes(usuario_id, apenas_nao_lidas=False, limite=LIMITE_NOTIFICACOES_PADRAO):
+    consulta = select(Notificacao).where(Notificacao.usuario_id == usuario_id)
+    if apenas_nao_lidas:
+        consulta = consulta.where(Notificacao.lida == False)  # noqa: E712 (usa o índice parcial das não lidas)
+    return consulta.order_by(Notificacao.data_envio.desc(), Notificacao.id_notificacao.desc()).limit(limite)
+
+
+async def listar_notificacoes(session, usuario_id, apenas_nao_lidas=False, limite=LIMITE_NOTIFICACOES_PADRAO):
+    """ As `limite` notificações mais recentes do usuário (as não lidas, com apenas_nao_lidas=True). """
+    consulta = consulta_notificacoes(usuario_id, apenas_nao_lidas, limite)
+    return (await session.execute(consulta)).scalars().all()
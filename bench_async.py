@@ -0,0 +1,195 @@
+"""
+Benchmark da camada async (banco_async.py) contra o caminho síncrono.
+
+Sobre um banco sintético (gerador_dados.py), dispara N requisições com no
+máximo C em andamento ao mesmo tempo, em um loop asyncio, com a mistura
+de operações da API: busca de horários livres, listagem de notificações,
+reserva e login. Compara três formas de atender:
+  - sync no loop: o handler async chama os serviços síncronos direto
+    (cada consulta e cada hash de senha travam o loop);
+  - sync em threads: os serviços síncronos via asyncio.to_thread;
+  - async: banco_async com AsyncSession/aiosqlite.
+Mostra requisições por segundo, p50/p99 da latência e o maior atraso do
+loop (um relógio que deveria acordar a cada 5 ms).
+
+Uso: python bench_async.py [--linhas 20000] [--requisicoes 2000] [--concorrencia 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time as relogio
+from datetime import timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+import banco_async
+import reservas
+from conexao import criar_engine
+from disponibilidade import buscar_horarios_disponiveis
+from gerador_dados import DATA_REFERENCIA, SEMANAS, gerar_banco
+from Model import AgendaProfissional, Paciente, Profissional, Usuario
+from reservas import HorarioIndisponivel
+from seguranca import VerificadorSenhas
+
+MISTURA = (("disponibilidade", 40), ("notificacoes", 40), ("reserva", 15), ("login", 5))
+SENHA = "senha123"  # senha de todos os usuários do gerador
+
+
+def montar_requisicoes(engine, n, semente, semana_base):
+    """ Lista de (operacao, argumentos); as reservas caem a partir de `semana_base` semanas depois do período. """
+    rnd = random.Random(semente)
+    with engine.connect() as conn:
+        agendas = conn.execute(select(AgendaProfissional.profissional_id, AgendaProfissional.dia_semana,
+                                      AgendaProfissional.hora_inicio, AgendaProfissional.hora_fim)).all()
+        pacientes = conn.scalars(select(Paciente.id_paciente)).all()
+        usuarios = conn.execute(select(Usuario.id_usuario, Usuario.email)).all()
+    especialidades = Profissional.__table__.c.tipo_de_especialidade.type.enums
+    dias = AgendaProfissional.OPCOES_DIA_SEMANA
+    inicio_futuro = DATA_REFERENCIA + timedelta(weeks=SEMANAS + semana_base)
+    inicio_futuro -= timedelta(days=inicio_futuro.weekday())
+    operacoes, pesos = zip(*MISTURA)
+
+    requisicoes = []
+    for operacao in rnd.choices(operacoes, pesos, k=n):
+        if operacao == "disponibilidade":
+            data = DATA_REFERENCIA + timedelta(days=rnd.randrange(14))
+            argumentos = (rnd.choice(especialidades), data, data + timedelta(days=6))
+        elif operacao == "notificacoes":
+            argumentos = (rnd.choice(usuarios).id_usuario,)
+        elif operacao == "reserva":
+            profissional_id, dia, hora_inicio, hora_fim = rnd.choice(agendas)
+            data = inicio_futuro + timedelta(weeks=rnd.randrange(4), days=dias.index(dia))
+            argumentos = (rnd.choice(pacientes), profissional_id, data,
+                          hora_inicio.replace(hour=rnd.randrange(hora_inicio.hour, hora_fim.hour)))
+        else:
+            argumentos = (rnd.choice(usuarios).email,)
+        requisicoes.append((operacao, argumentos))
+    return requisicoes
+
+
+class Sincrono:
+    """ Os serviços síncronos usados hoje, um por operação. """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.fabrica = sessionmaker(bind=engine, expire_on_commit=False)
+
+    def disponibilidade(self, especialidade, inicio, fim):
+        with Session(self.engine) as session:
+            return buscar_horarios_disponiveis(session, especialidade, inicio, fim, limite=50)
+
+    def notificacoes(self, usuario_id):
+        with Session(self.engine) as session:
+            return session.scalars(banco_async.consulta_notificacoes(usuario_id)).all()
+
+    def reserva(self, *argumentos):
+        try:
+            return reservas.reservar_consulta(*argumentos, session_factory=self.fabrica)
+        except HorarioIndisponivel:
+            return None
+
+    def login(self, email):
+        with Session(self.engine) as session:
+            usuario = session.scalars(select(Usuario).where(Usuario.email == email)).first()
+            confere = usuario is not None and usuario.fazer_login(SENHA)
+            session.commit()
+            return confere
+
+
+class Assincrono:
+    """ As mesmas operações pelo banco_async. """
+
+    def __init__(self, fabrica, verificador):
+        self.fabrica = fabrica
+        self.verificador = verificador
+
+    async def disponibilidade(self, especialidade, inicio, fim):
+        async with self.fabrica() as session:
+            return await banco_async.buscar_horarios_disponiveis(session, especialidade, inicio, fim, limite=50)
+
+    async def notificacoes(self, usuario_id):
+        async with self.fabrica() as session:
+            return await banco_async.listar_notificacoes(session, usuario_id)
+
+    async def reserva(self, *argumentos):
+        try:
+            return await banco_async.reservar_consulta(*argumentos, fabrica=self.fabrica)
+        except HorarioIndisponivel:
+            return None
+
+    async def login(self, email):
+        async with self.fabrica() as session:
+            return await banco_async.fazer_login(session, email, SENHA, verificador=self.verificador)
+
+
+async def _relogio(atrasos, parar, intervalo=0.005):
+    while not parar.is_set():
+        antes = relogio.perf_counter()
+        await asyncio.sleep(intervalo)
+        atrasos.append(relogio.perf_counter() - antes - intervalo)
+
+
+async def disparar(requisicoes, concorrencia, atender):
+    """ Atende as requisições com até `concorrencia` em andamento; devolve (duração, latências, maior atraso). """
+    limite = asyncio.Semaphore(concorrencia)
+    latencias, atrasos, parar = [], [], asyncio.Event()
+
+    async def requisicao(operacao, argumentos):
+        async with limite:
+            antes = relogio.perf_counter()
+            await atender(operacao, argumentos)
+            latencias.append(relogio.perf_counter() - antes)
+
+    ticker = asyncio.create_task(_relogio(atrasos, parar))
+    inicio = relogio.perf_counter()
+    await asyncio.gather(*(requisicao(*r) for r in requisicoes))
+    duracao = relogio.perf_counter() - inicio
+    parar.set()
+    await ticker
+    return duracao, sorted(latencias), max(atrasos, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    caminho = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'async.db')}"
+    engine = criar_engine(caminho)
+    gerar_banco(engine, args.linhas, args.semente)
+    sincrono = Sincrono(engine)
+    verificador = VerificadorSenhas()
+    fabrica = banco_async.criar_fabrica_sessoes(caminho)
+    assincrono = Assincrono(fabrica, verificador)
+
+    async def sync_no_loop(operacao, argumentos):
+        getattr(sincrono, operacao)(*argumentos)
+
+    async def sync_em_threads(operacao, argumentos):
+        await asyncio.to_thread(getattr(sincrono, operacao), *argumentos)
+
+    async def async_(operacao, argumentos):
+        await getattr(assincrono, operacao)(*argumentos)
+
+    formas = (("sync no loop", sync_no_loop), ("sync em threads", sync_em_threads), ("async", async_))
+    print(f"{args.requisicoes} requisições, concorrência {args.concorrencia}, mistura {dict(MISTURA)}")
+    for semana_base, (nome, atender) in enumerate(formas):
+        # Mesma mistura em todas as formas; as reservas de cada uma em semanas diferentes
+        requisicoes = montar_requisicoes(engine, args.requisicoes, args.semente, 1 + 4 * semana_base)
+        duracao, latencias, atraso = asyncio.run(disparar(requisicoes, args.concorrencia, atender))
+        p50, p99 = latencias[len(latencias) // 2], latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+        print(f"{nome + ':':<17} {len(latencias) / duracao:8.1f} req/s  p50={p50 * 1000:8.2f} ms  "
+              f"p99={p99 * 1000:8.2f} ms  maior atraso do loop={atraso * 1000:8.2f} ms")
+
+    asyncio.run(fabrica.kw["bind"].dispose())
+    verificador.encerrar()
+
+
+if __name__ == "__main__":
+    main()
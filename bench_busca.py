@@ -0,0 +1,157 @@
+"""
+Benchmark da busca de profissionais.
+
+Gera um banco sintético (padrão: 1 milhão de usuários, 20% profissionais,
+com endereço em 500 cidades e agregados de avaliação) e mede p50/p99 de
+buscas com filtros aleatórios, primeira página e páginas seguintes via
+cursor. Depois remove os índices compostos e mede de novo, para comparação.
+
+Uso: python bench_busca.py [--usuarios 1000000] [--buscas 300]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from Model import init_db, ajustar_agregado_avaliacao, Usuario, Profissional, Endereco, AvaliacaoAgregada
+from busca_profissionais import buscar_profissionais
+
+ESPECIALIDADES = Profissional.__table__.c.tipo_de_especialidade.type.enums
+ESTADOS = ["SP", "RJ", "MG", "RS", "PR", "BA", "PE", "CE", "SC", "GO"]
+INDICES_BUSCA = ["ix_profissional_especialidade_verificado_preco", "ix_profissional_especialidade_preco",
+                 "ix_profissional_endereco", "ix_endereco_estado_cidade", "ix_avaliacao_agregada_media"]
+LOTE = 50000
+
+
+def popular(engine, n_usuarios, fracao_profissionais=0.2, semente=11):
+    rnd = random.Random(semente)
+    cidades = [(f"Cidade {i}", ESTADOS[i % len(ESTADOS)]) for i in range(500)]
+    passo = int(1 / fracao_profissionais)
+
+    with engine.begin() as conn:
+        for inicio in range(1, n_usuarios + 1, LOTE):
+            ids = range(inicio, min(inicio + LOTE, n_usuarios + 1))
+            conn.execute(insert(Usuario.__table__), [
+                dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                     CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True) for i in ids])
+
+            profissionais = [i for i in ids if i % passo == 0]
+            enderecos, perfis, agregados = [], [], []
+            for i in profissionais:
+                cidade, estado = rnd.choice(cidades)
+                enderecos.append(dict(id_endereco=i, cep="00000-000", logradouro="Rua", numero="1",
+                                      bairro="Centro", cidade=cidade, estado=estado))
+                perfis.append(dict(id_profissional=i, endereco_id=i, tipo_de_especialidade=rnd.choice(ESPECIALIDADES),
+                                   crp_cnr_cref=f"REG-{i}", crp_cnr_cref_verificado=rnd.random() < 0.7,
+                                   valor_consulta=rnd.randrange(80, 400)))
+                if rnd.random() < 0.6:
+                    quantidade = rnd.randint(1, 40)
+                    soma = sum(rnd.randint(3, 5) for _ in range(quantidade))
+                    agregados.append(dict(profissional_id=i, quantidade=quantidade, soma=soma,
+                                          media=round(soma / quantidade, 2)))
+            if profissionais:
+                conn.execute(insert(Endereco.__table__), enderecos)
+                conn.execute(insert(Profissional.__table__), perfis)
+            if agregados:
+                conn.execute(insert(AvaliacaoAgregada.__table__), agregados)
+        conn.execute(text("ANALYZE"))
+    return cidades
+
+
+def medir(engine, cidades, n_buscas, semente=3):
+    rnd = random.Random(semente)
+    primeira, seguintes = [], []
+    with Session(engine) as session:
+        for _ in range(n_buscas):
+            filtros = dict(tipo_de_especialidade=rnd.choice(ESPECIALIDADES),
+                           ordenar_por=rnd.choice(("preco", "avaliacao")))
+            if rnd.random() < 0.5:
+                filtros["verificado"] = True
+            if rnd.random() < 0.5:
+                filtros["preco_min"], filtros["preco_max"] = 100, rnd.randrange(150, 400)
+            if rnd.random() < 0.5:
+                filtros["cidade"], filtros["estado"] = rnd.choice(cidades)
+
+            inicio = relogio.perf_counter()
+            pagina = buscar_profissionais(session, **filtros)
+            primeira.append(relogio.perf_counter() - inicio)
+
+            for _ in range(3):
+                if not pagina.proximo_cursor:
+                    break
+                inicio = relogio.perf_counter()
+                pagina = buscar_profissionais(session, cursor=pagina.proximo_cursor, **filtros)
+                seguintes.append(relogio.perf_counter() - inicio)
+    return primeira, seguintes
+
+
+def conferir_empates(n=30, tamanho_pagina=10):
+    """
+    Pagina por avaliação `n` profissionais empatados com média 13/3, gravada
+    pelo mesmo caminho das avaliações (ajustar_agregado_avaliacao), e confere
+    que todos aparecem uma única vez.
+    """
+    engine = criar_engine("sqlite://")
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True) for i in range(1, n + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade=ESPECIALIDADES[0], crp_cnr_cref=f"REG-{i}",
+                 valor_consulta=100) for i in range(1, n + 1)])
+        for i in range(1, n + 1):
+            for nota in (5, 4, 4):
+                ajustar_agregado_avaliacao(conn, i, nota, +1)
+
+    vistos, cursor = [], None
+    with Session(engine) as session:
+        while True:
+            pagina = buscar_profissionais(session, ordenar_por="avaliacao", cursor=cursor,
+                                          tamanho_pagina=tamanho_pagina)
+            vistos += [item.id_profissional for item in pagina.itens]
+            cursor = pagina.proximo_cursor
+            if cursor is None:
+                break
+    print(f"empates: {len(vistos)} de {n} profissionais com media 13/3 paginados de {tamanho_pagina} em {tamanho_pagina}")
+    assert sorted(vistos) == list(range(1, n + 1))
+
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    p50 = tempos[len(tempos) // 2]
+    p99 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))]
+    return f"p50={p50 * 1000:7.2f} ms  p99={p99 * 1000:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=1_000_000)
+    parser.add_argument("--buscas", type=int, default=300)
+    args = parser.parse_args()
+    conferir_empates()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'busca.db')}")
+    init_db(engine)
+    inicio = relogio.perf_counter()
+    cidades = popular(engine, args.usuarios)
+    print(f"usuarios={args.usuarios} populados em {relogio.perf_counter() - inicio:.1f} s")
+
+    primeira, seguintes = medir(engine, cidades, args.buscas)
+    print(f"com indices    primeira pagina: {_percentis(primeira)} | paginas seguintes: {_percentis(seguintes)}")
+
+    with engine.begin() as conn:
+        for indice in INDICES_BUSCA:
+            conn.execute(text(f"DROP INDEX {indice}"))
+        conn.execute(text("ANALYZE"))
+    primeira, seguintes = medir(engine, cidades, args.buscas)
+    print(f"sem indices    primeira pagina: {_percentis(primeira)} | paginas seguintes: {_percentis(seguintes)}")
+
+
+if __name__ == "__main__":
+    main()
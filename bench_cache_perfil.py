@@ -0,0 +1,115 @@
+"""
+Benchmark do cache de perfis.
+
+Popula profissionais com usuário, endereço, dados bancários e agregado de
+avaliações e simula visualizações de perfil com acesso concentrado (poucos
+profissionais muito vistos, distribuição de Zipf). Compara:
+  - o caminho antigo pelo ORM (Profissional, .usuario, .dados_bancarios e
+    o Endereco consultado à parte, uma sessão por visualização);
+  - a carga do perfil com a consulta única, sem cache;
+  - o CachePerfis (LRU menor que o número de profissionais, para haver despejos).
+Mostra visualizações/s, consultas ao banco por visualização e os contadores
+do cache, e confere que uma alteração pelo ORM invalida o perfil.
+
+Uso: python bench_cache_perfil.py [--profissionais 20000] [--visualizacoes 50000] [--capacidade 2000]
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time as relogio
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from cache_perfil import CachePerfis, carregar_perfis
+from conexao import criar_engine
+from Model import init_db, Usuario, Profissional, Endereco, DadosBancarios, AvaliacaoAgregada
+
+
+def popular(engine, n):
+    with engine.begin() as conn:
+        conn.execute(insert(Endereco.__table__), [
+            dict(id_endereco=i, cep="01000-000", logradouro="Rua B", numero=str(i), bairro="Centro",
+                 cidade="São Paulo", estado="SP") for i in range(1, n + 1)])
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"{i:011d}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, n + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, endereco_id=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}",
+                 valor_consulta=200) for i in range(1, n + 1)])
+        conn.execute(insert(DadosBancarios.__table__), [
+            dict(profissional_id=i, banco="001", agencia="0001", conta=f"{i:08d}", tipo_conta="Corrente",
+                 nome_titular=f"Usuario {i}", cpf_cnpj_titular=f"{i:011d}") for i in range(1, n + 1)])
+        conn.execute(insert(AvaliacaoAgregada.__table__), [
+            dict(profissional_id=i, quantidade=3, soma=14, media=14 / 3, nota_4=1, nota_5=2)
+            for i in range(1, n + 1)])
+
+
+def perfil_orm(engine, id_profissional):
+    """ Como teste.py: carrega as relações uma a uma. """
+    with Session(engine) as session:
+        profissional = session.get(Profissional, id_profissional)
+        endereco = session.get(Endereco, profissional.endereco_id)
+        return (profissional.usuario.nome, profissional.dados_bancarios.banco,
+                endereco.formatar_endereco(), profissional.valor_consulta)
+
+
+def medir(nome, ids, ver, contador):
+    contador[0] = 0
+    inicio = relogio.perf_counter()
+    for id_profissional in ids:
+        ver(id_profissional)
+    duracao = relogio.perf_counter() - inicio
+    print(f"{nome:<22} {len(ids) / duracao:9.0f} visualizacoes/s | {contador[0] / len(ids):.2f} consultas por visualizacao")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profissionais", type=int, default=20000)
+    parser.add_argument("--visualizacoes", type=int, default=50000)
+    parser.add_argument("--capacidade", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'perfis.db')}")
+    init_db(engine)
+    popular(engine, args.profissionais)
+
+    contador = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _contar(*_):
+        contador[0] += 1
+
+    rnd = random.Random(5)
+    pesos = list(itertools.accumulate(1 / posicao for posicao in range(1, args.profissionais + 1)))
+    ids = rnd.choices(range(1, args.profissionais + 1), cum_weights=pesos, k=args.visualizacoes)
+
+    medir("ORM (relacoes)", ids[:max(1, len(ids) // 10)], lambda i: perfil_orm(engine, i), contador)
+
+    def sem_cache(id_profissional):
+        with engine.connect() as conn:
+            return carregar_perfis(conn, [id_profissional])[id_profissional]
+    medir("consulta unica", ids[:max(1, len(ids) // 10)], sem_cache, contador)
+
+    cache = CachePerfis(capacidade=args.capacidade, ttl=300, bind=engine)
+    medir(f"cache (LRU {args.capacidade})", ids, cache.obter, contador)
+    print(f"contadores: {cache.estatisticas()}")
+
+    # Invalidação: uma alteração pelo ORM aparece na próxima leitura
+    mais_visto = ids[0]
+    antes = cache.obter(mais_visto)
+    with Session(engine) as session:
+        session.get(Profissional, mais_visto).valor_consulta = antes.valor_consulta + 50
+        session.get(Usuario, mais_visto).nome = "Nome Alterado"
+        session.commit()
+    depois = cache.obter(mais_visto)
+    print(f"invalidacao: valor {antes.valor_consulta} -> {depois.valor_consulta}, nome {antes.nome!r} -> "
+          f"{depois.nome!r} | invalidacoes={cache.invalidacoes}")
+    assert depois.valor_consulta == antes.valor_consulta + 50 and depois.nome == "Nome Alterado"
+
+
+if __name__ == "__main__":
+    main()
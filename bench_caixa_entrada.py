@@ -0,0 +1,125 @@
+"""
+Benchmark da caixa de entrada de notificações.
+
+Grava N notificações para U usuários (alguns com milhares, como contas
+de profissionais muito procurados) e compara:
+  - o número do sino: COUNT(*) das não lidas a cada página contra a
+    leitura de CONTADOR_NAO_LIDAS;
+  - páginas profundas: OFFSET contra cursor (data_envio, id);
+  - "marcar todas como lidas": objeto a objeto pelo ORM contra um UPDATE;
+  - a compactação: quantas linhas saem da tabela quente e o tempo.
+
+Uso: python bench_caixa_entrada.py [--notificacoes 200000] [--usuarios 2000] [--consultas 2000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert, select, text
+from sqlalchemy.orm import Session
+
+import caixa_entrada
+from conexao import criar_engine
+from Model import init_db, somar_nao_lidas, Usuario, Notificacao
+
+
+def popular(engine, n_notificacoes, n_usuarios, semente=11):
+    rnd = random.Random(semente)
+    agora = datetime.utcnow()
+    # Poucos usuários concentram a maior parte das notificações
+    pesos = [1 / posicao for posicao in range(1, n_usuarios + 1)]
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, n_usuarios + 1)])
+        destinatarios = rnd.choices(range(1, n_usuarios + 1), pesos, k=n_notificacoes)
+        linhas = []
+        for i, usuario_id in enumerate(destinatarios):
+            envio = agora - timedelta(minutes=rnd.randrange(365 * 24 * 60))
+            # As antigas quase sempre já foram lidas
+            lida = rnd.random() < (0.98 if envio < agora - timedelta(days=30) else 0.4)
+            linhas.append(dict(usuario_id=usuario_id, tipo_notificacao="Alerta Sistema", mensagem=f"Aviso {i}",
+                               data_envio=envio, lida=lida, status_entrega="Enviada", enviada_em=envio,
+                               proxima_tentativa=envio, tentativas=1))
+        conn.execute(insert(Notificacao.__table__), linhas)
+        somar_nao_lidas(conn, Counter(l["usuario_id"] for l in linhas if not l["lida"]))
+        conn.execute(text("ANALYZE"))
+
+
+def cronometrar(funcao, repeticoes):
+    inicio = relogio.perf_counter()
+    for i in range(repeticoes):
+        funcao(i)
+    return (relogio.perf_counter() - inicio) / repeticoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notificacoes", type=int, default=200000)
+    parser.add_argument("--usuarios", type=int, default=2000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'caixa.db')}")
+    init_db(engine)
+    inicio = relogio.perf_counter()
+    popular(engine, args.notificacoes, args.usuarios)
+    print(f"{args.notificacoes} notificações para {args.usuarios} usuários em {relogio.perf_counter() - inicio:.1f} s")
+    tabela = Notificacao.__table__
+    ativos = [1 + (i * 7) % 50 for i in range(args.consultas)]  # os usuários com mais notificações
+
+    with Session(engine) as session:
+        contar = select(func.count()).where(tabela.c.usuario_id == bindparam("u"), tabela.c.lida == False)  # noqa: E712
+        us_count = cronometrar(lambda i: session.execute(contar, {"u": ativos[i]}).scalar(), args.consultas)
+        us_contador = cronometrar(lambda i: caixa_entrada.contar_nao_lidas(session, ativos[i]), args.consultas)
+        print(f"sino: COUNT(*) = {us_count:8.1f} us   contador = {us_contador:8.1f} us")
+
+        usuario = 1
+        total = session.scalar(select(func.count()).where(tabela.c.usuario_id == usuario))
+        pagina, tamanho = total // 20 * 19 // 20, 20  # uma página perto do fim
+        offset = select(tabela.c.id_notificacao).where(tabela.c.usuario_id == usuario).order_by(
+            tabela.c.data_envio.desc(), tabela.c.id_notificacao.desc()).offset(pagina * tamanho).limit(tamanho)
+        us_offset = cronometrar(lambda i: session.execute(offset).all(), 200)
+        cursor = caixa_entrada.listar(session, usuario, tamanho_pagina=pagina * tamanho).proximo_cursor
+        us_cursor = cronometrar(lambda i: caixa_entrada.listar(session, usuario, cursor=cursor), 200)
+        print(f"página {pagina} de {total // tamanho} do usuário 1: OFFSET = {us_offset:8.1f} us   "
+              f"cursor = {us_cursor:8.1f} us")
+
+    # Marcar todas como lidas: dois usuários com a mesma ordem de grandeza de não lidas
+    with Session(engine) as session:
+        nao_lidas = session.scalars(select(Notificacao).where(Notificacao.usuario_id == 2,
+                                                              Notificacao.lida.is_(False))).all()
+        inicio = relogio.perf_counter()
+        for notificacao in nao_lidas:
+            notificacao.lida = True
+        session.commit()
+        ms_orm = (relogio.perf_counter() - inicio) * 1000
+    inicio = relogio.perf_counter()
+    alteradas = caixa_entrada.marcar_como_lidas(3, bind=engine)
+    ms_update = (relogio.perf_counter() - inicio) * 1000
+    print(f"marcar todas: ORM {len(nao_lidas)} linhas em {ms_orm:.1f} ms   UPDATE {alteradas} linhas em "
+          f"{ms_update:.1f} ms")
+
+    inicio = relogio.perf_counter()
+    arquivadas = caixa_entrada.arquivar_lidas(engine)
+    with engine.connect() as conn:
+        restantes = conn.scalar(select(func.count()).select_from(tabela))
+    print(f"compactação: {arquivadas} arquivadas em {relogio.perf_counter() - inicio:.1f} s, "
+          f"{restantes} ficam na tabela quente")
+
+    # O contador continua igual à contagem real
+    with Session(engine) as session:
+        reais = dict(session.execute(select(tabela.c.usuario_id, func.count()).where(tabela.c.lida.is_(False))
+                                     .group_by(tabela.c.usuario_id)).all())
+        divergentes = [u for u in range(1, args.usuarios + 1)
+                       if caixa_entrada.contar_nao_lidas(session, u) != reais.get(u, 0)]
+    print(f"contadores divergentes: {len(divergentes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark do calendário dos profissionais (calendario.py).
+
+Sobre um banco sintético (gerador_dados.py):
+  - visualizações de 4 semanas da agenda de profissionais sorteados (Zipf,
+    como a procura real): expansão direta a cada visualização contra o
+    CalendarioProfissionais com as semanas memorizadas;
+  - exportação iCalendar de um ano de todos os profissionais: montando o
+    texto inteiro na memória contra o gerador de exportar_ical, com o pico
+    de memória medido pelo tracemalloc.
+
+Uso: python bench_calendario.py [--linhas 200000] [--visualizacoes 5000] [--semente 42]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+import tracemalloc
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from calendario import CalendarioProfissionais, carregar_semanas, exportar_ical, iterar_eventos, linhas_ical, \
+    segunda_feira
+from conexao import criar_engine
+from gerador_dados import DATA_REFERENCIA, gerar_banco, pesos_zipf
+from Model import Profissional
+
+
+def medir_pico(funcao):
+    """ (resultado, segundos, pico de memória em MB) da chamada. """
+    tracemalloc.start()
+    inicio = relogio.perf_counter()
+    resultado = funcao()
+    duracao = relogio.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, duracao, pico / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--visualizacoes", type=int, default=5000)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'calendario.db')}")
+    gerar_banco(engine, args.linhas, args.semente)
+    with engine.connect() as conn:
+        ids = conn.execute(select(Profissional.id_profissional).order_by(Profissional.id_profissional)).scalars().all()
+    print(f"{len(ids)} profissionais")
+
+    rnd = random.Random(args.semente)
+    pesos = pesos_zipf(len(ids), 1.1)
+    pedidos = [(rnd.choices(ids, cum_weights=pesos)[0], DATA_REFERENCIA + timedelta(weeks=rnd.randrange(-2, 3)))
+               for _ in range(args.visualizacoes)]
+
+    with engine.connect() as conn:
+        inicio = relogio.perf_counter()
+        for profissional_id, data in pedidos:
+            segunda = segunda_feira(data)
+            carregar_semanas(conn, [profissional_id], segunda, segunda + timedelta(weeks=3))
+        direto = relogio.perf_counter() - inicio
+
+    calendario = CalendarioProfissionais(bind=engine)
+    inicio = relogio.perf_counter()
+    for profissional_id, data in pedidos:
+        calendario.eventos(profissional_id, data, data + timedelta(weeks=4) - timedelta(days=1))
+    memorizado = relogio.perf_counter() - inicio
+    estatisticas = calendario.estatisticas()
+    print(f"visualizações de 4 semanas: direto {args.visualizacoes / direto:8.0f}/s   "
+          f"memorizado {args.visualizacoes / memorizado:8.0f}/s   "
+          f"(acerto {estatisticas['taxa_acerto']:.0%}, {estatisticas['tamanho']} semanas em cache)")
+
+    inicio_ano = DATA_REFERENCIA - timedelta(days=182)
+    fim_ano = inicio_ano + timedelta(days=364)
+
+    def em_memoria():
+        with engine.connect() as conn:
+            eventos = list(iterar_eventos(conn, ids, inicio_ano, fim_ano))
+        return len("".join(linhas_ical(eventos)))
+
+    def em_streaming():
+        return sum(len(linha) for linha in exportar_ical(inicio_ano, fim_ano, bind=engine))
+
+    for nome, funcao in (("texto inteiro", em_memoria), ("streaming", em_streaming)):
+        tamanho, duracao, pico = medir_pico(funcao)
+        print(f"exportação de um ano ({nome}): {tamanho / 2 ** 20:6.1f} MB de iCal em {duracao:5.1f} s, "
+              f"pico de memória {pico:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark do ciclo de vida dos agendamentos (ciclo_agendamento.py).
+
+Sobre duas cópias do mesmo banco sintético (gerador_dados.py):
+  - fim do dia: as consultas confirmadas das próximas semanas viram
+    Concluido e as pendentes são canceladas, pelo ORM (carrega cada
+    agendamento, registrar_conclusao / cancelar e o pagamento pendente como
+    Falhou, um commit no fim) contra fechar_dia (UPDATEs guardados pelo
+    status, em lotes); confere que os status finais, dos agendamentos e dos
+    pagamentos, e o histórico gravado são iguais nas duas cópias;
+  - cancelamentos feitos por usuários (ciclo_agendamento.cancelar), para
+    ter autores no histórico;
+  - leitura do histórico: "o que aconteceu com este agendamento" e "o que
+    este usuário alterou na semana", com objetos do ORM contra as
+    consultas do Core de ciclo_agendamento.
+
+Uso: python bench_ciclo_agendamento.py [--linhas 200000] [--semanas 4] [--consultas 2000] [--semente 42]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time as relogio
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import ciclo_agendamento
+from conexao import criar_engine
+from gerador_dados import DATA_REFERENCIA, gerar_banco
+from Model import Agendamento, HistoricoStatusAgendamento, Pagamento
+
+N_AUTORES = 50
+
+
+def fechar_dia_orm(engine, data):
+    """ O fim do dia como seria feito objeto a objeto. """
+    with Session(engine) as session:
+        for agendamento in session.scalars(select(Agendamento).where(
+                Agendamento.data_consulta <= data, Agendamento.status.in_(("Confirmado", "Pendente")))):
+            if agendamento.status == "Confirmado":
+                agendamento.registrar_conclusao()
+            elif agendamento.cancelar(motivo="não paga até a consulta") and agendamento.pagamento is not None:
+                agendamento.pagamento.mudar_status("Falhou")
+        session.commit()
+
+
+def estado(engine):
+    """ Status de cada agendamento e pagamento e (agendamento, de, para) de cada linha do histórico. """
+    tabela = HistoricoStatusAgendamento.__table__
+    with engine.connect() as conn:
+        status = dict(conn.execute(select(Agendamento.id_agendamento, Agendamento.status)).all())
+        pagamentos = dict(conn.execute(select(Pagamento.id_transacao, Pagamento.status)).all())
+        historico = sorted(conn.execute(select(tabela.c.agendamento_id, tabela.c.status_anterior,
+                                               tabela.c.status_novo)).all())
+    return status, pagamentos, historico
+
+
+def cronometrar(funcao, argumentos):
+    inicio = relogio.perf_counter()
+    linhas = sum(len(funcao(*argumento)) for argumento in argumentos)
+    return (relogio.perf_counter() - inicio) / len(argumentos) * 1000, linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--semanas", type=int, default=4, help="semanas à frente fechadas de uma vez")
+    parser.add_argument("--consultas", type=int, default=2000, help="leituras do histórico medidas")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    arquivo_orm, arquivo_lote = os.path.join(pasta, "orm.db"), os.path.join(pasta, "lote.db")
+    engine = criar_engine(f"sqlite:///{arquivo_orm}")
+    gerar_banco(engine, args.linhas, args.semente)
+    # Fecha as conexões (checkpoint do WAL) antes de copiar só o arquivo principal
+    engine.dispose()
+    shutil.copy(arquivo_orm, arquivo_lote)
+    engine_orm, engine_lote = criar_engine(f"sqlite:///{arquivo_orm}"), criar_engine(f"sqlite:///{arquivo_lote}")
+    data = DATA_REFERENCIA + timedelta(weeks=args.semanas)
+
+    inicio = relogio.perf_counter()
+    fechar_dia_orm(engine_orm, data)
+    s_orm = relogio.perf_counter() - inicio
+    inicio = relogio.perf_counter()
+    resumo = ciclo_agendamento.fechar_dia(engine_lote, data)
+    s_lote = relogio.perf_counter() - inicio
+    total = resumo["concluidas"] + resumo["expiradas"]
+    confere = estado(engine_orm) == estado(engine_lote)
+    print(f"fim do dia até {data}: {resumo['concluidas']} concluídas, {resumo['expiradas']} canceladas "
+          f"({resumo['pagamentos_cancelados']} pagamentos como Falhou)")
+    print(f"    ORM {s_orm:6.2f} s ({total / s_orm:7.0f}/s)   fechar_dia {s_lote:6.2f} s ({total / s_lote:7.0f}/s)   "
+          f"({s_orm / s_lote:4.1f}x)   confere: {'sim' if confere else 'NÃO'}")
+
+    # Cancelamentos pelas telas, cada autor com a sua lista
+    rnd = random.Random(args.semente)
+    with engine_lote.begin() as conn:
+        futuros = conn.execute(select(Agendamento.id_agendamento).where(
+            Agendamento.data_consulta > data, Agendamento.status.in_(("Confirmado", "Pendente")))).scalars().all()
+        por_autor = defaultdict(list)
+        for agendamento_id in rnd.sample(futuros, min(len(futuros), args.consultas * 5)):
+            por_autor[rnd.randrange(1, N_AUTORES + 1)].append(agendamento_id)
+        inicio = relogio.perf_counter()
+        cancelados = sum(sum(map(len, ciclo_agendamento.cancelar(conn, ids, por=autor,
+                                                                 motivo="pedido do paciente").values()))
+                         for autor, ids in por_autor.items())
+    print(f"{cancelados} cancelamentos de {len(por_autor)} usuários em "
+          f"{(relogio.perf_counter() - inicio) * 1000:.0f} ms")
+
+    with engine_lote.connect() as conn:
+        alterados = conn.execute(select(HistoricoStatusAgendamento.agendamento_id).distinct()).scalars().all()
+        linhas_historico = conn.execute(select(func.count()).select_from(HistoricoStatusAgendamento)).scalar()
+    agendamentos = [(agendamento_id,) for agendamento_id in rnd.choices(alterados, k=args.consultas)]
+    hoje = datetime.utcnow()
+    periodos = [(autor, hoje - timedelta(days=7), hoje + timedelta(days=1)) for autor in range(1, N_AUTORES + 1)]
+    print(f"histórico: {linhas_historico} linhas")
+
+    with Session(engine_lote) as session:
+        def historico_orm(agendamento_id):
+            return session.scalars(select(HistoricoStatusAgendamento)
+                                   .where(HistoricoStatusAgendamento.agendamento_id == agendamento_id)
+                                   .order_by(HistoricoStatusAgendamento.id_historico)).all()
+
+        def autor_orm(usuario_id, de, ate):
+            return session.scalars(select(HistoricoStatusAgendamento).where(
+                HistoricoStatusAgendamento.alterado_por == usuario_id,
+                HistoricoStatusAgendamento.alterado_em >= de, HistoricoStatusAgendamento.alterado_em < ate)
+                .order_by(HistoricoStatusAgendamento.alterado_em)).all()
+
+        ms_orm, linhas_orm = cronometrar(historico_orm, agendamentos)
+        ms_autor_orm, autor_linhas_orm = cronometrar(autor_orm, periodos)
+    with engine_lote.connect() as conn:
+        ms_core, linhas_core = cronometrar(lambda i: ciclo_agendamento.historico(conn, i), agendamentos)
+        ms_autor_core, autor_linhas_core = cronometrar(
+            lambda *periodo: ciclo_agendamento.alteracoes_do_usuario(conn, *periodo), periodos)
+    print(f"por agendamento   ORM {ms_orm:7.3f} ms   Core {ms_core:7.3f} ms   ({ms_orm / ms_core:4.1f}x)   "
+          f"confere: {'sim' if linhas_orm == linhas_core else 'NÃO'}")
+    print(f"por usuário       ORM {ms_autor_orm:7.3f} ms   Core {ms_autor_core:7.3f} ms   "
+          f"({ms_autor_orm / ms_autor_core:4.1f}x)   confere: {'sim' if autor_linhas_orm == autor_linhas_core else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
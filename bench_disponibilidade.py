@@ -0,0 +1,96 @@
+"""
+Benchmark da busca de horários disponíveis.
+
+Cria um banco em memória com N profissionais (agenda de segunda a sexta,
+8h às 18h) e agendamentos aleatórios, e mede o tempo de uma busca de um mês:
+completa, só os primeiros horários (limite) e percorrendo a busca completa
+com iterar_horarios_disponiveis sem guardar a lista.
+
+Uso: python bench_disponibilidade.py [--profissionais 2000] [--dias 30]
+"""
+import argparse
+import random
+import time as relogio
+from datetime import date, time, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Profissional, Paciente, AgendaProfissional, Agendamento
+from disponibilidade import buscar_horarios_disponiveis, iterar_horarios_disponiveis
+
+
+def popular(engine, n_profissionais, data_inicio, dias, ocupacao=0.3, semente=42):
+    """ Insere profissionais, agendas e agendamentos sintéticos. """
+    rnd = random.Random(semente)
+    n_usuarios = n_profissionais + 1
+    usuarios = [
+        dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x",
+             RG=f"RG{i}", CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+        for i in range(1, n_usuarios + 1)
+    ]
+    profissionais = [
+        dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}",
+             valor_consulta=200)
+        for i in range(1, n_profissionais + 1)
+    ]
+    agendas = [
+        dict(profissional_id=i, dia_semana=dia, hora_inicio=time(8), hora_fim=time(18), disponivel=True)
+        for i in range(1, n_profissionais + 1)
+        for dia in AgendaProfissional.OPCOES_DIA_SEMANA[:5]
+    ]
+    agendamentos = []
+    for dia in range(dias):
+        data = data_inicio + timedelta(days=dia)
+        if data.weekday() >= 5:
+            continue
+        for i in range(1, n_profissionais + 1):
+            for hora in range(8, 18):
+                if rnd.random() < ocupacao:
+                    agendamentos.append(dict(profissional_id=i, paciente_id=n_usuarios, data_consulta=data,
+                                             hora_consulta=time(hora), status="Confirmado"))
+
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), usuarios)
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=n_usuarios)])
+        conn.execute(insert(Profissional.__table__), profissionais)
+        conn.execute(insert(AgendaProfissional.__table__), agendas)
+        conn.execute(insert(Agendamento.__table__), agendamentos)
+    return len(agendamentos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profissionais", type=int, default=2000)
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = criar_engine("sqlite://")
+    init_db(engine)
+    data_inicio = date(2025, 11, 3)
+    data_fim = data_inicio + timedelta(days=args.dias - 1)
+    n_agendamentos = popular(engine, args.profissionais, data_inicio, args.dias)
+
+    print(f"profissionais={args.profissionais} dias={args.dias} agendamentos={n_agendamentos}")
+    with Session(engine) as session:
+        for rotulo, limite in (("busca completa", None), ("primeiros 1000", 1000), ("primeiros 100", 100),
+                               ("primeiros 10", 10)):
+            tempos = []
+            for _ in range(args.repeticoes):
+                inicio = relogio.perf_counter()
+                livres = buscar_horarios_disponiveis(session, "Psicólogo", data_inicio, data_fim,
+                                                     duracao_minutos=60, limite=limite)
+                tempos.append(relogio.perf_counter() - inicio)
+            tempos.sort()
+            print(f"{rotulo}: {len(livres)} horarios  melhor={tempos[0] * 1000:.1f} ms  "
+                  f"mediana={tempos[len(tempos) // 2] * 1000:.1f} ms")
+        inicio = relogio.perf_counter()
+        total = sum(1 for _ in iterar_horarios_disponiveis(session, "Psicólogo", data_inicio, data_fim,
+                                                           duracao_minutos=60))
+        print(f"busca completa iterada: {total} horarios  {(relogio.perf_counter() - inicio) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark da engine configurada (conexao.criar_engine) contra a engine padrão.
+
+Para cada engine, em um arquivo SQLite novo:
+  - inserts: N transações pequenas (um INSERT + commit cada, como em uma API web)
+  - leituras: várias threads fazendo consultas por chave primária
+  - misto: as mesmas leituras com uma thread gravando ao mesmo tempo
+
+Uso: python bench_engine.py [--inserts 2000] [--leituras 20000] [--threads 8]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time as relogio
+
+from sqlalchemy import create_engine, insert, select
+
+from Model import init_db, Usuario, Notificacao
+from conexao import criar_engine
+
+
+def _preparar(engine):
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [dict(
+            id_usuario=1, nome="Bench", email="bench@bench.com", senha="x", RG="RG1", CPF="CPF1",
+            genero="Outro", telefone="tel1", termos_aceitos=True)])
+
+
+def _inserir(engine, n, inicio_id=0):
+    tabela = Notificacao.__table__
+    for i in range(n):
+        with engine.begin() as conn:
+            conn.execute(insert(tabela).values(
+                usuario_id=1, tipo_notificacao="Alerta Sistema", mensagem=f"mensagem {inicio_id + i}"))
+
+
+def _ler(engine, n_leituras, n_threads, maior_id):
+    tabela = Notificacao.__table__
+    por_thread = n_leituras // n_threads
+
+    def trabalhador(semente):
+        rnd = random.Random(semente)
+        with engine.connect() as conn:
+            for _ in range(por_thread):
+                conn.execute(select(tabela.c.mensagem).where(
+                    tabela.c.id_notificacao == rnd.randint(1, maior_id))).first()
+                conn.rollback()
+
+    threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(n_threads)]
+    inicio = relogio.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return por_thread * n_threads / (relogio.perf_counter() - inicio)
+
+
+def medir(nome, engine, args):
+    _preparar(engine)
+
+    inicio = relogio.perf_counter()
+    _inserir(engine, args.inserts)
+    inserts_s = args.inserts / (relogio.perf_counter() - inicio)
+
+    leituras_s = _ler(engine, args.leituras, args.threads, args.inserts)
+
+    # Leituras com um escritor concorrente
+    escritor = threading.Thread(target=_inserir, args=(engine, args.inserts // 4, args.inserts))
+    escritor.start()
+    misto_s = _ler(engine, args.leituras, args.threads, args.inserts)
+    escritor.join()
+
+    print(f"{nome:<12} inserts/s={inserts_s:8.0f}  leituras/s={leituras_s:8.0f}  "
+          f"leituras/s com escritor={misto_s:8.0f}")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--leituras", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    padrao = create_engine(f"sqlite:///{os.path.join(diretorio, 'padrao.db')}")
+    configurada = criar_engine(f"sqlite:///{os.path.join(diretorio, 'configurada.db')}")
+
+    medir("padrao", padrao, args)
+    medir("configurada", configurada, args)
+
+
+if __name__ == "__main__":
+    main()
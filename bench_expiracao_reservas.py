@@ -0,0 +1,118 @@
+"""
+Benchmark da expiração de reservas não pagas (expiracao_reservas.py).
+
+Sobre um banco sintético (gerador_dados.py) em que todas as reservas
+pendentes seguram horário com prazo no futuro, vence o prazo de N delas
+(N = 10, 100, 1000, ...) e compara, em duas cópias do banco:
+
+  - a varredura do ORM: carrega os agendamentos pendentes com o pagamento,
+    confere o prazo em Python, cancela os vencidos e marca o pagamento como
+    Falhou (o custo cresce com o número de pendentes);
+  - expirar_reservas: faixa do índice (status, prazo_reserva) e UPDATEs em
+    lote (o custo cresce com o número de vencidas);
+
+conferindo que os status finais de agendamentos e pagamentos são iguais.
+Mostra também o custo de metricas() (contagens pelo mesmo índice).
+
+Uso: python bench_expiracao_reservas.py [--linhas 200000] [--vencidas 10,100,1000,5000] [--semente 42]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time as relogio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from expiracao_reservas import VarredorReservas, expirar_reservas
+from gerador_dados import gerar_banco
+from Model import Agendamento, Pagamento
+
+AGORA = datetime(2025, 6, 2, 12, 0)
+
+
+def varrer_orm(engine, agora):
+    """ A expiração como seria feita objeto a objeto. """
+    with Session(engine) as session:
+        for agendamento in session.scalars(select(Agendamento).where(Agendamento.status == "Pendente")):
+            if agendamento.prazo_reserva is not None and agendamento.prazo_reserva < agora:
+                agendamento.cancelar(motivo="reserva expirada")
+                if agendamento.pagamento is not None:
+                    agendamento.pagamento.mudar_status("Falhou")
+        session.commit()
+
+
+def estado(engine):
+    with engine.connect() as conn:
+        return (conn.execute(select(Agendamento.id_agendamento, Agendamento.status)
+                             .order_by(Agendamento.id_agendamento)).all(),
+                conn.execute(select(Pagamento.id_transacao, Pagamento.status)
+                             .order_by(Pagamento.id_transacao)).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--vencidas", default="10,100,1000,5000")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    original = os.path.join(pasta, "original.db")
+    engine = criar_engine(f"sqlite:///{original}")
+    gerar_banco(engine, args.linhas, args.semente)
+    # O gerador não define prazos: todas as pendentes seguram o horário até amanhã
+    with engine.begin() as conn:
+        conn.execute(update(Agendamento).where(Agendamento.status == "Pendente")
+                     .values(prazo_reserva=AGORA + timedelta(days=1)))
+        pendentes = conn.execute(select(Agendamento.id_agendamento)
+                                 .where(Agendamento.status == "Pendente")).scalars().all()
+    engine.dispose()
+    print(f"{len(pendentes)} reservas pendentes segurando horário")
+
+    rnd = random.Random(args.semente)
+    for quantidade in (int(n) for n in args.vencidas.split(",")):
+        quantidade = min(quantidade, len(pendentes))
+        ids = rnd.sample(pendentes, quantidade)
+        engines = []
+        for nome in ("orm.db", "lote.db"):
+            shutil.copy(original, os.path.join(pasta, nome))
+            copia = criar_engine(f"sqlite:///{os.path.join(pasta, nome)}")
+            with copia.begin() as conn:
+                conn.execute(update(Agendamento).where(Agendamento.id_agendamento.in_(ids))
+                             .values(prazo_reserva=AGORA - timedelta(minutes=1)))
+            engines.append(copia)
+        engine_orm, engine_lote = engines
+
+        inicio = relogio.perf_counter()
+        varrer_orm(engine_orm, AGORA)
+        ms_orm = (relogio.perf_counter() - inicio) * 1000
+        varredor = VarredorReservas(bind=engine_lote)
+        inicio = relogio.perf_counter()
+        metricas = varredor.metricas(AGORA)
+        ms_metricas = (relogio.perf_counter() - inicio) * 1000
+        inicio = relogio.perf_counter()
+        expiradas = varredor.executar_ciclo(AGORA)
+        ms_lote = (relogio.perf_counter() - inicio) * 1000
+        confere = estado(engine_orm) == estado(engine_lote) and expiradas == quantidade
+        print(f"{quantidade:6d} vencidas: ORM {ms_orm:8.1f} ms   expirar_reservas {ms_lote:7.1f} ms   "
+              f"({ms_orm / ms_lote:6.1f}x)   metricas() {ms_metricas:5.1f} ms "
+              f"(em_espera={metricas['em_espera']}, vencidas={metricas['vencidas']})   "
+              f"confere: {'sim' if confere else 'NÃO'}")
+        for copia in engines:
+            copia.dispose()
+
+    # Varredura sem nada vencido: só a busca vazia no índice
+    engine = criar_engine(f"sqlite:///{original}")
+    inicio = relogio.perf_counter()
+    for _ in range(100):
+        expirar_reservas(engine, AGORA)
+    print(f"varredura sem vencidas: {(relogio.perf_counter() - inicio) * 10:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark da importação em massa.
+
+Gera um CSV sintético (metade pacientes, metade profissionais, com
+endereço e uma fração de linhas duplicadas/inválidas), importa com
+importacao.importar e compara com a criação objeto a objeto via ORM,
+como em teste.py (add + commit por entidade).
+
+O custo do hash de senha é reduzido aqui (PBKDF2 com poucas iterações)
+para medir a importação em si; o custo real do hash é medido em
+bench_senhas.py.
+
+Uso: python bench_importacao.py [--linhas 50000] [--linhas-orm 2000]
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time as relogio
+
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Paciente, Profissional, Endereco
+from importacao import importar, ler_registros, validar_registro
+from seguranca import definir_custo
+
+COLUNAS = ["tipo", "nome", "email", "senha", "data_de_nascimento", "RG", "CPF", "genero", "telefone",
+           "termos_aceitos", "historico_medico", "tipo_de_especialidade", "crp_cnr_cref", "valor_consulta",
+           "cep", "logradouro", "numero", "complemento", "bairro", "cidade", "estado"]
+
+
+def gerar_csv(caminho, n_linhas, taxa_problemas=0.02, semente=7):
+    """ Escreve um CSV sintético; ~taxa_problemas das linhas repetem um CPF ou vêm sem email. """
+    rnd = random.Random(semente)
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=COLUNAS)
+        escritor.writeheader()
+        for i in range(n_linhas):
+            profissional = i % 2 == 1
+            linha = dict(
+                tipo="profissional" if profissional else "paciente", nome=f"Pessoa {i}",
+                email=f"pessoa{i}@clinica.com", senha="senha", data_de_nascimento="1990-01-01",
+                RG=f"RG{i:09d}", CPF=f"{i:011d}", genero="Prefiro não informar", telefone=f"11{i:09d}",
+                termos_aceitos="sim", historico_medico="" if profissional else "sem observações",
+                tipo_de_especialidade="Nutricionista" if profissional else "",
+                crp_cnr_cref=f"CRN-{i}" if profissional else "", valor_consulta="150.00" if profissional else "",
+                cep="01000-000", logradouro="Rua B", numero=str(i % 500), complemento="", bairro="Centro",
+                cidade="São Paulo", estado="SP",
+            )
+            if i > 0 and rnd.random() < taxa_problemas:
+                if rnd.random() < 0.5:
+                    linha["CPF"] = f"{rnd.randrange(i):011d}"   # colide com uma linha anterior
+                else:
+                    linha["email"] = ""                          # inválida
+            escritor.writerow(linha)
+
+
+def importar_orm(caminho, engine, limite):
+    """ Caminho antigo: objetos ORM com um commit por entidade. """
+    inicio = relogio.perf_counter()
+    n = 0
+    with Session(engine) as session:
+        for registro in ler_registros(caminho):
+            if n >= limite:
+                break
+            try:
+                tipo, usuario, perfil, endereco = validar_registro(registro)
+            except ValueError:
+                continue
+            n += 1
+            novo = Usuario(**{c: usuario[c] for c in ("email", "senha", "termos_aceitos", "nome", "data_de_nascimento",
+                                                     "RG", "CPF", "genero", "telefone")})
+            session.add(novo)
+            try:
+                session.commit()
+            except Exception:
+                session.rollback()
+                continue
+            end = Endereco(**endereco)
+            session.add(end)
+            session.commit()
+            if tipo == "paciente":
+                perfil_obj = Paciente(id_paciente=novo.id_usuario)
+                perfil_obj.historico_medico = perfil["historico_medico"]
+            else:
+                perfil_obj = Profissional(id_profissional=novo.id_usuario, tipo_de_especialidade=perfil["tipo_de_especialidade"],
+                                          crp_cnr_cref=perfil["crp_cnr_cref"], valor_consulta=perfil["valor_consulta"])
+            perfil_obj.endereco_id = end.id_endereco
+            session.add(perfil_obj)
+            session.commit()
+    return n / (relogio.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=50000)
+    parser.add_argument("--linhas-orm", type=int, default=2000)
+    parser.add_argument("--lote", type=int, default=5000)
+    args = parser.parse_args()
+    definir_custo("pbkdf2_sha256", iteracoes=1000)
+
+    diretorio = tempfile.mkdtemp()
+    caminho_csv = os.path.join(diretorio, "clinica.csv")
+    gerar_csv(caminho_csv, args.linhas)
+
+    engine = criar_engine(f"sqlite:///{os.path.join(diretorio, 'importacao.db')}")
+    relatorio = importar(caminho_csv, os.path.join(diretorio, "rejeitados.jsonl"), args.lote, bind=engine)
+    print(f"importacao em lote: {relatorio}")
+
+    engine_orm = criar_engine(f"sqlite:///{os.path.join(diretorio, 'orm.db')}")
+    init_db(engine_orm)
+    print(f"ORM linha a linha: {importar_orm(caminho_csv, engine_orm, args.linhas_orm):.0f} linhas/s "
+          f"(primeiras {args.linhas_orm} linhas)")
+
+
+if __name__ == "__main__":
+    main()
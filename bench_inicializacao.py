@@ -0,0 +1,85 @@
+"""
+Benchmark do tempo de inicialização.
+
+Mede, em processos novos:
+  - import Model a frio (sem bytecode em cache) e a quente (com cache)
+  - init_db() em um banco vazio (cria o esquema)
+  - init_db() em um banco já na versão atual (só o PRAGMA user_version)
+  - create_all() em um banco já criado (o custo que antes era pago em todo import)
+
+Uso: python bench_inicializacao.py [--repeticoes 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+DIRETORIO_PROJETO = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT_IMPORT = """
+import time
+inicio = time.perf_counter()
+import Model
+print(time.perf_counter() - inicio)
+"""
+
+SCRIPT_INIT_DB = """
+import Model, time
+inicio = time.perf_counter()
+Model.init_db()
+print(time.perf_counter() - inicio)
+"""
+
+SCRIPT_CREATE_ALL = """
+import Model, time
+inicio = time.perf_counter()
+Model.Base.metadata.create_all(Model.engine)
+print(time.perf_counter() - inicio)
+"""
+
+
+def _rodar(script, url, cache_vazio=None):
+    ambiente = dict(os.environ, TCC_DATABASE_URL=url)
+    if cache_vazio:
+        # A frio: nenhum .pyc é lido nem gravado
+        ambiente.update(PYTHONPYCACHEPREFIX=cache_vazio, PYTHONDONTWRITEBYTECODE="1")
+    saida = subprocess.run([sys.executable, "-c", script], cwd=DIRETORIO_PROJETO, env=ambiente,
+                           capture_output=True, text=True, check=True)
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def _mediana(valores):
+    valores = sorted(valores)
+    return valores[len(valores) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    url = f"sqlite:///{os.path.join(diretorio, 'inicializacao.db')}"
+
+    cache_vazio = os.path.join(diretorio, "sem_cache")
+    frio = [_rodar(SCRIPT_IMPORT, url, cache_vazio) for _ in range(args.repeticoes)]
+    _rodar(SCRIPT_IMPORT, url)
+    quente = [_rodar(SCRIPT_IMPORT, url) for _ in range(args.repeticoes)]
+
+    banco_vazio = []
+    for i in range(args.repeticoes):
+        url_vazio = f"sqlite:///{os.path.join(diretorio, f'vazio{i}.db')}"
+        banco_vazio.append(_rodar(SCRIPT_INIT_DB, url_vazio))
+    banco_atual = [_rodar(SCRIPT_INIT_DB, url) for _ in range(args.repeticoes)]
+    create_all = [_rodar(SCRIPT_CREATE_ALL, url) for _ in range(args.repeticoes)]
+
+    print(f"import Model a frio:              {_mediana(frio) * 1000:7.1f} ms")
+    print(f"import Model a quente:            {_mediana(quente) * 1000:7.1f} ms")
+    print(f"init_db() em banco vazio:         {_mediana(banco_vazio) * 1000:7.1f} ms")
+    print(f"init_db() com esquema atual:      {_mediana(banco_atual) * 1000:7.1f} ms")
+    print(f"create_all() com esquema criado:  {_mediana(create_all) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark da instrumentação das consultas.
+
+Mede o custo por comando de uma consulta curta (SELECT por chave
+primária) em quatro situações, sobre o mesmo banco:
+  - sem instrumentação;
+  - instrumentação instalada e depois removida (nenhum listener fica
+    registrado, mas o SQLAlchemy mantém a engine no caminho com eventos);
+  - dois listeners vazios (before/after_cursor_execute), para separar o
+    custo do próprio mecanismo de eventos do SQLAlchemy;
+  - instrumentação ligada.
+Depois roda uma consulta lenta (LIKE sem índice) para mostrar o log com o
+EXPLAIN QUERY PLAN e um trecho da exportação no formato do Prometheus.
+
+Uso: python bench_instrumentacao.py [--consultas 20000] [--repeticoes 5] [--usuarios 100000]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time as relogio
+
+from sqlalchemy import bindparam, event, func, insert, select
+
+from conexao import criar_engine
+from instrumentacao import Instrumentacao
+from Model import init_db, Usuario
+
+
+def popular(engine, n):
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, n + 1)])
+
+
+def micro_segundos_por_consulta(engine, n_consultas, n_usuarios):
+    consulta = select(Usuario.nome).where(Usuario.id_usuario == bindparam("id"))
+    with engine.connect() as conn:
+        inicio = relogio.perf_counter()
+        for i in range(n_consultas):
+            conn.execute(consulta, {"id": i % n_usuarios + 1}).scalar()
+        return (relogio.perf_counter() - inicio) / n_consultas * 1e6
+
+
+def _vazio(*_):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", type=int, default=20000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--usuarios", type=int, default=100000)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s")
+
+    caminho = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'instrumentacao.db')}"
+    engine = criar_engine(caminho)
+    init_db(engine)
+    popular(engine, args.usuarios)
+
+    # Uma engine por situação, sobre o mesmo arquivo; as rodadas são intercaladas para
+    # que variações da máquina afetem todas igualmente (vale o melhor tempo de cada uma)
+    removida, vazios, ligada = criar_engine(caminho), criar_engine(caminho), criar_engine(caminho)
+    Instrumentacao().instalar(removida).remover()
+    for nome in ("before_cursor_execute", "after_cursor_execute"):
+        event.listen(vazios, nome, _vazio)
+    instrumentacao = Instrumentacao(limite_lenta=0.005).instalar(ligada)
+    situacoes = {"sem instrumentacao": engine, "instalada e removida": removida,
+                 "listeners vazios": vazios, "ligada": ligada}
+    tempos = {nome: [] for nome in situacoes}
+    for rodada in range(args.repeticoes + 1):
+        for nome, alvo in situacoes.items():
+            tempo = micro_segundos_por_consulta(alvo, args.consultas, args.usuarios)
+            if rodada:  # a primeira só aquece caches
+                tempos[nome].append(tempo)
+    base = min(tempos["sem instrumentacao"])
+    for nome, medidas in tempos.items():
+        print(f"{nome + ':':<24} {min(medidas):6.2f} us/consulta ({(min(medidas) / base - 1) * 100:+.1f}%)")
+
+    with ligada.connect() as conn:
+        conn.execute(select(func.count()).where(Usuario.email.like("%999%"))).scalar()
+    lenta = instrumentacao.lentas[-1] if instrumentacao.lentas else None
+    if lenta:
+        print(f"consulta lenta registrada: {lenta['duracao'] * 1000:.1f} ms, plano: {lenta['plano']!r}")
+
+    prometheus = instrumentacao.exportar_prometheus()
+    dados = json.loads(instrumentacao.exportar_json())
+    print(f"prometheus: {len(prometheus.splitlines())} linhas; json: {len(dados['formas'])} formas, "
+          f"transacoes={dados['transacoes']['commit']} commits/{dados['transacoes']['rollback']} rollbacks")
+    print("\n".join(linha for linha in prometheus.splitlines() if "_count{" in linha))
+
+
+if __name__ == "__main__":
+    main()
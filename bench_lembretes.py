@@ -0,0 +1,121 @@
+"""
+Benchmark do agendador de lembretes.
+
+Gera um ano de agendamentos (padrão: ~1 milhão, de hora em hora para 200
+profissionais) e simula um dia do agendador, com uma rodada por minuto.
+Compara o tempo por rodada com a abordagem ingênua (ler todos os
+agendamentos confirmados a cada minuto e filtrar os vencidos) e confere
+que um segundo agendador, simulando um reinício, não gera lembretes
+duplicados.
+
+Uso: python bench_lembretes.py [--profissionais 200] [--dias 365]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, insert, select, text
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Paciente, Profissional, Agendamento, LembreteConsulta, \
+    Notificacao
+from lembretes import AgendadorLembretes, ANTECEDENCIAS_PADRAO
+
+N_PACIENTES = 10000
+HORARIOS = [time(h) for h in range(8, 22)]
+PRIMEIRO_DIA = date(2025, 1, 1)
+
+
+def popular(engine, n_profissionais, n_dias, semente=9):
+    rnd = random.Random(semente)
+    total = n_profissionais + N_PACIENTES
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, total + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}", valor_consulta=200)
+            for i in range(1, n_profissionais + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=i) for i in range(n_profissionais + 1, total + 1)])
+
+        for dia in range(n_dias):
+            data = PRIMEIRO_DIA + timedelta(days=dia)
+            conn.execute(insert(Agendamento.__table__), [
+                dict(profissional_id=p, paciente_id=rnd.randint(n_profissionais + 1, total),
+                     data_consulta=data, hora_consulta=hora, link_meet="https://meet.google.com/bench",
+                     status=rnd.choices(("Confirmado", "Pendente", "Cancelado"), (0.7, 0.2, 0.1))[0])
+                for p in range(1, n_profissionais + 1) for hora in HORARIOS])
+        conn.execute(text("ANALYZE"))
+
+
+def rodada_ingenua(engine, agora, antecedencias):
+    """ Lê todos os confirmados e filtra em Python os lembretes que vencem neste minuto. """
+    vencidos = []
+    with engine.connect() as conn:
+        for id_agendamento, data, hora in conn.execute(
+                select(Agendamento.id_agendamento, Agendamento.data_consulta, Agendamento.hora_consulta)
+                .where(Agendamento.status == "Confirmado")):
+            inicio = datetime.combine(data, hora)
+            for antecedencia in antecedencias:
+                if agora - timedelta(minutes=1) < inicio - antecedencia <= agora:
+                    vencidos.append(id_agendamento)
+    return vencidos
+
+
+def simular(engine, inicio, minutos):
+    agendador = AgendadorLembretes(bind=engine)
+    tempos = []
+    for minuto in range(minutos):
+        comeco = relogio.perf_counter()
+        agendador.executar_ciclo(inicio + timedelta(minutes=minuto))
+        tempos.append(relogio.perf_counter() - comeco)
+    return agendador, tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profissionais", type=int, default=200)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--rodadas-ingenuas", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'lembretes.db')}")
+    init_db(engine)
+    comeco = relogio.perf_counter()
+    popular(engine, args.profissionais, args.dias)
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(Agendamento.__table__)).scalar()
+    print(f"agendamentos={total} populados em {relogio.perf_counter() - comeco:.1f} s")
+
+    # Um dia inteiro, uma rodada por minuto, começando no meio do período
+    inicio = datetime.combine(PRIMEIRO_DIA + timedelta(days=args.dias // 2), time(0))
+    agendador, tempos = simular(engine, inicio, 24 * 60)
+    tempos.sort()
+    print(f"agendador: {agendador.gerados} lembretes em {len(tempos)} rodadas | "
+          f"media={sum(tempos) / len(tempos) * 1000:.2f} ms  p99={tempos[int(len(tempos) * 0.99)] * 1000:.2f} ms "
+          f"por rodada | recargas={agendador.recargas}")
+
+    tempos_ingenuos = []
+    for minuto in range(args.rodadas_ingenuas):
+        comeco = relogio.perf_counter()
+        rodada_ingenua(engine, inicio + timedelta(hours=9, minutes=minuto), ANTECEDENCIAS_PADRAO)
+        tempos_ingenuos.append(relogio.perf_counter() - comeco)
+    print(f"ingenuo:   media={sum(tempos_ingenuos) / len(tempos_ingenuos) * 1000:.2f} ms por rodada "
+          f"(varre todos os confirmados)")
+
+    # Reinício: um agendador novo passando pelo mesmo dia não pode gerar nada
+    reinicio, _ = simular(engine, inicio, 24 * 60)
+    with engine.connect() as conn:
+        notificacoes = conn.execute(select(func.count()).select_from(Notificacao.__table__).where(
+            Notificacao.tipo_notificacao == "Lembrete Consulta")).scalar()
+        registrados = conn.execute(select(func.count()).select_from(LembreteConsulta.__table__)).scalar()
+    print(f"reinicio: {reinicio.gerados} lembretes novos | registrados={registrados} "
+          f"notificacoes de lembrete={notificacoes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark do pool de links de reunião (links_reuniao.py).
+
+  - custo por link: random.choices (o gerador antigo), gerar_codigo_sala
+    (secrets, sem conferência de colisão) e PoolLinks.proximo_link, com 1
+    e com T threads tirando links do mesmo pool;
+  - reserva em massa: N agendamentos gravados pelo ORM em lotes, com o
+    provedor de vídeo chamado na hora para cada agendamento (uma
+    requisição de --latencia segundos por link) contra o pool instalado,
+    menor que N, reabastecido em segundo plano. No fim confere que todos
+    os agendamentos têm link, que não há links repetidos e que todos estão
+    em SALA_REUNIAO.
+
+Uso: python bench_links_reuniao.py [--agendamentos 5000] [--latencia 0.005] [--threads 8] [--capacidade 1000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time as relogio
+from datetime import date, time, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from links_reuniao import PoolLinks, ProvedorLocal, criar_salas
+from Model import init_db, gerar_codigo_sala, Agendamento, SalaReuniao
+
+LOTE_COMMIT = 200
+N_PROFISSIONAIS = 50
+
+
+def gerador_antigo():
+    return f"https://meet.google.com/{''.join(random.choices('abcdefghijkmnopqrstuvwxyz', k=10))}"
+
+
+def por_link(funcao, n, n_threads=1):
+    """ Microssegundos por chamada, com n chamadas divididas entre n_threads. """
+    def trabalhador(quantidade):
+        for _ in range(quantidade):
+            funcao()
+
+    threads = [threading.Thread(target=trabalhador, args=(n // n_threads,)) for _ in range(n_threads)]
+    inicio = relogio.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (relogio.perf_counter() - inicio) / n * 1e6
+
+
+def reservar(engine, n):
+    """ Grava n agendamentos em horários distintos, LOTE_COMMIT por commit. Devolve os segundos. """
+    inicio = relogio.perf_counter()
+    with Session(engine) as session:
+        for i in range(n):
+            dia, hora = divmod(i // N_PROFISSIONAIS, 10)
+            session.add(Agendamento(i % N_PROFISSIONAIS + 1, 1, date(2025, 6, 2) + timedelta(days=dia),
+                                    time(8 + hora)))
+            if (i + 1) % LOTE_COMMIT == 0:
+                session.commit()
+        session.commit()
+    return relogio.perf_counter() - inicio
+
+
+def conferir(engine, n):
+    with engine.connect() as conn:
+        total, com_link, distintos = conn.execute(select(
+            func.count(), func.count(Agendamento.link_meet), func.count(func.distinct(Agendamento.link_meet)))).one()
+        fora = conn.execute(select(func.count()).select_from(Agendamento).where(
+            Agendamento.link_meet.not_in(select(SalaReuniao.url)))).scalar()
+    return total == com_link == distintos == n and fora == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agendamentos", type=int, default=5000)
+    parser.add_argument("--latencia", type=float, default=0.005, help="segundos por chamada ao provedor")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--capacidade", type=int, default=1000)
+    parser.add_argument("--links", type=int, default=200000, help="chamadas medidas no custo por link")
+    args = parser.parse_args()
+    pasta = tempfile.mkdtemp()
+
+    # Custo por link
+    engine = criar_engine(f"sqlite:///{os.path.join(pasta, 'pool.db')}")
+    init_db(engine)
+    pool = PoolLinks(ProvedorLocal(latencia=0), bind=engine, capacidade=args.links * 2, lote=5000)
+    pool.reabastecer()
+    print(f"custo por link ({args.links} chamadas):")
+    print(f"    random.choices            {por_link(gerador_antigo, args.links):6.2f} µs")
+    print(f"    gerar_codigo_sala         {por_link(gerar_codigo_sala, args.links):6.2f} µs")
+    print(f"    proximo_link              {por_link(pool.proximo_link, args.links):6.2f} µs")
+    print(f"    proximo_link {args.threads} threads    {por_link(pool.proximo_link, args.links, args.threads):6.2f} µs   "
+          f"(faltas: {pool.faltas})")
+
+    # Reserva em massa
+    print(f"reserva de {args.agendamentos} agendamentos (provedor com {args.latencia * 1000:.0f} ms por chamada):")
+    engine = criar_engine(f"sqlite:///{os.path.join(pasta, 'na_hora.db')}")
+    init_db(engine)
+    provedor = ProvedorLocal(args.latencia)
+
+    def na_hora():
+        # Uma sala por agendamento, pedida ao provedor no __init__ (o caso sem pool)
+        with engine.begin() as conn:
+            return criar_salas(conn, provedor, 1)[0]
+
+    Agendamento.fornecedor_links = na_hora
+    segundos = reservar(engine, args.agendamentos)
+    Agendamento.fornecedor_links = None
+    print(f"    provedor na hora  {segundos:6.2f} s ({args.agendamentos / segundos:7.0f}/s)   "
+          f"chamadas ao provedor: {provedor.chamadas}   confere: {'sim' if conferir(engine, args.agendamentos) else 'NÃO'}")
+
+    engine = criar_engine(f"sqlite:///{os.path.join(pasta, 'pool_reserva.db')}")
+    init_db(engine)
+    provedor = ProvedorLocal(args.latencia)
+    pool = PoolLinks(provedor, bind=engine, capacidade=args.capacidade, minimo=args.capacidade // 2,
+                     lote=min(200, args.capacidade)).iniciar().instalar()
+    segundos = reservar(engine, args.agendamentos)
+    pool.parar()
+    # Os que ficaram sem link por falta no pool e a thread não chegou a completar
+    pool.completar_sem_link()
+    print(f"    pool ({args.capacidade})       {segundos:6.2f} s ({args.agendamentos / segundos:7.0f}/s)   "
+          f"chamadas ao provedor: {provedor.chamadas}   faltas: {pool.faltas} (completados depois: "
+          f"{pool.completados})   confere: {'sim' if conferir(engine, args.agendamentos) else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
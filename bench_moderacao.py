@@ -0,0 +1,133 @@
+"""
+Benchmark da fila de moderação (moderacao.py).
+
+Grava N avaliações pendentes (parte com ofensas, links ou telefones no
+comentário) e mede:
+  - a triagem do texto: Aho-Corasick contra procurar cada termo no texto
+    (`termo in texto`) e contra uma regex com todos os termos, com a lista
+    padrão e com uma lista grande de termos;
+  - a moderação: uma por uma pelo ORM (aprovar_avaliacao + commit, como
+    hoje) contra moderar_pendentes em lotes, em avaliações por segundo;
+e confere o agregado de notas contra avaliacoes.recalcular_agregados().
+
+Uso: python bench_moderacao.py [--avaliacoes 50000] [--orm 2000] [--lote 1000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import tempfile
+import time as relogio
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from avaliacoes import recalcular_agregados
+from conexao import criar_engine
+from moderacao import TERMOS_SUSPEITOS, AutomatoTermos, FiltroComentarios, moderar_pendentes, normalizar
+from Model import init_db, Usuario, Paciente, Profissional, Avaliacao, AvaliacaoAgregada
+
+N_PROFISSIONAIS = 200
+N_PACIENTES = 2000
+LIMPOS = ("Excelente profissional, muito atencioso.", "Gostei muito da consulta, recomendo.",
+          "Pontual, educado e explicou tudo com calma.", "A consulta ajudou bastante no meu tratamento.",
+          "Atendimento ok, mas a conexão caiu uma vez.", "Consulta rápida demais, esperava mais.")
+SUSPEITOS = ("Que lixo de atendimento.", "Isso é golpe, vou processar!", "Me chama no zap (11) 98765-4321",
+             "Faço mais barato: www.exemplo.com", "Profissional incompetente e ridícula.")
+
+
+def popular(engine, n, semente=5):
+    rnd = random.Random(semente)
+    ids = range(1, N_PROFISSIONAIS + N_PACIENTES + 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True) for i in ids])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP{i}", valor_consulta=150)
+            for i in range(1, N_PROFISSIONAIS + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=i) for i in ids[N_PROFISSIONAIS:]])
+        inicio = datetime(2025, 1, 1)
+        conn.execute(insert(Avaliacao.__table__), [
+            dict(paciente_id=rnd.randrange(N_PROFISSIONAIS + 1, N_PROFISSIONAIS + N_PACIENTES + 1),
+                 profissional_id=rnd.randrange(1, N_PROFISSIONAIS + 1), nota=rnd.choice((1, 3, 4, 5, 5, 5)),
+                 comentario=rnd.choice(SUSPEITOS) if rnd.random() < 0.05 else rnd.choice(LIMPOS + (None,)),
+                 data_avaliacao=inicio + timedelta(seconds=rnd.randrange(180 * 86400)), status="Pendente")
+            for _ in range(n)])
+        conn.execute(text("ANALYZE"))
+
+
+def medir_triagem(termos, textos):
+    """ Textos por segundo de cada forma de procurar os termos. """
+    automato = AutomatoTermos(termos)
+    chaves = [normalizar(termo) for termo in termos]
+    regex = re.compile("|".join(re.escape(chave) for chave in chaves))
+    formas = {
+        "termo in texto": lambda t: [chave for chave in chaves if chave in t],
+        "regex única": lambda t: regex.findall(t),
+        "aho-corasick": automato.encontrar,
+    }
+    normalizados = [normalizar(texto) for texto in textos]
+    resultados = {}
+    for nome, procurar in formas.items():
+        inicio = relogio.perf_counter()
+        for texto in normalizados:
+            procurar(texto)
+        resultados[nome] = len(normalizados) / (relogio.perf_counter() - inicio)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--avaliacoes", type=int, default=50000)
+    parser.add_argument("--orm", type=int, default=2000, help="avaliações moderadas uma a uma pelo ORM")
+    parser.add_argument("--lote", type=int, default=1000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    textos = [rnd.choice(LIMPOS + SUSPEITOS) * rnd.randint(1, 4) for _ in range(20000)]
+    grande = list(TERMOS_SUSPEITOS) + [f"termo{i} proibido{i % 37}" for i in range(2000)]
+    for nome, termos in (("lista padrão", TERMOS_SUSPEITOS), (f"{len(grande)} termos", grande)):
+        resultados = medir_triagem(termos, textos)
+        print(f"triagem ({nome}): " + "   ".join(f"{forma} {vazao:9.0f}/s" for forma, vazao in resultados.items()))
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'moderacao.db')}")
+    init_db(engine)
+    popular(engine, args.avaliacoes)
+
+    # Hoje: o moderador aprova uma por uma (imprime e faz commit a cada avaliação)
+    filtro = FiltroComentarios()
+    with Session(engine) as session, contextlib.redirect_stdout(io.StringIO()):
+        pendentes = session.scalars(select(Avaliacao).where(Avaliacao.status == "Pendente")
+                                    .order_by(Avaliacao.data_avaliacao).limit(args.orm)).all()
+        inicio = relogio.perf_counter()
+        for avaliacao in pendentes:
+            if filtro.motivos(avaliacao.comentario):
+                avaliacao.denunciar_avaliacao()
+            else:
+                avaliacao.aprovar_avaliacao()
+            session.commit()
+        orm = len(pendentes) / (relogio.perf_counter() - inicio)
+
+    resumo = moderar_pendentes(engine, filtro, tamanho_lote=args.lote)
+    lotes = resumo["processadas"] / resumo["segundos"]
+    print(f"moderação: ORM uma a uma {orm:8.0f}/s   em lotes {lotes:8.0f}/s "
+          f"({resumo['processadas']} processadas: {resumo['aprovadas']} aprovadas, "
+          f"{resumo['denunciadas']} denunciadas)")
+
+    with engine.connect() as conn:
+        restantes = conn.scalar(select(func.count()).where(Avaliacao.status == "Pendente"))
+        antes = conn.execute(select(AvaliacaoAgregada.__table__).order_by(AvaliacaoAgregada.profissional_id)).all()
+    recalcular_agregados(engine)
+    with engine.connect() as conn:
+        depois = conn.execute(select(AvaliacaoAgregada.__table__).order_by(AvaliacaoAgregada.profissional_id)).all()
+    # A média gravada incrementalmente pode diferir do AVG nas casas decimais: compara contagens e somas
+    iguais = [linha[:3] + linha[4:] for linha in antes] == [linha[:3] + linha[4:] for linha in depois]
+    print(f"pendentes restantes: {restantes}   agregado confere com o recálculo: {'sim' if iguais else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark das listagens de agendamentos (N+1).
+
+Lista N agendamentos com nome do paciente, do profissional e status do
+pagamento de dois jeitos, medindo com o DetectorNMais1:
+  - com lazy load em todas as relações (como antes das opções de
+    carregamento): o número de consultas cresce com N e o detector avisa;
+  - com consultas_agendamento.listar_agendamentos: número constante.
+
+Uso: python bench_n_mais_1.py [--tamanhos 10,100,1000]
+"""
+import argparse
+import os
+import tempfile
+import time as relogio
+import warnings
+from datetime import date, time, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, lazyload
+
+from conexao import criar_engine
+from consultas_agendamento import linha_exibicao, listar_agendamentos
+from diagnostico import AvisoNMais1, DetectorNMais1
+from Model import init_db, Usuario, Paciente, Profissional, Agendamento, Pagamento
+
+N_PROFISSIONAIS = 50
+HORARIOS = [time(h) for h in range(8, 22)]
+
+
+def popular(engine, n_agendamentos):
+    n_pacientes = n_agendamentos
+    total = N_PROFISSIONAIS + n_pacientes
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, total + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}", valor_consulta=200)
+            for i in range(1, N_PROFISSIONAIS + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=i) for i in range(N_PROFISSIONAIS + 1, total + 1)])
+        por_dia = N_PROFISSIONAIS * len(HORARIOS)
+        conn.execute(insert(Agendamento.__table__), [
+            dict(id_agendamento=i, profissional_id=i % N_PROFISSIONAIS + 1, paciente_id=N_PROFISSIONAIS + i,
+                 data_consulta=date(2025, 3, 1) + timedelta(days=i // por_dia),
+                 hora_consulta=HORARIOS[(i // N_PROFISSIONAIS) % len(HORARIOS)], link_meet="https://meet.google.com/b")
+            for i in range(1, n_agendamentos + 1)])
+        conn.execute(insert(Pagamento.__table__), [
+            dict(id_transacao=f"txn_{i:08d}", agendamento_id=i, valor=200, metodo="PIX", status="Aprovado")
+            for i in range(1, n_agendamentos + 1)])
+
+
+def listar_lazy(session, limite):
+    consulta = (select(Agendamento)
+                .options(lazyload(Agendamento.paciente).lazyload(Paciente.usuario),
+                         lazyload(Agendamento.profissional).lazyload(Profissional.usuario),
+                         lazyload(Agendamento.pagamento))
+                .order_by(Agendamento.data_consulta, Agendamento.hora_consulta, Agendamento.id_agendamento)
+                .limit(limite))
+    return session.scalars(consulta).all()
+
+
+def listar_otimizado(session, limite):
+    return listar_agendamentos(session, limite=limite)
+
+
+def medir(engine, detector, nome, listar, n):
+    with Session(engine) as session, warnings.catch_warnings(record=True) as avisos:
+        warnings.simplefilter("always", AvisoNMais1)
+        inicio = relogio.perf_counter()
+        with detector.unidade(nome) as relatorio:
+            linhas = [linha_exibicao(agendamento) for agendamento in listar(session, n)]
+        duracao = relogio.perf_counter() - inicio
+    assert len(linhas) == n
+    aviso = "AVISO N+1" if any(issubclass(a.category, AvisoNMais1) for a in avisos) else "ok"
+    print(f"{nome:<18} N={n:<5} {relatorio.total:5d} consultas  {duracao * 1000:8.1f} ms  {aviso}")
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="10,100,1000")
+    args = parser.parse_args()
+    tamanhos = [int(t) for t in args.tamanhos.split(",")]
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'n_mais_1.db')}")
+    init_db(engine)
+    popular(engine, max(tamanhos))
+    detector = DetectorNMais1().instalar(engine)
+
+    for n in tamanhos:
+        relatorio = medir(engine, detector, "lazy load", listar_lazy, n)
+        medir(engine, detector, "listar_agendamentos", listar_otimizado, n)
+    print(f"lazy loads na ultima listagem com lazy load: {dict(relatorio.lazy_loads)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark do despachante de notificações com o transporte local (sem rede).
+
+Enfileira um volume de notificações normais (Push, Email e SMS) e, enquanto
+o despachante esvazia a fila, grava alertas de emergência em intervalos
+regulares. Mostra a vazão (entregas por segundo), a latência das
+emergências (da gravação até a entrega) e quantas falhas simuladas foram
+reenviadas.
+
+Uso: python bench_notificacoes.py [--notificacoes 20000] [--emergencias 50] [--falhas 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time as relogio
+
+from sqlalchemy import func, insert, select
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Notificacao
+from notificacoes import DespachanteNotificacoes, TransporteLocal
+
+CANAIS = (("Push", 0.7), ("Email", 0.2), ("SMS", 0.1))
+
+
+def popular(engine, n_notificacoes, n_usuarios=1000, semente=5):
+    rnd = random.Random(semente)
+    canais = [canal for canal, _ in CANAIS]
+    pesos = [peso for _, peso in CANAIS]
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, n_usuarios + 1)])
+        conn.execute(insert(Notificacao.__table__), [
+            dict(usuario_id=rnd.randint(1, n_usuarios), tipo_notificacao="Lembrete Consulta",
+                 mensagem=f"Lembrete {i}", canal=rnd.choices(canais, pesos)[0])
+            for i in range(n_notificacoes)])
+
+
+def _gravar_emergencia(engine):
+    with engine.begin() as conn:
+        id_notificacao = conn.execute(
+            insert(Notificacao.__table__).values(
+                usuario_id=1, tipo_notificacao="Alerta Emergencia", mensagem="URGENTE", canal="SMS",
+                prioridade=Notificacao.PRIORIDADE_EMERGENCIA, destino="+5511999990000")
+            .returning(Notificacao.__table__.c.id_notificacao)
+        ).scalar_one()
+    return id_notificacao, relogio.perf_counter()
+
+
+async def _emergencias(engine, despachante, n, intervalo, gravadas):
+    for _ in range(n):
+        await asyncio.sleep(intervalo)
+        gravadas.append(await asyncio.to_thread(_gravar_emergencia, engine))
+        despachante.acordar()
+
+
+async def rodar(engine, args):
+    transporte = TransporteLocal(latencia=args.latencia, taxa_falha=args.falhas, semente=1)
+    despachante = DespachanteNotificacoes(transporte, bind=engine, tamanho_lote=args.lote,
+                                          espera_inicial=0.05, intervalo=0.05)
+    gravadas = []
+    inicio = relogio.perf_counter()
+    emergencias = asyncio.create_task(
+        _emergencias(engine, despachante, args.emergencias, args.intervalo_emergencias, gravadas))
+    await despachante.executar(ate_esvaziar=True)
+    await emergencias
+    # Falhas reagendadas para depois do fim da primeira passada e emergências atrasadas
+    while await asyncio.to_thread(_pendentes, engine):
+        await despachante.executar(ate_esvaziar=True)
+    return transporte, despachante, gravadas, relogio.perf_counter() - inicio
+
+
+def _pendentes(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Notificacao.__table__).where(
+            Notificacao.status_entrega.in_(("Pendente", "Enviando")))).scalar()
+
+
+def _percentis(valores):
+    valores = sorted(valores)
+    return (f"p50={valores[len(valores) // 2] * 1000:7.1f} ms  "
+            f"p99={valores[min(len(valores) - 1, int(len(valores) * 0.99))] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notificacoes", type=int, default=20000)
+    parser.add_argument("--emergencias", type=int, default=50)
+    parser.add_argument("--intervalo-emergencias", type=float, default=0.02)
+    parser.add_argument("--latencia", type=float, default=0.02, help="latência média do transporte (s)")
+    parser.add_argument("--falhas", type=float, default=0.05, help="probabilidade de falha por envio")
+    parser.add_argument("--lote", type=int, default=500)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'notificacoes.db')}")
+    init_db(engine)
+    popular(engine, args.notificacoes)
+
+    transporte, despachante, gravadas, duracao = asyncio.run(rodar(engine, args))
+
+    total = args.notificacoes + args.emergencias
+    latencias = [transporte.entregas[id_notificacao] - instante for id_notificacao, instante in gravadas]
+    print(f"notificacoes={total} entregues={len(transporte.entregas)} em {duracao:.2f} s "
+          f"({len(transporte.entregas) / duracao:.0f} entregas/s)")
+    print(f"falhas simuladas={transporte.falhas} (reenviadas com espera exponencial)")
+    print(f"latencia das emergencias: {_percentis(latencias)}")
+    with engine.connect() as conn:
+        estados = dict(conn.execute(select(Notificacao.status_entrega, func.count())
+                                    .group_by(Notificacao.status_entrega)).all())
+    print(f"status_entrega no banco: {estados}")
+
+
+if __name__ == "__main__":
+    main()
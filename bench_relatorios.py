@@ -0,0 +1,171 @@
+"""
+Benchmark dos relatórios operacionais (relatorios.py).
+
+Sobre um banco sintético (gerador_dados.py):
+  - extração completa para o armazém colunar e extração incremental
+    depois de alguns cancelamentos e reembolsos (linhas lidas e tempo);
+  - cada relatório (receita por especialidade, cancelamentos por
+    profissional, faltas por semana, ocupação da agenda, notas por
+    especialidade) com as consultas agrupadas do ORM no banco da aplicação
+    contra o NumPy sobre o armazém, conferindo que os resultados batem.
+
+Uso: python bench_relatorios.py [--linhas 200000] [--repeticoes 20] [--semente 42]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from conexao import criar_engine
+from gerador_dados import DATA_REFERENCIA, gerar_banco
+from relatorios import Relatorios, extrair
+from Model import AgendaProfissional, Agendamento, Avaliacao, Pagamento, Profissional
+
+INICIO = DATA_REFERENCIA - timedelta(weeks=13)
+FIM = DATA_REFERENCIA + timedelta(weeks=13)
+
+
+def receita_orm(session):
+    linhas = session.execute(
+        select(Profissional.tipo_de_especialidade, func.count(), func.sum(Pagamento.valor))
+        .join(Agendamento, Agendamento.id_agendamento == Pagamento.agendamento_id)
+        .join(Profissional, Profissional.id_profissional == Agendamento.profissional_id)
+        .where(Pagamento.status == "Aprovado", Pagamento.data_pagamento >= INICIO,
+               Pagamento.data_pagamento < FIM + timedelta(days=1))
+        .group_by(Profissional.tipo_de_especialidade)).all()
+    return {especialidade: (quantidade, round(float(receita), 2)) for especialidade, quantidade, receita in linhas}
+
+
+def cancelamentos_orm(session):
+    linhas = session.execute(
+        select(Agendamento.profissional_id, func.count(), func.sum(case((Agendamento.status == "Cancelado", 1),
+                                                                        else_=0)))
+        .where(Agendamento.data_consulta.between(INICIO, FIM))
+        .group_by(Agendamento.profissional_id)).all()
+    return {profissional_id: (total, cancelados) for profissional_id, total, cancelados in linhas}
+
+
+def faltas_orm(session):
+    # Segunda-feira da semana: volta 6 dias e avança até a próxima segunda
+    semana = func.date(Agendamento.data_consulta, "-6 days", "weekday 1")
+    linhas = session.execute(
+        select(semana, func.count(), func.sum(case((Agendamento.status == "Confirmado", 1), else_=0)))
+        .where(Agendamento.data_consulta.between(INICIO, min(FIM, DATA_REFERENCIA - timedelta(days=1))),
+               Agendamento.status.in_(("Confirmado", "Concluido")))
+        .group_by(semana)).all()
+    return {date.fromisoformat(inicio_semana): (consultas, faltas) for inicio_semana, consultas, faltas in linhas}
+
+
+def ocupacao_orm(session):
+    ocorrencias = defaultdict(int)
+    dia = INICIO
+    while dia <= FIM:
+        ocorrencias[AgendaProfissional.OPCOES_DIA_SEMANA[dia.weekday()]] += 1
+        dia += timedelta(days=1)
+    horarios = defaultdict(int)
+    for janela in session.scalars(select(AgendaProfissional).where(AgendaProfissional.disponivel.is_(True))):
+        minutos = (janela.hora_fim.hour * 60 + janela.hora_fim.minute) - \
+            (janela.hora_inicio.hour * 60 + janela.hora_inicio.minute)
+        horarios[janela.profissional_id] += max(minutos, 0) // 50 * ocorrencias[janela.dia_semana]
+    agendados = dict(session.execute(
+        select(Agendamento.profissional_id, func.count())
+        .where(Agendamento.data_consulta.between(INICIO, FIM), Agendamento.status != "Cancelado")
+        .group_by(Agendamento.profissional_id)).all())
+    return {pid: (total, agendados.get(pid, 0)) for pid, total in horarios.items() if total}
+
+
+def notas_orm(session):
+    linhas = session.execute(
+        select(Profissional.tipo_de_especialidade, func.count(), func.avg(Avaliacao.nota))
+        .join(Profissional, Profissional.id_profissional == Avaliacao.profissional_id)
+        .where(Avaliacao.status == "Aprovada")
+        .group_by(Profissional.tipo_de_especialidade)).all()
+    return {especialidade: (quantidade, round(media, 6)) for especialidade, quantidade, media in linhas}
+
+
+def relatorios_numpy(relatorios):
+    return {
+        "receita": lambda: {l.especialidade: (l.pagamentos, float(l.receita))
+                            for l in relatorios.receita_por_especialidade(INICIO, FIM)},
+        "cancelamentos": lambda: {l.profissional_id: (l.agendamentos, l.cancelados)
+                                  for l in relatorios.cancelamentos_por_profissional(INICIO, FIM)},
+        "faltas": lambda: {l.semana: (l.consultas, l.faltas)
+                           for l in relatorios.faltas_por_semana(INICIO, FIM, hoje=DATA_REFERENCIA)},
+        "ocupacao": lambda: {l.profissional_id: (l.horarios, l.agendados)
+                             for l in relatorios.ocupacao_agenda(INICIO, FIM)},
+        "notas": lambda: {l.especialidade: (l.avaliacoes, round(l.media, 6))
+                          for l in relatorios.notas_por_especialidade()},
+    }
+
+
+def cronometrar(funcao, repeticoes):
+    resultado = funcao()
+    inicio = relogio.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return resultado, (relogio.perf_counter() - inicio) / repeticoes * 1000
+
+
+def alterar(engine, rnd, quantidade):
+    """ Cancela agendamentos futuros e reembolsa os pagamentos deles (UPDATEs do Core). """
+    with engine.begin() as conn:
+        futuros = conn.execute(select(Agendamento.id_agendamento).where(
+            Agendamento.data_consulta >= DATA_REFERENCIA, Agendamento.status == "Confirmado")).scalars().all()
+        ids = rnd.sample(futuros, min(quantidade, len(futuros)))
+        conn.execute(update(Agendamento).where(Agendamento.id_agendamento.in_(ids)).values(status="Cancelado"))
+        conn.execute(update(Pagamento).where(Pagamento.agendamento_id.in_(ids), Pagamento.status == "Aprovado")
+                     .values(status="Reembolsado"))
+    return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    engine = criar_engine(f"sqlite:///{os.path.join(pasta, 'relatorios.db')}")
+    gerar_banco(engine, args.linhas, args.semente)
+    armazem = os.path.join(pasta, "armazem")
+    rnd = random.Random(args.semente)
+
+    inicio = relogio.perf_counter()
+    lidas = extrair(engine, armazem, completo=True)
+    print(f"extração completa: {sum(lidas.values())} linhas em {relogio.perf_counter() - inicio:.2f} s")
+    # O gerador grava atualizado_em com uma data fixa: a primeira alteração tira a marca d'água dela e a
+    # segunda mede o caso comum (AVALIACAO, que não muda aqui, continua relida inteira pela margem da marca)
+    alterar(engine, rnd, 50)
+    extrair(engine, armazem)
+    alteradas = alterar(engine, rnd, 50)
+    inicio = relogio.perf_counter()
+    lidas = extrair(engine, armazem)
+    print(f"extração incremental após {alteradas} cancelamentos: {lidas['agendamentos']} agendamentos, "
+          f"{lidas['pagamentos']} pagamentos, {lidas['avaliacoes']} avaliações em "
+          f"{(relogio.perf_counter() - inicio) * 1000:.0f} ms")
+
+    inicio = relogio.perf_counter()
+    relatorios = Relatorios(armazem)
+    print(f"abertura do armazém (mmap): {(relogio.perf_counter() - inicio) * 1000:.1f} ms")
+    consultas_orm = {"receita": receita_orm, "cancelamentos": cancelamentos_orm, "faltas": faltas_orm,
+                     "ocupacao": ocupacao_orm, "notas": notas_orm}
+    with Session(engine) as session:
+        for nome, funcao in relatorios_numpy(relatorios).items():
+            esperado, ms_orm = cronometrar(lambda: consultas_orm[nome](session), args.repeticoes)
+            obtido, ms_numpy = cronometrar(funcao, args.repeticoes)
+            if nome == "receita":
+                esperado = {chave: (q, round(v, 2)) for chave, (q, v) in esperado.items()}
+            confere = esperado == obtido
+            print(f"{nome:14s} ORM {ms_orm:8.2f} ms   NumPy {ms_numpy:8.3f} ms   "
+                  f"({ms_orm / ms_numpy:6.0f}x)   confere: {'sim' if confere else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
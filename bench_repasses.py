@@ -0,0 +1,127 @@
+"""
+Benchmark do fechamento de repasses.
+
+Popula (em blocos, para não inflar a memória do próprio benchmark) um mês
+com 1 milhão de pagamentos de 20 mil profissionais, alguns com dados
+bancários inválidos ou ausentes, e mede:
+  - o fechamento da competência e a exportação do arquivo do banco
+    (tempo e pico de memória alocada pelo Python, via tracemalloc; o RSS
+    do processo inclui também o mmap e o cache de páginas do SQLite);
+  - que a soma dos repasses bate com a soma dos pagamentos repassados;
+  - que rodar de novo não gera nada (idempotência).
+
+Uso: python bench_repasses.py [--pagamentos 1000000] [--profissionais 20000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as relogio
+import tracemalloc
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, insert, select
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Paciente, Profissional, DadosBancarios, Agendamento, Pagamento, Repasse
+from repasses import fechar_competencia, exportar_arquivo_banco
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COMPETENCIA = "2025-03"
+BLOCO = 50000
+HORARIOS = [time(h) for h in range(8, 22)]
+
+
+def _pico_memoria_mb():
+    if resource is None:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def popular(engine, n_pagamentos, n_profissionais, semente=23):
+    rnd = random.Random(semente)
+    id_paciente = n_profissionais + 1
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"{i:011d}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, id_paciente + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}", valor_consulta=200)
+            for i in range(1, n_profissionais + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=id_paciente)])
+        # 1% sem dados bancários e 5% com CPF/CNPJ inválido
+        conn.execute(insert(DadosBancarios.__table__), [
+            dict(profissional_id=i, banco="001", agencia="0001", conta=f"{i:08d}", digito_verificador="0",
+                 tipo_conta="Corrente", nome_titular=f"Usuario {i}",
+                 cpf_cnpj_titular="123" if rnd.random() < 0.05 else f"{i:011d}")
+            for i in range(1, n_profissionais + 1) if rnd.random() >= 0.01])
+
+    por_horario = n_profissionais * len(HORARIOS)
+    for inicio in range(1, n_pagamentos + 1, BLOCO):
+        ids = range(inicio, min(inicio + BLOCO, n_pagamentos + 1))
+        with engine.begin() as conn:
+            conn.execute(insert(Agendamento.__table__), [
+                dict(id_agendamento=i, profissional_id=i % n_profissionais + 1, paciente_id=id_paciente,
+                     data_consulta=date(2025, 3, 1) + timedelta(days=i // por_horario),
+                     hora_consulta=HORARIOS[(i // n_profissionais) % len(HORARIOS)],
+                     status="Concluido", pagamento_confirmado=True, link_meet="https://meet.google.com/bench")
+                for i in ids])
+            conn.execute(insert(Pagamento.__table__), [
+                dict(id_transacao=f"txn_{i:08d}", agendamento_id=i, valor=rnd.choice((120, 150, 200, 250)),
+                     metodo="PIX", status=rnd.choices(("Aprovado", "Pendente", "Reembolsado"), (0.8, 0.1, 0.1))[0],
+                     data_pagamento=datetime(2025, 3, 1) + timedelta(seconds=rnd.uniform(0, 30 * 86400)))
+                for i in ids])
+
+
+def conferir(engine):
+    with engine.connect() as conn:
+        repassado = conn.execute(select(func.sum(Pagamento.valor), func.count())
+                                 .where(Pagamento.repasse_id.is_not(None))).one()
+        repasses = conn.execute(select(func.sum(Repasse.valor_total), func.sum(Repasse.quantidade_pagamentos))).one()
+    return repassado, repasses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pagamentos", type=int, default=1_000_000)
+    parser.add_argument("--profissionais", type=int, default=20000)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    engine = criar_engine(f"sqlite:///{os.path.join(diretorio, 'repasses.db')}")
+    init_db(engine)
+    inicio = relogio.perf_counter()
+    popular(engine, args.pagamentos, args.profissionais)
+    print(f"pagamentos={args.pagamentos} populados em {relogio.perf_counter() - inicio:.1f} s "
+          f"(pico de memória até aqui: {_pico_memoria_mb():.0f} MB)")
+
+    arquivo = os.path.join(diretorio, f"repasses_{COMPETENCIA}.csv")
+    tracemalloc.start()
+    inicio = relogio.perf_counter()
+    resumo = fechar_competencia(COMPETENCIA, bind=engine)
+    meio = relogio.perf_counter()
+    quantidade, total = exportar_arquivo_banco(COMPETENCIA, arquivo, bind=engine)
+    fim = relogio.perf_counter()
+    pico_python = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    print(f"fechamento: {meio - inicio:.1f} s {dict(resumo)}")
+    print(f"exportacao: {fim - meio:.1f} s, {quantidade} repasses (R$ {total}), "
+          f"arquivo de {os.path.getsize(arquivo) / 1e6:.1f} MB")
+    print(f"pico de memória: Python {pico_python:.1f} MB | processo (RSS) {_pico_memoria_mb():.0f} MB")
+
+    (soma_pagamentos, n_pagamentos), (soma_repasses, n_repasses) = conferir(engine)
+    print(f"conferencia: pagamentos repassados={n_pagamentos} (R$ {soma_pagamentos}) | "
+          f"repasses somam {n_repasses} pagamentos (R$ {soma_repasses})")
+
+    resumo = fechar_competencia(COMPETENCIA, bind=engine)
+    quantidade, _ = exportar_arquivo_banco(COMPETENCIA, arquivo + ".2", bind=engine)
+    print(f"segunda execucao: {dict(resumo)} exportados={quantidade}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark de contenção do serviço de reservas.
+
+Várias threads disputam um conjunto pequeno de horários de poucos
+profissionais "populares" (como no pico da noite). Ao final, mostra
+reservas por segundo, a taxa de conflitos abortados e confere que
+nenhum horário foi reservado duas vezes.
+
+Uso: python bench_reservas.py [--threads 16] [--tentativas 4000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time as relogio
+from datetime import date, time, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Profissional, Paciente, AgendaProfissional, Agendamento
+from reservas import reservar_consulta, HorarioIndisponivel, ReservaNaoConcluida
+
+
+def popular(engine, n_profissionais, n_pacientes):
+    """ Profissionais com agenda de segunda a sexta (18h às 22h) e pacientes. """
+    total = n_profissionais + n_pacientes
+    usuarios = [
+        dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x",
+             RG=f"RG{i}", CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+        for i in range(1, total + 1)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), usuarios)
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}", valor_consulta=200)
+            for i in range(1, n_profissionais + 1)
+        ])
+        conn.execute(insert(AgendaProfissional.__table__), [
+            dict(profissional_id=i, dia_semana=dia, hora_inicio=time(18), hora_fim=time(22), disponivel=True)
+            for i in range(1, n_profissionais + 1)
+            for dia in AgendaProfissional.OPCOES_DIA_SEMANA[:5]
+        ])
+        conn.execute(insert(Paciente.__table__), [
+            dict(id_paciente=i) for i in range(n_profissionais + 1, total + 1)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--tentativas", type=int, default=4000, help="total de pedidos de reserva")
+    parser.add_argument("--profissionais", type=int, default=5)
+    parser.add_argument("--dias", type=int, default=10)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    engine = criar_engine(f"sqlite:///{os.path.join(diretorio, 'bench.db')}")
+    init_db(engine)
+    n_pacientes = 200
+    popular(engine, args.profissionais, n_pacientes)
+    fabrica = sessionmaker(bind=engine, expire_on_commit=False)
+
+    # Horários disputados: dias úteis x 18h, 19h, 20h, 21h x profissionais
+    datas = [d for d in (date(2025, 11, 3) + timedelta(days=i) for i in range(args.dias)) if d.weekday() < 5]
+    horarios = [(p, d, time(h)) for p in range(1, args.profissionais + 1) for d in datas for h in (18, 19, 20, 21)]
+
+    contadores = {"reservas": 0, "conflitos": 0, "desistencias": 0}
+    trava_contadores = threading.Lock()
+
+    def trabalhador(n_pedidos, semente):
+        rnd = random.Random(semente)
+        locais = {"reservas": 0, "conflitos": 0, "desistencias": 0}
+        for _ in range(n_pedidos):
+            profissional_id, data, hora = rnd.choice(horarios)
+            paciente_id = rnd.randint(args.profissionais + 1, args.profissionais + n_pacientes)
+            try:
+                reservar_consulta(paciente_id, profissional_id, data, hora, session_factory=fabrica)
+                locais["reservas"] += 1
+            except HorarioIndisponivel:
+                locais["conflitos"] += 1
+            except ReservaNaoConcluida:
+                locais["desistencias"] += 1
+        with trava_contadores:
+            for chave, valor in locais.items():
+                contadores[chave] += valor
+
+    por_thread = args.tentativas // args.threads
+    threads = [threading.Thread(target=trabalhador, args=(por_thread, i)) for i in range(args.threads)]
+    inicio = relogio.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = relogio.perf_counter() - inicio
+
+    with engine.connect() as conn:
+        duplicados = conn.execute(
+            select(func.count()).select_from(
+                select(Agendamento.profissional_id)
+                .group_by(Agendamento.profissional_id, Agendamento.data_consulta, Agendamento.hora_consulta)
+                .having(func.count() > 1)
+                .subquery()
+            )
+        ).scalar()
+
+    total = por_thread * args.threads
+    print(f"threads={args.threads} pedidos={total} horarios disputados={len(horarios)}")
+    print(f"reservas={contadores['reservas']} conflitos={contadores['conflitos']} "
+          f"desistencias={contadores['desistencias']}")
+    print(f"pedidos/s={total / duracao:.0f} reservas/s={contadores['reservas'] / duracao:.0f} "
+          f"taxa de conflito={contadores['conflitos'] / total:.1%}")
+    print(f"horarios reservados em duplicidade: {duplicados}")
+
+
+if __name__ == "__main__":
+    main()
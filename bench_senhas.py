@@ -0,0 +1,127 @@
+"""
+Benchmark do hash de senhas.
+
+Para cada configuração de custo mede:
+  - logins por segundo por núcleo (verificações em sequência, uma thread);
+  - logins por segundo com vários logins simultâneos atendidos por um loop
+    asyncio usando o VerificadorSenhas, e o maior atraso do loop de eventos
+    nesse tempo (um tique a cada 10 ms);
+e, no custo padrão, compara com verificar direto na coroutine (bloqueando
+o loop). Por fim confere o rehash no login: uma senha em texto puro e um
+hash de custo antigo são regravados com o custo atual.
+
+Uso: python bench_senhas.py [--logins 200] [--workers N]
+"""
+import argparse
+import asyncio
+import os
+import time as relogio
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import seguranca
+from conexao import criar_engine
+from Model import init_db, Usuario
+from seguranca import VerificadorSenhas, conferir_senha, definir_custo, gerar_hash_senha
+
+CONFIGURACOES = [
+    ("pbkdf2_sha256", {"iteracoes": 100000}),
+    ("pbkdf2_sha256", {"iteracoes": 600000}),
+    ("scrypt", {"n": 2 ** 13, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 14, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 15, "r": 8, "p": 1}),
+]
+SENHA = "correta horse battery staple"
+
+
+def logins_por_nucleo(armazenado, duracao=1.0):
+    n, inicio = 0, relogio.perf_counter()
+    while relogio.perf_counter() - inicio < duracao:
+        conferir_senha(SENHA, armazenado)
+        n += 1
+    return n / (relogio.perf_counter() - inicio)
+
+
+async def _medir_atraso(parar, atrasos, intervalo=0.01):
+    while not parar.is_set():
+        antes = relogio.perf_counter()
+        await asyncio.sleep(intervalo)
+        atrasos.append(relogio.perf_counter() - antes - intervalo)
+
+
+async def rajada(armazenado, n_logins, verificador=None):
+    """ n_logins simultâneos; devolve (logins/s, maior atraso do loop em ms). """
+    class Conta:
+        senha = armazenado
+
+    async def login_bloqueante(conta):
+        return conferir_senha(SENHA, conta.senha)[0]
+
+    parar, atrasos = asyncio.Event(), []
+    medidor = asyncio.create_task(_medir_atraso(parar, atrasos))
+    await asyncio.sleep(0)
+    inicio = relogio.perf_counter()
+    if verificador:
+        resultados = await asyncio.gather(*(verificador.autenticar(Conta(), SENHA) for _ in range(n_logins)))
+    else:
+        resultados = await asyncio.gather(*(login_bloqueante(Conta()) for _ in range(n_logins)))
+    duracao = relogio.perf_counter() - inicio
+    parar.set()
+    await medidor
+    assert all(resultados)
+    return n_logins / duracao, max(atrasos, default=duracao) * 1000
+
+
+def conferir_rehash():
+    engine = criar_engine("sqlite://")
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=1, nome="Legado", email="legado@x.com", senha=SENHA, RG="RG1", CPF="CPF1",
+                 genero="Outro", telefone="tel1", termos_aceitos=True),
+            dict(id_usuario=2, nome="Antigo", email="antigo@x.com",
+                 senha=gerar_hash_senha(SENHA, "pbkdf2_sha256", {"iteracoes": 100000}), RG="RG2", CPF="CPF2",
+                 genero="Outro", telefone="tel2", termos_aceitos=True)])
+    with Session(engine) as session:
+        for usuario in session.query(Usuario).order_by(Usuario.id_usuario):
+            antes = usuario.senha.split("$")[0] if "$" in usuario.senha else "texto puro"
+            errada = usuario.fazer_login("senha errada")
+            certa = usuario.fazer_login(SENHA)
+            print(f"rehash: {usuario.nome}: {antes} -> {usuario.senha.rsplit('$', 2)[0]} "
+                  f"(senha errada={errada}, certa={certa})")
+        session.commit()
+        assert all(not seguranca.precisa_rehash(u.senha) for u in session.query(Usuario))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    nucleos = min(args.workers, os.cpu_count() or 1)
+    print(f"nucleos={os.cpu_count()} workers={args.workers}")
+
+    padrao = (seguranca.ALGORITMO_PADRAO, dict(seguranca.PARAMETROS_PADRAO))
+    with VerificadorSenhas(max_workers=args.workers) as verificador:
+        for algoritmo, parametros in CONFIGURACOES:
+            definir_custo(algoritmo, **parametros)
+            armazenado = gerar_hash_senha(SENHA)
+            sequencial = logins_por_nucleo(armazenado)
+            n_logins = max(args.workers, min(args.logins, int(sequencial * nucleos * 2)))
+            taxa, atraso = asyncio.run(rajada(armazenado, n_logins, verificador))
+            print(f"{algoritmo:<14} {parametros!s:<32} {sequencial:7.1f} logins/s por nucleo | "
+                  f"pool: {taxa:7.1f} logins/s ({taxa / nucleos:.1f} por nucleo), "
+                  f"atraso maximo do loop {atraso:6.1f} ms")
+
+        definir_custo(padrao[0], **padrao[1])
+        armazenado = gerar_hash_senha(SENHA)
+        n_logins = max(args.workers, min(args.logins, int(logins_por_nucleo(armazenado, 0.5) * nucleos * 2)))
+        taxa, atraso = asyncio.run(rajada(armazenado, n_logins))
+        print(f"sem pool (custo padrao, na coroutine): {taxa:7.1f} logins/s, atraso maximo do loop {atraso:6.1f} ms")
+
+    conferir_rehash()
+
+
+if __name__ == "__main__":
+    main()
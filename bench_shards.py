@@ -0,0 +1,142 @@
+"""
+Benchmark do roteamento em shards (shards.py).
+
+Para 1, 2, 4 e 8 shards (cada um um arquivo SQLite, mais o banco global
+com o cadastro), T threads reservam consultas ao mesmo tempo com
+reservas.reservar_consulta e a fábrica de sessões roteada, para
+profissionais sorteados. Mede reservas por segundo (a trava de escrita é
+por arquivo, então a vazão deve crescer com os shards) e, no fim, uma busca
+global (próximas consultas de vários profissionais, ordenadas) feita
+shard a shard pela sessão contra consulta_global em paralelo.
+
+Com --synchronous FULL (padrão aqui) cada commit espera o disco, que é o
+caso em que a trava única mais pesa. Em disco rápido (ou em uma máquina de
+um núcleo só) o commit é barato e a vazão fica presa à CPU; a opção
+--latencia-commit simula um disco mais lento: espera N ms em cada commit,
+com a trava de escrita ainda presa, como um fsync demorado.
+
+Uso: python bench_shards.py [--threads 8] [--reservas 2000] [--profissionais 64] [--synchronous FULL]
+                            [--latencia-commit 0]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time as relogio
+from datetime import date, time, timedelta
+
+from sqlalchemy import event, func, insert, select
+
+import reservas
+from conexao import criar_engine
+from shards import Shards
+from Model import Usuario, Paciente, Profissional, AgendaProfissional, Agendamento
+
+N_PACIENTES = 500
+SEGUNDA = date(2025, 6, 2)
+SEMANAS = 20
+HORAS = range(8, 18)
+
+
+def montar(pasta, quantidade, n_profissionais, synchronous, latencia_commit):
+    pragmas = {"synchronous": synchronous}
+    engine_global = criar_engine(f"sqlite:///{os.path.join(pasta, 'global.db')}", pragmas=pragmas)
+    shards = Shards.em_arquivos(quantidade, os.path.join(pasta, "shard_{:02d}.db"), engine_global=engine_global,
+                                pragmas=pragmas)
+    shards.preparar()
+    if latencia_commit:
+        for engine_shard in shards.engines.values():
+            event.listen(engine_shard, "commit", lambda conn: relogio.sleep(latencia_commit / 1000))
+    ids = range(1, n_profissionais + N_PACIENTES + 1)
+    with engine_global.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True) for i in ids])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP{i}", valor_consulta=150)
+            for i in range(1, n_profissionais + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=i) for i in ids[n_profissionais:]])
+    # Agenda de segunda a sexta, 8h às 18h, gravada pela sessão roteada (cada uma no seu shard)
+    with shards.fabrica_sessoes()() as session:
+        session.add_all(AgendaProfissional(i, dia, time(8), time(18))
+                        for i in range(1, n_profissionais + 1) for dia in AgendaProfissional.OPCOES_DIA_SEMANA[:5])
+        session.commit()
+    return shards
+
+
+def pedidos(n, n_profissionais, semente):
+    """ Reservas distintas (profissional, data, hora) sorteadas, com o paciente. """
+    rnd = random.Random(semente)
+    horarios = rnd.sample([(p, semana * 7 + dia, hora) for p in range(1, n_profissionais + 1)
+                           for semana in range(SEMANAS) for dia in range(5) for hora in HORAS], n)
+    return [(rnd.randrange(n_profissionais + 1, n_profissionais + N_PACIENTES + 1), p,
+             SEGUNDA + timedelta(days=dias), time(hora)) for p, dias, hora in horarios]
+
+
+def reservar_em_paralelo(shards, lista, n_threads):
+    fabrica = shards.fabrica_sessoes(expire_on_commit=False)
+    falhas = []
+
+    def trabalhador(parte):
+        for paciente_id, profissional_id, data, hora in parte:
+            try:
+                reservas.reservar_consulta(paciente_id, profissional_id, data, hora, session_factory=fabrica)
+            except (reservas.HorarioIndisponivel, reservas.ReservaNaoConcluida) as erro:
+                falhas.append(erro)
+
+    threads = [threading.Thread(target=trabalhador, args=(lista[i::n_threads],)) for i in range(n_threads)]
+    inicio = relogio.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return relogio.perf_counter() - inicio, falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--reservas", type=int, default=2000)
+    parser.add_argument("--profissionais", type=int, default=64)
+    parser.add_argument("--synchronous", default="FULL", choices=("OFF", "NORMAL", "FULL"))
+    parser.add_argument("--latencia-commit", type=float, default=0, help="ms simulados de disco por commit")
+    parser.add_argument("--semente", type=int, default=3)
+    args = parser.parse_args()
+
+    lista = pedidos(args.reservas, args.profissionais, args.semente)
+    base = None
+    for quantidade in (1, 2, 4, 8):
+        shards = montar(tempfile.mkdtemp(), quantidade, args.profissionais, args.synchronous,
+                        args.latencia_commit)
+        duracao, falhas = reservar_em_paralelo(shards, lista, args.threads)
+        vazao = (len(lista) - len(falhas)) / duracao
+        base = base or vazao
+        gravados = shards.contar_global(select(func.count()).select_from(Agendamento.__table__))
+        print(f"{quantidade} shard(s): {vazao:8.0f} reservas/s ({vazao / base:4.1f}x)   "
+              f"{gravados} gravadas, {len(falhas)} falhas")
+
+        # Busca global: as 50 próximas consultas de um grupo de profissionais espalhados pelos shards
+        grupo = list(range(1, args.profissionais + 1, 3))
+        consulta = select(Agendamento.data_consulta, Agendamento.hora_consulta, Agendamento.id_agendamento).where(
+            Agendamento.profissional_id.in_(grupo),
+            Agendamento.data_consulta >= SEGUNDA + timedelta(weeks=SEMANAS // 2)
+        ).order_by(Agendamento.data_consulta, Agendamento.hora_consulta, Agendamento.id_agendamento)
+        with shards.fabrica_sessoes()() as session:
+            inicio = relogio.perf_counter()
+            for _ in range(20):
+                # A sessão percorre os shards um a um e só concatena: ordena e corta aqui
+                sequencial = sorted(tuple(linha) for linha in session.execute(consulta).all())[:50]
+            ms_sessao = (relogio.perf_counter() - inicio) / 20 * 1000
+        inicio = relogio.perf_counter()
+        for _ in range(20):
+            paralelo = shards.consulta_global(consulta, chave=tuple, limite=50)
+        ms_global = (relogio.perf_counter() - inicio) / 20 * 1000
+        confere = [tuple(linha) for linha in paralelo] == sequencial
+        print(f"    busca global (50 próximas): sessão {ms_sessao:6.1f} ms   consulta_global {ms_global:6.1f} ms   "
+              f"confere: {'sim' if confere else 'NÃO'}")
+        shards.fechar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Suíte de benchmarks de carga sobre o banco sintético.
+
+Popula um banco temporário com o gerador_dados.py (mesma semente, mesmo
+banco) e roda os cenários de carga:
+  - reserva: reservar_consulta em horários da agenda (conflitos contam
+    como operação, como em produção);
+  - busca: buscar_profissionais com filtros sorteados e até 3 páginas;
+  - webhook: confirmação dos pagamentos pendentes em lotes (processar_lote);
+    a latência é por lote, não por evento;
+  - moderacao: a fila de moderação (moderar_pendentes) sobre as avaliações
+    pendentes, em lotes, com AVALIACAO_AGREGADA ajustada por lote; a
+    latência também é por lote;
+  - notificacoes: aviso para os pacientes dos profissionais mais
+    procurados, entregue pelo DespachanteNotificacoes (latência de cada
+    notificação = do início do despacho, com a fila já gravada, até a sua
+    entrega, medida pelo transporte).
+Para cada um mostra operações (ou lotes) por segundo e os percentis
+p50/p95/p99 da latência, e acrescenta o resultado ao bench_output.txt com a data, o
+commit, o tamanho e a semente, para comparar entre commits.
+
+Uso: python bench_suite.py [--linhas 100000] [--semente 42] [--operacoes 500] [--cenarios reserva,busca]
+     [--saida bench_output.txt]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import tempfile
+import time as relogio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from busca_profissionais import buscar_profissionais
+from conexao import criar_engine
+from gerador_dados import DATA_REFERENCIA, SEMANAS, gerar_banco
+from Model import AgendaProfissional, Agendamento, Avaliacao, Notificacao, Pagamento, Paciente, Profissional, \
+    Endereco
+from moderacao import FiltroComentarios, moderar_pendentes
+from notificacoes import DespachanteNotificacoes, TransporteLocal
+from reservas import HorarioIndisponivel, reservar_consulta
+from webhooks_pagamento import ler_evento, processar_lote
+
+CENARIOS = ("reserva", "busca", "webhook", "moderacao", "notificacoes")
+LOTE_WEBHOOK = 50
+LOTE_MODERACAO = 50
+
+
+class Resultado:
+    """ Latências (segundos) de um cenário e a duração total; `unidade` diz o que cada latência mede. """
+
+    def __init__(self, nome, unidade="ops"):
+        self.nome = nome
+        self.unidade = unidade
+        self.latencias = []
+        self.duracao = 0.0
+        self.observacao = ""
+
+    def percentil(self, p):
+        ordenadas = sorted(self.latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))] if ordenadas else 0.0
+
+    def __str__(self):
+        if not self.latencias:
+            return f"{self.nome:<13} sem operações"
+        vazao = len(self.latencias) / self.duracao if self.duracao else 0.0
+        percentis = "  ".join(f"p{int(p * 100)}={self.percentil(p) * 1000:8.2f} ms" for p in (0.5, 0.95, 0.99))
+        observacao = f"  ({self.observacao})" if self.observacao else ""
+        return (f"{self.nome:<13} {len(self.latencias):>7} {self.unidade:<5} {vazao:9.1f} {self.unidade + '/s':<7} "
+                f"{percentis}{observacao}")
+
+
+def _medir(resultado, operacao, itens):
+    """ Executa `operacao(item)` para cada item, guardando a latência de cada chamada. """
+    inicio = relogio.perf_counter()
+    for item in itens:
+        antes = relogio.perf_counter()
+        operacao(item)
+        resultado.latencias.append(relogio.perf_counter() - antes)
+    resultado.duracao = relogio.perf_counter() - inicio
+    return resultado
+
+
+def cenario_reserva(engine, rnd, n):
+    """ Reservas nas semanas seguintes ao período gerado, em horários da agenda. """
+    with engine.connect() as conn:
+        agendas = conn.execute(select(AgendaProfissional.profissional_id, AgendaProfissional.dia_semana,
+                                      AgendaProfissional.hora_inicio, AgendaProfissional.hora_fim)).all()
+        pacientes = conn.scalars(select(Paciente.id_paciente)).all()
+    dias = AgendaProfissional.OPCOES_DIA_SEMANA
+    inicio_futuro = DATA_REFERENCIA + timedelta(weeks=SEMANAS + 1)
+    inicio_futuro -= timedelta(days=inicio_futuro.weekday())
+    pedidos = []
+    for _ in range(n):
+        profissional_id, dia, hora_inicio, hora_fim = rnd.choice(agendas)
+        data = inicio_futuro + timedelta(weeks=rnd.randrange(4), days=dias.index(dia))
+        hora = hora_inicio.replace(hour=rnd.randrange(hora_inicio.hour, hora_fim.hour))
+        pedidos.append((rnd.choice(pacientes), profissional_id, data, hora))
+
+    fabrica = sessionmaker(bind=engine, expire_on_commit=False)
+    conflitos = 0
+
+    def reservar(pedido):
+        nonlocal conflitos
+        try:
+            reservar_consulta(*pedido, session_factory=fabrica)
+        except HorarioIndisponivel:
+            conflitos += 1
+
+    resultado = _medir(Resultado("reserva"), reservar, pedidos)
+    resultado.observacao = f"{conflitos} conflitos"
+    return resultado
+
+
+def cenario_busca(engine, rnd, n):
+    with engine.connect() as conn:
+        cidades = conn.execute(select(Endereco.cidade, Endereco.estado).distinct()).all()
+    especialidades = Profissional.__table__.c.tipo_de_especialidade.type.enums
+    paginas = 0
+
+    with Session(engine) as session:
+        def buscar(filtros):
+            nonlocal paginas
+            pagina = buscar_profissionais(session, **filtros)
+            paginas += 1
+            for _ in range(rnd.randrange(3)):
+                if not pagina.proximo_cursor:
+                    break
+                pagina = buscar_profissionais(session, cursor=pagina.proximo_cursor, **filtros)
+                paginas += 1
+
+        pedidos = []
+        for _ in range(n):
+            filtros = dict(tipo_de_especialidade=rnd.choice(especialidades),
+                           ordenar_por=rnd.choice(("preco", "avaliacao")))
+            if rnd.random() < 0.5:
+                filtros["cidade"], filtros["estado"] = rnd.choice(cidades)
+            if rnd.random() < 0.3:
+                filtros["verificado"] = True
+            pedidos.append(filtros)
+        resultado = _medir(Resultado("busca"), buscar, pedidos)
+    resultado.observacao = f"{paginas} páginas"
+    return resultado
+
+
+def cenario_webhook(engine, rnd, n):
+    """ Aprovação dos pagamentos pendentes; cada operação é um lote de LOTE_WEBHOOK eventos. """
+    with engine.connect() as conn:
+        pendentes = conn.scalars(select(Pagamento.id_transacao).where(Pagamento.status == "Pendente")).all()
+    pendentes = rnd.sample(pendentes, min(len(pendentes), n * LOTE_WEBHOOK))
+    agora = datetime.utcnow().isoformat()
+    lotes = [[ler_evento(dict(id_transacao=id_transacao, status="Aprovado", ocorrido_em=agora))
+              for id_transacao in pendentes[i:i + LOTE_WEBHOOK]]
+             for i in range(0, len(pendentes), LOTE_WEBHOOK)]
+    resultado = _medir(Resultado("webhook", "lotes"), lambda lote: processar_lote(lote, bind=engine), lotes)
+    resultado.observacao = (f"latência por lote de {LOTE_WEBHOOK} eventos, {len(pendentes)} eventos, "
+                            f"{len(pendentes) / resultado.duracao:.0f} eventos/s") if resultado.duracao else ""
+    return resultado
+
+
+def cenario_moderacao(engine, rnd, n):
+    """ Fila de moderação (moderar_pendentes); cada operação é um lote de LOTE_MODERACAO avaliações. """
+    filtro = FiltroComentarios()
+    resumo = Counter()
+
+    def moderar(_):
+        resumo.update(moderar_pendentes(engine, filtro, tamanho_lote=LOTE_MODERACAO, limite=LOTE_MODERACAO))
+
+    resultado = _medir(Resultado("moderacao", "lotes"), moderar, range(n))
+    resultado.observacao = (f"latência por lote de {LOTE_MODERACAO}, {resumo['aprovadas']} aprovadas, "
+                            f"{resumo['denunciadas']} denunciadas, "
+                            f"{resumo['processadas'] / resultado.duracao:.0f} avaliações/s") \
+        if resultado.duracao else ""
+    return resultado
+
+
+def cenario_notificacoes(engine, rnd, n):
+    """ Fan-out: um aviso para cada paciente dos profissionais mais procurados. """
+    mais_procurados = (select(Agendamento.profissional_id).group_by(Agendamento.profissional_id)
+                       .order_by(func.count().desc()).limit(20).subquery())
+    with engine.begin() as conn:
+        pacientes = conn.scalars(
+            select(Agendamento.paciente_id).distinct()
+            .where(Agendamento.profissional_id.in_(select(mais_procurados)))
+            .order_by(Agendamento.paciente_id).limit(n)).all()
+        # Notificações antigas que o despachante também entregar não entram na medida
+        ultima = conn.scalar(select(func.max(Notificacao.id_notificacao))) or 0
+        agora = datetime.utcnow()
+        conn.execute(insert(Notificacao.__table__), [
+            dict(usuario_id=paciente_id, tipo_notificacao="Alerta Sistema", canal="Push",
+                 mensagem="Seu profissional alterou a agenda da próxima semana.", data_envio=agora,
+                 status_entrega="Pendente", prioridade=Notificacao.PRIORIDADE_NORMAL, tentativas=0,
+                 proxima_tentativa=agora)
+            for paciente_id in pacientes])
+
+    # O transporte guarda o instante de cada entrega; enviada_em é gravado uma vez por lote e não serve aqui
+    transporte = TransporteLocal(latencia=0.002)
+    despachante = DespachanteNotificacoes(transporte, bind=engine)
+    resultado = Resultado("notificacoes")
+    inicio = relogio.perf_counter()
+    asyncio.run(despachante.executar(ate_esvaziar=True))
+    resultado.duracao = relogio.perf_counter() - inicio
+    resultado.latencias = [entrega - inicio for id_notificacao, entrega in transporte.entregas.items()
+                           if id_notificacao > ultima]
+    resultado.observacao = f"{despachante.falhas} falhas"
+    return resultado
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "?"
+    except OSError:
+        return "?"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=100000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--operacoes", type=int, default=500, help="operações por cenário")
+    parser.add_argument("--cenarios", default=",".join(CENARIOS))
+    parser.add_argument("--saida", default="bench_output.txt")
+    args = parser.parse_args()
+    cenarios = [nome.strip() for nome in args.cenarios.split(",") if nome.strip()]
+    desconhecidos = set(cenarios) - set(CENARIOS)
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    engine = criar_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'suite.db')}")
+    inicio = relogio.perf_counter()
+    relatorio = gerar_banco(engine, args.linhas, args.semente)
+    print(f"banco sintético: {sum(relatorio.values())} linhas em {relogio.perf_counter() - inicio:.1f} s")
+
+    rnd = random.Random(args.semente)
+    linhas = [f"# {datetime.now():%Y-%m-%d %H:%M} commit={_commit_atual()} linhas={args.linhas} "
+              f"semente={args.semente} operacoes={args.operacoes}"]
+    for nome in cenarios:
+        resultado = globals()[f"cenario_{nome}"](engine, rnd, args.operacoes)
+        print(resultado)
+        linhas.append(str(resultado))
+
+    with open(args.saida, "a", encoding="utf-8") as saida:
+        saida.write("\n".join(linhas) + "\n\n")
+    print(f"resultados acrescentados a {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark de reprodução dos webhooks de pagamento.
+
+Grava um arquivo JSONL de eventos do gateway com repetições e eventos
+fora de ordem e o reproduz, cada vez em um banco novo, com vários tamanhos
+de lote (1 = um commit por evento) e, por fim, com o ProcessadorWebhooks
+recebendo de várias threads. Mostra os eventos por segundo e confere o
+status final de cada pagamento e agendamento. (Um arquivo gravado de
+produção pode ser reproduzido com `python webhooks_pagamento.py`.)
+
+Uso: python bench_webhooks.py [--pagamentos 20000] [--lotes 1,50,500] [--threads 8]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time as relogio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import insert, select
+
+from conexao import criar_engine
+from Model import init_db, Usuario, Paciente, Profissional, Agendamento, Pagamento
+from webhooks_pagamento import ProcessadorWebhooks, reproduzir_arquivo
+
+N_PROFISSIONAIS = 100
+HORARIOS = [time(h) for h in range(8, 22)]
+
+
+def gerar_eventos(caminho, n_pagamentos, semente=17):
+    """ Grava os eventos e devolve o status final esperado de cada transação. """
+    rnd = random.Random(semente)
+    inicio = datetime(2025, 3, 1, 8)
+    eventos, atrasados, esperado = [], [], {}
+    for i in range(1, n_pagamentos + 1):
+        id_transacao = f"txn_{i:08d}"
+        momento = inicio + timedelta(seconds=rnd.uniform(0, 86400))
+        if rnd.random() < 0.85:
+            eventos.append((momento, id_transacao, "Aprovado"))
+            esperado[id_transacao] = "Aprovado"
+            if rnd.random() < 0.1:
+                eventos.append((momento + timedelta(seconds=rnd.uniform(1, 600)), id_transacao, "Reembolsado"))
+                esperado[id_transacao] = "Reembolsado"
+        else:
+            eventos.append((momento, id_transacao, "Falhou"))
+            esperado[id_transacao] = "Falhou"
+            if rnd.random() < 0.05:
+                # Aprovação tardia de uma transação que já falhou: deve ser ignorada
+                atrasados.append((momento + timedelta(seconds=30), id_transacao, "Aprovado"))
+    eventos.sort()
+
+    # Entrega do gateway: reenvios e eventos fora de ordem
+    entregues = list(eventos)
+    for evento in eventos:
+        if rnd.random() < 0.2:
+            entregues.insert(min(len(entregues), rnd.randrange(len(entregues))), evento)
+    for _ in range(len(entregues) // 20):
+        a = rnd.randrange(len(entregues))
+        b = min(len(entregues) - 1, max(0, a + rnd.randint(-300, 300)))
+        entregues[a], entregues[b] = entregues[b], entregues[a]
+    entregues += atrasados
+
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        for momento, id_transacao, status in entregues:
+            arquivo.write(json.dumps(dict(id_transacao=id_transacao, status=status,
+                                          ocorrido_em=momento.isoformat())) + "\n")
+    return esperado, len(entregues)
+
+
+def preparar_banco(caminho_banco, n_pagamentos):
+    engine = criar_engine(f"sqlite:///{caminho_banco}")
+    init_db(engine)
+    id_paciente = N_PROFISSIONAIS + 1
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            dict(id_usuario=i, nome=f"Usuario {i}", email=f"u{i}@bench.com", senha="x", RG=f"RG{i}",
+                 CPF=f"CPF{i}", genero="Outro", telefone=f"tel{i}", termos_aceitos=True)
+            for i in range(1, id_paciente + 1)])
+        conn.execute(insert(Profissional.__table__), [
+            dict(id_profissional=i, tipo_de_especialidade="Psicólogo", crp_cnr_cref=f"CRP-{i}", valor_consulta=200)
+            for i in range(1, N_PROFISSIONAIS + 1)])
+        conn.execute(insert(Paciente.__table__), [dict(id_paciente=id_paciente)])
+
+        por_dia = N_PROFISSIONAIS * len(HORARIOS)
+        conn.execute(insert(Agendamento.__table__), [
+            dict(id_agendamento=i, profissional_id=i % N_PROFISSIONAIS + 1, paciente_id=id_paciente,
+                 data_consulta=date(2025, 3, 2) + timedelta(days=i // por_dia),
+                 hora_consulta=HORARIOS[(i // N_PROFISSIONAIS) % len(HORARIOS)],
+                 link_meet="https://meet.google.com/bench")
+            for i in range(1, n_pagamentos + 1)])
+        conn.execute(insert(Pagamento.__table__), [
+            dict(id_transacao=f"txn_{i:08d}", agendamento_id=i, valor=200, metodo="PIX", status="Pendente")
+            for i in range(1, n_pagamentos + 1)])
+    return engine
+
+
+def conferir(engine, esperado):
+    """ Quantos pagamentos/agendamentos terminaram diferentes do esperado. """
+    status_agendamento = {"Aprovado": "Confirmado", "Falhou": "Pendente", "Reembolsado": "Cancelado"}
+    erros = 0
+    with engine.connect() as conn:
+        for id_transacao, pagamento, agendamento in conn.execute(
+                select(Pagamento.id_transacao, Pagamento.status, Agendamento.status)
+                .join(Agendamento, Agendamento.id_agendamento == Pagamento.agendamento_id)):
+            final = esperado[id_transacao]
+            erros += pagamento != final or agendamento != status_agendamento[final]
+    return erros
+
+
+def reproduzir_com_threads(engine, caminho, n_threads):
+    with open(caminho, encoding="utf-8") as arquivo:
+        eventos = [json.loads(linha) for linha in arquivo]
+    processador = ProcessadorWebhooks(bind=engine)
+    processador.iniciar()
+
+    def servidor(parte):
+        # Cada "requisição" só responde depois que o evento foi gravado
+        for dados in parte:
+            processador.receber(dados).result()
+
+    threads = [threading.Thread(target=servidor, args=(eventos[i::n_threads],)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    processador.parar()
+    return processador
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pagamentos", type=int, default=20000)
+    parser.add_argument("--lotes", default="1,50,500")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    caminho = os.path.join(diretorio, "eventos.jsonl")
+    esperado, n_eventos = gerar_eventos(caminho, args.pagamentos)
+    print(f"eventos gravados={n_eventos} (pagamentos={args.pagamentos})")
+
+    for tamanho_lote in (int(lote) for lote in args.lotes.split(",")):
+        engine = preparar_banco(os.path.join(diretorio, f"lote{tamanho_lote}.db"), args.pagamentos)
+        inicio = relogio.perf_counter()
+        resumo = reproduzir_arquivo(caminho, bind=engine, tamanho_lote=tamanho_lote)
+        duracao = relogio.perf_counter() - inicio
+        print(f"lote={tamanho_lote:<5} {n_eventos / duracao:8.0f} eventos/s | {dict(sorted(resumo.items()))} "
+              f"| divergencias={conferir(engine, esperado)}")
+        engine.dispose()
+
+    engine = preparar_banco(os.path.join(diretorio, "threads.db"), args.pagamentos)
+    inicio = relogio.perf_counter()
+    processador = reproduzir_com_threads(engine, caminho, args.threads)
+    duracao = relogio.perf_counter() - inicio
+    print(f"processador com {args.threads} threads: {n_eventos / duracao:8.0f} eventos/s em {processador.lotes} lotes "
+          f"| divergencias={conferir(engine, esperado)}")
+
+
+if __name__ == "__main__":
+    main()
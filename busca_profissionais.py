@@ -0,0 +1,166 @@
+"""
+Busca e listagem de profissionais.
+
+Filtra por especialidade, registro verificado, faixa de preço e cidade/UF,
+ordena por preço ou por avaliação e pagina por chave (keyset): a próxima
+página continua a partir do último item da anterior, em vez de usar OFFSET,
+então o custo de uma página não cresce com a posição na listagem.
+
+Os índices compostos usados aqui estão declarados em Model.py
+(PROFISSIONAL, ENDERECO e AVALIACAO_AGREGADA).
+"""
+import base64
+import json
+from collections import namedtuple
+from decimal import Decimal
+
+from sqlalchemy import Float, func, literal_column, select, tuple_, type_coerce
+
+from Model import Profissional, Usuario, Endereco, AvaliacaoAgregada
+
+TAMANHO_PAGINA_PADRAO = 20
+
+ORDENACOES = ("preco", "avaliacao")
+
+ProfissionalResumo = namedtuple('ProfissionalResumo', [
+    'id_profissional', 'nome', 'tipo_de_especialidade', 'valor_consulta', 'verificado',
+    'cidade', 'estado', 'media', 'quantidade_avaliacoes'])
+
+PaginaProfissionais = namedtuple('PaginaProfissionais', ['itens', 'proximo_cursor'])
+
+# A média gravada no SQLite é o float sem arredondar (soma * 1.0 / quantidade),
+# mas a coluna Numeric(3, 2) a devolve arredondada: o cursor da ordenação por
+# avaliação precisa do valor bruto, senão 4.3333 < 4.33 é falso e a próxima
+# página pula todos os empatados.
+_MEDIA_BRUTA = type_coerce(AvaliacaoAgregada.media, Float)
+
+
+def _codificar_cursor(valor, id_profissional):
+    bruto = json.dumps([None if valor is None else str(valor), id_profissional]).encode()
+    return base64.urlsafe_b64encode(bruto).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        valor, id_profissional = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (None if valor is None else Decimal(valor)), int(id_profissional)
+    except (ValueError, TypeError):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+
+def _consulta_base(tipo_de_especialidade, verificado, preco_min, preco_max, cidade, estado, avaliados,
+                   filtro=lambda condicao: condicao):
+    """
+    SELECT com os filtros comuns. `avaliados=True` parte de AVALIACAO_AGREGADA
+    (só profissionais com média), `False` pega só os sem média e `None` todos.
+    `filtro` envolve as condições sobre PROFISSIONAL (usado para dicas ao otimizador).
+    """
+    colunas = (Profissional.id_profissional, Usuario.nome, Profissional.tipo_de_especialidade,
+               Profissional.valor_consulta, Profissional.crp_cnr_cref_verificado,
+               Endereco.cidade, Endereco.estado, AvaliacaoAgregada.media,
+               func.coalesce(AvaliacaoAgregada.quantidade, 0), _MEDIA_BRUTA.label('media_bruta'))
+
+    if avaliados:
+        consulta = (
+            select(*colunas)
+            .select_from(AvaliacaoAgregada)
+            .join(Profissional, Profissional.id_profissional == AvaliacaoAgregada.profissional_id)
+            .where(AvaliacaoAgregada.media.is_not(None))
+        )
+    else:
+        consulta = select(*colunas).outerjoin(
+            AvaliacaoAgregada, AvaliacaoAgregada.profissional_id == Profissional.id_profissional)
+        if avaliados is False:
+            consulta = consulta.where(AvaliacaoAgregada.media.is_(None))
+    consulta = consulta.join(Usuario, Usuario.id_usuario == Profissional.id_profissional)
+
+    # A junção com ENDERECO só é obrigatória quando há filtro de localização
+    if cidade is not None or estado is not None:
+        consulta = consulta.join(Endereco, Endereco.id_endereco == Profissional.endereco_id)
+        if estado is not None:
+            consulta = consulta.where(Endereco.estado == estado)
+        if cidade is not None:
+            consulta = consulta.where(Endereco.cidade == cidade)
+    else:
+        consulta = consulta.outerjoin(Endereco, Endereco.id_endereco == Profissional.endereco_id)
+
+    if tipo_de_especialidade is not None:
+        consulta = consulta.where(filtro(Profissional.tipo_de_especialidade == tipo_de_especialidade))
+    if verificado is not None:
+        consulta = consulta.where(filtro(Profissional.crp_cnr_cref_verificado.is_(verificado)))
+    if preco_min is not None:
+        consulta = consulta.where(filtro(Profissional.valor_consulta >= preco_min))
+    if preco_max is not None:
+        consulta = consulta.where(filtro(Profissional.valor_consulta <= preco_max))
+    return consulta
+
+
+def _pouco_seletivo(condicao):
+    """
+    Dica do SQLite (likelihood) dizendo que a condição é pouco seletiva.
+    Sem ela, o otimizador prefere o índice de especialidade mesmo quando
+    precisa ordenar todos os profissionais da especialidade pela média, ou
+    filtrar a cidade linha a linha; com ela, usa o índice de cidade/UF ou
+    percorre AVALIACAO_AGREGADA já na ordem da listagem.
+    """
+    return func.likelihood(condicao, literal_column("0.9"))
+
+
+def buscar_profissionais(session, tipo_de_especialidade=None, verificado=None, preco_min=None,
+                         preco_max=None, cidade=None, estado=None, ordenar_por="preco",
+                         cursor=None, tamanho_pagina=TAMANHO_PAGINA_PADRAO):
+    """
+    Retorna uma PaginaProfissionais com até `tamanho_pagina` itens.
+
+    ordenar_por="preco" lista do mais barato para o mais caro;
+    ordenar_por="avaliacao" lista da maior para a menor média e, no fim,
+    os profissionais ainda sem avaliação aprovada.
+    Para a próxima página, passe o `proximo_cursor` da página anterior.
+    """
+    if ordenar_por not in ORDENACOES:
+        raise ValueError(f"ordenar_por deve ser um de {ORDENACOES}")
+    filtros = (tipo_de_especialidade, verificado, preco_min, preco_max, cidade, estado)
+    posicao = _decodificar_cursor(cursor) if cursor is not None else None
+
+    # No SQLite, marca os filtros de PROFISSIONAL como pouco seletivos quando
+    # existe um caminho melhor: o índice de cidade/UF ou o índice da média.
+    dica = {}
+    if session.get_bind().dialect.name == "sqlite" and (
+            cidade is not None or estado is not None or ordenar_por == "avaliacao"):
+        dica = {"filtro": _pouco_seletivo}
+
+    if ordenar_por == "preco":
+        consulta = _consulta_base(*filtros, avaliados=None, **dica)
+        if posicao is not None:
+            consulta = consulta.where(
+                tuple_(Profissional.valor_consulta, Profissional.id_profissional) > tuple_(*posicao))
+        consulta = consulta.order_by(Profissional.valor_consulta, Profissional.id_profissional)
+        linhas = session.execute(consulta.limit(tamanho_pagina + 1)).all()
+        chave = lambda linha: linha.valor_consulta
+    else:
+        # 1ª fase: avaliados, percorrendo o índice (media, profissional_id) de trás para frente
+        linhas = []
+        if posicao is None or posicao[0] is not None:
+            consulta = _consulta_base(*filtros, avaliados=True, **dica)
+            if posicao is not None:
+                consulta = consulta.where(
+                    tuple_(_MEDIA_BRUTA, AvaliacaoAgregada.profissional_id) < tuple_(float(posicao[0]), posicao[1]))
+            consulta = consulta.order_by(AvaliacaoAgregada.media.desc(), AvaliacaoAgregada.profissional_id.desc())
+            linhas = session.execute(consulta.limit(tamanho_pagina + 1)).all()
+        # 2ª fase: sem avaliação, do id maior para o menor
+        if len(linhas) <= tamanho_pagina:
+            consulta = _consulta_base(*filtros, avaliados=False)
+            if posicao is not None and posicao[0] is None:
+                consulta = consulta.where(Profissional.id_profissional < posicao[1])
+            consulta = consulta.order_by(Profissional.id_profissional.desc())
+            linhas += session.execute(consulta.limit(tamanho_pagina + 1 - len(linhas))).all()
+        chave = lambda linha: linha.media_bruta
+
+    # Um item a mais foi buscado só para saber se existe próxima página
+    n_campos = len(ProfissionalResumo._fields)
+    itens = [ProfissionalResumo(*linha[:n_campos]) for linha in linhas[:tamanho_pagina]]
+    proximo_cursor = None
+    if len(linhas) > tamanho_pagina:
+        ultimo = linhas[tamanho_pagina - 1]
+        proximo_cursor = _codificar_cursor(chave(ultimo), ultimo.id_profissional)
+    return PaginaProfissionais(itens, proximo_cursor)
@@ -0,0 +1,267 @@
+"""
+Cache de leitura dos perfis de profissionais.
+
+A página de perfil precisava de Profissional, depois Profissional.usuario,
+depois dados_bancarios e ainda uma consulta separada do Endereco (como em
+teste.py): três ou mais idas ao banco por visualização. Aqui o perfil é
+lido com uma única consulta (USUARIO + PROFISSIONAL + ENDERECO +
+DADOS_BANCARIOS + AVALIACAO_AGREGADA) e guardado como um PerfilProfissional:
+um objeto pequeno, imutável e com __slots__, que pode ser compartilhado
+entre threads sem cópia.
+
+O CachePerfis é um LRU com validade (TTL) por id_profissional. Os perfis
+são invalidados automaticamente quando uma sessão do ORM grava (flush) e
+confirma (commit) alterações em Usuario, Profissional, Endereco,
+DadosBancarios ou Avaliacao do profissional. Quem altera pelo Core chama
+invalidar_perfis() depois do commit (ex: moderacao.py); alterações de outro
+processo aparecem no máximo após o TTL.
+
+    cache = CachePerfis(capacidade=10000, ttl=300)
+    perfil = cache.obter(id_profissional)
+    cache.estatisticas()  # acertos, falhas, despejos, expirados, invalidações
+"""
+import threading
+import time as relogio
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.orm import Session
+
+from Model import engine, Usuario, Profissional, Endereco, DadosBancarios, Avaliacao, AvaliacaoAgregada
+
+CAPACIDADE_PADRAO = 10000
+TTL_PADRAO = 300  # segundos
+
+
+class PerfilProfissional:
+    """ Fotografia somente leitura do perfil de um profissional. """
+
+    __slots__ = ('id_profissional', 'nome', 'email', 'telefone', 'url_foto_perfil', 'tipo_de_especialidade',
+                 'crp_cnr_cref', 'verificado', 'valor_consulta', 'endereco_id', 'cidade', 'estado',
+                 'endereco_formatado', 'banco', 'dados_bancarios_validos', 'media', 'quantidade_avaliacoes')
+
+    def __init__(self, **valores):
+        for campo in self.__slots__:
+            object.__setattr__(self, campo, valores.get(campo))
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError(f"{type(self).__name__} é somente leitura")
+
+    __delattr__ = __setattr__
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    def __eq__(self, outro):
+        return isinstance(outro, PerfilProfissional) and self.como_dict() == outro.como_dict()
+
+    def __hash__(self):
+        return hash(self.id_profissional)
+
+    def __repr__(self):
+        return f"PerfilProfissional(id_profissional={self.id_profissional}, nome={self.nome!r})"
+
+
+# Montada uma vez só: a mesma instância reaproveita o SQL compilado e os metadados do resultado
+_CONSULTA_PERFIS = (
+    select(Profissional.id_profissional, Usuario.nome, Usuario.email, Usuario.telefone, Usuario.url_foto_perfil,
+           Profissional.tipo_de_especialidade, Profissional.crp_cnr_cref, Profissional.crp_cnr_cref_verificado,
+           Profissional.valor_consulta, Profissional.endereco_id,
+           Endereco.logradouro, Endereco.numero, Endereco.complemento, Endereco.cidade, Endereco.estado,
+           DadosBancarios.banco, DadosBancarios.cpf_cnpj_titular, DadosBancarios.agencia, DadosBancarios.conta,
+           AvaliacaoAgregada.media, AvaliacaoAgregada.quantidade)
+    .join(Usuario, Usuario.id_usuario == Profissional.id_profissional)
+    .outerjoin(Endereco, Endereco.id_endereco == Profissional.endereco_id)
+    .outerjoin(DadosBancarios, DadosBancarios.profissional_id == Profissional.id_profissional)
+    .outerjoin(AvaliacaoAgregada, AvaliacaoAgregada.profissional_id == Profissional.id_profissional)
+    .where(Profissional.id_profissional.in_(bindparam("ids", expanding=True)))
+)
+
+
+def _perfil(linha):
+    endereco = None
+    if linha.logradouro is not None:
+        partes = [linha.logradouro, linha.numero, linha.complemento]
+        endereco = ", ".join(p for p in partes if p) + f" - {linha.cidade}/{linha.estado}"
+    return PerfilProfissional(
+        id_profissional=linha.id_profissional, nome=linha.nome, email=linha.email, telefone=linha.telefone,
+        url_foto_perfil=linha.url_foto_perfil, tipo_de_especialidade=linha.tipo_de_especialidade,
+        crp_cnr_cref=linha.crp_cnr_cref, verificado=bool(linha.crp_cnr_cref_verificado),
+        valor_consulta=linha.valor_consulta, endereco_id=linha.endereco_id, cidade=linha.cidade,
+        estado=linha.estado, endereco_formatado=endereco, banco=linha.banco,
+        dados_bancarios_validos=linha.banco is not None and DadosBancarios.dados_validos(
+            linha.cpf_cnpj_titular, linha.agencia, linha.conta),
+        media=linha.media, quantidade_avaliacoes=linha.quantidade or 0)
+
+
+def carregar_perfis(conn, ids):
+    """ {id_profissional: PerfilProfissional} dos ids que existem, com uma única consulta. """
+    return {linha.id_profissional: _perfil(linha) for linha in conn.execute(_CONSULTA_PERFIS, {"ids": list(ids)})}
+
+
+class CachePerfis:
+    """ LRU + TTL de PerfilProfissional por id_profissional, seguro entre threads. """
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO, ttl=TTL_PADRAO, bind=None, relogio_monotonico=relogio.monotonic):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.bind = bind or engine
+        self._agora = relogio_monotonico
+        self._itens = OrderedDict()     # id -> (expira_em, perfil), do menos para o mais recente
+        self._por_endereco = {}         # endereco_id -> ids em cache que apontam para ele
+        self._trava = threading.Lock()
+        # Aumenta a cada invalidação: uma leitura que começou antes não é guardada
+        self._versao = 0
+        self.acertos = self.falhas = self.despejos = self.expirados = self.invalidacoes = 0
+        _caches.add(self)
+
+    # ---------------------------------------------------------------------
+    # Leitura
+    # ---------------------------------------------------------------------
+
+    def obter(self, id_profissional):
+        """ Perfil do profissional (None se não existir). """
+        return self.obter_varios([id_profissional]).get(id_profissional)
+
+    def obter_varios(self, ids):
+        """ {id: perfil} dos ids pedidos que existem; as falhas são lidas juntas, numa consulta só. """
+        encontrados, faltando = {}, []
+        agora = self._agora()
+        with self._trava:
+            for id_profissional in ids:
+                item = self._itens.get(id_profissional)
+                if item is not None and item[0] <= agora:
+                    self._remover(id_profissional)
+                    self.expirados += 1
+                    item = None
+                if item is None:
+                    self.falhas += 1
+                    faltando.append(id_profissional)
+                else:
+                    self.acertos += 1
+                    self._itens.move_to_end(id_profissional)
+                    encontrados[id_profissional] = item[1]
+            versao = self._versao
+        if not faltando:
+            return encontrados
+
+        with self.bind.connect() as conn:
+            lidos = carregar_perfis(conn, faltando)
+        encontrados.update(lidos)
+        with self._trava:
+            if versao == self._versao:
+                expira_em = self._agora() + self.ttl
+                for id_profissional, perfil in lidos.items():
+                    self._guardar(id_profissional, perfil, expira_em)
+        return encontrados
+
+    def _guardar(self, id_profissional, perfil, expira_em):
+        if id_profissional in self._itens:
+            self._remover(id_profissional)
+        self._itens[id_profissional] = (expira_em, perfil)
+        if perfil.endereco_id is not None:
+            self._por_endereco.setdefault(perfil.endereco_id, set()).add(id_profissional)
+        while len(self._itens) > self.capacidade:
+            self._remover(next(iter(self._itens)))
+            self.despejos += 1
+
+    def _remover(self, id_profissional):
+        _, perfil = self._itens.pop(id_profissional)
+        ids = self._por_endereco.get(perfil.endereco_id)
+        if ids is not None:
+            ids.discard(id_profissional)
+            if not ids:
+                del self._por_endereco[perfil.endereco_id]
+
+    # ---------------------------------------------------------------------
+    # Invalidação
+    # ---------------------------------------------------------------------
+
+    def invalidar(self, ids_profissionais=(), ids_enderecos=()):
+        """ Descarta os perfis dos profissionais (e dos que usam os endereços) informados. """
+        with self._trava:
+            self._versao += 1
+            alvos = set(ids_profissionais)
+            for id_endereco in ids_enderecos:
+                alvos.update(self._por_endereco.get(id_endereco, ()))
+            for id_profissional in alvos:
+                if id_profissional in self._itens:
+                    self._remover(id_profissional)
+                    self.invalidacoes += 1
+
+    def limpar(self):
+        with self._trava:
+            self._versao += 1
+            self._itens.clear()
+            self._por_endereco.clear()
+
+    def estatisticas(self):
+        consultas = self.acertos + self.falhas
+        return dict(tamanho=len(self._itens), acertos=self.acertos, falhas=self.falhas,
+                    taxa_acerto=self.acertos / consultas if consultas else 0.0, despejos=self.despejos,
+                    expirados=self.expirados, invalidacoes=self.invalidacoes)
+
+    def __len__(self):
+        return len(self._itens)
+
+
+# -------------------------------------------------------------------------
+# Invalidação pelos eventos do ORM
+# -------------------------------------------------------------------------
+
+_caches = weakref.WeakSet()
+
+
+def invalidar_perfis(ids_profissionais=(), ids_enderecos=()):
+    """
+    Invalida os perfis informados em todos os caches. Para quem altera
+    os dados do perfil sem o ORM (UPDATEs em lote do Core), depois do commit.
+    """
+    for cache in list(_caches):
+        cache.invalidar(ids_profissionais, ids_enderecos)
+
+
+def _afetados(objetos):
+    """ (ids de profissionais, ids de endereços) tocados pelos objetos gravados. """
+    profissionais, enderecos = set(), set()
+    for objeto in objetos:
+        if isinstance(objeto, Usuario):
+            profissionais.add(objeto.id_usuario)
+        elif isinstance(objeto, Profissional):
+            profissionais.add(objeto.id_profissional)
+        elif isinstance(objeto, (DadosBancarios, Avaliacao)):
+            profissionais.add(objeto.profissional_id)
+        elif isinstance(objeto, Endereco):
+            enderecos.add(objeto.id_endereco)
+    profissionais.discard(None)
+    enderecos.discard(None)
+    return profissionais, enderecos
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidar_apos_flush(session, _contexto):
+    if not _caches:
+        return
+    profissionais, enderecos = _afetados(list(session.new) + list(session.dirty) + list(session.deleted))
+    if not (profissionais or enderecos):
+        return
+    for cache in list(_caches):
+        cache.invalidar(profissionais, enderecos)
+    # Uma leitura feita entre o flush e o commit ainda vê os dados antigos: invalida de novo no commit
+    pendentes = session.info.setdefault("cache_perfil_pendentes", (set(), set()))
+    pendentes[0].update(profissionais)
+    pendentes[1].update(enderecos)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(session):
+    pendentes = session.info.pop("cache_perfil_pendentes", None)
+    if pendentes:
+        for cache in list(_caches):
+            cache.invalidar(*pendentes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendentes(session):
+    session.info.pop("cache_perfil_pendentes", None)
@@ -0,0 +1,197 @@
+"""
+Caixa de entrada de notificações do usuário.
+
+  - listar: página da caixa (todas ou só as não lidas), da mais recente
+    para a mais antiga, paginada por chave (data_envio, id_notificacao) nos
+    índices ix_notificacao_caixa / ix_notificacao_nao_lidas;
+  - contar_nao_lidas: o número do sino, lido de CONTADOR_NAO_LIDAS (uma
+    leitura por chave primária em vez de um COUNT a cada página);
+  - marcar_como_lidas: "marcar todas" ou "marcar estas" em um único UPDATE,
+    ajustando o contador na mesma transação;
+  - arquivar_lidas: move as notificações lidas e antigas para
+    NOTIFICACAO_ARQUIVADA em lotes, para a tabela quente continuar pequena.
+
+O contador é mantido pelos eventos de Notificacao (Model.py) e por quem
+grava notificações via Core (Model.somar_nao_lidas); recalcular_contadores
+reconstrói tudo a partir da NOTIFICACAO.
+
+Uso: python caixa_entrada.py [--arquivar] [--dias 90] [--recalcular] [--vacuum]
+"""
+import argparse
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, tuple_, update
+
+from Model import engine, init_db, ContadorNaoLidas, LembreteConsulta, Notificacao, NotificacaoArquivada
+
+TAMANHO_PAGINA_PADRAO = 20
+# Notificações lidas há mais tempo que isso saem da tabela quente
+RETENCAO_PADRAO = timedelta(days=90)
+TAMANHO_LOTE_ARQUIVO = 5000
+
+ItemCaixa = namedtuple('ItemCaixa', ['id_notificacao', 'tipo_notificacao', 'mensagem', 'data_envio', 'lida',
+                                     'agendamento_id'])
+
+PaginaNotificacoes = namedtuple('PaginaNotificacoes', ['itens', 'proximo_cursor'])
+
+_CONTADORES = ContadorNaoLidas.__table__
+_CONSULTA_CONTADOR = select(_CONTADORES.c.nao_lidas).where(_CONTADORES.c.usuario_id == bindparam("usuario_id"))
+
+# Colunas copiadas para o arquivo (as de entrega em andamento não fazem sentido lá)
+_COLUNAS_ARQUIVO = ('id_notificacao', 'usuario_id', 'agendamento_id', 'tipo_notificacao', 'mensagem',
+                    'data_envio', 'canal', 'status_entrega', 'enviada_em')
+
+
+def _codificar_cursor(data_envio, id_notificacao):
+    bruto = json.dumps([data_envio.isoformat(), id_notificacao]).encode()
+    return base64.urlsafe_b64encode(bruto).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        data_envio, id_notificacao = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(data_envio), int(id_notificacao)
+    except (ValueError, TypeError):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+
+def listar(session, usuario_id, apenas_nao_lidas=False, cursor=None, tamanho_pagina=TAMANHO_PAGINA_PADRAO):
+    """
+    Retorna uma PaginaNotificacoes com até `tamanho_pagina` ItemCaixa.
+    Para a próxima página, passe o `proximo_cursor` da página anterior.
+    """
+    tabela = Notificacao.__table__
+    consulta = (
+        select(tabela.c.id_notificacao, tabela.c.tipo_notificacao, tabela.c.mensagem, tabela.c.data_envio,
+               tabela.c.lida, tabela.c.agendamento_id)
+        .where(tabela.c.usuario_id == usuario_id)
+    )
+    if apenas_nao_lidas:
+        # "lida = 0", como no sqlite_where do índice parcial (com IS 0 o SQLite não o usaria)
+        consulta = consulta.where(tabela.c.lida == False)  # noqa: E712
+    if cursor is not None:
+        consulta = consulta.where(
+            tuple_(tabela.c.data_envio, tabela.c.id_notificacao) < tuple_(*_decodificar_cursor(cursor)))
+    consulta = consulta.order_by(tabela.c.data_envio.desc(), tabela.c.id_notificacao.desc())
+
+    linhas = session.execute(consulta.limit(tamanho_pagina + 1)).all()
+    itens = [ItemCaixa(*linha) for linha in linhas[:tamanho_pagina]]
+    proximo = None
+    if len(linhas) > tamanho_pagina:
+        ultimo = itens[-1]
+        proximo = _codificar_cursor(ultimo.data_envio, ultimo.id_notificacao)
+    return PaginaNotificacoes(itens, proximo)
+
+
+def contar_nao_lidas(session, usuario_id):
+    """ Notificações não lidas do usuário (0 se ele nunca recebeu nenhuma). """
+    # SELECT direto (e não session.get) para não devolver um valor antigo do identity map
+    return session.scalar(_CONSULTA_CONTADOR, {"usuario_id": usuario_id}) or 0
+
+
+def marcar_como_lidas(usuario_id, ids=None, bind=None):
+    """
+    Marca como lidas as notificações `ids` do usuário (todas, se ids=None)
+    com um único UPDATE e desconta do contador. Devolve quantas mudaram.
+    Objetos Notificacao já carregados em sessões abertas não são atualizados.
+    """
+    bind = bind or engine
+    tabela = Notificacao.__table__
+    contadores = ContadorNaoLidas.__table__
+    comando = (update(tabela).where(tabela.c.usuario_id == usuario_id, tabela.c.lida == False)  # noqa: E712
+               .values(lida=True))
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        comando = comando.where(tabela.c.id_notificacao.in_(ids))
+
+    with bind.begin() as conn:
+        alteradas = conn.execute(comando).rowcount
+        if ids is None:
+            conn.execute(update(contadores).where(contadores.c.usuario_id == usuario_id).values(nao_lidas=0))
+        elif alteradas:
+            conn.execute(update(contadores).where(contadores.c.usuario_id == usuario_id)
+                         .values(nao_lidas=case((contadores.c.nao_lidas > alteradas,
+                                                 contadores.c.nao_lidas - alteradas), else_=0)))
+    return alteradas
+
+
+def recalcular_contadores(bind=None):
+    """
+    Recalcula CONTADOR_NAO_LIDAS a partir de NOTIFICACAO (INSERT ... SELECT
+    ... GROUP BY no banco). Retorna o número de usuários com não lidas.
+    """
+    bind = bind or engine
+    contadores = ContadorNaoLidas.__table__
+    tabela = Notificacao.__table__
+    with bind.begin() as conn:
+        conn.execute(delete(contadores))
+        resultado = conn.execute(insert(contadores).from_select(
+            ["usuario_id", "nao_lidas"],
+            select(tabela.c.usuario_id, func.count()).where(tabela.c.lida == False)  # noqa: E712
+            .group_by(tabela.c.usuario_id)))
+    return resultado.rowcount
+
+
+def arquivar_lidas(bind=None, retencao=RETENCAO_PADRAO, tamanho_lote=TAMANHO_LOTE_ARQUIVO, agora=None):
+    """
+    Move para NOTIFICACAO_ARQUIVADA as notificações lidas, com a entrega
+    encerrada, enviadas há mais de `retencao`. Cada lote é uma transação
+    curta (a fila de saída e a caixa de entrada continuam sendo atendidas
+    entre os lotes) e a varredura avança pela chave primária, então a
+    tabela é percorrida uma única vez. Devolve quantas foram arquivadas.
+    """
+    bind = bind or engine
+    limite = (agora or datetime.utcnow()) - retencao
+    tabela = Notificacao.__table__
+    arquivo = NotificacaoArquivada.__table__
+    lembretes = LembreteConsulta.__table__
+    colunas = [tabela.c[nome] for nome in _COLUNAS_ARQUIVO]
+
+    total, ultimo = 0, 0
+    while True:
+        with bind.begin() as conn:
+            ids = conn.execute(
+                select(tabela.c.id_notificacao)
+                .where(tabela.c.id_notificacao > ultimo,
+                       tabela.c.lida.is_(True),
+                       tabela.c.status_entrega.in_(("Enviada", "Falhou")),
+                       tabela.c.data_envio < limite)
+                .order_by(tabela.c.id_notificacao)
+                .limit(tamanho_lote)).scalars().all()
+            if not ids:
+                return total
+            conn.execute(insert(arquivo).from_select(
+                list(_COLUNAS_ARQUIVO), select(*colunas).where(tabela.c.id_notificacao.in_(ids))))
+            # O lembrete continua registrado (não é gerado de novo), só perde o vínculo
+            conn.execute(update(lembretes).where(lembretes.c.notificacao_id.in_(ids)).values(notificacao_id=None))
+            conn.execute(delete(tabela).where(tabela.c.id_notificacao.in_(ids)))
+        total += len(ids)
+        ultimo = ids[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arquivar", action="store_true", help="arquiva as notificações lidas e antigas")
+    parser.add_argument("--dias", type=int, default=RETENCAO_PADRAO.days, help="retenção das lidas, em dias")
+    parser.add_argument("--recalcular", action="store_true", help="reconstrói CONTADOR_NAO_LIDAS")
+    parser.add_argument("--vacuum", action="store_true", help="devolve ao disco o espaço liberado (SQLite)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.arquivar:
+        print(f"{arquivar_lidas(retencao=timedelta(days=args.dias))} notificações arquivadas")
+    if args.recalcular:
+        print(f"{recalcular_contadores()} usuários com notificações não lidas")
+    if args.vacuum and engine.dialect.name == "sqlite":
+        # VACUUM não roda dentro de transação
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+Calendário dos profissionais: agenda semanal + consultas em eventos concretos.
+
+AGENDA_PROFISSIONAL guarda modelos semanais ("Segunda", 09:00-12:00) e
+AGENDAMENTO as consultas marcadas; aqui os dois viram uma lista de Evento
+com datetime de início e fim, para qualquer janela de datas:
+
+    calendario = CalendarioProfissionais()
+    eventos = calendario.eventos(id_profissional, date(2025, 6, 2), date(2025, 6, 30))
+
+A expansão é memorizada por (profissional, semana) em um LRU com validade
+(TTL). Gravações do ORM em AgendaProfissional descartam todas as semanas do
+profissional; em Agendamento, só a semana da consulta. Alterações feitas
+por fora do ORM (UPDATE do Core, outro processo) aparecem no máximo após o
+TTL, ou na hora com invalidar() / invalidar_calendarios().
+
+exportar_ical() gera o feed iCalendar (RFC 5545) linha a linha, lendo os
+profissionais em blocos e as consultas com yield_per: exportar um ano de
+milhares de profissionais usa memória constante e não passa pelo cache.
+
+Uso: python calendario.py saida.ics [--inicio 2025-01-01] [--dias 365] [--profissional 7]
+"""
+import argparse
+import threading
+import time as relogio
+import weakref
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import bindparam, event, inspect, select
+from sqlalchemy.orm import Session
+
+from disponibilidade import DURACAO_PADRAO_MINUTOS, expandir_agendas
+from Model import engine, AgendaProfissional, Agendamento, Profissional
+
+CAPACIDADE_PADRAO = 50000  # semanas (profissional, semana) em cache
+TTL_PADRAO = 300  # segundos
+BLOCO_EXPORTACAO = 200  # profissionais por leitura na exportação
+
+TIPO_DISPONIVEL = "Disponivel"
+TIPO_CONSULTA = "Consulta"
+
+Evento = namedtuple('Evento', ['profissional_id', 'inicio', 'fim', 'tipo', 'agendamento_id', 'status'])
+
+_CONSULTA_AGENDAS = (
+    select(AgendaProfissional.profissional_id, AgendaProfissional.dia_semana,
+           AgendaProfissional.hora_inicio, AgendaProfissional.hora_fim)
+    .where(AgendaProfissional.profissional_id.in_(bindparam("ids", expanding=True)),
+           AgendaProfissional.disponivel.is_(True))
+)
+
+# Usa o índice único (profissional_id, data_consulta, hora_consulta) dos agendamentos ativos
+_CONSULTA_AGENDAMENTOS = (
+    select(Agendamento.profissional_id, Agendamento.data_consulta, Agendamento.hora_consulta,
+           Agendamento.id_agendamento, Agendamento.status)
+    .where(Agendamento.profissional_id.in_(bindparam("ids", expanding=True)),
+           Agendamento.data_consulta.between(bindparam("inicio"), bindparam("fim")),
+           Agendamento.status != "Cancelado")
+)
+
+
+def segunda_feira(data):
+    return data - timedelta(days=data.weekday())
+
+
+def _minutos_para_datetime(data, minutos):
+    return datetime.combine(data, datetime.min.time()) + timedelta(minutes=minutos)
+
+
+def iterar_eventos(conn, ids, data_inicio, data_fim, duracao_minutos=DURACAO_PADRAO_MINUTOS, yield_per=None):
+    """
+    Gera os Evento dos profissionais `ids` entre data_inicio e data_fim
+    (inclusive): primeiro as janelas da agenda, depois as consultas. Com
+    yield_per, as consultas são lidas do cursor aos poucos.
+    """
+    ids = list(ids)
+    agendas = conn.execute(_CONSULTA_AGENDAS, {"ids": ids}).all()
+    for profissional_id, data, inicio, fim in expandir_agendas(agendas, data_inicio, data_fim):
+        yield Evento(profissional_id, _minutos_para_datetime(data, inicio), _minutos_para_datetime(data, fim),
+                     TIPO_DISPONIVEL, None, None)
+
+    consulta = _CONSULTA_AGENDAMENTOS
+    if yield_per:
+        consulta = consulta.execution_options(yield_per=yield_per)
+    duracao = timedelta(minutes=duracao_minutos)
+    for linha in conn.execute(consulta, {"ids": ids, "inicio": data_inicio, "fim": data_fim}):
+        inicio = datetime.combine(linha.data_consulta, linha.hora_consulta)
+        yield Evento(linha.profissional_id, inicio, inicio + duracao, TIPO_CONSULTA, linha.id_agendamento,
+                     linha.status)
+
+
+def carregar_semanas(conn, ids, primeira_semana, ultima_semana):
+    """ {(profissional_id, segunda): tupla de Evento ordenada} para todas as semanas do intervalo. """
+    semanas = {}
+    segunda = primeira_semana
+    while segunda <= ultima_semana:
+        for profissional_id in ids:
+            semanas[(profissional_id, segunda)] = []
+        segunda += timedelta(weeks=1)
+    for evento in iterar_eventos(conn, ids, primeira_semana, ultima_semana + timedelta(days=6)):
+        semanas[(evento.profissional_id, segunda_feira(evento.inicio.date()))].append(evento)
+    return {chave: tuple(sorted(eventos, key=lambda e: (e.inicio, e.tipo))) for chave, eventos in semanas.items()}
+
+
+class CalendarioProfissionais:
+    """ Eventos por profissional, com a expansão de cada semana em um LRU + TTL seguro entre threads. """
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO, ttl=TTL_PADRAO, bind=None, relogio_monotonico=relogio.monotonic):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.bind = bind or engine
+        self._agora = relogio_monotonico
+        self._semanas = OrderedDict()       # (id, segunda) -> (expira_em, eventos), do menos para o mais recente
+        self._por_profissional = {}         # id -> segundas em cache
+        self._trava = threading.Lock()
+        # Aumenta a cada invalidação: uma leitura que começou antes não é guardada
+        self._versao = 0
+        self.acertos = self.falhas = self.despejos = self.expirados = self.invalidacoes = 0
+        _calendarios.add(self)
+
+    # ---------------------------------------------------------------------
+    # Leitura
+    # ---------------------------------------------------------------------
+
+    def eventos(self, profissional_id, data_inicio, data_fim):
+        """ Eventos do profissional entre data_inicio e data_fim (inclusive), em ordem de início. """
+        return self.eventos_varios([profissional_id], data_inicio, data_fim)[profissional_id]
+
+    def eventos_varios(self, ids, data_inicio, data_fim):
+        """ {id: [Evento]} de vários profissionais; as semanas que faltam são lidas juntas. """
+        segundas = []
+        segunda = segunda_feira(data_inicio)
+        while segunda <= data_fim:
+            segundas.append(segunda)
+            segunda += timedelta(weeks=1)
+
+        encontradas, faltando = {}, set()
+        agora = self._agora()
+        with self._trava:
+            for profissional_id in ids:
+                for segunda in segundas:
+                    chave = (profissional_id, segunda)
+                    item = self._semanas.get(chave)
+                    if item is not None and item[0] <= agora:
+                        self._remover(chave)
+                        self.expirados += 1
+                        item = None
+                    if item is None:
+                        self.falhas += 1
+                        faltando.add(chave)
+                    else:
+                        self.acertos += 1
+                        self._semanas.move_to_end(chave)
+                        encontradas[chave] = item[1]
+            versao = self._versao
+
+        if faltando:
+            profissionais = sorted({chave[0] for chave in faltando})
+            semanas_faltando = [chave[1] for chave in faltando]
+            with self.bind.connect() as conn:
+                lidas = carregar_semanas(conn, profissionais, min(semanas_faltando), max(semanas_faltando))
+            lidas = {chave: eventos for chave, eventos in lidas.items() if chave in faltando}
+            encontradas.update(lidas)
+            with self._trava:
+                if versao == self._versao:
+                    expira_em = self._agora() + self.ttl
+                    for chave, eventos in lidas.items():
+                        self._guardar(chave, eventos, expira_em)
+
+        inicio = datetime.combine(data_inicio, datetime.min.time())
+        fim = datetime.combine(data_fim + timedelta(days=1), datetime.min.time())
+        return {profissional_id: [evento for segunda in segundas
+                                  for evento in encontradas[(profissional_id, segunda)]
+                                  if inicio <= evento.inicio < fim]
+                for profissional_id in ids}
+
+    def _guardar(self, chave, eventos, expira_em):
+        if chave in self._semanas:
+            self._remover(chave)
+        self._semanas[chave] = (expira_em, eventos)
+        self._por_profissional.setdefault(chave[0], set()).add(chave[1])
+        while len(self._semanas) > self.capacidade:
+            self._remover(next(iter(self._semanas)))
+            self.despejos += 1
+
+    def _remover(self, chave):
+        del self._semanas[chave]
+        segundas = self._por_profissional.get(chave[0])
+        if segundas is not None:
+            segundas.discard(chave[1])
+            if not segundas:
+                del self._por_profissional[chave[0]]
+
+    # ---------------------------------------------------------------------
+    # Invalidação
+    # ---------------------------------------------------------------------
+
+    def invalidar(self, profissional_id, datas=None):
+        """ Descarta as semanas das `datas` do profissional (todas, se datas=None). """
+        with self._trava:
+            self._versao += 1
+            segundas = set(self._por_profissional.get(profissional_id, ()))
+            if datas is not None:
+                segundas &= {segunda_feira(data) for data in datas}
+            for segunda in segundas:
+                self._remover((profissional_id, segunda))
+                self.invalidacoes += 1
+
+    def limpar(self):
+        with self._trava:
+            self._versao += 1
+            self._semanas.clear()
+            self._por_profissional.clear()
+
+    def estatisticas(self):
+        consultas = self.acertos + self.falhas
+        return dict(tamanho=len(self._semanas), acertos=self.acertos, falhas=self.falhas,
+                    taxa_acerto=self.acertos / consultas if consultas else 0.0, despejos=self.despejos,
+                    expirados=self.expirados, invalidacoes=self.invalidacoes)
+
+    def __len__(self):
+        return len(self._semanas)
+
+
+# -------------------------------------------------------------------------
+# Invalidação pelos eventos do ORM
+# -------------------------------------------------------------------------
+
+_calendarios = weakref.WeakSet()
+
+
+def _afetados(objetos):
+    """ {profissional_id: datas tocadas, ou None para todas as semanas} dos objetos gravados. """
+    afetados = {}
+    for objeto in objetos:
+        if isinstance(objeto, AgendaProfissional) and objeto.profissional_id is not None:
+            afetados[objeto.profissional_id] = None
+        elif isinstance(objeto, Agendamento) and objeto.profissional_id is not None:
+            datas = afetados.setdefault(objeto.profissional_id, set())
+            if datas is not None:
+                datas.add(objeto.data_consulta)
+                # Consulta remarcada: a semana antiga também muda
+                datas.update(inspect(objeto).attrs.data_consulta.history.deleted)
+    for datas in afetados.values():
+        if datas is not None:
+            datas.discard(None)
+    return afetados
+
+
+def invalidar_calendarios(afetados):
+    """
+    Invalida {profissional_id: datas (ou None)} em todos os calendários.
+    Para quem altera agendamentos sem o ORM (UPDATEs em lote do Core).
+    """
+    for calendario in list(_calendarios):
+        for profissional_id, datas in afetados.items():
+            calendario.invalidar(profissional_id, datas)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidar_apos_flush(session, _contexto):
+    if not _calendarios:
+        return
+    afetados = _afetados(list(session.new) + list(session.dirty) + list(session.deleted))
+    if not afetados:
+        return
+    invalidar_calendarios(afetados)
+    # Uma leitura feita entre o flush e o commit ainda vê os dados antigos: invalida de novo no commit
+    pendentes = session.info.setdefault("calendario_pendentes", {})
+    for profissional_id, datas in afetados.items():
+        if datas is None or pendentes.get(profissional_id, set()) is None:
+            pendentes[profissional_id] = None
+        else:
+            pendentes.setdefault(profissional_id, set()).update(datas)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(session):
+    pendentes = session.info.pop("calendario_pendentes", None)
+    if pendentes:
+        invalidar_calendarios(pendentes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendentes(session):
+    session.info.pop("calendario_pendentes", None)
+
+
+# -------------------------------------------------------------------------
+# iCalendar
+# -------------------------------------------------------------------------
+
+def _escapar(texto):
+    return texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _dobrar(linha):
+    """ Quebra a linha em pedaços de até 75 octetos (RFC 5545, 3.1), com CRLF. """
+    bruto = linha.encode("utf-8")
+    if len(bruto) <= 75:
+        return linha + "\r\n"
+    partes, inicio, limite = [], 0, 75
+    while inicio < len(bruto):
+        fim = min(len(bruto), inicio + limite)
+        # Não corta um caractere UTF-8 ao meio
+        while fim < len(bruto) and (bruto[fim] & 0xC0) == 0x80:
+            fim -= 1
+        partes.append(bruto[inicio:fim].decode("utf-8"))
+        inicio, limite = fim, 74  # as linhas de continuação começam com um espaço
+    return "\r\n ".join(partes) + "\r\n"
+
+
+def linhas_ical(eventos, nome="Agenda TCC Telessaúde", carimbo=None):
+    """ Gera as linhas (com CRLF) de um VCALENDAR com os eventos, sem montar o texto inteiro. """
+    carimbo = f"{carimbo or datetime.utcnow():%Y%m%dT%H%M%SZ}"
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield "PRODID:-//TCC Telessaude//Calendario//PT-BR\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    yield _dobrar(f"X-WR-CALNAME:{_escapar(nome)}")
+    yield "X-WR-TIMEZONE:America/Sao_Paulo\r\n"
+    for evento in eventos:
+        if evento.tipo == TIPO_CONSULTA:
+            uid = f"agendamento-{evento.agendamento_id}@tcc-telesaude"
+            resumo = f"Consulta ({evento.status})"
+            transparencia = "OPAQUE"
+        else:
+            uid = f"disponivel-{evento.profissional_id}-{evento.inicio:%Y%m%dT%H%M}@tcc-telesaude"
+            resumo = "Disponível para consultas"
+            transparencia = "TRANSPARENT"
+        yield "BEGIN:VEVENT\r\n"
+        yield f"UID:{uid}\r\n"
+        yield f"DTSTAMP:{carimbo}\r\n"
+        # Hora local sem fuso ("floating"): a mesma hora de parede gravada na agenda
+        yield f"DTSTART:{evento.inicio:%Y%m%dT%H%M%S}\r\n"
+        yield f"DTEND:{evento.fim:%Y%m%dT%H%M%S}\r\n"
+        yield _dobrar(f"SUMMARY:{_escapar(resumo)}")
+        yield f"TRANSP:{transparencia}\r\n"
+        yield "END:VEVENT\r\n"
+    yield "END:VCALENDAR\r\n"
+
+
+def exportar_ical(data_inicio, data_fim, ids=None, bind=None, bloco=BLOCO_EXPORTACAO, yield_per=1000):
+    """
+    Gera o feed iCalendar dos profissionais `ids` (todos, se None) na janela
+    informada. Os profissionais são lidos em blocos e as consultas de cada
+    bloco com yield_per; a memória não cresce com o tamanho da exportação.
+    Consome o gerador enquanto a conexão é usada (ex: resposta HTTP em streaming).
+    """
+    bind = bind or engine
+
+    def eventos():
+        with bind.connect() as conn:
+            if ids is None:
+                todos = conn.execute(select(Profissional.id_profissional)
+                                     .order_by(Profissional.id_profissional)).scalars()
+            else:
+                todos = iter(ids)
+            while True:
+                parte = list(islice(todos, bloco))
+                if not parte:
+                    return
+                yield from iterar_eventos(conn, parte, data_inicio, data_fim, yield_per=yield_per)
+
+    return linhas_ical(eventos())
+
+
+def escrever_ical(caminho, data_inicio, data_fim, ids=None, bind=None):
+    """ Grava o feed em um arquivo; devolve o número de eventos. """
+    eventos = 0
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        for linha in exportar_ical(data_inicio, data_fim, ids, bind):
+            if linha == "BEGIN:VEVENT\r\n":
+                eventos += 1
+            arquivo.write(linha)
+    return eventos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("saida", help="arquivo .ics")
+    parser.add_argument("--inicio", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--profissional", type=int, action="append", help="pode repetir; padrão: todos")
+    args = parser.parse_args()
+
+    inicio = relogio.perf_counter()
+    eventos = escrever_ical(args.saida, args.inicio, args.inicio + timedelta(days=args.dias - 1), args.profissional)
+    print(f"{eventos} eventos gravados em {args.saida} em {relogio.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
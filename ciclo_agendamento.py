@@ -0,0 +1,248 @@
+"""
+Ciclo de vida dos agendamentos em lote, com histórico.
+
+As transições permitidas são as de Agendamento.TRANSICOES_STATUS
+(Pendente -> Confirmado/Cancelado, Confirmado -> Concluido/Cancelado). Em
+vez de carregar cada agendamento e chamar mudar_status, as funções daqui
+rodam um UPDATE por status de origem permitido:
+
+    UPDATE AGENDAMENTO SET status = :novo WHERE <filtro> AND status = :origem
+    RETURNING id_agendamento
+
+de modo que um agendamento em um status que não permite a transição
+simplesmente não é alterado (mesmo que outro processo tenha mudado o
+status entre a seleção e o UPDATE), e os ids devolvidos já dizem de onde
+cada um veio. As mudanças vão para HISTORICO_STATUS_AGENDAMENTO com um
+INSERT em lote.
+
+Os UPDATEs do Core não passam pelos eventos do ORM que limpam o cache do
+calendário, então as semanas alteradas são invalidadas aqui
+(calendario.invalidar_calendarios) depois do commit:
+
+  - transicionar(conn, ids, novo): ids conhecidos (webhooks, telas); a
+    transação é de quem chama, que recebe as semanas em `afetados` e
+    invalida depois do commit;
+  - transicionar_onde(bind, novo, condicao): por filtro, em lotes com uma
+    transação curta cada (processamento do fim do dia); invalida as
+    semanas de cada lote logo após o commit dele;
+  - fechar_dia(bind, data): conclui as consultas confirmadas até a data e
+    cancela as que nunca foram pagas, com o PAGAMENTO pendente delas
+    marcado como "Falhou" na mesma transação (falhar_pagamentos);
+  - historico / alteracoes_do_usuario: leitura do histórico sem objetos do
+    ORM, pelos índices da tabela.
+
+Uso: python ciclo_agendamento.py fechar-dia [--data AAAA-MM-DD]
+     python ciclo_agendamento.py historico ID
+"""
+import argparse
+from collections import Counter, namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, insert, select, update
+
+from calendario import invalidar_calendarios
+from Model import engine, init_db, linha_historico_status, Agendamento, HistoricoStatusAgendamento, Pagamento
+
+TAMANHO_LOTE = 1000
+
+Mudanca = namedtuple('Mudanca', ['agendamento_id', 'de', 'para', 'em', 'por', 'motivo'])
+
+_AGENDAMENTOS = Agendamento.__table__
+_HISTORICO = HistoricoStatusAgendamento.__table__
+_PAGAMENTOS = Pagamento.__table__
+_STATUS = Agendamento.OPCOES_STATUS_AGENDAMENTO
+
+# Status de origem de onde se pode chegar a cada status
+ORIGENS = {novo: tuple(origem for origem, destinos in Agendamento.TRANSICOES_STATUS.items() if novo in destinos)
+           for novo in _STATUS}
+
+
+def _atualizar(novo_status, *condicoes):
+    return (update(_AGENDAMENTOS)
+            .where(*condicoes)
+            .values(status=novo_status, **Agendamento.VALORES_AO_ENTRAR.get(novo_status, {}))
+            .returning(_AGENDAMENTOS.c.id_agendamento, _AGENDAMENTOS.c.profissional_id,
+                       _AGENDAMENTOS.c.data_consulta))
+
+
+def _anotar_afetados(afetados, linhas):
+    """ Acrescenta as semanas das linhas devolvidas por _atualizar a {profissional_id: {datas}}. """
+    for linha in linhas:
+        afetados.setdefault(linha.profissional_id, set()).add(linha.data_consulta)
+
+
+# UPDATE por lista de ids, um para cada (novo status, origem)
+_POR_IDS = {
+    (novo, origem): _atualizar(novo, _AGENDAMENTOS.c.id_agendamento.in_(bindparam("b_ids", expanding=True)),
+                               _AGENDAMENTOS.c.status == origem)
+    for novo in _STATUS for origem in ORIGENS[novo]
+}
+
+
+_PAGAMENTOS_PENDENTES = (update(_PAGAMENTOS)
+                         .where(_PAGAMENTOS.c.agendamento_id.in_(bindparam("b_ids", expanding=True)),
+                                _PAGAMENTOS.c.status == "Pendente")
+                         .values(status="Falhou"))
+
+
+def _validar(novo_status):
+    if not ORIGENS.get(novo_status):
+        raise ValueError(f"nenhuma transição leva a {novo_status!r}")
+
+
+def _gravar_historico(conn, alterados, novo_status, por, motivo, quando):
+    linhas = [linha_historico_status(agendamento_id, origem, novo_status, quando, por, motivo)
+              for origem, ids in alterados.items() for agendamento_id in ids]
+    if linhas:
+        conn.execute(insert(_HISTORICO), linhas)
+
+
+def transicionar(conn, ids, novo_status, por=None, motivo=None, quando=None, afetados=None):
+    """
+    Leva os agendamentos `ids` para `novo_status`, onde a transição é
+    permitida, dentro da transação de `conn`. Devolve {status de origem:
+    [ids alterados]}; ids ausentes ou em outro status ficam de fora.
+    `afetados`, se passado, recebe {profissional_id: {datas}} das consultas
+    alteradas, para invalidar_calendarios() depois do commit.
+    """
+    _validar(novo_status)
+    ids = list(dict.fromkeys(ids))
+    quando = quando or datetime.utcnow()
+    alterados = {}
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+        for origem in ORIGENS[novo_status]:
+            linhas = conn.execute(_POR_IDS[novo_status, origem], {"b_ids": lote}).all()
+            if linhas:
+                alterados.setdefault(origem, []).extend(linha.id_agendamento for linha in linhas)
+                if afetados is not None:
+                    _anotar_afetados(afetados, linhas)
+    _gravar_historico(conn, alterados, novo_status, por, motivo, quando)
+    return alterados
+
+
+def transicionar_onde(bind, novo_status, condicao, por=None, motivo=None, origens=None, tamanho_lote=TAMANHO_LOTE,
+                      ao_mudar=None):
+    """
+    Leva para `novo_status` todos os agendamentos que atendem `condicao`
+    (expressão sobre Agendamento), em lotes de `tamanho_lote`, cada um na
+    sua transação: a trava de escrita fica presa só durante um lote.
+    `origens` restringe os status de origem e `ao_mudar(conn, ids)` é
+    chamada na transação de cada lote com os ids alterados. As semanas do
+    calendário de cada lote são invalidadas depois do commit. Devolve um
+    Counter {status de origem: quantidade}.
+    """
+    _validar(novo_status)
+    bind = bind or engine
+    resumo = Counter()
+    for origem in ORIGENS[novo_status]:
+        if origens is not None and origem not in origens:
+            continue
+        lote = (select(_AGENDAMENTOS.c.id_agendamento)
+                .where(condicao, _AGENDAMENTOS.c.status == origem)
+                .limit(tamanho_lote).scalar_subquery())
+        consulta = _atualizar(novo_status, _AGENDAMENTOS.c.id_agendamento.in_(lote), _AGENDAMENTOS.c.status == origem)
+        while True:
+            with bind.begin() as conn:
+                linhas = conn.execute(consulta).all()
+                mudaram = [linha.id_agendamento for linha in linhas]
+                _gravar_historico(conn, {origem: mudaram}, novo_status, por, motivo, datetime.utcnow())
+                if ao_mudar is not None and mudaram:
+                    ao_mudar(conn, mudaram)
+            if linhas:
+                afetados = {}
+                _anotar_afetados(afetados, linhas)
+                invalidar_calendarios(afetados)
+            resumo[origem] += len(mudaram)
+            if len(mudaram) < tamanho_lote:
+                break
+    return resumo
+
+
+def falhar_pagamentos(conn, ids):
+    """
+    Marca como "Falhou" os pagamentos ainda pendentes dos agendamentos
+    `ids` (reservas canceladas sem pagamento). Devolve quantos mudaram.
+    """
+    return conn.execute(_PAGAMENTOS_PENDENTES, {"b_ids": ids}).rowcount
+
+
+def cancelar(conn, ids, por=None, motivo=None, afetados=None):
+    """ Cancela (os que ainda não foram concluídos). Devolve {status de origem: [ids]}. """
+    return transicionar(conn, ids, "Cancelado", por, motivo, afetados=afetados)
+
+
+def fechar_dia(bind=None, data=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Processamento do fim do dia `data` (padrão: hoje): consultas
+    confirmadas até a data viram Concluido e reservas ainda pendentes (sem
+    pagamento) de consultas até a data são canceladas, com o pagamento
+    pendente de cada uma marcado como "Falhou" no mesmo lote. Devolve um
+    Counter com concluidas, expiradas e pagamentos_cancelados.
+    """
+    data = data or date.today()
+    ate = _AGENDAMENTOS.c.data_consulta <= data
+    resumo = Counter()
+
+    def ao_cancelar(conn, ids):
+        resumo["pagamentos_cancelados"] += falhar_pagamentos(conn, ids)
+
+    resumo["concluidas"] = sum(transicionar_onde(bind, "Concluido", ate, motivo="fim do dia",
+                                                 tamanho_lote=tamanho_lote).values())
+    resumo["expiradas"] = sum(transicionar_onde(bind, "Cancelado", ate, motivo="não paga até a consulta",
+                                                origens=("Pendente",), tamanho_lote=tamanho_lote,
+                                                ao_mudar=ao_cancelar).values())
+    return resumo
+
+
+# -------------------------------------------------------------------------
+# Leitura do histórico (Core, sem objetos do ORM)
+# -------------------------------------------------------------------------
+
+def _mudanca(linha):
+    return Mudanca(linha.agendamento_id, None if linha.status_anterior is None else _STATUS[linha.status_anterior],
+                   _STATUS[linha.status_novo], linha.alterado_em, linha.alterado_por, linha.motivo)
+
+
+_CONSULTA_HISTORICO = select(_HISTORICO).where(
+    _HISTORICO.c.agendamento_id == bindparam("b_agendamento")).order_by(_HISTORICO.c.id_historico)
+
+_CONSULTA_AUTOR = select(_HISTORICO).where(
+    _HISTORICO.c.alterado_por == bindparam("b_usuario"),
+    _HISTORICO.c.alterado_em >= bindparam("b_inicio"),
+    _HISTORICO.c.alterado_em < bindparam("b_fim"),
+).order_by(_HISTORICO.c.alterado_em)
+
+
+def historico(conn, agendamento_id):
+    """ Mudanças de status de um agendamento, em ordem. """
+    return [_mudanca(linha) for linha in conn.execute(_CONSULTA_HISTORICO, {"b_agendamento": agendamento_id})]
+
+
+def alteracoes_do_usuario(conn, usuario_id, inicio, fim):
+    """ Mudanças feitas por um usuário em [inicio, fim). """
+    return [_mudanca(linha) for linha in
+            conn.execute(_CONSULTA_AUTOR, {"b_usuario": usuario_id, "b_inicio": inicio, "b_fim": fim})]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("acao", choices=("fechar-dia", "historico"))
+    parser.add_argument("agendamento", type=int, nargs="?")
+    parser.add_argument("--data", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    init_db()
+    if args.acao == "fechar-dia":
+        resumo = fechar_dia(data=args.data)
+        print(f"{resumo['concluidas']} consultas concluídas, {resumo['expiradas']} reservas não pagas canceladas "
+              f"({resumo['pagamentos_cancelados']} pagamentos marcados como Falhou)")
+    else:
+        with engine.connect() as conn:
+            for mudanca in historico(conn, args.agendamento):
+                print(f"{mudanca.em:%Y-%m-%d %H:%M:%S}  {mudanca.de or '-':>10} -> {mudanca.para:<10} "
+                      f"por {mudanca.por or 'sistema'}  {mudanca.motivo or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Fábrica de engines do banco de dados.
+
+Centraliza a criação das engines do SQLAlchemy para que todos os
+consumidores (Model.py, serviços, scripts de teste e benchmarks) usem a
+mesma configuração: WAL, synchronous=NORMAL, mmap e cache do SQLite,
+pool de conexões para workers com várias threads e, opcionalmente, uma
+engine somente leitura para relatórios.
+
+A engine pode ser criada a partir de uma DSN ou de um dicionário de
+configuração:
+
+    criar_engine("sqlite:///tcc.db")
+    criar_engine({"url": "sqlite:///tcc.db", "pool_size": 20, "pragmas": {"cache_size": -131072}})
+
+criar_engine_async() cria a engine equivalente do asyncio (aiosqlite para
+SQLite), com os mesmos PRAGMAs e o mesmo pool, para o banco_async.py.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+
+# PRAGMAs aplicados em cada nova conexão SQLite
+PRAGMAS_PADRAO = {
+    "journal_mode": "WAL",      # leitores não bloqueiam o escritor (e vice-versa)
+    "synchronous": "NORMAL",    # seguro com WAL e bem mais rápido que FULL
+    "mmap_size": 268435456,     # 256 MB de leitura via memória mapeada
+    "cache_size": -65536,       # 64 MB de cache de páginas (valor negativo = KiB)
+    "busy_timeout": 5000,       # espera até 5 s pela trava de escrita antes de falhar
+    "temp_store": "MEMORY",
+}
+
+# Pool para workers web com várias threads
+POOL_SIZE_PADRAO = 10
+MAX_OVERFLOW_PADRAO = 20
+POOL_TIMEOUT_PADRAO = 30
+
+
+def _sqlite_em_memoria(url):
+    return url.database in (None, "", ":memory:")
+
+
+def _aplicar_pragmas(engine, pragmas, somente_leitura):
+    """ Registra um listener que configura cada conexão DBAPI recém-aberta. """
+
+    @event.listens_for(engine, "connect")
+    def _configurar_conexao(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            for nome, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {nome}={valor}")
+            if somente_leitura:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+
+def _montar_engine(fabrica, url, pragmas, pool_size, max_overflow, pool_timeout, somente_leitura, opcoes):
+    """
+    Configuração comum de criar_engine e criar_engine_async: `fabrica` é
+    create_engine ou create_async_engine. Os PRAGMAs são registrados na
+    engine síncrona (a sync_engine, no caso async).
+    """
+    if url.get_backend_name() != "sqlite":
+        # Outros bancos: apenas o pool (os PRAGMAs são específicos do SQLite)
+        return fabrica(url, pool_size=pool_size, max_overflow=max_overflow,
+                       pool_timeout=pool_timeout, pool_pre_ping=True, **opcoes)
+
+    pragmas_efetivos = dict(PRAGMAS_PADRAO)
+    pragmas_efetivos.update(pragmas or {})
+    pragmas_efetivos = {nome: valor for nome, valor in pragmas_efetivos.items() if valor is not None}
+
+    connect_args = dict(opcoes.pop("connect_args", {}))
+    # As conexões do pool são compartilhadas entre threads (uma por vez)
+    connect_args.setdefault("check_same_thread", False)
+
+    if _sqlite_em_memoria(url):
+        # Banco em memória: uma única conexão compartilhada, WAL não se aplica
+        pragmas_efetivos.pop("journal_mode", None)
+        pragmas_efetivos.pop("mmap_size", None)
+        engine = fabrica(url, poolclass=StaticPool, connect_args=connect_args, **opcoes)
+    else:
+        connect_args.setdefault("timeout", pragmas_efetivos.get("busy_timeout", 5000) / 1000)
+        engine = fabrica(url, pool_size=pool_size, max_overflow=max_overflow,
+                         pool_timeout=pool_timeout, connect_args=connect_args, **opcoes)
+
+    _aplicar_pragmas(getattr(engine, "sync_engine", engine), pragmas_efetivos, somente_leitura)
+    return engine
+
+
+def criar_engine(dsn_ou_config, pragmas=None, pool_size=POOL_SIZE_PADRAO,
+                 max_overflow=MAX_OVERFLOW_PADRAO, pool_timeout=POOL_TIMEOUT_PADRAO,
+                 somente_leitura=False, **opcoes):
+    """
+    Cria uma engine configurada a partir de uma DSN ou de um dicionário.
+
+    `pragmas` sobrescreve/complementa PRAGMAS_PADRAO (use None como valor
+    para remover um PRAGMA). `somente_leitura=True` liga PRAGMA query_only,
+    útil para a engine de relatórios. Opções extras vão para create_engine.
+    """
+    if isinstance(dsn_ou_config, dict):
+        config = dict(dsn_ou_config)
+        dsn_ou_config = config.pop("url")
+        return criar_engine(dsn_ou_config, **config)
+
+    return _montar_engine(create_engine, make_url(dsn_ou_config), pragmas, pool_size, max_overflow,
+                          pool_timeout, somente_leitura, opcoes)
+
+
+def criar_engine_leitura(dsn_ou_config, **opcoes):
+    """
+    Cria a engine de leitura (réplica) usada pelas consultas de relatório.
+
+    Com SQLite em WAL, a "réplica" pode ser o próprio arquivo principal:
+    os leitores não bloqueiam as gravações e query_only impede escritas
+    acidentais por essa engine.
+    """
+    opcoes.setdefault("somente_leitura", True)
+    return criar_engine(dsn_ou_config, **opcoes)
+
+
+def _url_async(url):
+    """ Troca o driver síncrono do SQLite pelo aiosqlite (outros bancos: a URL já deve indicar o driver async). """
+    if url.get_backend_name() == "sqlite" and url.get_driver_name() in ("pysqlite", "sqlite"):
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+def criar_engine_async(dsn_ou_config, pragmas=None, pool_size=POOL_SIZE_PADRAO,
+                       max_overflow=MAX_OVERFLOW_PADRAO, pool_timeout=POOL_TIMEOUT_PADRAO,
+                       somente_leitura=False, **opcoes):
+    """
+    Cria uma AsyncEngine com a mesma configuração de criar_engine.
+
+    "sqlite:///tcc.db" vira "sqlite+aiosqlite:///tcc.db"; os PRAGMAs são
+    aplicados a cada conexão nova pela sync_engine. Requer o pacote aiosqlite.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if isinstance(dsn_ou_config, dict):
+        config = dict(dsn_ou_config)
+        dsn_ou_config = config.pop("url")
+        return criar_engine_async(dsn_ou_config, **config)
+
+    return _montar_engine(create_async_engine, _url_async(make_url(dsn_ou_config)), pragmas, pool_size,
+                          max_overflow, pool_timeout, somente_leitura, opcoes)
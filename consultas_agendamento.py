@@ -0,0 +1,63 @@
+"""
+Listagens de agendamentos com os dados de exibição já carregados.
+
+Uma lista de N agendamentos mostrando paciente, profissional e pagamento
+fazia 1 + 3N consultas (ou mais) com os lazy loads padrão. Aqui o número
+de consultas é constante, qualquer que seja N:
+
+  1. os agendamentos;
+  2. os pacientes (SELECT ... IN), com o USUARIO na mesma junção;
+  3. os profissionais (SELECT ... IN), idem;
+  4. os pagamentos (SELECT ... IN).
+
+(O SQLAlchemy divide cada SELECT ... IN em blocos de 500 ids, então listas
+maiores que isso fazem uma consulta a mais por bloco.)
+
+As relações em Model.py ficam com o carregamento padrão (sob demanda); cada
+listagem diz na consulta o que precisa carregar, em OPCOES_EXIBICAO.
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from Model import Agendamento, Paciente, Profissional
+
+LIMITE_PADRAO = 100
+
+OPCOES_EXIBICAO = (
+    selectinload(Agendamento.paciente).joinedload(Paciente.usuario),
+    selectinload(Agendamento.profissional).joinedload(Profissional.usuario),
+    selectinload(Agendamento.pagamento),
+)
+
+
+def listar_agendamentos(session, profissional_id=None, paciente_id=None, status=None, desde=None,
+                        limite=LIMITE_PADRAO):
+    """
+    Agendamentos (em ordem de data/hora) com paciente.usuario,
+    profissional.usuario e pagamento carregados, em 4 consultas.
+    """
+    consulta = select(Agendamento).options(*OPCOES_EXIBICAO)
+    if profissional_id is not None:
+        consulta = consulta.where(Agendamento.profissional_id == profissional_id)
+    if paciente_id is not None:
+        consulta = consulta.where(Agendamento.paciente_id == paciente_id)
+    if status is not None:
+        consulta = consulta.where(Agendamento.status == status)
+    if desde is not None:
+        consulta = consulta.where(Agendamento.data_consulta >= desde)
+    consulta = consulta.order_by(Agendamento.data_consulta, Agendamento.hora_consulta,
+                                 Agendamento.id_agendamento).limit(limite)
+    return session.scalars(consulta).all()
+
+
+def linha_exibicao(agendamento):
+    """ Os campos que a tela de agendamentos mostra (não dispara consultas após listar_agendamentos). """
+    pagamento = agendamento.pagamento
+    return dict(
+        id_agendamento=agendamento.id_agendamento, data=agendamento.data_consulta, hora=agendamento.hora_consulta,
+        status=agendamento.status, paciente=agendamento.paciente.usuario.nome,
+        profissional=agendamento.profissional.usuario.nome,
+        especialidade=agendamento.profissional.tipo_de_especialidade,
+        pagamento=pagamento.status if pagamento is not None else None,
+        valor=pagamento.valor if pagamento is not None else None,
+    )
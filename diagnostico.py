@@ -0,0 +1,135 @@
+"""
+Detector de N+1 para desenvolvimento.
+
+Conta os comandos SQL executados em cada "unidade de trabalho" (uma
+requisição, um job, uma listagem) e aponta:
+  - o mesmo SQL repetido muitas vezes na unidade (sinal de laço que faz uma
+    consulta por item);
+  - tempestades de lazy load: a mesma relação do ORM carregada sob demanda
+    muitas vezes (ex: agendamento.paciente dentro de um for), com o caminho
+    da relação para saber qual opção de carregamento falta.
+
+    detector = DetectorNMais1(limite_repeticoes=10)
+    detector.instalar(engine)
+    with detector.unidade("listar agendamentos") as relatorio:
+        ...
+    print(relatorio)
+
+Os problemas viram avisos (AvisoNMais1) ou, com estrito=True, um erro
+(ErroNMais1), para quebrar os testes. O custo fica só nos processos em
+que o detector é instalado; ativar_se_debug() instala quando a variável de
+ambiente TCC_DEBUG_SQL está definida (Model.py chama na engine principal e
+guarda o detector em Model.detector_n_mais_1).
+"""
+import contextvars
+import os
+import warnings
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+LIMITE_REPETICOES_PADRAO = 10
+
+
+class AvisoNMais1(UserWarning):
+    pass
+
+
+class ErroNMais1(Exception):
+    pass
+
+
+class RelatorioUnidade:
+    """ O que foi executado em uma unidade de trabalho. """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.por_sql = Counter()       # SQL (com parâmetros de ligação, sem valores) -> execuções
+        self.lazy_loads = Counter()    # "Classe.relacao" -> cargas sob demanda
+
+    @property
+    def total(self):
+        return sum(self.por_sql.values())
+
+    def problemas(self, limite_repeticoes):
+        encontrados = [f"lazy load de {caminho} {vezes}x" for caminho, vezes in self.lazy_loads.most_common()
+                       if vezes > limite_repeticoes]
+        encontrados += [f"mesmo SQL {vezes}x: {' '.join(sql.split())[:160]}" for sql, vezes in self.por_sql.most_common()
+                        if vezes > limite_repeticoes]
+        return encontrados
+
+    def __str__(self):
+        lazy = f", lazy loads: {dict(self.lazy_loads)}" if self.lazy_loads else ""
+        return f"{self.nome}: {self.total} comandos SQL ({len(self.por_sql)} distintos){lazy}"
+
+
+_unidade_atual = contextvars.ContextVar("unidade_atual", default=None)
+
+
+def _contar_sql(_conn, _cursor, sql, _parametros, _contexto, executemany):
+    relatorio = _unidade_atual.get()
+    if relatorio is not None:
+        relatorio.por_sql[sql] += 1
+
+
+def _contar_lazy_load(estado_execucao):
+    relatorio = _unidade_atual.get()
+    if relatorio is None or not estado_execucao.is_relationship_load:
+        return
+    origem = estado_execucao.lazy_loaded_from
+    if origem is not None:
+        caminho = estado_execucao.loader_strategy_path
+        relacao = caminho[-1].key if caminho and len(caminho) else "?"
+        relatorio.lazy_loads[f"{origem.class_.__name__}.{relacao}"] += 1
+
+
+class DetectorNMais1:
+
+    def __init__(self, limite_repeticoes=LIMITE_REPETICOES_PADRAO, estrito=False):
+        self.limite_repeticoes = limite_repeticoes
+        self.estrito = estrito
+        self.relatorios = []
+
+    def instalar(self, engine):
+        """ Passa a contar os comandos desta engine (e os lazy loads de qualquer Session). """
+        if not event.contains(engine, "before_cursor_execute", _contar_sql):
+            event.listen(engine, "before_cursor_execute", _contar_sql)
+        if not event.contains(Session, "do_orm_execute", _contar_lazy_load):
+            event.listen(Session, "do_orm_execute", _contar_lazy_load)
+        return self
+
+    @contextmanager
+    def unidade(self, nome="unidade"):
+        relatorio = RelatorioUnidade(nome)
+        token = _unidade_atual.set(relatorio)
+        try:
+            yield relatorio
+        finally:
+            _unidade_atual.reset(token)
+        self.relatorios.append(relatorio)
+        problemas = relatorio.problemas(self.limite_repeticoes)
+        if problemas:
+            mensagem = f"Possível N+1 em '{nome}' ({relatorio.total} comandos): " + "; ".join(problemas)
+            if self.estrito:
+                raise ErroNMais1(mensagem)
+            warnings.warn(mensagem, AvisoNMais1, stacklevel=3)
+
+    def monitorar(self, nome=None):
+        """ Decorador: cada chamada da função é uma unidade de trabalho. """
+        def decorador(funcao):
+            @wraps(funcao)
+            def envolvida(*args, **kwargs):
+                with self.unidade(nome or funcao.__qualname__):
+                    return funcao(*args, **kwargs)
+            return envolvida
+        return decorador
+
+
+def ativar_se_debug(engine, **opcoes):
+    """ Instala um DetectorNMais1 na engine se TCC_DEBUG_SQL estiver definida; senão devolve None. """
+    if not os.environ.get("TCC_DEBUG_SQL"):
+        return None
+    return DetectorNMais1(**opcoes).instalar(engine)
@@ -0,0 +1,329 @@
+"""
+Motor de busca de horários disponíveis.
+
+Expande os modelos semanais de AGENDA_PROFISSIONAL (dia_semana, hora_inicio,
+hora_fim) em intervalos concretos, subtrai os AGENDAMENTOs já existentes e
+devolve os horários livres de todos os profissionais de uma especialidade.
+
+O banco é lido em blocos de profissionais, um dia por vez: os ids da
+especialidade são paginados por id (ix_profissional_especialidade_preco) e
+lidos, com as agendas (ix_agenda_profissional_dia), só na primeira data; os
+agendamentos de cada bloco no dia vêm do índice uq_agendamento_horario. A
+busca para de ler assim que `limite` horários foram encontrados, e
+iterar_horarios_disponiveis entrega os horários à medida que cada bloco é
+lido. Em cada bloco, a subtração é feita em memória com um índice de
+arrays ordenados.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from itertools import islice
+from datetime import time, timedelta
+
+from sqlalchemy import bindparam, literal, select
+
+from Model import Agendamento, AgendaProfissional, Profissional
+
+# Duração padrão de uma consulta (em minutos)
+DURACAO_PADRAO_MINUTOS = 50
+
+# Mapeia o dia da semana usado no Enum para o número de date.weekday()
+# (OPCOES_DIA_SEMANA já está na ordem Segunda=0 ... Domingo=6)
+DIA_SEMANA_PARA_NUMERO = {dia: i for i, dia in enumerate(AgendaProfissional.OPCOES_DIA_SEMANA)}
+
+# Profissionais do primeiro bloco lido pela busca; cada bloco seguinte tem o dobro, até BLOCO_MAXIMO
+BLOCO_INICIAL = 50
+BLOCO_MAXIMO = 1000
+
+# Resultado da busca: um horário concreto que pode ser reservado
+HorarioLivre = namedtuple('HorarioLivre', ['profissional_id', 'data', 'hora_inicio', 'hora_fim'])
+
+
+def _para_minutos(hora):
+    """ Converte um datetime.time em minutos desde a meia-noite. """
+    return hora.hour * 60 + hora.minute
+
+
+# Tabela com um datetime.time para cada minuto do dia (evita recriar objetos)
+_HORAS = [time(m // 60, m % 60) for m in range(24 * 60)]
+
+
+class IndiceOcupacao:
+    """
+    Índice dos horários já ocupados, por profissional e por dia.
+
+    Para cada (profissional, data) guarda os inícios ordenados e o máximo
+    acumulado dos fins. Assim, saber se [inicio, fim) colide com alguma
+    consulta é uma busca binária: O(log n) por consulta ao índice.
+    """
+
+    def __init__(self):
+        self._dias = {}
+
+    @classmethod
+    def construir(cls, ocupados, duracao_minutos):
+        """
+        Monta o índice a partir de (profissional_id, data, hora_inicio);
+        cada entrada ocupa `duracao_minutos` a partir da hora marcada.
+        """
+        indice = cls()
+        inicios_por_dia = defaultdict(list)
+        for profissional_id, data, hora in ocupados:
+            inicios_por_dia[(profissional_id, data)].append(_para_minutos(hora))
+
+        for chave, inicios in inicios_por_dia.items():
+            inicios.sort()
+            # Com duração fixa, o máximo acumulado dos fins é o fim do último início
+            indice._dias[chave] = (inicios, [i + duracao_minutos for i in inicios])
+        return indice
+
+    def arrays(self, profissional_id, data):
+        """
+        Retorna (inicios, fins_max) do dia, ou None se não houver nada ocupado.
+        """
+        return self._dias.get((profissional_id, data))
+
+    def ocupado(self, profissional_id, data, inicio, fim):
+        """ Retorna True se [inicio, fim) colide com algum intervalo registrado. """
+        arrays = self._dias.get((profissional_id, data))
+        if arrays is None:
+            return False
+        inicios, fins_max = arrays
+        # Intervalos que começam antes do fim do candidato: [0, pos)
+        pos = bisect_left(inicios, fim)
+        return pos > 0 and fins_max[pos - 1] > inicio
+
+
+def _agendas_por_dia_semana(agendas):
+    """ {date.weekday(): [(profissional_id, inicio_min, fim_min)]}, em ordem de profissional e hora. """
+    por_dia_semana = defaultdict(list)
+    for profissional_id, dia_semana, hora_inicio, hora_fim in agendas:
+        por_dia_semana[DIA_SEMANA_PARA_NUMERO[dia_semana]].append(
+            (profissional_id, _para_minutos(hora_inicio), _para_minutos(hora_fim))
+        )
+    for slots in por_dia_semana.values():
+        slots.sort()
+    return por_dia_semana
+
+
+def expandir_agendas(agendas, data_inicio, data_fim):
+    """
+    Expande os modelos semanais em intervalos concretos.
+
+    `agendas` é um iterável de (profissional_id, dia_semana, hora_inicio, hora_fim).
+    Gera tuplas (profissional_id, data, inicio_min, fim_min) para cada data
+    entre data_inicio e data_fim (inclusive).
+    """
+    por_dia_semana = _agendas_por_dia_semana(agendas)
+
+    data = data_inicio
+    while data <= data_fim:
+        for profissional_id, inicio, fim in por_dia_semana.get(data.weekday(), ()):
+            yield profissional_id, data, inicio, fim
+        data += timedelta(days=1)
+
+
+def iterar_horarios_livres(agendas, ocupados, data_inicio, data_fim,
+                           duracao_minutos=DURACAO_PADRAO_MINUTOS, passo_minutos=None):
+    """
+    Gera os horários livres (HorarioLivre) sem acessar o banco.
+
+    `ocupados` é um iterável de (profissional_id, data_consulta, hora_consulta);
+    cada agendamento ocupa `duracao_minutos` a partir da hora marcada.
+    Os horários seguem a grade hora_inicio + k * passo de cada slot da agenda.
+    """
+    indice = IndiceOcupacao.construir(ocupados, duracao_minutos)
+    return _livres(expandir_agendas(agendas, data_inicio, data_fim), indice, duracao_minutos,
+                   passo_minutos or duracao_minutos)
+
+
+def _livres(slots, indice, duracao_minutos, passo):
+    """ Horários livres dos slots (profissional_id, data, inicio_min, fim_min), descontado o índice. """
+    for profissional_id, data, inicio_slot, fim_slot in slots:
+        # Percorre os intervalos ocupados em ordem, emitindo os horários de cada lacuna livre
+        inicios, fins_max = indice.arrays(profissional_id, data) or ((), ())
+        cursor = inicio_slot
+        for ocupado_inicio, ocupado_fim in zip(inicios, fins_max):
+            if ocupado_fim <= cursor:
+                continue
+            if ocupado_inicio >= fim_slot:
+                break
+            yield from _horarios_na_lacuna(profissional_id, data, inicio_slot, cursor, ocupado_inicio,
+                                           duracao_minutos, passo)
+            cursor = ocupado_fim
+        yield from _horarios_na_lacuna(profissional_id, data, inicio_slot, cursor, fim_slot,
+                                       duracao_minutos, passo)
+
+
+def _horarios_na_lacuna(profissional_id, data, origem, lacuna_inicio, lacuna_fim, duracao, passo):
+    """ Horários da grade (origem + k * passo) que cabem inteiros em [lacuna_inicio, lacuna_fim). """
+    primeiro = origem + -(-(lacuna_inicio - origem) // passo) * passo
+    return [HorarioLivre(profissional_id, data, _HORAS[inicio], _HORAS[inicio + duracao])
+            for inicio in range(primeiro, lacuna_fim - duracao + 1, passo)]
+
+
+def calcular_horarios_livres(agendas, ocupados, data_inicio, data_fim,
+                             duracao_minutos=DURACAO_PADRAO_MINUTOS, passo_minutos=None, limite=None):
+    """ Versão em lista de iterar_horarios_livres (limitada a `limite` itens, se informado). """
+    livres = iterar_horarios_livres(agendas, ocupados, data_inicio, data_fim, duracao_minutos, passo_minutos)
+    return list(islice(livres, limite))
+
+
+def consultas_disponibilidade(tipo_de_especialidade):
+    """
+    Os SELECTs da busca, usados também pelo banco_async:
+      - os próximos b_limite profissionais da especialidade com id maior que b_apos;
+      - as agendas dos profissionais b_ids;
+      - os agendamentos ocupados dos profissionais b_ids no dia b_data.
+    """
+    profissionais = (
+        select(Profissional.id_profissional)
+        .where(Profissional.tipo_de_especialidade == tipo_de_especialidade,
+               Profissional.id_profissional > bindparam("b_apos"))
+        .order_by(Profissional.id_profissional)
+        .limit(bindparam("b_limite"))
+    )
+    agendas = (
+        select(AgendaProfissional.profissional_id, AgendaProfissional.dia_semana,
+               AgendaProfissional.hora_inicio, AgendaProfissional.hora_fim)
+        .where(AgendaProfissional.profissional_id.in_(bindparam("b_ids", expanding=True)),
+               AgendaProfissional.disponivel.is_(True))
+    )
+    ocupados = (
+        select(Agendamento.profissional_id, Agendamento.hora_consulta)
+        .where(Agendamento.profissional_id.in_(bindparam("b_ids", expanding=True)),
+               Agendamento.data_consulta == bindparam("b_data"),
+               # Literal no SQL para o SQLite poder usar o índice parcial uq_agendamento_horario
+               Agendamento.status != literal("Cancelado", literal_execute=True))
+    )
+    return profissionais, agendas, ocupados
+
+
+# Um pedaço da busca: os profissionais das posições inicio a fim (na ordem de id) em uma data.
+# Se ler_apos não for None, os profissionais com id maior que ler_apos ainda precisam ser
+# lidos (ler_quantos deles, com as agendas) antes de consultar os ocupados
+Bloco = namedtuple('Bloco', ['data', 'inicio', 'fim', 'ler_apos', 'ler_quantos'])
+
+
+class BuscaPaginada:
+    """
+    Estado de uma busca lida em blocos de profissionais, dia a dia (o mesmo
+    para a versão síncrona e a async):
+
+        busca = BuscaPaginada(data_inicio, data_fim, limite=100)
+        for bloco in busca.blocos():
+            if bloco.ler_apos is not None:
+                ids = <ler_quantos ids da especialidade maiores que ler_apos>
+                busca.adicionar_profissionais(ids, <agendas de ids>)
+            livres = busca.horarios_do_bloco(bloco, <(profissional_id, hora_consulta) ocupados
+                                                     de busca.profissionais(bloco) na data>)
+
+    O primeiro bloco tem BLOCO_INICIAL profissionais e cada um dos seguintes
+    o dobro do anterior, até BLOCO_MAXIMO: uma busca com limite pequeno lê
+    poucas linhas, e uma busca completa faz poucas consultas por dia. Os
+    profissionais e as agendas são lidos uma vez só (na primeira data), e
+    blocos() termina assim que `limite` horários foram entregues.
+    """
+
+    def __init__(self, data_inicio, data_fim, duracao_minutos=DURACAO_PADRAO_MINUTOS,
+                 passo_minutos=None, limite=None):
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.duracao_minutos = duracao_minutos
+        self.passo = passo_minutos or duracao_minutos
+        self.limite = limite
+        self.entregues = 0
+        self.profissional_ids = []           # em ordem de id, à medida que são lidos
+        self._todos_lidos = False
+        self._tamanho = BLOCO_INICIAL
+        self._slots = defaultdict(list)      # date.weekday() -> [(profissional_id, inicio_min, fim_min)]
+        self._chaves = defaultdict(list)     # date.weekday() -> profissional_id de cada slot (para bisect)
+
+    @property
+    def completa(self):
+        return self.limite is not None and self.entregues >= self.limite
+
+    def blocos(self):
+        data = self.data_inicio
+        while data <= self.data_fim:
+            # Com todas as agendas lidas, os dias da semana sem agenda nem são consultados
+            if not self._todos_lidos or data.weekday() in self._slots:
+                inicio = 0
+                while inicio < len(self.profissional_ids) or not self._todos_lidos:
+                    if self.completa:
+                        return
+                    fim = inicio + self._tamanho
+                    faltam = 0 if self._todos_lidos else fim - len(self.profissional_ids)
+                    if faltam > 0:
+                        apos = self.profissional_ids[-1] if self.profissional_ids else 0
+                        yield Bloco(data, inicio, fim, apos, faltam)
+                    else:
+                        yield Bloco(data, inicio, fim, None, 0)
+                    self._tamanho = min(self._tamanho * 2, BLOCO_MAXIMO)
+                    inicio = fim
+            data += timedelta(days=1)
+
+    def adicionar_profissionais(self, ids, agendas, pedidos=None):
+        """
+        Recebe os ids lidos para um bloco (em ordem) e as agendas deles,
+        (profissional_id, dia_semana, hora_inicio, hora_fim). Menos ids que
+        os pedidos (ler_quantos) indica que não há mais profissionais.
+        """
+        if pedidos is None or len(ids) < pedidos:
+            self._todos_lidos = True
+        self.profissional_ids.extend(ids)
+        for dia_semana, slots in _agendas_por_dia_semana(agendas).items():
+            self._slots[dia_semana].extend(slots)
+            self._chaves[dia_semana].extend(profissional_id for profissional_id, _, _ in slots)
+
+    def profissionais(self, bloco):
+        return self.profissional_ids[bloco.inicio:bloco.fim]
+
+    def horarios_do_bloco(self, bloco, ocupados):
+        """ Horários livres do bloco (no máximo os que faltam para o limite), descontados os ocupados. """
+        ids = self.profissionais(bloco)
+        if not ids:
+            return []
+        dia_semana = bloco.data.weekday()
+        chaves = self._chaves[dia_semana]
+        fatia = self._slots[dia_semana][bisect_left(chaves, ids[0]):bisect_right(chaves, ids[-1])]
+        indice = IndiceOcupacao.construir(((profissional_id, bloco.data, hora) for profissional_id, hora in ocupados),
+                                          self.duracao_minutos)
+        slots = ((profissional_id, bloco.data, inicio, fim) for profissional_id, inicio, fim in fatia)
+        restantes = None if self.limite is None else self.limite - self.entregues
+        livres = list(islice(_livres(slots, indice, self.duracao_minutos, self.passo), restantes))
+        self.entregues += len(livres)
+        return livres
+
+
+def iterar_horarios_disponiveis(session, tipo_de_especialidade, data_inicio, data_fim,
+                                duracao_minutos=DURACAO_PADRAO_MINUTOS, passo_minutos=None, limite=None):
+    """
+    Gera os horários livres (HorarioLivre) de todos os profissionais de uma
+    especialidade, em ordem de data, profissional e hora, lendo o banco um
+    bloco por vez: só o que for consumido é lido e montado.
+    """
+    consulta_profissionais, consulta_agendas, consulta_ocupados = consultas_disponibilidade(tipo_de_especialidade)
+    # Só colunas: pela conexão da sessão, sem a camada de carregamento do ORM
+    conn = session.connection()
+    busca = BuscaPaginada(data_inicio, data_fim, duracao_minutos, passo_minutos, limite)
+    for bloco in busca.blocos():
+        if bloco.ler_apos is not None:
+            ids = conn.execute(consulta_profissionais, {"b_apos": bloco.ler_apos,
+                                                        "b_limite": bloco.ler_quantos}).scalars().all()
+            agendas = conn.execute(consulta_agendas, {"b_ids": ids}).all() if ids else []
+            busca.adicionar_profissionais(ids, agendas, bloco.ler_quantos)
+        ids = busca.profissionais(bloco)
+        if ids:
+            yield from busca.horarios_do_bloco(bloco, conn.execute(consulta_ocupados, {
+                "b_data": bloco.data, "b_ids": ids}).all())
+
+
+def buscar_horarios_disponiveis(session, tipo_de_especialidade, data_inicio, data_fim,
+                                duracao_minutos=DURACAO_PADRAO_MINUTOS, passo_minutos=None, limite=None):
+    """
+    Retorna os horários livres de todos os profissionais de uma especialidade
+    no intervalo de datas informado (lista de HorarioLivre, ordenada por data,
+    profissional e hora). Com `limite`, o resto do período nem é lido.
+    """
+    return list(iterar_horarios_disponiveis(session, tipo_de_especialidade, data_inicio, data_fim,
+                                            duracao_minutos, passo_minutos, limite))
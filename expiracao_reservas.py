@@ -0,0 +1,211 @@
+"""
+Expiração das reservas não pagas.
+
+Um agendamento novo fica "Pendente" até o pagamento ser aprovado e, enquanto
+isso, segura o horário (o índice uq_agendamento_horario só deixa de fora os
+cancelados). Para que um paciente que desistiu no meio do pagamento não
+bloqueie a agenda, cada agendamento nasce com prazo_reserva (agora +
+Agendamento.PRAZO_RESERVA) e o VarredorReservas cancela os que passaram do
+prazo ainda pendentes:
+
+  - a busca é uma faixa do índice ix_agendamento_prazo_reserva
+    (status = 'Pendente' AND prazo_reserva < agora), então cada varredura
+    custa o número de reservas vencidas, e não o tamanho da tabela;
+  - o cancelamento usa ciclo_agendamento.transicionar_onde (UPDATEs em
+    lote guardados pelo status, com histórico): uma reserva paga entre a
+    busca e o UPDATE já está "Confirmado" e não é tocada;
+  - na mesma transação o PAGAMENTO ainda pendente da reserva vira
+    "Falhou"; depois do commit, transicionar_onde invalida os calendários
+    em memória das semanas afetadas, devolvendo o horário à
+    disponibilidade. Uma aprovação que
+    chegar depois marca o pagamento para reembolso (webhooks_pagamento.py);
+  - reservas sem prazo (gravadas antes desta versão ou por INSERT do Core)
+    ficam fora da varredura: não há como saber há quanto tempo esperam o
+    pagamento, então seguram o horário até fechar_dia cancelá-las no dia
+    da consulta;
+  - entre varreduras o varredor dorme até o menor prazo pendente (também
+    lido do índice), limitado a INTERVALO_MAXIMO.
+
+metricas() devolve as reservas segurando horário (com e sem prazo), as
+vencidas ainda não varridas, o total expirado, a taxa de expiração recente
+e os pagamentos aprovados tarde à espera de reembolso;
+exportar_prometheus() devolve o mesmo no formato de texto do Prometheus.
+
+Uso: python expiracao_reservas.py [--uma-vez]
+"""
+import argparse
+import threading
+import time as relogio
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, select
+
+from ciclo_agendamento import TAMANHO_LOTE, falhar_pagamentos, transicionar_onde
+from Model import engine, init_db, Agendamento, Pagamento
+
+# Maior espera entre duas varreduras (reservas novas vencem só depois de PRAZO_RESERVA)
+INTERVALO_MAXIMO = timedelta(minutes=1)
+# Janela da taxa de expiração em metricas()
+JANELA_TAXA = timedelta(minutes=5)
+
+_AGENDAMENTOS = Agendamento.__table__
+
+_MENOR_PRAZO = select(func.min(_AGENDAMENTOS.c.prazo_reserva)).where(
+    _AGENDAMENTOS.c.status == "Pendente", _AGENDAMENTOS.c.prazo_reserva.is_not(None))
+
+_CONTAGEM = select(
+    func.count().filter(_AGENDAMENTOS.c.prazo_reserva >= bindparam("b_agora")),
+    func.count().filter(_AGENDAMENTOS.c.prazo_reserva < bindparam("b_agora")),
+    func.count().filter(_AGENDAMENTOS.c.prazo_reserva.is_(None)),
+).where(_AGENDAMENTOS.c.status == "Pendente")
+
+_REEMBOLSOS_PENDENTES = select(func.count()).where(Pagamento.__table__.c.reembolso_pendente_desde.is_not(None))
+
+
+def expirar_reservas(bind=None, agora=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Cancela as reservas pendentes com prazo anterior a `agora`, em lotes
+    (uma transação cada), junto com os pagamentos pendentes delas.
+    Devolve um Counter com expiradas e pagamentos_cancelados.
+    """
+    bind = bind or engine
+    agora = agora or datetime.utcnow()
+    resumo = Counter()
+
+    def ao_expirar(conn, ids):
+        resumo["pagamentos_cancelados"] += falhar_pagamentos(conn, ids)
+
+    vencidas = _AGENDAMENTOS.c.prazo_reserva < agora
+    resumo["expiradas"] = sum(transicionar_onde(bind, "Cancelado", vencidas, motivo="reserva expirada",
+                                                origens=("Pendente",), tamanho_lote=tamanho_lote,
+                                                ao_mudar=ao_expirar).values())
+    return resumo
+
+
+class VarredorReservas:
+    """
+    Varre as reservas vencidas em segundo plano.
+
+        varredor = VarredorReservas()
+        threading.Thread(target=varredor.executar, daemon=True).start()
+        ...
+        varredor.parar()
+
+    executar_ciclo(agora) faz uma varredura só (útil em testes e benchmarks).
+    """
+
+    def __init__(self, bind=None, intervalo_maximo=INTERVALO_MAXIMO, tamanho_lote=TAMANHO_LOTE,
+                 janela_taxa=JANELA_TAXA):
+        self.bind = bind or engine
+        self.intervalo_maximo = intervalo_maximo
+        self.tamanho_lote = tamanho_lote
+        self.janela_taxa = janela_taxa
+        self._parar = threading.Event()
+        self._trava = threading.Lock()
+        self._recentes = deque()    # (instante, expiradas) das varreduras dentro da janela
+
+        # Contadores
+        self.ciclos = 0
+        self.expiradas = 0
+        self.pagamentos_cancelados = 0
+        self.duracao_ultimo_ciclo = 0.0
+
+    def parar(self):
+        self._parar.set()
+
+    def executar_ciclo(self, agora=None):
+        """ Expira as reservas vencidas até `agora`. Devolve quantas foram canceladas. """
+        agora = agora or datetime.utcnow()
+        inicio = relogio.perf_counter()
+        resumo = expirar_reservas(self.bind, agora, self.tamanho_lote)
+        with self._trava:
+            self.ciclos += 1
+            self.expiradas += resumo["expiradas"]
+            self.pagamentos_cancelados += resumo["pagamentos_cancelados"]
+            self.duracao_ultimo_ciclo = relogio.perf_counter() - inicio
+            if resumo["expiradas"]:
+                self._recentes.append((agora, resumo["expiradas"]))
+        return resumo["expiradas"]
+
+    def segundos_ate_proximo(self, agora=None):
+        """ Quanto esperar até o menor prazo pendente vencer (no máximo intervalo_maximo). """
+        agora = agora or datetime.utcnow()
+        with self.bind.connect() as conn:
+            proximo = conn.execute(_MENOR_PRAZO).scalar()
+        espera = self.intervalo_maximo.total_seconds()
+        if proximo is not None:
+            espera = min(espera, (proximo - agora).total_seconds())
+        return max(espera, 0.0)
+
+    def executar(self):
+        """ Roda até parar(), dormindo até a próxima reserva vencer. """
+        while not self._parar.is_set():
+            self.executar_ciclo()
+            self._parar.wait(self.segundos_ate_proximo())
+
+    # ---------------------------------------------------------------------
+    # Métricas
+    # ---------------------------------------------------------------------
+
+    def metricas(self, agora=None):
+        """
+        em_espera: reservas pendentes dentro do prazo (segurando horário);
+        vencidas: pendentes já fora do prazo, à espera da próxima varredura;
+        sem_prazo: pendentes sem prazo (antigas), fora da varredura;
+        reembolsos_pendentes: valores cobrados a devolver (aprovados depois da expiração
+            ou de consultas canceladas, ver repasses.py);
+        expiradas e pagamentos_cancelados: totais desde o início;
+        taxa_por_minuto: expiradas por minuto dentro de janela_taxa.
+        """
+        agora = agora or datetime.utcnow()
+        with self.bind.connect() as conn:
+            em_espera, vencidas, sem_prazo = conn.execute(_CONTAGEM, {"b_agora": agora}).one()
+            reembolsos_pendentes = conn.execute(_REEMBOLSOS_PENDENTES).scalar()
+        with self._trava:
+            while self._recentes and self._recentes[0][0] < agora - self.janela_taxa:
+                self._recentes.popleft()
+            recentes = sum(quantidade for _, quantidade in self._recentes)
+            return dict(em_espera=em_espera, vencidas=vencidas, sem_prazo=sem_prazo,
+                        reembolsos_pendentes=reembolsos_pendentes, expiradas=self.expiradas,
+                        pagamentos_cancelados=self.pagamentos_cancelados,
+                        taxa_por_minuto=recentes / (self.janela_taxa.total_seconds() / 60),
+                        ciclos=self.ciclos, duracao_ultimo_ciclo=self.duracao_ultimo_ciclo)
+
+    def exportar_prometheus(self, prefixo="tcc_reservas", agora=None):
+        metricas = self.metricas(agora)
+        linhas = []
+        for nome, tipo, descricao in (
+                ("em_espera", "gauge", "Reservas pendentes dentro do prazo."),
+                ("vencidas", "gauge", "Reservas pendentes fora do prazo, ainda não varridas."),
+                ("sem_prazo", "gauge", "Reservas pendentes sem prazo, fora da varredura."),
+                ("reembolsos_pendentes", "gauge", "Pagamentos cobrados à espera de reembolso."),
+                ("expiradas", "counter", "Reservas canceladas por falta de pagamento."),
+                ("pagamentos_cancelados", "counter", "Pagamentos pendentes marcados como Falhou na expiração."),
+                ("taxa_por_minuto", "gauge", "Reservas expiradas por minuto na janela recente."),
+                ("duracao_ultimo_ciclo", "gauge", "Duração da última varredura, em segundos.")):
+            sufixo = "_total" if tipo == "counter" else ""
+            linhas += [f"# HELP {prefixo}_{nome}{sufixo} {descricao}", f"# TYPE {prefixo}_{nome}{sufixo} {tipo}",
+                       f"{prefixo}_{nome}{sufixo} {metricas[nome]}"]
+        return "\n".join(linhas) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uma-vez", action="store_true", help="expira as reservas vencidas e termina")
+    args = parser.parse_args()
+
+    init_db()
+    varredor = VarredorReservas()
+    if args.uma_vez:
+        print(f"Reservas expiradas: {varredor.executar_ciclo()}")
+        return
+    try:
+        varredor.executar()
+    except KeyboardInterrupt:
+        pass
+    print(f"Reservas expiradas: {varredor.expiradas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Gerador de dados sintéticos para testes de carga.
+
+Popula, a partir de uma semente, as onze tabelas do cadastro e da
+operação (USUARIO, ENDERECO, PACIENTE, PROFISSIONAL, DADOS_BANCARIOS,
+CONTATO_EMERGENCIA, AGENDA_PROFISSIONAL, AGENDAMENTO, PAGAMENTO,
+AVALIACAO, NOTIFICACAO) e recalcula AVALIACAO_AGREGADA e
+CONTADOR_NAO_LIDAS, com distribuições parecidas com as de produção:
+
+  - demanda por profissional com distribuição de Zipf (poucos muito
+    procurados), limitada pela capacidade da agenda de cada um;
+  - agenda semanal de 3 a 6 dias, e os agendamentos caem em horários da
+    agenda, sem dois agendamentos no mesmo horário;
+  - consultas passadas concluídas ou canceladas, futuras confirmadas,
+    pendentes ou canceladas, com o pagamento correspondente (aprovado,
+    pendente, reembolsado, falhou);
+  - avaliações de parte das consultas concluídas, com notas concentradas
+    em 4 e 5 e uma fração pendente de moderação ou denunciada;
+  - notificações já entregues do histórico.
+
+O tamanho é dado pelo total aproximado de linhas (de 10 mil a 10 milhões);
+as linhas são geradas e gravadas em blocos, sem montar tudo na memória. A
+mesma semente e o mesmo tamanho produzem exatamente o mesmo banco (as
+senhas usam um hash com sal fixo, senha "senha123"). O banco precisa estar
+vazio.
+
+Uso: python gerador_dados.py banco.db [--linhas 100000] [--semente 42]
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time as relogio
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select, text
+
+from avaliacoes import recalcular_agregados
+from caixa_entrada import recalcular_contadores
+from conexao import criar_engine
+from Model import init_db, Usuario, Endereco, Paciente, Profissional, DadosBancarios, ContatoEmergencia, \
+    AgendaProfissional, Agendamento, Pagamento, Avaliacao, Notificacao
+from seguranca import gerar_hash_senha
+
+SEMENTE_PADRAO = 42
+LINHAS_PADRAO = 100000
+BLOCO = 20000
+
+# Linhas geradas, em média, por profissional (somando todas as tabelas); define a escala
+LINHAS_POR_PROFISSIONAL = 250
+PACIENTES_POR_PROFISSIONAL = 12
+AGENDAMENTOS_POR_PROFISSIONAL = 60
+
+EXPOENTE_ZIPF_PROFISSIONAIS = 1.1
+EXPOENTE_ZIPF_PACIENTES = 0.7
+
+# Período dos agendamentos: SEMANAS antes e depois da data de referência
+DATA_REFERENCIA = date(2025, 6, 2)
+SEMANAS = 13
+
+CIDADES = [("São Paulo", "SP", 30), ("Rio de Janeiro", "RJ", 15), ("Belo Horizonte", "MG", 7),
+           ("Brasília", "DF", 6), ("Curitiba", "PR", 5), ("Porto Alegre", "RS", 5), ("Salvador", "BA", 5),
+           ("Recife", "PE", 4), ("Fortaleza", "CE", 4), ("Campinas", "SP", 3), ("Goiânia", "GO", 3),
+           ("Florianópolis", "SC", 3), ("Manaus", "AM", 2), ("Belém", "PA", 2), ("Vitória", "ES", 2)]
+PRECOS = {"Psicólogo": (150, 350), "Nutricionista": (120, 280), "Educador Físico": (80, 200)}
+PESOS_ESPECIALIDADE = {"Psicólogo": 55, "Nutricionista": 30, "Educador Físico": 15}
+GENEROS = Usuario.__table__.c.genero.type.enums
+PESOS_NOTA = (3, 5, 12, 30, 50)  # notas 1..5
+COMENTARIOS = ("Excelente profissional, muito atencioso.", "Gostei da consulta.", "Pontual e educado.",
+               "Ajudou bastante.", "Consulta rápida demais.", "Não gostei do atendimento.", None)
+
+Escala = namedtuple('Escala', ['profissionais', 'pacientes', 'agendamentos'])
+
+
+def calcular_escala(linhas):
+    profissionais = max(5, round(linhas / LINHAS_POR_PROFISSIONAL))
+    return Escala(profissionais, profissionais * PACIENTES_POR_PROFISSIONAL,
+                  profissionais * AGENDAMENTOS_POR_PROFISSIONAL)
+
+
+def pesos_zipf(n, expoente):
+    """ Pesos acumulados (para random.choices) da distribuição de Zipf sobre n itens. """
+    return list(itertools.accumulate(1 / posicao ** expoente for posicao in range(1, n + 1)))
+
+
+def _aleatorio(semente, parte):
+    # Um gerador por parte: mudar o tamanho do bloco ou a ordem das partes não muda os dados
+    return random.Random(f"{semente}:{parte}")
+
+
+class GeradorDados:
+    """ Gera e grava o banco sintético. `relatorio` guarda as linhas gravadas por tabela. """
+
+    def __init__(self, bind, linhas=LINHAS_PADRAO, semente=SEMENTE_PADRAO, bloco=BLOCO):
+        self.bind = bind
+        self.semente = semente
+        self.bloco = bloco
+        self.escala = calcular_escala(linhas)
+        self.relatorio = {}
+        self._pendentes = {}
+        self._senha = gerar_hash_senha("senha123", sal=f"sintetico:{semente}".encode())
+
+    # ---------------------------------------------------------------------
+    # Gravação em blocos
+    # ---------------------------------------------------------------------
+
+    def _gravar(self, conn, tabela, linha):
+        pendentes = self._pendentes.setdefault(tabela, [])
+        pendentes.append(linha)
+        if len(pendentes) >= self.bloco:
+            self._descarregar(conn, tabela)
+
+    def _descarregar(self, conn, *tabelas):
+        for tabela in tabelas or list(self._pendentes):
+            pendentes = self._pendentes.get(tabela)
+            if pendentes:
+                conn.execute(insert(tabela), pendentes)
+                self.relatorio[tabela.name] = self.relatorio.get(tabela.name, 0) + len(pendentes)
+                self._pendentes[tabela] = []
+
+    # ---------------------------------------------------------------------
+    # Cadastro
+    # ---------------------------------------------------------------------
+
+    def _pessoas(self, conn):
+        """ USUARIO + ENDERECO para profissionais (ids 1..P) e pacientes (P+1..P+Q). """
+        rnd = _aleatorio(self.semente, "pessoas")
+        cidades, pesos_cidades = [c[:2] for c in CIDADES], list(itertools.accumulate(c[2] for c in CIDADES))
+        total = self.escala.profissionais + self.escala.pacientes
+        agora = datetime.combine(DATA_REFERENCIA, time(0))
+        for i in range(1, total + 1):
+            cidade, estado = rnd.choices(cidades, cum_weights=pesos_cidades)[0]
+            self._gravar(conn, Endereco.__table__, dict(
+                id_endereco=i, cep=f"{rnd.randrange(10000, 99999)}-{rnd.randrange(1000):03d}",
+                logradouro=f"Rua {rnd.randrange(1, 400)}", numero=str(rnd.randrange(1, 3000)),
+                complemento=rnd.choice((None, None, f"Apto {rnd.randrange(1, 200)}")),
+                bairro=f"Bairro {rnd.randrange(1, 60)}", cidade=cidade, estado=estado))
+            cadastro = agora - timedelta(days=rnd.randrange(30, 1500))
+            self._gravar(conn, Usuario.__table__, dict(
+                id_usuario=i, nome=f"Pessoa {i}", email=f"pessoa{i}@exemplo.com", senha=self._senha,
+                data_cadastro=cadastro, data_de_nascimento=date(1950, 1, 1) + timedelta(days=rnd.randrange(20000)),
+                RG=f"{i:09d}", CPF=f"{i:011d}", genero=rnd.choice(GENEROS), telefone=f"55{i:011d}",
+                termos_aceitos=True, data_aceite_termos=cadastro))
+        self._descarregar(conn, Endereco.__table__, Usuario.__table__)
+
+    def _profissionais(self, conn):
+        """ PROFISSIONAL, DADOS_BANCARIOS e AGENDA_PROFISSIONAL; devolve as agendas semanais. """
+        rnd = _aleatorio(self.semente, "profissionais")
+        especialidades = list(PESOS_ESPECIALIDADE)
+        pesos = list(itertools.accumulate(PESOS_ESPECIALIDADE.values()))
+        dias = AgendaProfissional.OPCOES_DIA_SEMANA
+        self.precos, agendas = {}, {}
+        id_agenda = 0
+        for i in range(1, self.escala.profissionais + 1):
+            especialidade = rnd.choices(especialidades, cum_weights=pesos)[0]
+            minimo, maximo = PRECOS[especialidade]
+            self.precos[i] = Decimal(rnd.randrange(minimo, maximo + 1, 10))
+            self._gravar(conn, Profissional.__table__, dict(
+                id_profissional=i, endereco_id=i, tipo_de_especialidade=especialidade,
+                crp_cnr_cref=f"CR-{i:07d}", crp_cnr_cref_verificado=rnd.random() < 0.8,
+                valor_consulta=self.precos[i]))
+            if rnd.random() < 0.97:
+                self._gravar(conn, DadosBancarios.__table__, dict(
+                    profissional_id=i, banco=rnd.choice(("001", "033", "104", "237", "260", "341")),
+                    agencia=f"{rnd.randrange(1, 9999):04d}", conta=f"{rnd.randrange(10 ** 7):07d}",
+                    digito_verificador=str(rnd.randrange(10)), tipo_conta=rnd.choice(("Corrente", "Poupança")),
+                    cpf_cnpj_titular=f"{i:011d}", nome_titular=f"Pessoa {i}"))
+
+            # Agenda semanal: 3 a 6 dias (fim de semana com menos chance), um bloco por dia
+            slots = []
+            for dia in sorted(rnd.sample(range(7), rnd.randint(3, 6))):
+                if dia >= 5 and rnd.random() < 0.7:
+                    continue
+                inicio = rnd.randrange(7, 15)
+                fim = min(22, inicio + rnd.randint(4, 8))
+                id_agenda += 1
+                self._gravar(conn, AgendaProfissional.__table__, dict(
+                    id_disponibilidade=id_agenda, profissional_id=i, dia_semana=dias[dia],
+                    hora_inicio=time(inicio), hora_fim=time(fim), disponivel=True))
+                slots += [(dia, hora) for hora in range(inicio, fim)]
+            agendas[i] = slots
+        self._descarregar(conn, Profissional.__table__, DadosBancarios.__table__, AgendaProfissional.__table__)
+        return agendas
+
+    def _pacientes(self, conn):
+        """ PACIENTE e CONTATO_EMERGENCIA. """
+        rnd = _aleatorio(self.semente, "pacientes")
+        historicos = (None, "Sem observações.", "Ansiedade.", "Acompanhamento nutricional.", "Hipertensão.")
+        parentesco = ("Mãe", "Pai", "Cônjuge", "Irmão", "Irmã", "Amigo")
+        inicio = self.escala.profissionais + 1
+        for i in range(inicio, inicio + self.escala.pacientes):
+            self._gravar(conn, Paciente.__table__, dict(id_paciente=i, endereco_id=i,
+                                                        historico_medico=rnd.choice(historicos)))
+            if rnd.random() < 0.6:
+                for n in range(rnd.choice((1, 1, 2))):
+                    self._gravar(conn, ContatoEmergencia.__table__, dict(
+                        paciente_id=i, nome=f"Contato {n + 1} de {i}", telefone=f"56{i:09d}{n}",
+                        relacionamento=rnd.choice(parentesco)))
+        self._descarregar(conn, Paciente.__table__, ContatoEmergencia.__table__)
+
+    # ---------------------------------------------------------------------
+    # Operação
+    # ---------------------------------------------------------------------
+
+    def _demanda(self, agendas):
+        """ Agendamentos por profissional: Zipf, limitado à capacidade da agenda no período. """
+        rnd = _aleatorio(self.semente, "demanda")
+        ids = list(agendas)
+        rnd.shuffle(ids)  # a posição no ranking de procura não depende do id
+        pesos = [1 / posicao ** EXPOENTE_ZIPF_PROFISSIONAIS for posicao in range(1, len(ids) + 1)]
+        capacidade = {i: len(agendas[i]) * 2 * SEMANAS for i in ids}
+        demanda = dict.fromkeys(ids, 0)
+        restante, abertos = self.escala.agendamentos, set(ids)
+        # Distribui e redistribui o que excede a capacidade dos mais procurados
+        while restante > 0 and abertos:
+            soma = sum(peso for i, peso in zip(ids, pesos) if i in abertos)
+            distribuido = 0
+            for i, peso in zip(ids, pesos):
+                if i not in abertos:
+                    continue
+                extra = min(capacidade[i] - demanda[i], max(1, round(restante * peso / soma)))
+                extra = min(extra, restante - distribuido)
+                demanda[i] += extra
+                distribuido += extra
+                if demanda[i] >= capacidade[i]:
+                    abertos.discard(i)
+                if distribuido >= restante:
+                    break
+            restante -= distribuido
+            if distribuido == 0:
+                break
+        return demanda
+
+    def _agendamentos(self, conn, agendas):
+        """ AGENDAMENTO, PAGAMENTO, AVALIACAO e NOTIFICACAO, profissional a profissional. """
+        rnd = _aleatorio(self.semente, "agendamentos")
+        demanda = self._demanda(agendas)
+        primeiro_paciente = self.escala.profissionais + 1
+        pacientes = range(primeiro_paciente, primeiro_paciente + self.escala.pacientes)
+        pesos_pacientes = pesos_zipf(len(pacientes), EXPOENTE_ZIPF_PACIENTES)
+        total_pesos = pesos_pacientes[-1]
+        inicio_periodo = DATA_REFERENCIA - timedelta(weeks=SEMANAS)
+        inicio_periodo -= timedelta(days=inicio_periodo.weekday())  # segunda-feira
+        referencia = datetime.combine(DATA_REFERENCIA, time(0))
+        metodos, pesos_metodo = ("PIX", "Cartao_Credito", "Boleto"), (55, 90, 100)
+        id_agendamento = id_avaliacao = id_notificacao = 0
+        tabelas = (Agendamento.__table__, Pagamento.__table__, Avaliacao.__table__, Notificacao.__table__)
+
+        for profissional_id in sorted(demanda):
+            slots = agendas[profissional_id]
+            escolhidos = sorted(rnd.sample(range(len(slots) * 2 * SEMANAS), demanda[profissional_id]))
+            for indice in escolhidos:
+                semana, posicao = divmod(indice, len(slots))
+                dia, hora = slots[posicao]
+                inicio = datetime.combine(inicio_periodo + timedelta(weeks=semana, days=dia), time(hora))
+                paciente_id = pacientes[bisect.bisect_left(pesos_pacientes, rnd.random() * total_pesos)]
+                passado = inicio < referencia
+                sorteio = rnd.random()
+                if passado:
+                    status = "Concluido" if sorteio < 0.85 else "Cancelado"
+                else:
+                    status = "Confirmado" if sorteio < 0.6 else "Pendente" if sorteio < 0.88 else "Cancelado"
+                id_agendamento += 1
+                self._gravar(conn, tabelas[0], dict(
+                    id_agendamento=id_agendamento, profissional_id=profissional_id, paciente_id=paciente_id,
+                    data_consulta=inicio.date(), hora_consulta=inicio.time(), status=status,
+                    pagamento_confirmado=status in ("Confirmado", "Concluido"),
+                    link_meet=f"https://meet.google.com/{id_agendamento:010x}", atualizado_em=referencia))
+
+                # Pagamento: reservado de 1 a 20 dias antes da consulta
+                reservado = inicio - timedelta(days=rnd.randint(1, 20), minutes=rnd.randrange(1440))
+                if status in ("Confirmado", "Concluido"):
+                    pagamento = "Aprovado"
+                elif status == "Pendente":
+                    pagamento = "Pendente" if rnd.random() < 0.8 else None
+                else:
+                    pagamento = rnd.choices(("Reembolsado", "Falhou", None), (60, 20, 20))[0]
+                if pagamento:
+                    self._gravar(conn, tabelas[1], dict(
+                        id_transacao=f"txn_{id_agendamento:010d}", agendamento_id=id_agendamento,
+                        valor=self.precos[profissional_id], status=pagamento,
+                        metodo=rnd.choices(metodos, cum_weights=pesos_metodo)[0],
+                        data_pagamento=reservado + timedelta(minutes=rnd.randint(1, 30))
+                        if pagamento != "Pendente" else None, atualizado_em=referencia))
+                    id_notificacao += 1
+                    self._gravar(conn, tabelas[3], self._notificacao(
+                        id_notificacao, paciente_id, id_agendamento, "Pagamento Status",
+                        f"Pagamento {pagamento.lower()} para a consulta de {inicio:%d/%m %H:%M}.", reservado, rnd,
+                        referencia))
+
+                if status == "Concluido" and rnd.random() < 0.3:
+                    id_avaliacao += 1
+                    avaliado_em = inicio + timedelta(hours=rnd.randint(1, 72))
+                    self._gravar(conn, tabelas[2], dict(
+                        id_avaliacao=id_avaliacao, paciente_id=paciente_id, profissional_id=profissional_id,
+                        agendamento_id=id_agendamento, nota=rnd.choices(range(1, 6), PESOS_NOTA)[0],
+                        comentario=rnd.choice(COMENTARIOS), data_avaliacao=avaliado_em,
+                        status=rnd.choices(("Aprovada", "Pendente", "Denunciada"), (85, 12, 3))[0],
+                        atualizado_em=referencia))
+                    id_notificacao += 1
+                    self._gravar(conn, tabelas[3], self._notificacao(
+                        id_notificacao, profissional_id, id_agendamento, "Feedback Avaliacao",
+                        "Você recebeu uma nova avaliação.", avaliado_em, rnd, referencia))
+        self._descarregar(conn, *tabelas)
+
+    @staticmethod
+    def _notificacao(id_notificacao, usuario_id, agendamento_id, tipo, mensagem, quando, rnd, referencia):
+        quando = min(quando, referencia)
+        return dict(id_notificacao=id_notificacao, usuario_id=usuario_id, agendamento_id=agendamento_id,
+                    tipo_notificacao=tipo, mensagem=mensagem, data_envio=quando, lida=rnd.random() < 0.7,
+                    canal=rnd.choices(("Push", "Email", "SMS"), (70, 25, 5))[0], status_entrega="Enviada",
+                    prioridade=Notificacao.PRIORIDADE_NORMAL, tentativas=1, proxima_tentativa=quando,
+                    enviada_em=quando + timedelta(seconds=rnd.randint(1, 30)))
+
+    # ---------------------------------------------------------------------
+
+    def gerar(self):
+        """ Popula o banco (vazio) e devolve {tabela: linhas}. """
+        init_db(self.bind)
+        with self.bind.connect() as conn:
+            if conn.execute(select(func.count()).select_from(Usuario.__table__)).scalar():
+                raise ValueError("O gerador precisa de um banco vazio.")
+        with self.bind.begin() as conn:
+            self._pessoas(conn)
+            agendas = self._profissionais(conn)
+            self._pacientes(conn)
+            self._agendamentos(conn, agendas)
+        self.relatorio["AVALIACAO_AGREGADA"] = recalcular_agregados(self.bind)
+        self.relatorio["CONTADOR_NAO_LIDAS"] = recalcular_contadores(self.bind)
+        with self.bind.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        return self.relatorio
+
+
+def gerar_banco(bind, linhas=LINHAS_PADRAO, semente=SEMENTE_PADRAO):
+    return GeradorDados(bind, linhas, semente).gerar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("banco", help="arquivo SQLite (vazio ou inexistente)")
+    parser.add_argument("--linhas", type=int, default=LINHAS_PADRAO)
+    parser.add_argument("--semente", type=int, default=SEMENTE_PADRAO)
+    args = parser.parse_args()
+
+    engine = criar_engine(f"sqlite:///{args.banco}")
+    inicio = relogio.perf_counter()
+    relatorio = gerar_banco(engine, args.linhas, args.semente)
+    duracao = relogio.perf_counter() - inicio
+    total = sum(relatorio.values())
+    for tabela, quantidade in sorted(relatorio.items()):
+        print(f"{tabela:<22} {quantidade:>10}")
+    print(f"total: {total} linhas em {duracao:.1f} s ({total / duracao:.0f} linhas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Importação em massa de usuários (pacientes e profissionais).
+
+Lê um arquivo CSV ou JSONL exportado pela clínica, valida as linhas em
+lotes e grava USUARIO + PACIENTE/PROFISSIONAL + ENDERECO com INSERTs do
+SQLAlchemy Core (executemany), uma transação por lote. Linhas inválidas ou
+que colidem com email, CPF, RG ou telefone já existentes vão para um
+arquivo de rejeitados (com a senha mascarada) sem abortar o lote. As
+senhas são gravadas como hash (seguranca.py), calculado em paralelo pelo
+pool do VerificadorSenhas.
+
+Colunas esperadas (as de endereço são opcionais, mas vêm juntas):
+    tipo (paciente|profissional), nome, email, senha, data_de_nascimento,
+    RG, CPF, genero, telefone, termos_aceitos, historico_medico,
+    tipo_de_especialidade, crp_cnr_cref, valor_consulta,
+    cep, logradouro, numero, complemento, bairro, cidade, estado
+
+Uso: python importacao.py clinica.csv [--lote 5000] [--rejeitados rejeitados.jsonl]
+"""
+import argparse
+import csv
+import json
+import time as relogio
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from Model import engine, init_db, Usuario, Paciente, Profissional, Endereco
+from seguranca import VerificadorSenhas
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TAMANHO_LOTE_PADRAO = 5000
+
+# Colunas de USUARIO que não podem se repetir
+CAMPOS_UNICOS = ("email", "CPF", "RG", "telefone")
+
+CAMPOS_OBRIGATORIOS = ("tipo", "nome", "email", "senha", "RG", "CPF", "genero", "telefone")
+# Não vão em claro para o arquivo de rejeitados
+CAMPOS_SENSIVEIS = ("senha",)
+MASCARA = "***"
+CAMPOS_ENDERECO = ("cep", "logradouro", "numero", "complemento", "bairro", "cidade", "estado")
+
+OPCOES_GENERO = Usuario.__table__.c.genero.type.enums
+OPCOES_ESPECIALIDADE = Profissional.__table__.c.tipo_de_especialidade.type.enums
+
+VALORES_VERDADEIROS = ("1", "true", "sim", "s", "yes")
+
+# Linha já validada e normalizada, pronta para o INSERT
+LinhaValida = namedtuple('LinhaValida', ['numero', 'tipo', 'usuario', 'perfil', 'endereco', 'registro'])
+
+
+class RelatorioImportacao:
+    """ Contadores e métricas de uma importação. """
+
+    def __init__(self):
+        self.lidas = 0
+        self.inseridas = 0
+        self.rejeitadas = 0
+        self.lotes = 0
+        self.inicio = relogio.perf_counter()
+        self.fim = None
+
+    @property
+    def segundos(self):
+        return (self.fim or relogio.perf_counter()) - self.inicio
+
+    @property
+    def linhas_por_segundo(self):
+        return self.lidas / self.segundos if self.segundos else 0.0
+
+    @property
+    def memoria_pico_mb(self):
+        """ Pico de memória residente do processo (None se indisponível). """
+        if resource is None:
+            return None
+        # ru_maxrss é em KiB no Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def __str__(self):
+        memoria = f"{self.memoria_pico_mb:.1f} MB" if self.memoria_pico_mb is not None else "n/d"
+        return (f"{self.lidas} linhas lidas, {self.inseridas} inseridas, {self.rejeitadas} rejeitadas "
+                f"em {self.lotes} lotes | {self.linhas_por_segundo:.0f} linhas/s | pico de memória {memoria}")
+
+
+# -------------------------------------------------------------------------
+# Leitura
+# -------------------------------------------------------------------------
+
+def ler_registros(caminho):
+    """ Gera os registros (dicts) de um arquivo CSV ou JSONL, sem carregá-lo inteiro. """
+    with open(caminho, encoding="utf-8", newline="") as arquivo:
+        if caminho.endswith((".jsonl", ".ndjson", ".json")):
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+        else:
+            yield from csv.DictReader(arquivo)
+
+
+def _em_lotes(registros, tamanho):
+    iterador = iter(registros)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+# -------------------------------------------------------------------------
+# Validação
+# -------------------------------------------------------------------------
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def validar_registro(registro):
+    """
+    Normaliza um registro. Retorna (tipo, usuario, perfil, endereco) ou lança
+    ValueError com o motivo da rejeição.
+    """
+    dados = {campo: _texto(valor) for campo, valor in registro.items()}
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not dados.get(campo)]
+    if faltando:
+        raise ValueError(f"campos obrigatórios ausentes: {', '.join(faltando)}")
+
+    tipo = dados["tipo"].lower()
+    if tipo not in ("paciente", "profissional"):
+        raise ValueError(f"tipo inválido: {dados['tipo']}")
+    if dados["genero"] not in OPCOES_GENERO:
+        raise ValueError(f"gênero inválido: {dados['genero']}")
+
+    nascimento = None
+    if dados.get("data_de_nascimento"):
+        try:
+            nascimento = date.fromisoformat(dados["data_de_nascimento"])
+        except ValueError:
+            raise ValueError(f"data de nascimento inválida: {dados['data_de_nascimento']}")
+
+    termos = (dados.get("termos_aceitos") or "").lower() in VALORES_VERDADEIROS
+    agora = datetime.utcnow()
+    usuario = dict(
+        nome=dados["nome"], email=dados["email"], senha=dados["senha"],
+        data_de_nascimento=nascimento, RG=dados["RG"], CPF=dados["CPF"], genero=dados["genero"],
+        telefone=dados["telefone"], url_foto_perfil=dados.get("url_foto_perfil"),
+        termos_aceitos=termos, data_aceite_termos=agora if termos else None, data_cadastro=agora,
+    )
+
+    if tipo == "paciente":
+        perfil = dict(historico_medico=dados.get("historico_medico"))
+    else:
+        if dados.get("tipo_de_especialidade") not in OPCOES_ESPECIALIDADE:
+            raise ValueError(f"especialidade inválida: {dados.get('tipo_de_especialidade')}")
+        if not dados.get("crp_cnr_cref"):
+            raise ValueError("crp_cnr_cref ausente para profissional")
+        try:
+            valor = Decimal(dados.get("valor_consulta") or "0")
+        except InvalidOperation:
+            raise ValueError(f"valor_consulta inválido: {dados.get('valor_consulta')}")
+        perfil = dict(tipo_de_especialidade=dados["tipo_de_especialidade"],
+                      crp_cnr_cref=dados["crp_cnr_cref"], valor_consulta=valor)
+
+    endereco = None
+    if dados.get("cep"):
+        endereco = {campo: dados.get(campo) for campo in CAMPOS_ENDERECO}
+        faltando = [campo for campo in CAMPOS_ENDERECO if campo != "complemento" and not endereco[campo]]
+        if faltando:
+            raise ValueError(f"endereço incompleto: {', '.join(faltando)}")
+
+    return tipo, usuario, perfil, endereco
+
+
+def _colisoes_no_banco(conn, validos):
+    """ Valores únicos do lote que já existem em USUARIO, por campo. """
+    tabela = Usuario.__table__
+    existentes = {}
+    for campo in CAMPOS_UNICOS:
+        valores = {linha.usuario[campo] for linha in validos}
+        coluna = tabela.c[campo]
+        existentes[campo] = set(conn.execute(select(coluna).where(coluna.in_(valores))).scalars())
+    return existentes
+
+
+# -------------------------------------------------------------------------
+# Gravação
+# -------------------------------------------------------------------------
+
+def _inserir(conn, linhas):
+    """ Insere um grupo de linhas válidas (USUARIO, ENDERECO e o perfil). """
+    usuarios_t = Usuario.__table__
+    enderecos_t = Endereco.__table__
+
+    com_endereco = [linha for linha in linhas if linha.endereco is not None]
+    if com_endereco:
+        ids_endereco = conn.execute(
+            insert(enderecos_t).returning(enderecos_t.c.id_endereco, sort_by_parameter_order=True),
+            [linha.endereco for linha in com_endereco],
+        ).scalars().all()
+        for linha, id_endereco in zip(com_endereco, ids_endereco):
+            linha.perfil["endereco_id"] = id_endereco
+
+    ids_usuario = conn.execute(
+        insert(usuarios_t).returning(usuarios_t.c.id_usuario, sort_by_parameter_order=True),
+        [linha.usuario for linha in linhas],
+    ).scalars().all()
+
+    pacientes, profissionais = [], []
+    for linha, id_usuario in zip(linhas, ids_usuario):
+        if linha.tipo == "paciente":
+            pacientes.append(dict(linha.perfil, id_paciente=id_usuario))
+        else:
+            profissionais.append(dict(linha.perfil, id_profissional=id_usuario))
+    if pacientes:
+        conn.execute(insert(Paciente.__table__), pacientes)
+    if profissionais:
+        conn.execute(insert(Profissional.__table__), profissionais)
+
+
+def _sem_dados_sensiveis(registro):
+    """ Cópia do registro para o arquivo de rejeitados, com a senha mascarada. """
+    return {campo: (MASCARA if campo in CAMPOS_SENSIVEIS and valor else valor) for campo, valor in registro.items()}
+
+
+def _gravar_lote(bind, validos, rejeitar):
+    """ Grava o lote em uma transação; se houver colisão concorrente, grava linha a linha. """
+    try:
+        with bind.begin() as conn:
+            _inserir(conn, validos)
+        return len(validos)
+    except IntegrityError:
+        pass
+
+    # Outro processo gravou um valor único entre a checagem e o INSERT:
+    # repete linha a linha com SAVEPOINT, rejeitando só as que colidem.
+    inseridas = 0
+    with bind.begin() as conn:
+        for linha in validos:
+            try:
+                with conn.begin_nested():
+                    _inserir(conn, [linha])
+                inseridas += 1
+            except IntegrityError as erro:
+                rejeitar(linha.numero, linha.registro, f"violação de unicidade: {erro.orig}")
+    return inseridas
+
+
+def importar(caminho, caminho_rejeitados="rejeitados.jsonl", tamanho_lote=TAMANHO_LOTE_PADRAO, bind=None,
+             verificador=None):
+    """ Importa o arquivo e devolve um RelatorioImportacao. """
+    bind = bind or engine
+    init_db(bind)
+    relatorio = RelatorioImportacao()
+    proprio_verificador = verificador is None
+    verificador = verificador or VerificadorSenhas()
+
+    try:
+        with open(caminho_rejeitados, "w", encoding="utf-8") as arquivo_rejeitados:
+
+            def rejeitar(numero_linha, registro, motivo):
+                relatorio.rejeitadas += 1
+                arquivo_rejeitados.write(json.dumps(
+                    {"linha": numero_linha, "motivo": motivo, "registro": _sem_dados_sensiveis(registro)},
+                    ensure_ascii=False, default=str) + "\n")
+
+            numerados = enumerate(ler_registros(caminho), start=1)
+            for lote in _em_lotes(numerados, tamanho_lote):
+                relatorio.lidas += len(lote)
+                relatorio.lotes += 1
+
+                # 1. Validação de formato e duplicidades dentro do próprio lote
+                validos = []
+                vistos = {campo: set() for campo in CAMPOS_UNICOS}
+                for numero_linha, registro in lote:
+                    try:
+                        tipo, usuario, perfil, endereco = validar_registro(registro)
+                    except ValueError as erro:
+                        rejeitar(numero_linha, registro, str(erro))
+                        continue
+                    repetido = next((c for c in CAMPOS_UNICOS if usuario[c] in vistos[c]), None)
+                    if repetido:
+                        rejeitar(numero_linha, registro, f"{repetido} repetido no arquivo")
+                        continue
+                    for campo in CAMPOS_UNICOS:
+                        vistos[campo].add(usuario[campo])
+                    validos.append(LinhaValida(numero_linha, tipo, usuario, perfil, endereco, registro))
+
+                if not validos:
+                    continue
+
+                # 2. Colisões com usuários já cadastrados (inclusive de lotes anteriores)
+                with bind.connect() as conn:
+                    existentes = _colisoes_no_banco(conn, validos)
+                sem_colisao = []
+                for linha in validos:
+                    colidiu = next((c for c in CAMPOS_UNICOS if linha.usuario[c] in existentes[c]), None)
+                    if colidiu:
+                        rejeitar(linha.numero, linha.registro, f"{colidiu} já cadastrado")
+                    else:
+                        sem_colisao.append(linha)
+
+                # 3. Hash das senhas (só das linhas que vão ser gravadas) e gravação do lote
+                if sem_colisao:
+                    senhas = verificador.gerar_hashes([linha.usuario["senha"] for linha in sem_colisao])
+                    for linha, hash_senha in zip(sem_colisao, senhas):
+                        linha.usuario["senha"] = hash_senha
+                    relatorio.inseridas += _gravar_lote(bind, sem_colisao, rejeitar)
+    finally:
+        if proprio_verificador:
+            verificador.encerrar()
+    relatorio.fim = relogio.perf_counter()
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arquivo")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO)
+    parser.add_argument("--rejeitados", default="rejeitados.jsonl")
+    args = parser.parse_args()
+
+    relatorio = importar(args.arquivo, args.rejeitados, args.lote)
+    print(relatorio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Instrumentação das consultas (opcional).
+
+Registra, via eventos da engine do SQLAlchemy:
+  - histograma de latência por "forma" de comando (o SQL com os
+    parâmetros de ligação, com listas IN e VALUES repetidos resumidos);
+  - linhas afetadas (INSERT/UPDATE/DELETE; o SQLite não informa quantas
+    linhas um SELECT vai devolver antes de serem lidas);
+  - transações confirmadas/desfeitas e comandos por transação;
+  - consultas lentas, com o EXPLAIN QUERY PLAN, no logger "tcc.sql" e
+    nas últimas N guardadas para exportação.
+
+Os dados saem em texto no formato do Prometheus (exportar_prometheus) ou
+em JSON (exportar_json).
+
+É opt-in: sem instalar(), nenhum listener é registrado e o custo é zero
+(bench_instrumentacao.py mede isso). Model.py instala na engine principal
+quando a variável de ambiente TCC_INSTRUMENTAR_SQL está definida
+(TCC_SQL_LENTA_MS define o limite de consulta lenta, padrão 100 ms).
+
+    instrumentacao = Instrumentacao(limite_lenta=0.05).instalar(engine)
+    ...
+    print(instrumentacao.exportar_prometheus())
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time as relogio
+from bisect import bisect_left
+from collections import deque
+
+from sqlalchemy import event
+
+logger = logging.getLogger("tcc.sql")
+
+# Limites superiores dos baldes do histograma, em segundos (o último é +Inf)
+BALDES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BALDES_COMANDOS_TRANSACAO = (1, 2, 5, 10, 50, 100, 1000)
+
+LIMITE_LENTA_PADRAO = 0.1  # segundos
+MAX_LENTAS = 100
+MAX_FORMAS = 5000
+
+_LISTA_PARAMETROS = re.compile(r"\(\?(?:,\s*\?)+\)")
+_GRUPOS_REPETIDOS = re.compile(r"(\([^()]*\))(?:,\s*\1)+")
+_ESPACOS = re.compile(r"\s+")
+
+
+def forma_do_comando(sql):
+    """ SQL normalizado: espaços colapsados e listas IN / VALUES de tamanho variável resumidas. """
+    sql = _ESPACOS.sub(" ", sql).strip()
+    sql = _GRUPOS_REPETIDOS.sub(r"\1, ...", sql)
+    return _LISTA_PARAMETROS.sub("(?, ...)", sql)
+
+
+class Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0
+        self.total = 0
+
+    def registrar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def acumulado(self):
+        """ [(limite, quantidade <= limite)], no formato dos baldes do Prometheus. """
+        linhas, soma = [], 0
+        for limite, quantidade in zip(list(self.limites) + ["+Inf"], self.contagens):
+            soma += quantidade
+            linhas.append((limite, soma))
+        return linhas
+
+    def percentil(self, fracao):
+        """ Limite superior do balde onde cai o percentil (aproximação). """
+        if not self.total:
+            return None
+        alvo, soma = fracao * self.total, 0
+        for limite, quantidade in zip(list(self.limites) + [float("inf")], self.contagens):
+            soma += quantidade
+            if soma >= alvo:
+                return limite
+        return float("inf")
+
+
+class EstatisticaForma:
+    __slots__ = ('sql', 'latencia', 'linhas', 'erros')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.latencia = Histograma(BALDES_LATENCIA)
+        self.linhas = 0
+        self.erros = 0
+
+
+class Instrumentacao:
+
+    def __init__(self, limite_lenta=LIMITE_LENTA_PADRAO, explicar_lentas=True, max_lentas=MAX_LENTAS):
+        self.limite_lenta = limite_lenta
+        self.explicar_lentas = explicar_lentas
+        self.formas = {}                    # id da forma -> EstatisticaForma
+        self._ids_por_sql = {}              # SQL cru -> id da forma (evita normalizar a cada execução)
+        self.lentas = deque(maxlen=max_lentas)
+        self.transacoes = {"commit": 0, "rollback": 0}
+        self.comandos_por_transacao = Histograma(BALDES_COMANDOS_TRANSACAO)
+        self._trava = threading.Lock()
+        self._engines = []
+
+    # ---------------------------------------------------------------------
+    # Eventos
+    # ---------------------------------------------------------------------
+
+    _EVENTOS = (
+        ("before_cursor_execute", "_antes"),
+        ("after_cursor_execute", "_depois"),
+        ("handle_error", "_erro"),
+        ("begin", "_inicio_transacao"),
+        ("commit", "_commit"),
+        ("rollback", "_rollback"),
+    )
+
+    def instalar(self, engine):
+        for nome, metodo in self._EVENTOS:
+            event.listen(engine, nome, getattr(self, metodo))
+        self._engines.append(engine)
+        return self
+
+    def remover(self):
+        """
+        Retira os listeners (event.remove). A engine continua no caminho "com
+        eventos" do SQLAlchemy (alguns us por comando); para custo zero, não instale.
+        """
+        for engine in self._engines:
+            for nome, metodo in self._EVENTOS:
+                event.remove(engine, nome, getattr(self, metodo))
+        self._engines = []
+
+    def _antes(self, conn, cursor, sql, parametros, contexto, executemany):
+        contexto._instrumentacao_inicio = relogio.perf_counter()
+
+    def _depois(self, conn, cursor, sql, parametros, contexto, executemany):
+        duracao = relogio.perf_counter() - contexto._instrumentacao_inicio
+        linhas = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        with self._trava:
+            estatistica = self._estatistica(sql)
+            estatistica.latencia.registrar(duracao)
+            estatistica.linhas += linhas
+        conn.info["instrumentacao_comandos"] = conn.info.get("instrumentacao_comandos", 0) + 1
+        if duracao >= self.limite_lenta:
+            self._registrar_lenta(conn, cursor, sql, parametros, executemany, duracao)
+
+    def _erro(self, contexto_excecao):
+        if contexto_excecao.statement is not None:
+            with self._trava:
+                self._estatistica(contexto_excecao.statement).erros += 1
+
+    def _inicio_transacao(self, conn):
+        conn.info["instrumentacao_comandos"] = 0
+
+    def _fim_transacao(self, conn, resultado):
+        with self._trava:
+            self.transacoes[resultado] += 1
+            self.comandos_por_transacao.registrar(conn.info.get("instrumentacao_comandos", 0))
+
+    def _commit(self, conn):
+        self._fim_transacao(conn, "commit")
+
+    def _rollback(self, conn):
+        self._fim_transacao(conn, "rollback")
+
+    def _estatistica(self, sql):
+        """ Estatística da forma do comando (chamar com a trava). """
+        id_forma = self._ids_por_sql.get(sql)
+        if id_forma is None:
+            forma = forma_do_comando(sql)
+            id_forma = hashlib.sha1(forma.encode("utf-8")).hexdigest()[:12]
+            if len(self._ids_por_sql) < MAX_FORMAS:
+                self._ids_por_sql[sql] = id_forma
+            if id_forma not in self.formas:
+                self.formas[id_forma] = EstatisticaForma(forma)
+        return self.formas[id_forma]
+
+    # ---------------------------------------------------------------------
+    # Consultas lentas
+    # ---------------------------------------------------------------------
+
+    def _plano(self, conn, sql, parametros):
+        if conn.dialect.name == "sqlite":
+            prefixo = "EXPLAIN QUERY PLAN "
+        elif conn.dialect.name in ("postgresql", "mysql", "mariadb"):
+            prefixo = "EXPLAIN "
+        else:
+            return None
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefixo + sql, parametros)
+            linhas = cursor.fetchall()
+        except Exception as erro:  # o plano é só informativo
+            return f"(sem plano: {erro})"
+        finally:
+            cursor.close()
+        if conn.dialect.name == "sqlite":
+            return "\n".join(f"{'  ' * (linha[1] != 0)}{linha[3]}" for linha in linhas)
+        return "\n".join(str(linha[0]) for linha in linhas)
+
+    def _registrar_lenta(self, conn, cursor, sql, parametros, executemany, duracao):
+        plano = None
+        if self.explicar_lentas and not executemany and sql.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE"):
+            plano = self._plano(conn, sql, parametros)
+        registro = dict(quando=relogio.time(), duracao=duracao, sql=forma_do_comando(sql),
+                        parametros=repr(parametros)[:200], plano=plano)
+        with self._trava:
+            self.lentas.append(registro)
+        logger.warning("Consulta lenta (%.1f ms): %s\n%s", duracao * 1000, registro["sql"][:500], plano or "")
+
+    # ---------------------------------------------------------------------
+    # Exportação
+    # ---------------------------------------------------------------------
+
+    def exportar_json(self):
+        with self._trava:
+            dados = dict(
+                formas=[dict(id=id_forma, sql=e.sql, execucoes=e.latencia.total, tempo_total=e.latencia.soma,
+                             p50=e.latencia.percentil(0.5), p99=e.latencia.percentil(0.99), linhas=e.linhas,
+                             erros=e.erros, baldes=e.latencia.acumulado())
+                        for id_forma, e in sorted(self.formas.items(), key=lambda item: -item[1].latencia.soma)],
+                transacoes=dict(self.transacoes, comandos_por_transacao=self.comandos_por_transacao.acumulado()),
+                lentas=list(self.lentas),
+            )
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+    def exportar_prometheus(self, prefixo="tcc_sql"):
+        linhas = [f"# HELP {prefixo}_duracao_segundos Latência dos comandos SQL por forma.",
+                  f"# TYPE {prefixo}_duracao_segundos histogram"]
+        with self._trava:
+            formas = list(self.formas.items())
+            for id_forma, estatistica in formas:
+                for limite, quantidade in estatistica.latencia.acumulado():
+                    linhas.append(f'{prefixo}_duracao_segundos_bucket{{forma="{id_forma}",le="{limite}"}} {quantidade}')
+                linhas.append(f'{prefixo}_duracao_segundos_sum{{forma="{id_forma}"}} {estatistica.latencia.soma:.6f}')
+                linhas.append(f'{prefixo}_duracao_segundos_count{{forma="{id_forma}"}} {estatistica.latencia.total}')
+            linhas += [f"# HELP {prefixo}_linhas_total Linhas afetadas por INSERT/UPDATE/DELETE.",
+                       f"# TYPE {prefixo}_linhas_total counter"]
+            linhas += [f'{prefixo}_linhas_total{{forma="{id_forma}"}} {e.linhas}' for id_forma, e in formas]
+            linhas += [f"# HELP {prefixo}_erros_total Comandos que falharam.", f"# TYPE {prefixo}_erros_total counter"]
+            linhas += [f'{prefixo}_erros_total{{forma="{id_forma}"}} {e.erros}' for id_forma, e in formas]
+            linhas += [f"# HELP {prefixo}_forma_info SQL de cada forma.", f"# TYPE {prefixo}_forma_info gauge"]
+            linhas += [f'{prefixo}_forma_info{{forma="{id_forma}",sql="{_escapar(e.sql[:300])}"}} 1'
+                       for id_forma, e in formas]
+            linhas += [f"# HELP {prefixo}_transacoes_total Transações encerradas.",
+                       f"# TYPE {prefixo}_transacoes_total counter"]
+            linhas += [f'{prefixo}_transacoes_total{{resultado="{resultado}"}} {quantidade}'
+                       for resultado, quantidade in self.transacoes.items()]
+            linhas += [f"# HELP {prefixo}_comandos_por_transacao Comandos executados em cada transação.",
+                       f"# TYPE {prefixo}_comandos_por_transacao histogram"]
+            historico = self.comandos_por_transacao
+            linhas += [f'{prefixo}_comandos_por_transacao_bucket{{le="{limite}"}} {quantidade}'
+                       for limite, quantidade in historico.acumulado()]
+            linhas += [f"{prefixo}_comandos_por_transacao_sum {historico.soma}",
+                       f"{prefixo}_comandos_por_transacao_count {historico.total}"]
+            linhas += [f"# HELP {prefixo}_lentas_total Consultas acima do limite de lentidão (últimas guardadas).",
+                       f"# TYPE {prefixo}_lentas_total gauge", f"{prefixo}_lentas_total {len(self.lentas)}"]
+        return "\n".join(linhas) + "\n"
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def ativar_se_configurado(engine):
+    """ Instala a instrumentação se TCC_INSTRUMENTAR_SQL estiver definida; senão devolve None. """
+    if not os.environ.get("TCC_INSTRUMENTAR_SQL"):
+        return None
+    limite_ms = float(os.environ.get("TCC_SQL_LENTA_MS", LIMITE_LENTA_PADRAO * 1000))
+    return Instrumentacao(limite_lenta=limite_ms / 1000).instalar(engine)
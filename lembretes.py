@@ -0,0 +1,262 @@
+"""
+Agendador de lembretes de consulta.
+
+Gera notificações "Lembrete Consulta" na fila de saída (notificacoes.py)
+com antecedências configuráveis (padrão: 24 h e 1 h antes da consulta).
+
+Em vez de varrer AGENDAMENTO a cada minuto, o agendador mantém um heap com
+os próximos lembretes, ordenado pelo instante de envio. O heap é recarregado
+periodicamente só com a janela [agora - ATRASO_MAXIMO, agora + HORIZONTE]
+de cada antecedência, por faixa no índice ix_agendamento_data_hora_status,
+então o custo de cada varredura acompanha o número de lembretes próximos do
+vencimento, e não o tamanho da tabela.
+
+O status é conferido de novo na hora do envio (só consultas "Confirmado"
+ainda não iniciadas recebem lembrete), e a tabela LEMBRETE_CONSULTA
+garante que cada lembrete seja gerado uma única vez, mesmo depois de
+reiniciar o processo. Um lembrete que venceu há mais de ATRASO_MAXIMO
+(ex: consulta marcada em cima da hora) não é mais enviado. Se um lote
+colidir com outro agendador, é refeito lembrete a lembrete; o que ainda
+falhar fica no log (logger "tcc.lembretes").
+
+O relógio do agendador é o horário local (datetime.now()), o mesmo de
+data_consulta/hora_consulta: a agenda, fechar_dia e o iCal usam hora local
+de parede. Comparar com datetime.utcnow() adiantaria os lembretes pelo
+fuso (4 h antes, em vez de 1 h, em UTC-3). Os carimbos de auditoria
+(criado_em, data_envio) continuam em UTC.
+
+Uso: python lembretes.py [--uma-vez]
+"""
+import argparse
+import heapq
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from Model import engine, init_db, somar_nao_lidas, Agendamento, Usuario, Notificacao, LembreteConsulta
+
+logger = logging.getLogger("tcc.lembretes")
+
+ANTECEDENCIAS_PADRAO = (timedelta(hours=24), timedelta(hours=1))
+
+# Quanto à frente do agora os lembretes são carregados no heap
+HORIZONTE_PADRAO = timedelta(minutes=10)
+# Lembretes vencidos há mais tempo que isso são descartados
+ATRASO_MAXIMO = timedelta(minutes=15)
+# Intervalo entre recargas do heap (pega consultas marcadas ou confirmadas depois da última carga)
+INTERVALO_RECARGA = timedelta(minutes=1)
+
+TAMANHO_LOTE_PADRAO = 1000
+
+# Status que ainda podem receber lembrete; a confirmação é exigida na hora do envio
+STATUS_ATIVOS = ("Pendente", "Confirmado")
+
+
+def _minutos(antecedencia):
+    return int(antecedencia.total_seconds() // 60)
+
+
+def _descrever_antecedencia(minutos):
+    if minutos % (24 * 60) == 0:
+        dias = minutos // (24 * 60)
+        return "amanhã" if dias == 1 else f"em {dias} dias"
+    if minutos % 60 == 0:
+        horas = minutos // 60
+        return "em 1 hora" if horas == 1 else f"em {horas} horas"
+    return f"em {minutos} minutos"
+
+
+def lembretes_na_janela(conn, antecedencia, inicio, fim):
+    """
+    (instante_envio, agendamento_id, antecedencia_minutos) dos lembretes com
+    envio em (inicio, fim] ainda não gerados.
+    """
+    minutos = _minutos(antecedencia)
+    consulta_de, consulta_ate = inicio + antecedencia, fim + antecedencia
+    ja_gerado = (
+        select(LembreteConsulta.agendamento_id)
+        .where(LembreteConsulta.agendamento_id == Agendamento.id_agendamento,
+               LembreteConsulta.antecedencia_minutos == minutos)
+        .exists()
+    )
+    linhas = conn.execute(
+        select(Agendamento.id_agendamento, Agendamento.data_consulta, Agendamento.hora_consulta)
+        .where(tuple_(Agendamento.data_consulta, Agendamento.hora_consulta)
+               > tuple_(consulta_de.date(), consulta_de.time()),
+               tuple_(Agendamento.data_consulta, Agendamento.hora_consulta)
+               <= tuple_(consulta_ate.date(), consulta_ate.time()),
+               Agendamento.status.in_(STATUS_ATIVOS),
+               ~ja_gerado)
+    )
+    return [(datetime.combine(data, hora) - antecedencia, id_agendamento, minutos)
+            for id_agendamento, data, hora in linhas]
+
+
+def emitir_lembretes(conn, pendentes, agora):
+    """
+    Grava as notificações de uma lista de (agendamento_id, antecedencia_minutos)
+    e registra os lembretes em LEMBRETE_CONSULTA, com INSERTs em lote.
+    Devolve quantos lembretes foram gerados.
+    """
+    ids = {id_agendamento for id_agendamento, _ in pendentes}
+    consultas = {
+        linha.id_agendamento: linha for linha in conn.execute(
+            select(Agendamento.id_agendamento, Agendamento.paciente_id, Agendamento.data_consulta,
+                   Agendamento.hora_consulta, Usuario.nome.label("nome_profissional"))
+            .join(Usuario, Usuario.id_usuario == Agendamento.profissional_id)
+            .where(Agendamento.id_agendamento.in_(ids), Agendamento.status == "Confirmado"))
+    }
+    ja_gerados = set(conn.execute(
+        select(LembreteConsulta.agendamento_id, LembreteConsulta.antecedencia_minutos)
+        .where(LembreteConsulta.agendamento_id.in_(ids))).all())
+
+    lembretes, notificacoes = [], []
+    for id_agendamento, minutos in pendentes:
+        consulta = consultas.get(id_agendamento)
+        if consulta is None or (id_agendamento, minutos) in ja_gerados:
+            continue
+        # Consulta já começou: o lembrete não serve mais
+        if datetime.combine(consulta.data_consulta, consulta.hora_consulta) <= agora:
+            continue
+        ja_gerados.add((id_agendamento, minutos))
+        lembretes.append(dict(agendamento_id=id_agendamento, antecedencia_minutos=minutos))
+        notificacoes.append(dict(
+            usuario_id=consulta.paciente_id, agendamento_id=id_agendamento,
+            tipo_notificacao="Lembrete Consulta",
+            mensagem=(f"Lembrete: Sua consulta com {consulta.nome_profissional} é "
+                      f"{_descrever_antecedencia(minutos)}, às {consulta.hora_consulta.strftime('%H:%M')}.")))
+    if not lembretes:
+        return 0
+
+    tabela = Notificacao.__table__
+    ids_notificacao = conn.execute(
+        insert(tabela).returning(tabela.c.id_notificacao, sort_by_parameter_order=True), notificacoes
+    ).scalars().all()
+    for lembrete, id_notificacao in zip(lembretes, ids_notificacao):
+        lembrete["notificacao_id"] = id_notificacao
+    conn.execute(insert(LembreteConsulta.__table__), lembretes)
+    # O INSERT via Core não passa pelos eventos de Notificacao: o contador da caixa de entrada é somado aqui
+    somar_nao_lidas(conn, Counter(notificacao["usuario_id"] for notificacao in notificacoes))
+    return len(lembretes)
+
+
+class AgendadorLembretes:
+    """
+    Heap de lembretes pendentes, recarregado por janelas de tempo.
+
+        agendador = AgendadorLembretes()
+        agendador.executar()          # bloqueia; use parar() de outra thread
+
+    executar_ciclo(agora) faz uma rodada só (útil em testes e benchmarks).
+    """
+
+    def __init__(self, bind=None, antecedencias=ANTECEDENCIAS_PADRAO, horizonte=HORIZONTE_PADRAO,
+                 atraso_maximo=ATRASO_MAXIMO, intervalo_recarga=INTERVALO_RECARGA,
+                 tamanho_lote=TAMANHO_LOTE_PADRAO):
+        self.bind = bind or engine
+        self.antecedencias = tuple(antecedencias)
+        self.horizonte = horizonte
+        self.atraso_maximo = atraso_maximo
+        self.intervalo_recarga = intervalo_recarga
+        self.tamanho_lote = tamanho_lote
+
+        self._heap = []
+        self._no_heap = set()
+        self._proxima_recarga = None
+        self._parar = threading.Event()
+
+        # Contadores
+        self.gerados = 0
+        self.recargas = 0
+        self.falhas = 0
+
+    def parar(self):
+        self._parar.set()
+
+    def _recarregar(self, agora):
+        inicio, fim = agora - self.atraso_maximo, agora + self.horizonte
+        with self.bind.connect() as conn:
+            for antecedencia in self.antecedencias:
+                for item in lembretes_na_janela(conn, antecedencia, inicio, fim):
+                    chave = item[1:]
+                    if chave not in self._no_heap:
+                        self._no_heap.add(chave)
+                        heapq.heappush(self._heap, item)
+        self._proxima_recarga = agora + self.intervalo_recarga
+        self.recargas += 1
+
+    def executar_ciclo(self, agora=None):
+        """ Gera os lembretes vencidos até `agora` (hora local). Devolve quantos foram gerados. """
+        agora = agora or datetime.now()
+        if self._proxima_recarga is None or agora >= self._proxima_recarga:
+            self._recarregar(agora)
+
+        vencidos = []
+        while self._heap and self._heap[0][0] <= agora:
+            instante, id_agendamento, minutos = heapq.heappop(self._heap)
+            self._no_heap.discard((id_agendamento, minutos))
+            if instante >= agora - self.atraso_maximo:
+                vencidos.append((id_agendamento, minutos))
+
+        gerados = 0
+        for inicio in range(0, len(vencidos), self.tamanho_lote):
+            lote = vencidos[inicio:inicio + self.tamanho_lote]
+            try:
+                with self.bind.begin() as conn:
+                    gerados += emitir_lembretes(conn, lote, agora)
+            except IntegrityError:
+                # Outro agendador gerou parte do lote ao mesmo tempo: o lote é
+                # refeito um lembrete por transação, pulando os já gerados
+                gerados += self._emitir_um_a_um(lote, agora)
+        self.gerados += gerados
+        return gerados
+
+    def _emitir_um_a_um(self, lote, agora):
+        gerados = 0
+        for pendente in lote:
+            try:
+                with self.bind.begin() as conn:
+                    gerados += emitir_lembretes(conn, [pendente], agora)
+            except IntegrityError as erro:
+                self.falhas += 1
+                logger.warning("lembrete %s do agendamento %s não foi gerado: %s", pendente[1], pendente[0], erro.orig)
+        return gerados
+
+    def segundos_ate_proximo(self, agora=None):
+        """ Quanto esperar até o próximo lembrete ou a próxima recarga. """
+        agora = agora or datetime.now()
+        proximo = self._proxima_recarga
+        if self._heap:
+            proximo = min(proximo, self._heap[0][0])
+        return max((proximo - agora).total_seconds(), 0.0)
+
+    def executar(self):
+        """ Roda até parar(), dormindo até o próximo lembrete vencer. """
+        while not self._parar.is_set():
+            self.executar_ciclo()
+            self._parar.wait(self.segundos_ate_proximo())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uma-vez", action="store_true", help="gera os lembretes vencidos e termina")
+    args = parser.parse_args()
+
+    init_db()
+    agendador = AgendadorLembretes()
+    if args.uma_vez:
+        print(f"Lembretes gerados: {agendador.executar_ciclo()}")
+        return
+    try:
+        agendador.executar()
+    except KeyboardInterrupt:
+        pass
+    print(f"Lembretes gerados: {agendador.gerados}")
+
+
+if __name__ == "__main__":
+    main()
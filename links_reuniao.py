@@ -0,0 +1,278 @@
+"""
+Pool de links de reunião.
+
+Antes, cada Agendamento gerava o próprio link no __init__ com
+random.choices: sem gerador criptográfico, sem conferir colisão e, com um
+provedor de vídeo de verdade, seria uma chamada à API por consulta, no meio
+da reserva. Aqui os links são preparados antes:
+
+  - o PoolLinks sorteia códigos com o módulo secrets, pede ao provedor de
+    vídeo (ProvedorVideo) as salas em lote e grava em SALA_REUNIAO com
+    INSERT ... ON CONFLICT DO NOTHING RETURNING (SQLite ou PostgreSQL): o
+    índice único em codigo descarta colisões (inclusive com outros
+    processos) e só os códigos devolvidos entram no pool;
+  - os links ficam em um deque: proximo_link() é um popleft, O(1) e seguro
+    entre threads sem trava;
+  - quando o pool cai abaixo de `minimo`, a thread de reabastecimento é
+    acordada e completa até `capacidade`;
+  - se o pool esvaziar, proximo_link() devolve None em vez de esperar o
+    provedor: a reserva segue e o reabastecimento completa depois os
+    agendamentos sem link (índice parcial ix_agendamento_sem_link);
+  - um erro na thread de reabastecimento (provedor ou banco) vai para o
+    log "tcc.links" e é contado em estatisticas(); a thread tenta de novo
+    depois de `intervalo`.
+
+Códigos que ficarem no pool quando o processo terminar são descartados
+(continuam em SALA_REUNIAO, então nunca são reusados).
+
+    pool = PoolLinks(ProvedorLocal()).iniciar().instalar()
+    ...                      # Agendamento(...) pega o link do pool
+    pool.parar()
+
+Uso: python links_reuniao.py [--salas 1000] [--latencia 0.05]   (cria salas com o provedor local)
+"""
+import abc
+import argparse
+import logging
+import threading
+import time as relogio
+from collections import deque
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from Model import engine, init_db, gerar_codigo_sala, Agendamento, SalaReuniao
+
+logger = logging.getLogger("tcc.links")
+
+CAPACIDADE_PADRAO = 2000
+# Abaixo disso o reabastecimento é acordado
+MINIMO_PADRAO = 500
+# Salas pedidas ao provedor por chamada
+LOTE_PADRAO = 200
+# Espera (segundos) entre tentativas quando o provedor falha, e entre conferências periódicas
+INTERVALO_PADRAO = 5.0
+
+_SALAS = SalaReuniao.__table__
+
+# INSERT com ON CONFLICT DO NOTHING de cada banco suportado
+_INSERT_POR_DIALETO = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_AGENDAMENTOS = Agendamento.__table__
+
+_SEM_LINK = (select(_AGENDAMENTOS.c.id_agendamento)
+             .where(_AGENDAMENTOS.c.link_meet.is_(None), _AGENDAMENTOS.c.status != "Cancelado")
+             .limit(bindparam("b_limite")))
+
+_DEFINIR_LINK = (update(_AGENDAMENTOS)
+                 .where(_AGENDAMENTOS.c.id_agendamento == bindparam("b_id"), _AGENDAMENTOS.c.link_meet.is_(None))
+                 .values(link_meet=bindparam("b_link")))
+
+
+class FalhaProvedor(Exception):
+    """ O provedor de vídeo não criou as salas; o pool tenta de novo depois. """
+
+
+# -------------------------------------------------------------------------
+# Provedores de vídeo
+# -------------------------------------------------------------------------
+
+class ProvedorVideo(abc.ABC):
+    """ Interface dos provedores de vídeo (Google Meet, Jitsi, ...). """
+
+    nome = "base"
+
+    @abc.abstractmethod
+    def criar_salas(self, codigos):
+        """ Cria uma sala por código e devolve os links na mesma ordem; lança FalhaProvedor se não conseguir. """
+
+
+class ProvedorLocal(ProvedorVideo):
+    """
+    Provedor sem rede: cada chamada espera `latencia` segundos (o custo de
+    uma requisição à API, qualquer que seja o lote) e devolve links no
+    formato do Meet.
+    """
+
+    nome = "local"
+
+    def __init__(self, latencia=0.05, url_base="https://meet.google.com/"):
+        self.latencia = latencia
+        self.url_base = url_base
+        self.chamadas = 0
+
+    def criar_salas(self, codigos):
+        relogio.sleep(self.latencia)
+        self.chamadas += 1
+        return [self.url_base + codigo for codigo in codigos]
+
+
+# -------------------------------------------------------------------------
+# Pool
+# -------------------------------------------------------------------------
+
+def criar_salas(conn, provedor, quantidade):
+    """
+    Cria `quantidade` salas novas no provedor e grava em SALA_REUNIAO.
+    Devolve os links dos códigos aceitos pelo índice único (colisões ficam
+    de fora, então podem vir menos que `quantidade`).
+    """
+    try:
+        insert = _INSERT_POR_DIALETO[conn.dialect.name]
+    except KeyError:
+        raise NotImplementedError(f"SALA_REUNIAO sem INSERT ... ON CONFLICT para o banco {conn.dialect.name!r}")
+    codigos = list({gerar_codigo_sala() for _ in range(quantidade)})
+    links = provedor.criar_salas(codigos)
+    aceitos = conn.execute(
+        insert(_SALAS).on_conflict_do_nothing(index_elements=["codigo"]).returning(_SALAS.c.url),
+        [dict(codigo=codigo, provedor=provedor.nome, url=link) for codigo, link in zip(codigos, links)],
+    ).scalars().all()
+    return aceitos
+
+
+class PoolLinks:
+    """ Links de reunião pré-criados, entregues em O(1) e reabastecidos em segundo plano. """
+
+    def __init__(self, provedor, bind=None, capacidade=CAPACIDADE_PADRAO, minimo=MINIMO_PADRAO,
+                 lote=LOTE_PADRAO, intervalo=INTERVALO_PADRAO):
+        self.provedor = provedor
+        self.bind = bind or engine
+        self.capacidade = capacidade
+        self.minimo = minimo
+        self.lote = lote
+        self.intervalo = intervalo
+        self._links = deque()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._trava = threading.Lock()
+
+        # Contadores
+        self.criados = 0
+        self.colisoes = 0
+        self.faltas = 0
+        self.completados = 0
+        self.falhas_provedor = 0
+        self.falhas = 0             # outros erros na thread de reabastecimento (ex: banco)
+
+    # ---------------------------------------------------------------------
+    # Entrega
+    # ---------------------------------------------------------------------
+
+    def proximo_link(self):
+        """ Um link ainda não usado, ou None se o pool estiver vazio (sem esperar o provedor). """
+        try:
+            link = self._links.popleft()
+        except IndexError:
+            with self._trava:
+                self.faltas += 1
+            self._acordar.set()
+            return None
+        if len(self._links) < self.minimo:
+            self._acordar.set()
+        return link
+
+    def instalar(self):
+        """ Faz os agendamentos novos pegarem o link deste pool. """
+        Agendamento.fornecedor_links = self.proximo_link
+        return self
+
+    def remover(self):
+        if Agendamento.fornecedor_links == self.proximo_link:
+            Agendamento.fornecedor_links = None
+
+    def __len__(self):
+        return len(self._links)
+
+    # ---------------------------------------------------------------------
+    # Reabastecimento
+    # ---------------------------------------------------------------------
+
+    def reabastecer(self):
+        """ Completa o pool até a capacidade, em lotes. Devolve quantos links entraram. """
+        entraram = 0
+        while len(self._links) < self.capacidade:
+            quantidade = min(self.lote, self.capacidade - len(self._links))
+            with self.bind.begin() as conn:
+                aceitos = criar_salas(conn, self.provedor, quantidade)
+            self._links.extend(aceitos)
+            self.criados += len(aceitos)
+            self.colisoes += quantidade - len(aceitos)
+            entraram += len(aceitos)
+        return entraram
+
+    def completar_sem_link(self):
+        """
+        Dá link aos agendamentos gravados com o pool vazio (link_meet nulo),
+        um lote por transação. Devolve quantos foram completados.
+        """
+        total = 0
+        while True:
+            with self.bind.connect() as conn:
+                ids = conn.execute(_SEM_LINK, {"b_limite": self.lote}).scalars().all()
+            if not ids:
+                return total
+            with self.bind.begin() as conn:
+                links = []
+                while len(links) < len(ids):
+                    links += criar_salas(conn, self.provedor, len(ids) - len(links))
+                completados = conn.execute(_DEFINIR_LINK, [dict(b_id=agendamento_id, b_link=link)
+                                                           for agendamento_id, link in zip(ids, links)]).rowcount
+            self.criados += len(links)
+            self.completados += completados
+            total += completados
+            if len(ids) < self.lote:
+                return total
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                self.reabastecer()
+                self.completar_sem_link()
+            except FalhaProvedor as erro:
+                self.falhas_provedor += 1
+                logger.warning("provedor de vídeo falhou ao criar salas: %s", erro)
+            except Exception:
+                # Sem isto a thread morreria calada e o pool pararia de ser reabastecido
+                self.falhas += 1
+                logger.exception("erro no reabastecimento do pool de links")
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def iniciar(self):
+        """ Enche o pool e inicia a thread de reabastecimento. """
+        self.reabastecer()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="pool-links", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.remover()
+
+    def estatisticas(self):
+        return dict(disponiveis=len(self._links), criados=self.criados, colisoes=self.colisoes,
+                    faltas=self.faltas, completados=self.completados, falhas_provedor=self.falhas_provedor,
+                    falhas=self.falhas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--salas", type=int, default=1000)
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por chamada ao provedor local")
+    args = parser.parse_args()
+
+    init_db()
+    pool = PoolLinks(ProvedorLocal(args.latencia), capacidade=args.salas)
+    inicio = relogio.perf_counter()
+    pool.reabastecer()
+    print(f"{pool.criados} salas criadas em {relogio.perf_counter() - inicio:.2f} s "
+          f"({pool.colisoes} colisões descartadas); {pool.completar_sem_link()} agendamentos sem link completados")
+
+
+if __name__ == "__main__":
+    main()
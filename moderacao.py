@@ -0,0 +1,231 @@
+"""
+Fila de moderação das avaliações.
+
+As avaliações pendentes são lidas em lotes, em ordem de data_avaliacao
+(paginação por chave no índice ix_avaliacao_moderacao), e o comentário
+passa por uma triagem automática:
+
+  - termos suspeitos (ofensas, acusações de golpe, contato por fora da
+    plataforma) são procurados todos de uma vez com um autômato de
+    Aho-Corasick, em uma única passada pelo texto normalizado (minúsculas,
+    sem acentos), qualquer que seja o número de termos;
+  - padrões (links, e-mails, telefones) ficam em uma única expressão
+    regular compilada.
+
+Avaliações limpas são aprovadas e as suspeitas denunciadas (ficam para o
+moderador, com o motivo em motivo_moderacao). Cada lote é aplicado com um
+UPDATE por status, e o agregado de notas (AVALIACAO_AGREGADA) recebe os
+aprovados somados por profissional e nota, em vez de um ajuste por
+avaliação. Os UPDATEs só alteram linhas ainda pendentes: uma decisão de um
+moderador tomada no meio do lote não é sobrescrita. Depois do commit de cada
+lote, os perfis em cache (cache_perfil.py) dos profissionais com avaliações
+aprovadas são invalidados, já que a média e a quantidade mudaram.
+
+Uso: python moderacao.py [--lote 1000] [--limite N]
+"""
+import argparse
+import re
+import time as relogio
+import unicodedata
+from collections import Counter, deque, namedtuple
+
+from sqlalchemy import bindparam, select, tuple_, update
+
+from cache_perfil import invalidar_perfis
+from Model import engine, init_db, ajustar_agregado_avaliacao, Avaliacao
+
+TAMANHO_LOTE_PADRAO = 1000
+
+# Termos procurados como palavras inteiras, já sem acento
+TERMOS_SUSPEITOS = (
+    "idiota", "imbecil", "burro", "burra", "lixo", "porcaria", "nojento", "nojenta", "ridiculo", "ridicula",
+    "incompetente", "charlatao", "charlata", "golpe", "golpista", "fraude", "ladrao", "ladra", "roubo",
+    "picareta", "enganacao", "vou processar", "procon", "me chama no", "chama no whats", "whatsapp", "zap",
+    "pix direto", "fora do app", "fora da plataforma", "desconto por fora",
+)
+
+PADROES_SUSPEITOS = (
+    r"https?://\S+|www\.\S+",                       # links
+    r"[\w.+-]+@[\w-]+\.[\w.]+",                     # e-mails
+    r"\(?\b\d{2}\)?\s?9?\d{4}[-\s]?\d{4}\b",        # telefones
+)
+
+Decisao = namedtuple('Decisao', ['id_avaliacao', 'status', 'motivo'])
+
+
+def normalizar(texto):
+    """ Minúsculas, sem acentos e com tudo que não é letra ou número virando um espaço. """
+    sem_acento = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+    return " " + re.sub(r"[^a-z0-9]+", " ", sem_acento).strip() + " "
+
+
+class AutomatoTermos:
+    """
+    Autômato de Aho-Corasick sobre um conjunto fixo de termos: encontra
+    todas as ocorrências em O(tamanho do texto + ocorrências). Os termos são
+    guardados entre espaços, assim só casam palavras inteiras do texto
+    normalizado ("lixo" não casa "lixeira").
+    """
+
+    def __init__(self, termos):
+        self._transicoes = [{}]     # estado -> {caractere: próximo estado}
+        self._falha = [0]
+        self._saidas = [()]         # estado -> termos que terminam nele
+        for termo in termos:
+            self._adicionar(normalizar(termo), termo)
+        self._ligar_falhas()
+
+    def _adicionar(self, chave, termo):
+        estado = 0
+        for caractere in chave:
+            proximo = self._transicoes[estado].get(caractere)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes.append({})
+                self._falha.append(0)
+                self._saidas.append(())
+                self._transicoes[estado][caractere] = proximo
+            estado = proximo
+        self._saidas[estado] += (termo,)
+
+    def _ligar_falhas(self):
+        # Busca em largura: a falha de um estado é o maior sufixo próprio que também é prefixo de algum termo
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for caractere, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+                falha = self._falha[estado]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                candidato = self._transicoes[falha].get(caractere, 0)
+                self._falha[proximo] = candidato if candidato != proximo else 0
+                self._saidas[proximo] += self._saidas[self._falha[proximo]]
+
+    def encontrar(self, texto_normalizado):
+        """ Termos (originais) presentes no texto já normalizado, sem repetição. """
+        transicoes, falha, saidas = self._transicoes, self._falha, self._saidas
+        estado, encontrados = 0, set()
+        for caractere in texto_normalizado:
+            while estado and caractere not in transicoes[estado]:
+                estado = falha[estado]
+            estado = transicoes[estado].get(caractere, 0)
+            if saidas[estado]:
+                encontrados.update(saidas[estado])
+        return encontrados
+
+
+class FiltroComentarios:
+    """ Triagem de um comentário: termos (Aho-Corasick) + padrões (uma regex). """
+
+    def __init__(self, termos=TERMOS_SUSPEITOS, padroes=PADROES_SUSPEITOS):
+        self.automato = AutomatoTermos(termos)
+        self.padroes = re.compile("|".join(f"(?:{padrao})" for padrao in padroes), re.IGNORECASE) \
+            if padroes else None
+
+    def motivos(self, comentario):
+        """ Lista (ordenada) do que tornou o comentário suspeito; vazia se estiver limpo. """
+        if not comentario:
+            return []
+        motivos = self.automato.encontrar(normalizar(comentario))
+        if self.padroes is not None:
+            motivos.update(f"padrão: {achado.group(0)[:40]}" for achado in self.padroes.finditer(comentario))
+        return sorted(motivos)
+
+    def decidir(self, id_avaliacao, comentario):
+        motivos = self.motivos(comentario)
+        if motivos:
+            return Decisao(id_avaliacao, "Denunciada", "; ".join(motivos)[:255])
+        return Decisao(id_avaliacao, "Aprovada", None)
+
+
+def aplicar_decisoes(conn, decisoes, afetados=None):
+    """
+    Grava as decisões de um lote: um UPDATE para as aprovadas e um
+    (executemany) para as denunciadas, com o motivo. Só altera avaliações
+    ainda pendentes. Devolve Counter com aprovadas e denunciadas efetivas.
+    Os profissionais cujo agregado mudou entram no set `afetados`, para o
+    chamador invalidar os perfis (invalidar_perfis) depois do commit.
+    """
+    tabela = Avaliacao.__table__
+    resumo = Counter()
+    aprovadas = [decisao.id_avaliacao for decisao in decisoes if decisao.status == "Aprovada"]
+    if aprovadas:
+        alteradas = conn.execute(
+            update(tabela)
+            .where(tabela.c.id_avaliacao.in_(aprovadas), tabela.c.status == "Pendente")
+            .values(status="Aprovada", motivo_moderacao=None)
+            .returning(tabela.c.profissional_id, tabela.c.nota)).all()
+        resumo["aprovadas"] = len(alteradas)
+        # UPDATE do Core não dispara os eventos de Avaliacao: o agregado é ajustado aqui, somado por nota
+        for (profissional_id, nota), quantidade in Counter(map(tuple, alteradas)).items():
+            ajustar_agregado_avaliacao(conn, profissional_id, nota, quantidade)
+            if afetados is not None:
+                afetados.add(profissional_id)
+
+    denunciadas = [dict(b_id=decisao.id_avaliacao, b_motivo=decisao.motivo)
+                   for decisao in decisoes if decisao.status == "Denunciada"]
+    if denunciadas:
+        resultado = conn.execute(
+            update(tabela)
+            .where(tabela.c.id_avaliacao == bindparam("b_id"), tabela.c.status == "Pendente")
+            .values(status="Denunciada", motivo_moderacao=bindparam("b_motivo")),
+            denunciadas)
+        resumo["denunciadas"] = resultado.rowcount
+    return resumo
+
+
+def moderar_pendentes(bind=None, filtro=None, tamanho_lote=TAMANHO_LOTE_PADRAO, limite=None):
+    """
+    Processa as avaliações pendentes, das mais antigas para as mais novas,
+    em lotes de `tamanho_lote` (uma transação curta por lote). Devolve um
+    Counter com processadas, aprovadas, denunciadas, lotes e segundos.
+    """
+    bind = bind or engine
+    filtro = filtro or FiltroComentarios()
+    tabela = Avaliacao.__table__
+    resumo = Counter()
+    posicao = None
+    inicio = relogio.perf_counter()
+
+    while limite is None or resumo["processadas"] < limite:
+        tamanho = tamanho_lote if limite is None else min(tamanho_lote, limite - resumo["processadas"])
+        consulta = select(tabela.c.id_avaliacao, tabela.c.data_avaliacao, tabela.c.comentario).where(
+            tabela.c.status == "Pendente")
+        if posicao is not None:
+            consulta = consulta.where(tuple_(tabela.c.data_avaliacao, tabela.c.id_avaliacao) > tuple_(*posicao))
+        consulta = consulta.order_by(tabela.c.data_avaliacao, tabela.c.id_avaliacao).limit(tamanho)
+
+        afetados = set()
+        with bind.begin() as conn:
+            linhas = conn.execute(consulta).all()
+            if not linhas:
+                break
+            # A triagem roda com a transação de leitura aberta, mas só o UPDATE pega a trava de escrita
+            decisoes = [filtro.decidir(linha.id_avaliacao, linha.comentario) for linha in linhas]
+            resumo.update(aplicar_decisoes(conn, decisoes, afetados))
+        if afetados:
+            invalidar_perfis(afetados)
+        resumo["processadas"] += len(linhas)
+        resumo["lotes"] += 1
+        posicao = (linhas[-1].data_avaliacao, linhas[-1].id_avaliacao)
+
+    resumo["segundos"] = relogio.perf_counter() - inicio
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO)
+    parser.add_argument("--limite", type=int, default=None)
+    args = parser.parse_args()
+
+    init_db()
+    resumo = moderar_pendentes(tamanho_lote=args.lote, limite=args.limite)
+    segundos = resumo["segundos"] or 1e-9
+    print(f"{resumo['processadas']} avaliações em {segundos:.2f} s ({resumo['processadas'] / segundos:.0f}/s): "
+          f"{resumo['aprovadas']} aprovadas, {resumo['denunciadas']} denunciadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Fila de saída de notificações (outbox) e despachante assíncrono.
+
+Quem gera uma notificação só grava a linha em NOTIFICACAO (status_entrega
+"Pendente"), na mesma transação do resto da operação; nada de rede acontece
+dentro da requisição. O DespachanteNotificacoes, rodando em outro processo
+(ou em uma thread com o seu próprio loop asyncio), esvazia a fila:
+
+  - reserva lotes de pendentes com um UPDATE ... RETURNING (status
+    "Enviando" + prazo da reserva em proxima_tentativa), pela ordem do
+    índice ix_notificacao_fila: prioridade e depois horário;
+  - emergências (prioridade 0) são reservadas em toda rodada, mesmo com a
+    fila interna cheia, e passam na frente dentro de cada canal;
+  - cada canal (Push, Email, SMS) tem o seu número de envios simultâneos;
+  - os resultados são gravados em lote (executemany); falhas voltam para
+    "Pendente" com espera exponencial e jitter, até MAX_TENTATIVAS, e então
+    ficam como "Falhou";
+  - reservas de um despachante que morreu ou travou expiram: a busca de
+    toda rodada pega também as "Enviando" com a reserva vencida;
+  - o número de tentativas é a marca da reserva: o resultado só é gravado
+    se a linha ainda estiver "Enviando" com as mesmas tentativas, então um
+    despachante atrasado não sobrescreve o envio de quem pegou a
+    notificação depois que a reserva dele venceu.
+
+O envio em si fica atrás da interface Transporte. TransporteLocal é um
+substituto sem rede (latência e falhas simuladas) para testes e benchmarks.
+
+Uso: python notificacoes.py [--uma-vez] [--lote 100]
+"""
+import abc
+import argparse
+import asyncio
+import random
+import time as relogio
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select, update
+
+from Model import engine, init_db, Notificacao
+
+TAMANHO_LOTE_PADRAO = 100
+
+# Envios simultâneos por canal (limites típicos de provedores de SMS/e-mail)
+LIMITES_POR_CANAL = {"Push": 50, "Email": 20, "SMS": 5}
+
+MAX_TENTATIVAS = 6
+# Espera antes da 2ª tentativa (segundos); dobra a cada falha, até ESPERA_MAXIMA
+ESPERA_INICIAL = 5.0
+ESPERA_MAXIMA = 3600.0
+
+# Por quanto tempo uma notificação reservada fica com o despachante antes de voltar à fila
+DURACAO_RESERVA = timedelta(minutes=5)
+# Tempo máximo de um envio pelo transporte (segundos)
+TIMEOUT_ENVIO = 30.0
+# Intervalo entre buscas quando a fila está vazia e entre gravações de resultados (segundos)
+INTERVALO_BUSCA = 0.5
+
+# Dados que o transporte recebe para enviar uma notificação
+NotificacaoSaida = namedtuple('NotificacaoSaida', [
+    'id_notificacao', 'usuario_id', 'canal', 'destino', 'prioridade',
+    'tipo_notificacao', 'mensagem', 'tentativas'])
+
+
+class FalhaEnvio(Exception):
+    """ Falha temporária do transporte; a notificação volta para a fila. """
+
+
+# -------------------------------------------------------------------------
+# Transportes
+# -------------------------------------------------------------------------
+
+class Transporte(abc.ABC):
+    """ Interface dos transportes (SMS, e-mail, push). """
+
+    @abc.abstractmethod
+    async def enviar(self, notificacao):
+        """ Envia uma NotificacaoSaida; deve lançar uma exceção se não conseguir. """
+
+
+class TransporteLocal(Transporte):
+    """
+    Transporte sem rede: espera `latencia` segundos (com variação) e falha
+    com probabilidade `taxa_falha`. Guarda o instante (time.perf_counter)
+    de cada entrega em `entregas`, por id de notificação.
+    """
+
+    def __init__(self, latencia=0.01, taxa_falha=0.0, semente=None, exibir=False):
+        self.latencia = latencia
+        self.taxa_falha = taxa_falha
+        self.exibir = exibir
+        self.entregas = {}
+        self.falhas = 0
+        self._aleatorio = random.Random(semente)
+
+    async def enviar(self, notificacao):
+        await asyncio.sleep(self.latencia * (0.5 + self._aleatorio.random()))
+        if self._aleatorio.random() < self.taxa_falha:
+            self.falhas += 1
+            raise FalhaEnvio("falha simulada do provedor")
+        self.entregas[notificacao.id_notificacao] = relogio.perf_counter()
+        if self.exibir:
+            print(f"--- Envio de Notificação ({notificacao.canal}) ---")
+            print(f"Para Usuário ID {notificacao.usuario_id} | Tipo: {notificacao.tipo_notificacao}")
+            print(f"Conteúdo: {notificacao.mensagem[:50]}...")
+
+
+# -------------------------------------------------------------------------
+# Operações na fila (síncronas; o despachante as chama via asyncio.to_thread)
+# -------------------------------------------------------------------------
+
+def reservar_lote(bind, limite, prioridade_maxima=None, agora=None, duracao_reserva=DURACAO_RESERVA):
+    """
+    Marca até `limite` notificações vencidas (pendentes, ou reservadas por
+    um despachante cuja reserva expirou) como "Enviando" e as devolve como
+    NotificacaoSaida, da maior para a menor prioridade.
+    """
+    agora = agora or datetime.utcnow()
+    tabela = Notificacao.__table__
+    fila = (
+        select(tabela.c.id_notificacao)
+        .where(tabela.c.status_entrega.in_(("Pendente", "Enviando")), tabela.c.proxima_tentativa <= agora)
+        .order_by(tabela.c.prioridade, tabela.c.proxima_tentativa, tabela.c.id_notificacao)
+        .limit(limite)
+        .with_for_update(skip_locked=True)  # ignorado pelo SQLite, que já serializa os escritores
+    )
+    if prioridade_maxima is not None:
+        fila = fila.where(tabela.c.prioridade <= prioridade_maxima)
+
+    with bind.begin() as conn:
+        linhas = conn.execute(
+            update(tabela)
+            .where(tabela.c.id_notificacao.in_(fila.scalar_subquery()))
+            .values(status_entrega="Enviando", tentativas=tabela.c.tentativas + 1,
+                    proxima_tentativa=agora + duracao_reserva)
+            .returning(tabela.c.id_notificacao, tabela.c.usuario_id, tabela.c.canal, tabela.c.destino,
+                       tabela.c.prioridade, tabela.c.tipo_notificacao, tabela.c.mensagem, tabela.c.tentativas)
+        ).all()
+    return sorted((NotificacaoSaida(*linha) for linha in linhas), key=lambda n: (n.prioridade, n.id_notificacao))
+
+
+def calcular_espera(tentativas, espera_inicial=ESPERA_INICIAL, espera_maxima=ESPERA_MAXIMA):
+    """ Espera exponencial com jitter (entre 50% e 150%) antes da próxima tentativa. """
+    espera = min(espera_maxima, espera_inicial * 2 ** max(tentativas - 1, 0))
+    return espera * (0.5 + random.random())
+
+
+def _da_reserva(tabela):
+    """ Filtro da linha ainda reservada por quem a enviou (mesmo id e mesmas tentativas). """
+    return (tabela.c.id_notificacao == bindparam("b_id"), tabela.c.status_entrega == "Enviando",
+            tabela.c.tentativas == bindparam("b_tentativas"))
+
+
+def registrar_resultados(bind, enviadas, falhas, max_tentativas=MAX_TENTATIVAS,
+                         espera_inicial=ESPERA_INICIAL, agora=None):
+    """
+    Grava em uma transação o resultado de um lote de envios.
+
+    `enviadas` é uma lista de NotificacaoSaida; `falhas`, uma lista de
+    (NotificacaoSaida, erro). Linhas que já não estão na reserva deste
+    envio (reserva vencida e pega por outro despachante) ficam como estão.
+    Devolve quantas linhas foram gravadas.
+    """
+    if not enviadas and not falhas:
+        return 0
+    agora = agora or datetime.utcnow()
+    tabela = Notificacao.__table__
+    gravadas = 0
+    with bind.begin() as conn:
+        if enviadas:
+            gravadas += conn.execute(
+                update(tabela).where(*_da_reserva(tabela))
+                .values(status_entrega="Enviada", enviada_em=agora, ultimo_erro=None),
+                [dict(b_id=notificacao.id_notificacao, b_tentativas=notificacao.tentativas)
+                 for notificacao in enviadas]).rowcount
+        if falhas:
+            gravadas += conn.execute(
+                update(tabela).where(*_da_reserva(tabela))
+                .values(status_entrega=bindparam("b_status"), proxima_tentativa=bindparam("b_proxima"),
+                        ultimo_erro=bindparam("b_erro")),
+                [dict(b_id=notificacao.id_notificacao, b_tentativas=notificacao.tentativas,
+                      b_status="Falhou" if notificacao.tentativas >= max_tentativas else "Pendente",
+                      b_proxima=agora + timedelta(seconds=calcular_espera(notificacao.tentativas, espera_inicial)),
+                      b_erro=f"{type(erro).__name__}: {erro}"[:500])
+                 for notificacao, erro in falhas]).rowcount
+    return gravadas
+
+
+def devolver_para_fila(bind, notificacoes):
+    """ Devolve notificações reservadas e não enviadas (ex: despachante parando). """
+    if not notificacoes:
+        return
+    tabela = Notificacao.__table__
+    with bind.begin() as conn:
+        conn.execute(
+            update(tabela).where(*_da_reserva(tabela))
+            .values(status_entrega="Pendente", tentativas=tabela.c.tentativas - 1,
+                    proxima_tentativa=datetime.utcnow()),
+            [dict(b_id=notificacao.id_notificacao, b_tentativas=notificacao.tentativas)
+             for notificacao in notificacoes])
+
+
+# -------------------------------------------------------------------------
+# Despachante
+# -------------------------------------------------------------------------
+
+class DespachanteNotificacoes:
+    """
+    Esvazia a fila de saída com um grupo de tarefas asyncio por canal.
+
+        despachante = DespachanteNotificacoes(TransporteLocal())
+        asyncio.run(despachante.executar())
+
+    `parar()` (do mesmo loop) ou `acordar()` (de qualquer thread, para
+    buscar imediatamente, ex: depois de gravar uma emergência).
+    """
+
+    def __init__(self, transporte, bind=None, tamanho_lote=TAMANHO_LOTE_PADRAO, limites_por_canal=None,
+                 max_tentativas=MAX_TENTATIVAS, espera_inicial=ESPERA_INICIAL,
+                 intervalo=INTERVALO_BUSCA, timeout_envio=TIMEOUT_ENVIO):
+        self.transporte = transporte
+        self.bind = bind or engine
+        self.tamanho_lote = tamanho_lote
+        self.limites_por_canal = dict(limites_por_canal or LIMITES_POR_CANAL)
+        self.max_tentativas = max_tentativas
+        self.espera_inicial = espera_inicial
+        self.intervalo = intervalo
+        self.timeout_envio = timeout_envio
+
+        # Contadores
+        self.enviadas = 0
+        self.falhas = 0
+
+        self._loop = None
+        self._filas = {}
+        self._em_envio = {}
+        self._resultados_ok = []
+        self._resultados_falha = []
+
+    # --- Controle -------------------------------------------------------------
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def acordar(self):
+        """ Pede uma busca imediata; pode ser chamado de outra thread. """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._acordar.set)
+
+    # --- Execução -------------------------------------------------------------
+
+    async def executar(self, ate_esvaziar=False):
+        """
+        Roda até `parar()`. Com ate_esvaziar=True, termina quando não houver
+        mais notificações vencidas na fila (usado por scripts e benchmarks).
+        """
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        self._acordar = asyncio.Event()
+        self._filas = {canal: asyncio.PriorityQueue() for canal in self.limites_por_canal}
+        self._em_envio = {}
+
+        tarefas = [asyncio.create_task(self._trabalhador(canal))
+                   for canal, limite in self.limites_por_canal.items() for _ in range(limite)]
+        gravador = asyncio.create_task(self._gravar_periodicamente())
+        try:
+            while not self._parar.is_set():
+                reservadas = await self._buscar()
+                if reservadas:
+                    continue
+                if ate_esvaziar and not self._em_memoria():
+                    # Os resultados precisam estar gravados antes de conferir a fila de novo
+                    await self._gravar()
+                    if not await self._buscar():
+                        break
+                    continue
+                self._acordar.clear()
+                try:
+                    await asyncio.wait_for(self._acordar.wait(), self.intervalo)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for tarefa in tarefas + [gravador]:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, gravador, return_exceptions=True)
+            nao_enviadas = list(self._em_envio.values())
+            for fila in self._filas.values():
+                while not fila.empty():
+                    nao_enviadas.append(fila.get_nowait()[2])
+            await self._gravar()
+            await asyncio.to_thread(devolver_para_fila, self.bind, nao_enviadas)
+
+    def _em_memoria(self):
+        return sum(fila.qsize() for fila in self._filas.values()) + len(self._em_envio)
+
+    async def _buscar(self):
+        """ Reserva um lote no banco e distribui pelas filas dos canais. """
+        # Emergências entram em toda rodada, mesmo com a fila interna cheia
+        reservadas = await asyncio.to_thread(
+            reservar_lote, self.bind, self.tamanho_lote, Notificacao.PRIORIDADE_EMERGENCIA)
+        espaco = self.tamanho_lote - self._em_memoria() - len(reservadas)
+        if espaco > 0:
+            reservadas += await asyncio.to_thread(reservar_lote, self.bind, espaco)
+        elif not reservadas:
+            # Fila interna cheia: espera os trabalhadores liberarem espaço
+            self._acordar.clear()
+            try:
+                await asyncio.wait_for(self._acordar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+        for notificacao in reservadas:
+            self._filas[notificacao.canal].put_nowait(
+                (notificacao.prioridade, notificacao.id_notificacao, notificacao))
+        return reservadas
+
+    async def _trabalhador(self, canal):
+        fila = self._filas[canal]
+        while True:
+            _, _, notificacao = await fila.get()
+            self._em_envio[notificacao.id_notificacao] = notificacao
+            try:
+                await asyncio.wait_for(self.transporte.enviar(notificacao), self.timeout_envio)
+            except Exception as erro:
+                self._resultados_falha.append((notificacao, erro))
+                self.falhas += 1
+            else:
+                self._resultados_ok.append(notificacao)
+                self.enviadas += 1
+            del self._em_envio[notificacao.id_notificacao]
+            fila.task_done()
+            if self._em_memoria() <= self.tamanho_lote // 2:
+                self._acordar.set()
+
+    async def _gravar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self._gravar()
+
+    async def _gravar(self):
+        """ Grava os resultados acumulados (commit em grupo). """
+        enviadas, self._resultados_ok = self._resultados_ok, []
+        falhas, self._resultados_falha = self._resultados_falha, []
+        await asyncio.to_thread(registrar_resultados, self.bind, enviadas, falhas,
+                                self.max_tentativas, self.espera_inicial)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uma-vez", action="store_true", help="termina quando a fila esvaziar")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO)
+    args = parser.parse_args()
+
+    init_db()
+    # Sem provedor real configurado: o transporte local só exibe as mensagens
+    despachante = DespachanteNotificacoes(TransporteLocal(exibir=True), tamanho_lote=args.lote)
+    try:
+        asyncio.run(despachante.executar(ate_esvaziar=args.uma_vez))
+    except KeyboardInterrupt:
+        pass
+    print(f"Enviadas: {despachante.enviadas} | Falhas: {despachante.falhas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Relatórios operacionais sobre uma cópia colunar do banco.
+
+Os relatórios (receita por especialidade, cancelamentos por profissional,
+faltas por semana, ocupação da agenda, notas por especialidade) não rodam
+no banco da aplicação: varrer AGENDAMENTO e PAGAMENTO inteiros a cada
+relatório segura a leitura por segundos e disputa o arquivo com quem está
+reservando. Em vez disso:
+
+  - extrair() copia para um diretório (o "armazém") só as linhas de
+    AGENDAMENTO, PAGAMENTO e AVALIACAO alteradas desde a última extração,
+    pela coluna atualizado_em (marca d'água), e funde com o que já estava
+    lá pela chave; PROFISSIONAL e AGENDA_PROFISSIONAL, pequenas, são
+    copiadas inteiras. Cada coluna vira um arquivo .npy (datas como
+    datetime64, horas em minutos, valores em centavos, textos de Enum como
+    códigos int8);
+  - Relatorios abre os arquivos com mmap e calcula tudo com operações
+    vetorizadas do NumPy (bincount, searchsorted), sem conectar ao banco.
+
+Uma extração grava uma nova geração de cada tabela e só então troca o
+meta.json (os.replace): quem já está com o armazém aberto continua lendo a
+geração anterior, que é apagada só na extração seguinte.
+
+A marca d'água recua MARGEM_MARCA a cada extração, para pegar transações
+que gravaram atualizado_em antes da marca mas só fizeram commit depois
+(as linhas repetidas são simplesmente regravadas). Linhas anteriores à
+coluna atualizado_em (NULL) e linhas apagadas só são vistas por uma
+extração completa (--completo).
+
+Uso: python relatorios.py extrair [--completo]
+     python relatorios.py receita|cancelamentos|faltas|ocupacao|notas [--inicio AAAA-MM-DD] [--dias 90]
+"""
+import argparse
+import json
+import os
+import shutil
+import time as relogio
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import func, select
+
+from disponibilidade import DURACAO_PADRAO_MINUTOS
+from Model import engine, init_db, Agendamento, AgendaProfissional, Avaliacao, Pagamento, Profissional
+
+DIRETORIO_PADRAO = "relatorios"
+BLOCO = 50000
+MARGEM_MARCA = timedelta(minutes=5)
+
+# Tipos das colunas no armazém: dtype do NumPy ou uma conversão especial
+#   "minutos": datetime.time -> minutos desde a meia-noite (int16)
+#   "centavos": Numeric -> centavos (int64)
+#   "codigo": texto de um Enum -> posição na lista de categorias (int8)
+Tabela = namedtuple('Tabela', ['tabela', 'chave', 'colunas'])
+
+TABELAS = {
+    "agendamentos": Tabela(Agendamento.__table__, "id_agendamento", {
+        "id_agendamento": "int64", "profissional_id": "int32", "paciente_id": "int32",
+        "data_consulta": "datetime64[D]", "hora_consulta": "minutos", "status": "codigo"}),
+    "pagamentos": Tabela(Pagamento.__table__, "agendamento_id", {
+        "agendamento_id": "int64", "valor": "centavos", "status": "codigo", "metodo": "codigo",
+        "data_pagamento": "datetime64[s]"}),
+    "avaliacoes": Tabela(Avaliacao.__table__, "id_avaliacao", {
+        "id_avaliacao": "int64", "profissional_id": "int32", "nota": "int8", "status": "codigo",
+        "data_avaliacao": "datetime64[s]"}),
+    # Copiadas inteiras a cada extração (sem chave)
+    "profissionais": Tabela(Profissional.__table__, None, {
+        "id_profissional": "int32", "tipo_de_especialidade": "codigo"}),
+    "agenda": Tabela(AgendaProfissional.__table__, None, {
+        "profissional_id": "int32", "dia_semana": "codigo", "hora_inicio": "minutos", "hora_fim": "minutos",
+        "disponivel": "bool"}),
+}
+
+LinhaReceita = namedtuple('LinhaReceita', ['especialidade', 'pagamentos', 'receita'])
+LinhaCancelamento = namedtuple('LinhaCancelamento', ['profissional_id', 'agendamentos', 'cancelados', 'taxa'])
+LinhaFaltas = namedtuple('LinhaFaltas', ['semana', 'consultas', 'faltas', 'taxa'])
+LinhaOcupacao = namedtuple('LinhaOcupacao', ['profissional_id', 'horarios', 'agendados', 'ocupacao'])
+LinhaNotas = namedtuple('LinhaNotas', ['especialidade', 'avaliacoes', 'media'])
+
+
+# -------------------------------------------------------------------------
+# Armazém (arquivos .npy + meta.json)
+# -------------------------------------------------------------------------
+
+class Armazem:
+    """ Diretório com uma geração de arquivos .npy por tabela, descrito pelo meta.json. """
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO):
+        self.diretorio = diretorio
+        caminho = os.path.join(diretorio, "meta.json")
+        if os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as arquivo:
+                self.meta = json.load(arquivo)
+        else:
+            self.meta = {"geracao": 0, "tabelas": {}, "categorias": {}}
+
+    def colunas(self, nome):
+        """ {coluna: array somente leitura (mmap)} da geração atual; vazio se a tabela ainda não existe. """
+        info = self.meta["tabelas"].get(nome)
+        if info is None:
+            return {}
+        pasta = os.path.join(self.diretorio, info["pasta"])
+        return {coluna: np.load(os.path.join(pasta, f"{coluna}.npy"), mmap_mode="r")
+                for coluna in TABELAS[nome].colunas}
+
+    def categorias(self, nome, coluna):
+        return self.meta["categorias"].setdefault(f"{nome}.{coluna}", [])
+
+    def gravar(self, nome, arrays, marca):
+        """ Grava uma nova geração da tabela; só passa a valer em publicar(). """
+        pasta = f"{nome}-{self.meta['geracao'] + 1}"
+        os.makedirs(os.path.join(self.diretorio, pasta), exist_ok=True)
+        for coluna, valores in arrays.items():
+            np.save(os.path.join(self.diretorio, pasta, f"{coluna}.npy"), valores)
+        anterior = self.meta["tabelas"].get(nome, {})
+        self.meta["tabelas"][nome] = {"pasta": pasta, "linhas": len(next(iter(arrays.values()))),
+                                      "marca": marca, "anterior": anterior.get("pasta")}
+
+    def publicar(self):
+        """ Troca o meta.json de uma vez e apaga as gerações que ninguém mais referencia. """
+        self.meta["geracao"] += 1
+        temporario = os.path.join(self.diretorio, "meta.json.tmp")
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(self.meta, arquivo, ensure_ascii=False, indent=1)
+        os.replace(temporario, os.path.join(self.diretorio, "meta.json"))
+        em_uso = {pasta for info in self.meta["tabelas"].values() for pasta in (info["pasta"], info["anterior"])}
+        for entrada in os.listdir(self.diretorio):
+            if entrada.rpartition("-")[0] in TABELAS and entrada not in em_uso:
+                shutil.rmtree(os.path.join(self.diretorio, entrada), ignore_errors=True)
+
+
+def _converter(valores, tipo, categorias):
+    if tipo == "minutos":
+        return np.array([hora.hour * 60 + hora.minute for hora in valores], dtype=np.int16)
+    if tipo == "centavos":
+        return np.array([int(valor * 100) for valor in valores], dtype=np.int64)
+    if tipo == "codigo":
+        codigos = {texto: i for i, texto in enumerate(categorias)}
+        for texto in valores:
+            if texto not in codigos:
+                codigos[texto] = len(categorias)
+                categorias.append(texto)
+        return np.array([codigos[texto] for texto in valores], dtype=np.int8)
+    # datetime64 converte None em NaT
+    return np.array(valores, dtype=tipo)
+
+
+def _vazio(tipo):
+    dtype = {"minutos": np.int16, "centavos": np.int64, "codigo": np.int8}.get(tipo, tipo)
+    return np.empty(0, dtype=dtype)
+
+
+def _ler(conn, armazem, nome, desde, bloco):
+    """ Lê as linhas (todas, ou alteradas a partir de `desde`) em blocos, já convertidas em arrays. """
+    definicao = TABELAS[nome]
+    tabela = definicao.tabela
+    consulta = select(*[tabela.c[coluna] for coluna in definicao.colunas])
+    if desde is not None:
+        consulta = consulta.where(tabela.c.atualizado_em >= desde)
+    partes = {coluna: [] for coluna in definicao.colunas}
+    resultado = conn.execution_options(yield_per=bloco).execute(consulta)
+    for linhas in resultado.partitions():
+        for coluna, valores in zip(definicao.colunas, zip(*linhas)):
+            tipo = definicao.colunas[coluna]
+            partes[coluna].append(_converter(valores, tipo, armazem.categorias(nome, coluna)))
+    return {coluna: np.concatenate(arrays) if arrays else _vazio(definicao.colunas[coluna])
+            for coluna, arrays in partes.items()}
+
+
+def _fundir(atuais, novas, chave):
+    """
+    Funde as linhas novas nas atuais pela chave (as duas ordenadas pela
+    chave no resultado): linhas já existentes são substituídas, as outras
+    acrescentadas.
+    """
+    if not atuais or not len(atuais[chave]):
+        ordem = np.argsort(novas[chave], kind="stable")
+        return {coluna: valores[ordem] for coluna, valores in novas.items()}
+    chaves = atuais[chave]
+    posicoes = np.searchsorted(chaves, novas[chave])
+    limitadas = np.minimum(posicoes, len(chaves) - 1)
+    existentes = (posicoes < len(chaves)) & (chaves[limitadas] == novas[chave])
+    resultado = {}
+    for coluna, valores in atuais.items():
+        copia = np.array(valores)
+        copia[posicoes[existentes]] = novas[coluna][existentes]
+        resultado[coluna] = np.concatenate([copia, novas[coluna][~existentes]])
+    if len(chaves) and (~existentes).any() and novas[chave][~existentes].min() < chaves[-1]:
+        ordem = np.argsort(resultado[chave], kind="stable")
+        resultado = {coluna: valores[ordem] for coluna, valores in resultado.items()}
+    return resultado
+
+
+def extrair(bind=None, diretorio=DIRETORIO_PADRAO, completo=False, bloco=BLOCO):
+    """
+    Atualiza o armazém com as alterações do banco desde a última extração
+    (ou com tudo, se `completo`). Todas as tabelas são lidas na mesma
+    transação de leitura, então o armazém nunca mistura dois momentos do
+    banco. Devolve um Counter com as linhas lidas por tabela.
+    """
+    bind = bind or engine
+    armazem = Armazem(diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+    lidas = Counter()
+    with bind.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            # O pysqlite não abre transação para SELECT: sem o BEGIN, cada tabela veria um momento diferente
+            conn.exec_driver_sql("BEGIN")
+        for nome, definicao in TABELAS.items():
+            info = armazem.meta["tabelas"].get(nome)
+            marca = None
+            desde = None
+            if definicao.chave is not None:
+                marca = conn.scalar(select(func.max(definicao.tabela.c.atualizado_em)))
+                marca = marca.isoformat() if marca else None
+                if not completo and info and info["marca"]:
+                    desde = datetime.fromisoformat(info["marca"]) - MARGEM_MARCA
+            novas = _ler(conn, armazem, nome, desde, bloco)
+            lidas[nome] = len(next(iter(novas.values())))
+            if definicao.chave is None:
+                arrays = novas
+            else:
+                arrays = _fundir(armazem.colunas(nome) if desde is not None else {}, novas, definicao.chave)
+            armazem.gravar(nome, arrays, marca)
+    armazem.publicar()
+    return lidas
+
+
+# -------------------------------------------------------------------------
+# Relatórios (só leem o armazém)
+# -------------------------------------------------------------------------
+
+def _dia(data):
+    return np.datetime64(data, "D")
+
+
+def _segunda_feira(dias):
+    """ Segunda-feira da semana de cada datetime64[D] (1970-01-01 foi uma quinta). """
+    return dias - (dias.astype(np.int64) + 3) % 7
+
+
+class Relatorios:
+    """
+    Relatórios calculados sobre o armazém aberto (geração do momento da
+    abertura). Datas de início e fim são inclusivas.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO):
+        self.armazem = Armazem(diretorio)
+        if not self.armazem.meta["tabelas"]:
+            raise FileNotFoundError(f"armazém vazio em {diretorio!r}: rode relatorios.py extrair")
+        self.agendamentos = self.armazem.colunas("agendamentos")
+        self.pagamentos = self.armazem.colunas("pagamentos")
+        self.avaliacoes = self.armazem.colunas("avaliacoes")
+        self.agenda = self.armazem.colunas("agenda")
+        profissionais = self.armazem.colunas("profissionais")
+        # Tabela de consulta id do profissional -> código da especialidade
+        ids = profissionais["id_profissional"]
+        self._especialidade = np.full(int(ids.max(initial=0)) + 1, -1, dtype=np.int16)
+        self._especialidade[ids] = profissionais["tipo_de_especialidade"]
+        self._n_profissionais = len(self._especialidade)
+
+    def _codigo(self, nome, coluna, texto):
+        """ Código do texto no armazém (-1 se nunca apareceu: não casa com nada). """
+        categorias = self.armazem.meta["categorias"].get(f"{nome}.{coluna}", [])
+        return categorias.index(texto) if texto in categorias else -1
+
+    def _por_especialidade(self, codigos, pesos=None):
+        """ (quantidade, soma dos pesos) por código de especialidade. """
+        categorias = self.armazem.meta["categorias"].get("profissionais.tipo_de_especialidade", [])
+        validos = codigos >= 0
+        quantidade = np.bincount(codigos[validos], minlength=len(categorias))
+        soma = np.bincount(codigos[validos], weights=None if pesos is None else pesos[validos],
+                           minlength=len(categorias))
+        return categorias, quantidade, soma
+
+    def _faixa(self, datas, inicio, fim):
+        mascara = np.ones(len(datas), dtype=bool)
+        if inicio is not None:
+            mascara &= datas >= _dia(inicio)
+        if fim is not None:
+            mascara &= datas < _dia(fim + timedelta(days=1))
+        return mascara
+
+    def receita_por_especialidade(self, inicio=None, fim=None):
+        """ Pagamentos aprovados (pela data do pagamento) e receita, por especialidade. """
+        p = self.pagamentos
+        mascara = (p["status"] == self._codigo("pagamentos", "status", "Aprovado")) & \
+            self._faixa(p["data_pagamento"], inicio, fim)
+        # Pagamento -> agendamento (ids ordenados) -> profissional -> especialidade
+        ids = self.agendamentos["id_agendamento"]
+        posicoes = np.minimum(np.searchsorted(ids, p["agendamento_id"][mascara]), len(ids) - 1)
+        profissionais = self.agendamentos["profissional_id"][posicoes]
+        categorias, quantidade, centavos = self._por_especialidade(self._especialidade[profissionais],
+                                                                   p["valor"][mascara])
+        return [LinhaReceita(categoria, int(quantidade[i]), Decimal(int(centavos[i])).scaleb(-2))
+                for i, categoria in enumerate(categorias) if quantidade[i]]
+
+    def cancelamentos_por_profissional(self, inicio=None, fim=None, minimo=1):
+        """ Taxa de cancelamento por profissional (pela data da consulta), maiores primeiro. """
+        a = self.agendamentos
+        mascara = self._faixa(a["data_consulta"], inicio, fim)
+        profissionais = a["profissional_id"][mascara]
+        cancelados = a["status"][mascara] == self._codigo("agendamentos", "status", "Cancelado")
+        total = np.bincount(profissionais, minlength=self._n_profissionais)
+        canc = np.bincount(profissionais[cancelados], minlength=self._n_profissionais)
+        ids = np.flatnonzero(total >= max(minimo, 1))
+        taxa = canc[ids] / total[ids]
+        ordem = np.lexsort((ids, -taxa))
+        return [LinhaCancelamento(int(ids[i]), int(total[ids[i]]), int(canc[ids[i]]), float(taxa[i]))
+                for i in ordem]
+
+    def faltas_por_semana(self, inicio=None, fim=None, hoje=None):
+        """
+        Faltas por semana (segunda-feira). Conta as consultas já passadas
+        (antes de `hoje`) que foram pagas: as concluídas e as que ficaram
+        em "Confirmado", ou seja, nunca foram marcadas como realizadas.
+        """
+        a = self.agendamentos
+        hoje = hoje or date.today()
+        fim = min(fim, hoje - timedelta(days=1)) if fim else hoje - timedelta(days=1)
+        status = a["status"]
+        confirmado = status == self._codigo("agendamentos", "status", "Confirmado")
+        concluido = status == self._codigo("agendamentos", "status", "Concluido")
+        mascara = self._faixa(a["data_consulta"], inicio, fim) & (confirmado | concluido)
+        semanas, indices = np.unique(_segunda_feira(a["data_consulta"][mascara]), return_inverse=True)
+        consultas = np.bincount(indices, minlength=len(semanas))
+        faltas = np.bincount(indices[confirmado[mascara]], minlength=len(semanas))
+        return [LinhaFaltas(semana.item(), int(consultas[i]), int(faltas[i]), float(faltas[i] / consultas[i]))
+                for i, semana in enumerate(semanas)]
+
+    def ocupacao_agenda(self, inicio, fim, duracao_minutos=DURACAO_PADRAO_MINUTOS):
+        """
+        Horários oferecidos pela agenda semanal (janelas ativas divididas em
+        consultas de `duracao_minutos`, vezes quantas vezes o dia da semana
+        aparece no período) contra agendamentos não cancelados no período.
+        """
+        g = self.agenda
+        # Ocorrências de cada dia da semana (por código) no período: busday_count com um dia só na máscara
+        ocorrencias = np.array([
+            np.busday_count(_dia(inicio), _dia(fim + timedelta(days=1)),
+                            weekmask=[dia == outro for outro in AgendaProfissional.OPCOES_DIA_SEMANA])
+            for dia in self.armazem.meta["categorias"].get("agenda.dia_semana", [])], dtype=np.int64)
+        por_janela = np.maximum(g["hora_fim"].astype(np.int64) - g["hora_inicio"], 0) // duracao_minutos
+        horarios = np.bincount(g["profissional_id"], weights=(por_janela * ocorrencias[g["dia_semana"]]) *
+                               g["disponivel"], minlength=self._n_profissionais).astype(np.int64)
+
+        a = self.agendamentos
+        mascara = self._faixa(a["data_consulta"], inicio, fim) & \
+            (a["status"] != self._codigo("agendamentos", "status", "Cancelado"))
+        agendados = np.bincount(a["profissional_id"][mascara], minlength=len(horarios))
+        ids = np.flatnonzero(horarios)
+        return [LinhaOcupacao(int(i), int(horarios[i]), int(agendados[i]), float(agendados[i] / horarios[i]))
+                for i in ids]
+
+    def notas_por_especialidade(self, inicio=None, fim=None):
+        """ Avaliações aprovadas e nota média por especialidade. """
+        v = self.avaliacoes
+        mascara = (v["status"] == self._codigo("avaliacoes", "status", "Aprovada")) & \
+            self._faixa(v["data_avaliacao"], inicio, fim)
+        categorias, quantidade, soma = self._por_especialidade(
+            self._especialidade[v["profissional_id"][mascara]], v["nota"][mascara])
+        return [LinhaNotas(categoria, int(quantidade[i]), float(soma[i] / quantidade[i]))
+                for i, categoria in enumerate(categorias) if quantidade[i]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("acao", choices=("extrair", "receita", "cancelamentos", "faltas", "ocupacao", "notas"))
+    parser.add_argument("--diretorio", default=DIRETORIO_PADRAO)
+    parser.add_argument("--completo", action="store_true", help="extrai tudo de novo, ignorando a marca d'água")
+    parser.add_argument("--inicio", type=date.fromisoformat, default=date.today() - timedelta(days=90))
+    parser.add_argument("--dias", type=int, default=90)
+    args = parser.parse_args()
+
+    if args.acao == "extrair":
+        init_db()
+        inicio = relogio.perf_counter()
+        lidas = extrair(diretorio=args.diretorio, completo=args.completo)
+        print(", ".join(f"{nome}: {quantidade}" for nome, quantidade in lidas.items()) +
+              f" linhas lidas em {relogio.perf_counter() - inicio:.1f} s")
+        return
+
+    relatorios = Relatorios(args.diretorio)
+    fim = args.inicio + timedelta(days=args.dias - 1)
+    linhas = {
+        "receita": lambda: relatorios.receita_por_especialidade(args.inicio, fim),
+        "cancelamentos": lambda: relatorios.cancelamentos_por_profissional(args.inicio, fim, minimo=5),
+        "faltas": lambda: relatorios.faltas_por_semana(args.inicio, fim),
+        "ocupacao": lambda: relatorios.ocupacao_agenda(args.inicio, fim),
+        "notas": lambda: relatorios.notas_por_especialidade(args.inicio, fim),
+    }[args.acao]()
+    for linha in linhas:
+        print(";".join(str(valor) for valor in linha))
+
+
+if __name__ == "__main__":
+    main()
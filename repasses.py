@@ -0,0 +1,278 @@
+"""
+Fechamento mensal dos repasses aos profissionais.
+
+Para uma competência (AAAA-MM), junta os pagamentos aprovados e ainda não
+repassados até o fim do mês:
+
+  1. uma única consulta agrupada por profissional (com os dados bancários
+     na mesma junção), lida em streaming, decide quem recebe; os dados
+     bancários são validados uma vez por profissional, e quem não tem dados
+     válidos fica de fora (os pagamentos continuam pendentes de repasse);
+  2. em lotes de profissionais, uma transação cria (ou reaproveita) o
+     REPASSE da competência, marca os pagamentos com o repasse_id e calcula
+     quantidade e total a partir dos pagamentos marcados, de modo que o
+     valor do repasse é sempre exatamente a soma dos pagamentos ligados a ele;
+  3. o arquivo para o banco é gerado em streaming (uma linha por repasse,
+     CSV separado por ";") e os repasses exportados passam para "Exportado".
+
+Pagamentos aprovados de agendamentos cancelados não são repassados: o valor
+volta para o paciente. Nem a prévia do passo 1 nem a marcação do passo 2
+os contam, e fechar_competencia os marca com reembolso_pendente_desde (a
+mesma fila de reembolsos dos webhooks, visível em
+VarredorReservas.metricas()); eles saem da fila quando o gateway confirma
+o Reembolsado.
+
+Rodar de novo a mesma competência é seguro: pagamentos já repassados não
+entram de novo, e um repasse já exportado não é alterado (pagamentos
+aprovados depois da exportação ficam para a competência seguinte).
+
+Uso: python repasses.py 2025-03 [--arquivo repasses_2025-03.csv] [--lote 1000]
+"""
+import argparse
+import csv
+import os
+import time as relogio
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, insert, literal_column, select, update
+
+from Model import engine, init_db, Agendamento, DadosBancarios, Pagamento, Repasse
+
+TAMANHO_LOTE_PADRAO = 1000
+
+CAMPOS_ARQUIVO = ("id_repasse", "competencia", "cpf_cnpj_titular", "nome_titular", "banco", "agencia",
+                  "conta", "digito_verificador", "tipo_conta", "quantidade_pagamentos", "valor_total")
+
+
+def _fim_competencia(competencia):
+    """ Início (00:00) do primeiro dia do mês seguinte à competência AAAA-MM. """
+    try:
+        ano, mes = (int(parte) for parte in competencia.split("-"))
+        if not 1 <= mes <= 12:
+            raise ValueError
+        return datetime(ano + mes // 12, mes % 12 + 1, 1)
+    except ValueError:
+        raise ValueError(f"Competência inválida (use AAAA-MM): {competencia!r}")
+
+
+@contextmanager
+def _transacao_escrita(bind):
+    """
+    Transação que já começa com a trava de escrita no SQLite (BEGIN IMMEDIATE):
+    o que é lido no início continua valendo até o commit, mesmo com outros
+    processos (ex: webhooks) gravando ao mesmo tempo.
+    """
+    with bind.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def _filtro_a_repassar(fim, dica=lambda condicao: condicao):
+    tabela = Pagamento.__table__
+    return tuple(dica(condicao) for condicao in (
+        tabela.c.repasse_id.is_(None), tabela.c.status == "Aprovado", tabela.c.data_pagamento < fim))
+
+
+# Só consultas não canceladas geram repasse; o mesmo filtro vale para a prévia e para a marcação
+def _agendamento_repassavel(agendamentos):
+    return agendamentos.c.status != "Cancelado"
+
+
+def _pouco_seletivo(condicao):
+    """
+    Dica do SQLite (likelihood): ao marcar os pagamentos de um profissional,
+    o otimizador deve partir dos agendamentos dele, e não do índice de
+    pagamentos a repassar (que cobre o mês inteiro).
+    """
+    return func.likelihood(condicao, literal_column("0.9"))
+
+
+def profissionais_a_repassar(conn, fim):
+    """
+    Uma linha por profissional com pagamentos a repassar (quantidade e soma
+    prévias, e os dados bancários), em streaming.
+    """
+    pagamentos, agendamentos, bancarios = Pagamento.__table__, Agendamento.__table__, DadosBancarios.__table__
+    consulta = (
+        select(agendamentos.c.profissional_id,
+               func.count().label("quantidade"),
+               func.sum(pagamentos.c.valor).label("total"),
+               bancarios.c.cpf_cnpj_titular, bancarios.c.agencia, bancarios.c.conta)
+        .select_from(pagamentos)
+        .join(agendamentos, agendamentos.c.id_agendamento == pagamentos.c.agendamento_id)
+        .outerjoin(bancarios, bancarios.c.profissional_id == agendamentos.c.profissional_id)
+        .where(*_filtro_a_repassar(fim), _agendamento_repassavel(agendamentos))
+        .group_by(agendamentos.c.profissional_id)
+        .order_by(agendamentos.c.profissional_id)
+    )
+    return conn.execution_options(yield_per=TAMANHO_LOTE_PADRAO).execute(consulta)
+
+
+def _gravar_lote(conn, competencia, fim, profissionais, resumo):
+    """ Cria/reaproveita os repasses de um lote de profissionais e liga os pagamentos a eles. """
+    repasses, agendamentos, pagamentos = Repasse.__table__, Agendamento.__table__, Pagamento.__table__
+
+    existentes = dict(conn.execute(
+        select(repasses.c.profissional_id, repasses.c.status)
+        .where(repasses.c.competencia == competencia, repasses.c.profissional_id.in_(profissionais))).all())
+    novos = [id_profissional for id_profissional in profissionais if id_profissional not in existentes]
+    resumo["adiados_ja_exportados"] += sum(1 for status in existentes.values() if status == "Exportado")
+    if novos:
+        conn.execute(insert(repasses), [dict(profissional_id=id_profissional, competencia=competencia,
+                                             quantidade_pagamentos=0, valor_total=0, status="Gerado")
+                                        for id_profissional in novos])
+
+    ids = dict(conn.execute(
+        select(repasses.c.profissional_id, repasses.c.id_repasse)
+        .where(repasses.c.competencia == competencia, repasses.c.status == "Gerado",
+               repasses.c.profissional_id.in_(profissionais))).all())
+    if not ids:
+        return
+
+    # Marca os pagamentos dentro da mesma transação em que os totais são calculados
+    do_profissional = (
+        select(agendamentos.c.id_agendamento)
+        .where(agendamentos.c.profissional_id == bindparam("b_profissional"),
+               _agendamento_repassavel(agendamentos))
+    )
+    dica = _pouco_seletivo if conn.dialect.name == "sqlite" else (lambda condicao: condicao)
+    resumo["pagamentos"] += conn.execute(
+        update(pagamentos)
+        .where(pagamentos.c.agendamento_id.in_(do_profissional.scalar_subquery()), *_filtro_a_repassar(fim, dica))
+        .values(repasse_id=bindparam("b_repasse")),
+        [dict(b_profissional=id_profissional, b_repasse=id_repasse) for id_profissional, id_repasse in ids.items()]
+    ).rowcount
+
+    do_repasse = pagamentos.c.repasse_id == repasses.c.id_repasse
+    conn.execute(
+        update(repasses).where(repasses.c.id_repasse.in_(ids.values()))
+        .values(quantidade_pagamentos=select(func.count()).where(do_repasse).scalar_subquery(),
+                valor_total=select(func.coalesce(func.sum(pagamentos.c.valor), 0)).where(do_repasse)
+                .scalar_subquery()))
+    resumo["repasses"] += len(ids)
+
+
+def sinalizar_reembolsos(conn, fim, agora=None):
+    """
+    Marca com reembolso_pendente_desde os pagamentos aprovados até `fim`,
+    sem repasse, de agendamentos cancelados. Devolve quantos foram marcados.
+    """
+    pagamentos, agendamentos = Pagamento.__table__, Agendamento.__table__
+    cancelados = select(agendamentos.c.id_agendamento).where(~_agendamento_repassavel(agendamentos))
+    return conn.execute(
+        update(pagamentos)
+        .where(*_filtro_a_repassar(fim), pagamentos.c.reembolso_pendente_desde.is_(None),
+               pagamentos.c.agendamento_id.in_(cancelados.scalar_subquery()))
+        .values(reembolso_pendente_desde=agora or datetime.utcnow())
+    ).rowcount
+
+
+def fechar_competencia(competencia, bind=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """
+    Gera os repasses da competência. Devolve um Counter com repasses,
+    pagamentos, rejeitados_dados_bancarios, adiados_ja_exportados e
+    reembolsos_pendentes (pagamentos de consultas canceladas marcados nesta
+    execução).
+    """
+    bind = bind or engine
+    fim = _fim_competencia(competencia)
+    resumo = Counter()
+    lote = []
+
+    with _transacao_escrita(bind) as conn:
+        resumo["reembolsos_pendentes"] += sinalizar_reembolsos(conn, fim)
+
+    # A leitura agrupada usa uma conexão; cada lote é gravado em outra, em sua própria transação
+    with bind.connect() as leitura:
+        for linha in profissionais_a_repassar(leitura, fim):
+            if not DadosBancarios.dados_validos(linha.cpf_cnpj_titular, linha.agencia, linha.conta):
+                resumo["rejeitados_dados_bancarios"] += 1
+                continue
+            lote.append(linha.profissional_id)
+            if len(lote) >= tamanho_lote:
+                with _transacao_escrita(bind) as conn:
+                    _gravar_lote(conn, competencia, fim, lote, resumo)
+                lote = []
+        if lote:
+            with _transacao_escrita(bind) as conn:
+                _gravar_lote(conn, competencia, fim, lote, resumo)
+    return resumo
+
+
+def exportar_arquivo_banco(competencia, caminho, bind=None):
+    """
+    Escreve, em streaming, os repasses "Gerado" da competência no arquivo do
+    banco e os marca como "Exportado". Devolve (quantidade, valor total).
+    """
+    bind = bind or engine
+    repasses, bancarios = Repasse.__table__, DadosBancarios.__table__
+    consulta = (
+        select(repasses.c.id_repasse, repasses.c.competencia, bancarios.c.cpf_cnpj_titular,
+               bancarios.c.nome_titular, bancarios.c.banco, bancarios.c.agencia, bancarios.c.conta,
+               bancarios.c.digito_verificador, bancarios.c.tipo_conta, repasses.c.quantidade_pagamentos,
+               repasses.c.valor_total)
+        .join(bancarios, bancarios.c.profissional_id == repasses.c.profissional_id)
+        .where(repasses.c.competencia == competencia, repasses.c.status == "Gerado",
+               repasses.c.quantidade_pagamentos > 0)
+        .order_by(repasses.c.id_repasse)
+    )
+
+    quantidade, total, exportados = 0, 0, []
+    temporario = caminho + ".tmp"
+    try:
+        # A escrita e a marcação ficam na mesma transação: nenhum repasse novo entra no meio
+        with _transacao_escrita(bind) as conn, open(temporario, "w", newline="", encoding="utf-8") as arquivo:
+            escritor = csv.writer(arquivo, delimiter=";")
+            escritor.writerow(CAMPOS_ARQUIVO)
+            for linha in conn.execution_options(yield_per=TAMANHO_LOTE_PADRAO).execute(consulta):
+                escritor.writerow(linha)
+                quantidade += 1
+                total += linha.valor_total
+                exportados.append(linha.id_repasse)
+                if len(exportados) >= TAMANHO_LOTE_PADRAO:
+                    _marcar_exportados(conn, exportados)
+                    exportados = []
+            _marcar_exportados(conn, exportados)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        # Falha na escrita ou no commit: não deixa um arquivo pela metade para trás
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return quantidade, total
+
+
+def _marcar_exportados(conn, ids):
+    if ids:
+        repasses = Repasse.__table__
+        conn.execute(update(repasses).where(repasses.c.id_repasse.in_(ids))
+                     .values(status="Exportado", exportado_em=datetime.utcnow()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("competencia", help="mês de referência, AAAA-MM")
+    parser.add_argument("--arquivo", help="arquivo do banco (padrão: repasses_<competencia>.csv)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO)
+    args = parser.parse_args()
+
+    init_db()
+    inicio = relogio.perf_counter()
+    resumo = fechar_competencia(args.competencia, tamanho_lote=args.lote)
+    quantidade, total = exportar_arquivo_banco(args.competencia, args.arquivo or f"repasses_{args.competencia}.csv")
+    print(f"Competência {args.competencia}: {dict(resumo)} | exportados={quantidade} (R$ {total}) "
+          f"em {relogio.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Serviço de reserva de consultas (gravação de AGENDAMENTO).
+
+Cada reserva ocupa [hora, hora + DURACAO_PADRAO_MINUTOS). A tentativa
+começa pegando a trava de escrita (BEGIN IMMEDIATE no SQLite; nos outros
+bancos, SELECT ... FOR UPDATE nas linhas da agenda do profissional no dia),
+confere dentro dela que nenhum agendamento ativo do profissional se
+sobrepõe ao intervalo e só então faz o INSERT: 09:00 e 09:30 não convivem
+com consultas de 50 minutos. O índice único parcial `uq_agendamento_horario`
+(profissional_id, data_consulta, hora_consulta) continua como última
+proteção contra reserva dupla; outras violações de integridade (ex: chave
+estrangeira) não viram HorarioIndisponivel e sobem como IntegrityError.
+
+Isto não é a reserva otimista sem trava global pedida originalmente. No
+SQLite, BEGIN IMMEDIATE trava o banco inteiro para escrita: reservas de
+profissionais diferentes também entram em fila, uma de cada vez, e a vazão
+de escrita fica limitada a um escritor por vez. Foi a forma de garantir a
+checagem de sobreposição, que o índice único não cobre (ele só pega o mesmo
+horário exato). Nos outros bancos a trava é de linha e só serializa
+reservas do mesmo profissional no mesmo dia da semana.
+
+Quando o SQLite está com a trava de escrita ocupada ("database is locked"),
+a tentativa é repetida com espera exponencial e jitter.
+
+O agendamento nasce "Pendente" com prazo_reserva (Agendamento.PRAZO_RESERVA):
+se o pagamento não for aprovado até lá, expiracao_reservas.py o cancela e o
+horário volta a ficar livre.
+"""
+import random
+import time as relogio
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, literal, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from Model import engine, AgendaProfissional, Agendamento
+from disponibilidade import DURACAO_PADRAO_MINUTOS
+
+# Número máximo de tentativas quando o banco está travado por outro escritor
+TENTATIVAS_PADRAO = 8
+# Espera inicial (segundos) entre tentativas; dobra a cada nova tentativa
+ESPERA_INICIAL = 0.005
+
+# Sessões do serviço não expiram os objetos no commit: o Agendamento
+# devolvido continua legível depois que a sessão é fechada.
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+
+class HorarioIndisponivel(Exception):
+    """ O horário já foi reservado por outro paciente (ou está fora da agenda). """
+
+
+class ReservaNaoConcluida(Exception):
+    """ O banco continuou travado depois de todas as tentativas. """
+
+
+def _banco_travado(erro):
+    return "locked" in str(erro.orig).lower() or "busy" in str(erro.orig).lower()
+
+
+def _conflito_de_horario(erro):
+    """ True se o IntegrityError veio do índice uq_agendamento_horario (e não de outra restrição). """
+    mensagem = str(erro.orig)
+    # PostgreSQL cita o nome do índice; o SQLite, as colunas
+    return ("uq_agendamento_horario" in mensagem
+            or "AGENDAMENTO.profissional_id, AGENDAMENTO.data_consulta, AGENDAMENTO.hora_consulta" in mensagem)
+
+
+def consulta_horario_na_agenda(profissional_id, data, hora, duracao_minutos=DURACAO_PADRAO_MINUTOS):
+    """ SELECT de um slot ativo da agenda em que [hora, hora + duracao) cabe (usado também pelo banco_async). """
+    dia_semana = AgendaProfissional.OPCOES_DIA_SEMANA[data.weekday()]
+    fim = (datetime.combine(data, hora) + timedelta(minutes=duracao_minutos)).time()
+    return (
+        select(AgendaProfissional.id_disponibilidade)
+        .where(AgendaProfissional.profissional_id == profissional_id,
+               AgendaProfissional.dia_semana == dia_semana,
+               AgendaProfissional.disponivel.is_(True),
+               AgendaProfissional.hora_inicio <= hora,
+               AgendaProfissional.hora_fim >= fim)
+        .limit(1)
+    )
+
+
+def consulta_conflitos(profissional_id, data, hora, duracao_minutos=DURACAO_PADRAO_MINUTOS):
+    """
+    SELECT de um agendamento ativo do profissional que se sobrepõe a
+    [hora, hora + duracao) no dia (faixa do índice uq_agendamento_horario;
+    usado também pelo banco_async).
+    """
+    inicio = datetime.combine(data, hora)
+    duracao = timedelta(minutes=duracao_minutos)
+    condicoes = [Agendamento.profissional_id == profissional_id,
+                 Agendamento.data_consulta == data,
+                 # Literal no SQL para o SQLite poder usar o índice parcial
+                 Agendamento.status != literal("Cancelado", literal_execute=True)]
+    # Outro agendamento de mesma duração colide se começar a menos de `duracao` deste
+    if (inicio - duracao).date() == data:
+        condicoes.append(Agendamento.hora_consulta > (inicio - duracao).time())
+    if (inicio + duracao).date() == data:
+        condicoes.append(Agendamento.hora_consulta < (inicio + duracao).time())
+    return select(Agendamento.id_agendamento).where(*condicoes).limit(1)
+
+
+def consulta_trava_agenda(profissional_id, data):
+    """ SELECT ... FOR UPDATE das linhas da agenda do profissional no dia da semana (bancos sem BEGIN IMMEDIATE). """
+    return (
+        select(AgendaProfissional.id_disponibilidade)
+        .where(AgendaProfissional.profissional_id == profissional_id,
+               AgendaProfissional.dia_semana == AgendaProfissional.OPCOES_DIA_SEMANA[data.weekday()])
+        .with_for_update()
+    )
+
+
+def opcoes_conexao(consulta):
+    """
+    bind_arguments de session.connection() para a conexão em que `consulta`
+    roda (com o ShardedSession, a do shard do profissional do filtro).
+    """
+    return {"mapper": inspect(Agendamento), "clause": consulta.whereclause}
+
+
+def _travar_agenda(conn, profissional_id, data):
+    """ Serializa as reservas do profissional até o commit (ver consulta_trava_agenda). """
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.execute(consulta_trava_agenda(profissional_id, data)).all()
+
+
+def horario_na_agenda(session, profissional_id, data, hora, duracao_minutos=DURACAO_PADRAO_MINUTOS):
+    """ Verifica se [hora, hora + duracao) cabe em algum slot ativo da agenda do profissional. """
+    consulta = consulta_horario_na_agenda(profissional_id, data, hora, duracao_minutos)
+    return session.execute(consulta).first() is not None
+
+
+def reservar_consulta(paciente_id, profissional_id, data, hora, session_factory=None,
+                      validar_agenda=True, tentativas=TENTATIVAS_PADRAO):
+    """
+    Grava um novo agendamento e devolve o objeto Agendamento.
+
+    Lança HorarioIndisponivel se o horário se sobrepuser a outro agendamento
+    ativo (ou estiver fora da agenda, quando validar_agenda=True) e
+    ReservaNaoConcluida se o banco continuar travado depois de `tentativas`
+    tentativas.
+    """
+    session_factory = session_factory or Session
+    espera = ESPERA_INICIAL
+
+    for _ in range(tentativas):
+        session = session_factory()
+        try:
+            conflitos = consulta_conflitos(profissional_id, data, hora)
+            _travar_agenda(session.connection(bind_arguments=opcoes_conexao(conflitos)), profissional_id, data)
+            if validar_agenda and not horario_na_agenda(session, profissional_id, data, hora):
+                raise HorarioIndisponivel(
+                    f"Horário {data} {hora} fora da agenda do profissional {profissional_id}.")
+            if session.execute(conflitos).first() is not None:
+                raise HorarioIndisponivel(
+                    f"Horário {data} {hora} do profissional {profissional_id} já está reservado.")
+
+            agendamento = Agendamento(profissional_id, paciente_id, data, hora)
+            session.add(agendamento)
+            session.commit()
+            return agendamento
+        except IntegrityError as erro:
+            session.rollback()
+            if not _conflito_de_horario(erro):
+                raise
+            raise HorarioIndisponivel(
+                f"Horário {data} {hora} do profissional {profissional_id} já está reservado.")
+        except OperationalError as erro:
+            session.rollback()
+            if not _banco_travado(erro):
+                raise
+            # Outro escritor está com a trava: espera e tenta de novo
+            relogio.sleep(espera * (1 + random.random()))
+            espera *= 2
+        finally:
+            session.close()
+
+    raise ReservaNaoConcluida(f"Banco ocupado após {tentativas} tentativas.")
@@ -0,0 +1,210 @@
+"""
+Hash de senhas dos usuários.
+
+As senhas são guardadas como hash scrypt (ou PBKDF2-SHA256), com o
+algoritmo, os parâmetros de custo e o sal gravados junto do próprio hash:
+
+    scrypt$16384$8$1$<sal base64>$<hash base64>
+    pbkdf2_sha256$600000$<sal base64>$<hash base64>
+
+Assim o custo pode ser aumentado a qualquer momento (definir_custo): os
+hashes antigos continuam válidos e são regravados com o custo atual no
+próximo login bem-sucedido (conferir_senha devolve o hash novo). Senhas
+ainda em texto puro, de bancos criados antes deste módulo, são aceitas da
+mesma forma e migradas no primeiro login; só vale como texto puro um valor
+não vazio sem o prefixo de nenhum algoritmo ("scrypt$", "pbkdf2_sha256$").
+Um hash com prefixo conhecido mas malformado nunca confere.
+
+Calcular o hash é caro de propósito (dezenas de ms de CPU), então quem
+atende muitos logins ao mesmo tempo não deve fazê-lo na thread do loop de
+eventos: o VerificadorSenhas roda as verificações em um pool de threads
+(hashlib libera o GIL durante o scrypt/PBKDF2) ou de processos.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+# Custos disponíveis; o padrão vale para os hashes novos e para o rehash no login
+CUSTOS = {
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "pbkdf2_sha256": {"iteracoes": 600000},
+}
+ALGORITMO_PADRAO = "scrypt"
+PARAMETROS_PADRAO = dict(CUSTOS[ALGORITMO_PADRAO])
+
+TAMANHO_SAL = 16
+TAMANHO_HASH = 32
+
+
+def definir_custo(algoritmo=ALGORITMO_PADRAO, **parametros):
+    """
+    Troca o algoritmo/custo usado para os hashes novos. Parâmetros omitidos
+    ficam com o valor de CUSTOS.
+    """
+    global ALGORITMO_PADRAO, PARAMETROS_PADRAO
+    if algoritmo not in CUSTOS:
+        raise ValueError(f"Algoritmo de senha desconhecido: {algoritmo}")
+    desconhecidos = set(parametros) - set(CUSTOS[algoritmo])
+    if desconhecidos:
+        raise ValueError(f"Parâmetros inválidos para {algoritmo}: {', '.join(sorted(desconhecidos))}")
+    ALGORITMO_PADRAO = algoritmo
+    PARAMETROS_PADRAO = dict(CUSTOS[algoritmo], **parametros)
+
+
+def _derivar(algoritmo, parametros, senha, sal):
+    if algoritmo == "scrypt":
+        n, r, p = parametros["n"], parametros["r"], parametros["p"]
+        # Memória usada pelo scrypt: 128 * r * (n + p), com folga
+        return hashlib.scrypt(senha.encode("utf-8"), salt=sal, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=TAMANHO_HASH)
+    return hashlib.pbkdf2_hmac("sha256", senha.encode("utf-8"), sal, parametros["iteracoes"], TAMANHO_HASH)
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode("ascii").rstrip("=")
+
+
+def _de_b64(texto):
+    return base64.b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def gerar_hash_senha(senha, algoritmo=None, parametros=None, sal=None):
+    """
+    Hash de uma senha com o custo atual (ou o informado), já no formato de
+    armazenamento. `sal` fixo só para dados sintéticos reproduzíveis.
+    """
+    algoritmo = algoritmo or ALGORITMO_PADRAO
+    parametros = parametros or (PARAMETROS_PADRAO if algoritmo == ALGORITMO_PADRAO else CUSTOS[algoritmo])
+    sal = sal or os.urandom(TAMANHO_SAL)
+    derivado = _b64(_derivar(algoritmo, parametros, senha, sal))
+    if algoritmo == "scrypt":
+        return f"scrypt${parametros['n']}${parametros['r']}${parametros['p']}${_b64(sal)}${derivado}"
+    return f"pbkdf2_sha256${parametros['iteracoes']}${_b64(sal)}${derivado}"
+
+
+def _legado(armazenado):
+    """ True se o valor armazenado é uma senha em texto puro (não vazia e sem prefixo de algoritmo). """
+    return bool(armazenado) and not any(armazenado.startswith(algoritmo + "$") for algoritmo in CUSTOS)
+
+
+def _decodificar(armazenado):
+    """ (algoritmo, parametros, sal, hash) de um valor armazenado; None se for texto puro ou malformado. """
+    partes = (armazenado or "").split("$")
+    try:
+        if partes[0] == "scrypt" and len(partes) == 6:
+            n, r, p = (int(valor) for valor in partes[1:4])
+            return "scrypt", {"n": n, "r": r, "p": p}, _de_b64(partes[4]), _de_b64(partes[5])
+        if partes[0] == "pbkdf2_sha256" and len(partes) == 4:
+            return "pbkdf2_sha256", {"iteracoes": int(partes[1])}, _de_b64(partes[2]), _de_b64(partes[3])
+    except ValueError:
+        pass
+    return None
+
+
+def verificar_senha(senha, armazenado):
+    """ True se a senha confere com o valor armazenado (hash ou texto puro legado). """
+    decodificado = _decodificar(armazenado)
+    if decodificado is None:
+        if not _legado(armazenado):
+            # Vazio, ou hash com prefixo de algoritmo que não decodifica
+            return False
+        return hmac.compare_digest((senha or "").encode("utf-8"), armazenado.encode("utf-8"))
+    algoritmo, parametros, sal, esperado = decodificado
+    try:
+        derivado = _derivar(algoritmo, parametros, senha, sal)
+    except ValueError:
+        # Parâmetros de custo inválidos gravados no hash (ex: n do scrypt que não é potência de 2)
+        return False
+    return hmac.compare_digest(derivado, esperado)
+
+
+def precisa_rehash(armazenado, algoritmo=None, parametros=None):
+    """ True se o valor armazenado não usa o algoritmo/custo atual (ou está em texto puro). """
+    algoritmo = algoritmo or ALGORITMO_PADRAO
+    parametros = parametros or (PARAMETROS_PADRAO if algoritmo == ALGORITMO_PADRAO else CUSTOS[algoritmo])
+    decodificado = _decodificar(armazenado)
+    return decodificado is None or decodificado[:2] != (algoritmo, parametros)
+
+
+def conferir_senha(senha, armazenado, algoritmo=None, parametros=None):
+    """
+    Verifica a senha e, se ela confere mas o hash está com custo antigo,
+    calcula o hash novo. Devolve (confere, hash_novo ou None).
+
+    O algoritmo e os parâmetros podem ser passados explicitamente para que
+    workers de um pool de processos usem o custo do processo principal.
+    """
+    if not verificar_senha(senha, armazenado):
+        return False, None
+    if precisa_rehash(armazenado, algoritmo, parametros):
+        return True, gerar_hash_senha(senha, algoritmo, parametros)
+    return True, None
+
+
+# Usado quando o usuário não existe, para o tempo de resposta não denunciar emails cadastrados
+_HASH_FICTICIO = None
+
+
+def _hash_ficticio():
+    global _HASH_FICTICIO
+    if _HASH_FICTICIO is None or precisa_rehash(_HASH_FICTICIO):
+        _HASH_FICTICIO = gerar_hash_senha(_b64(os.urandom(TAMANHO_SAL)))
+    return _HASH_FICTICIO
+
+
+class VerificadorSenhas:
+    """
+    Pool para verificar e gerar hashes fora da thread que atende as
+    requisições. Por padrão usa threads; com processos=True usa um pool de
+    processos (útil se o hash for trocado por algo que não libera o GIL).
+
+        with VerificadorSenhas() as verificador:
+            ok = await verificador.autenticar(usuario, senha)
+    """
+
+    def __init__(self, max_workers=None, processos=False):
+        max_workers = max_workers or os.cpu_count() or 1
+        self.executor = (ProcessPoolExecutor if processos else ThreadPoolExecutor)(max_workers=max_workers)
+        self.max_workers = max_workers
+
+    def conferir(self, senha, armazenado):
+        """ Future de conferir_senha, com o custo atual deste processo. """
+        return self.executor.submit(conferir_senha, senha, armazenado, ALGORITMO_PADRAO, PARAMETROS_PADRAO)
+
+    async def conferir_async(self, senha, armazenado):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, conferir_senha, senha, armazenado,
+                                          ALGORITMO_PADRAO, PARAMETROS_PADRAO)
+
+    async def autenticar(self, usuario, senha_informada):
+        """
+        Login sem bloquear o loop de eventos. `usuario` é qualquer objeto com
+        o atributo `senha` (ex: Usuario), ou None se o email não existe. Se o
+        hash estiver com custo antigo, o atributo recebe o hash novo (quem
+        chamou faz o commit).
+        """
+        armazenado = usuario.senha if usuario is not None else _hash_ficticio()
+        confere, hash_novo = await self.conferir_async(senha_informada, armazenado)
+        if usuario is None:
+            return False
+        if hash_novo:
+            usuario.senha = hash_novo
+        return confere
+
+    def gerar_hashes(self, senhas, chunksize=16):
+        """ Hashes de várias senhas em paralelo, na mesma ordem (ex: importação em massa). """
+        return self.executor.map(gerar_hash_senha, senhas, repeat(ALGORITMO_PADRAO), repeat(PARAMETROS_PADRAO),
+                                 chunksize=chunksize)
+
+    def encerrar(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.encerrar()
@@ -0,0 +1,291 @@
+"""
+Roteamento dos dados por profissional entre vários arquivos SQLite (shards).
+
+Com um único tcc.db, toda gravação (reservas, pagamentos, avaliações) passa
+pela mesma trava de escrita do SQLite. Aqui a operação de cada profissional
+vai para um shard (profissional_id % quantidade), cada um com seu arquivo
+e sua trava:
+
+  - tabelas por profissional (AGENDA_PROFISSIONAL, AGENDAMENTO, PAGAMENTO,
+    AVALIACAO, AVALIACAO_AGREGADA, REPASSE) ficam no shard do profissional,
+    e HISTORICO_STATUS_AGENDAMENTO no shard do agendamento;
+  - o cadastro e o resto (USUARIO, PACIENTE, PROFISSIONAL, ENDERECO,
+    NOTIFICACAO, ...) ficam no banco global, o tcc.db de sempre.
+
+A sessão é um ShardedSession do SQLAlchemy: um objeto novo é gravado no
+shard do seu profissional_id (um PAGAMENTO, no do agendamento) e uma
+consulta vai só para os shards citados nos filtros de primeiro nível
+(profissional_id == / IN, ou a chave primária); sem filtro, vai para
+todos, em sequência. As chaves inteiras de cada shard começam em
+shard * FAIXA_IDS, então o id de um agendamento já diz em que shard ele
+está (session.get não precisa procurar em todos).
+
+Cada shard tem só as tabelas por profissional (preparar() não cria as
+globais nele), então uma consulta que junte uma tabela global com uma do
+shard falha com "no such table" em vez de voltar vazia; não há JOIN entre
+arquivos. Os relacionamentos são carregados com consultas separadas, cada
+uma roteada para o seu banco. Para buscas globais, consulta_global() roda
+a mesma consulta em todos os shards em paralelo (uma thread por shard) e
+junta os resultados, já ordenados, com heapq.merge.
+
+Só reservas.reservar_consulta funciona sem mudança com
+Shards.fabrica_sessoes() (todas as suas consultas ficam no shard do
+profissional). A busca de horários livres (disponibilidade.py e
+banco_async.py) não é suportada com shards: ela junta PROFISSIONAL (global)
+com AGENDA_PROFISSIONAL e AGENDAMENTO na mesma consulta.
+
+Uso: python shards.py 4 [--modelo tcc_shard_{:02d}.db]   (cria os arquivos dos shards)
+"""
+import argparse
+import heapq
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+from conexao import criar_engine
+from Model import engine, init_db, Base, AgendaProfissional, Agendamento, Pagamento, Avaliacao, AvaliacaoAgregada, \
+    Repasse, HistoricoStatusAgendamento
+
+SHARD_GLOBAL = "global"
+MODELO_ARQUIVO = "tcc_shard_{:02d}.db"
+
+# Chaves inteiras do shard n ficam em [n * FAIXA_IDS, (n + 1) * FAIXA_IDS)
+FAIXA_IDS = 1 << 40
+
+# Classes gravadas no shard do profissional (o histórico vai junto com o agendamento, pelo agendamento_id)
+CLASSES_POR_PROFISSIONAL = (AgendaProfissional, Agendamento, Pagamento, Avaliacao, AvaliacaoAgregada, Repasse,
+                            HistoricoStatusAgendamento)
+TABELAS_POR_PROFISSIONAL = {classe.__table__ for classe in CLASSES_POR_PROFISSIONAL}
+# As que têm chave inteira gerada pelo banco (as outras usam o id do profissional ou do gateway)
+CLASSES_COM_FAIXA = (AgendaProfissional, Agendamento, Avaliacao, Repasse)
+
+# Colunas que decidem o shard quando aparecem em um filtro: "profissional" (id % quantidade) ou "faixa" (id // FAIXA_IDS)
+_COLUNAS_ROTEAMENTO = {
+    "profissional_id": "profissional",
+    "id_agendamento": "faixa", "agendamento_id": "faixa", "id_avaliacao": "faixa",
+    "id_disponibilidade": "faixa", "id_repasse": "faixa",
+}
+
+# Engine de cada shard -> início da faixa de ids (e as tabelas que já têm linha na faixa)
+_faixas = weakref.WeakKeyDictionary()
+_trava_faixas = threading.Lock()
+
+
+class Shards:
+    """ Banco global + N shards, com a fábrica de sessões roteadas e as consultas globais. """
+
+    def __init__(self, engines_shards, engine_global=None):
+        self.engine_global = engine_global or engine
+        self.engines = {str(numero): engine_shard for numero, engine_shard in enumerate(engines_shards)}
+        self.quantidade = len(self.engines)
+        for numero, engine_shard in enumerate(engines_shards):
+            _faixas[engine_shard] = (numero * FAIXA_IDS, set())
+        self._executor = ThreadPoolExecutor(max_workers=self.quantidade, thread_name_prefix="shard")
+
+    @classmethod
+    def em_arquivos(cls, quantidade, modelo=MODELO_ARQUIVO, engine_global=None, **opcoes):
+        """ Um arquivo SQLite por shard (modelo.format(numero)); opções vão para criar_engine. """
+        return cls([criar_engine(f"sqlite:///{modelo.format(numero)}", **opcoes) for numero in range(quantidade)],
+                   engine_global)
+
+    def preparar(self):
+        """
+        Cria o esquema completo no banco global e, em cada shard, só as
+        tabelas por profissional. Tabelas globais vazias deixadas em um shard
+        por versões anteriores são removidas; com dados, é um erro.
+        """
+        init_db(self.engine_global)
+        globais = {tabela.name for tabela in Base.metadata.tables.values()} - \
+            {tabela.name for tabela in TABELAS_POR_PROFISSIONAL}
+        for numero, engine_shard in self.engines.items():
+            init_db(engine_shard, tabelas=TABELAS_POR_PROFISSIONAL)
+            with engine_shard.begin() as conn:
+                for nome in sorted(globais & set(inspect(conn).get_table_names())):
+                    if conn.exec_driver_sql(f'SELECT 1 FROM "{nome}" LIMIT 1').first() is not None:
+                        raise ValueError(f"shard {numero} tem linhas na tabela global {nome}")
+                    conn.exec_driver_sql(f'DROP TABLE "{nome}"')
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+        for engine_shard in self.engines.values():
+            engine_shard.dispose()
+
+    # ---------------------------------------------------------------------
+    # Roteamento
+    # ---------------------------------------------------------------------
+
+    def shard_do_profissional(self, profissional_id):
+        return str(profissional_id % self.quantidade)
+
+    def _shard_da_chave(self, tipo, valor):
+        if tipo == "profissional":
+            return self.shard_do_profissional(valor)
+        numero = valor // FAIXA_IDS
+        return str(numero) if 0 <= numero < self.quantidade else None
+
+    def _escolher_shard(self, mapper, instance, clause=None):
+        """ Shard em que um objeto novo é gravado (ou da conexão pedida sem objeto). """
+        if mapper is None or mapper.local_table not in TABELAS_POR_PROFISSIONAL:
+            return SHARD_GLOBAL
+        if instance is not None:
+            if isinstance(instance, Pagamento):
+                # Sem acessar o atributo: não dispara um lazy load no meio do flush
+                agendamento = instance.__dict__.get("agendamento")
+                if agendamento is not None and agendamento.profissional_id is not None:
+                    return self.shard_do_profissional(agendamento.profissional_id)
+                return self._shard_da_chave("faixa", instance.agendamento_id)
+            return self.shard_do_profissional(instance.profissional_id)
+        if clause is not None:
+            shards = self._shards_dos_filtros(clause)
+            if len(shards) == 1:
+                return shards.pop()
+        raise ValueError(f"não dá para escolher o shard de {mapper.class_.__name__} sem o objeto ou um filtro")
+
+    def _escolher_por_identidade(self, mapper, primary_key, *, lazy_loaded_from, **kw):
+        """ Shards onde procurar um objeto pela chave primária (session.get, many-to-one). """
+        if mapper.local_table not in TABELAS_POR_PROFISSIONAL:
+            return [SHARD_GLOBAL]
+        chave = primary_key[0]
+        if isinstance(chave, int):
+            tipo = "profissional" if mapper.class_ is AvaliacaoAgregada else "faixa"
+            shard = self._shard_da_chave(tipo, chave)
+            if shard is not None:
+                return [shard]
+        if lazy_loaded_from is not None and lazy_loaded_from.identity_token in self.engines:
+            return [lazy_loaded_from.identity_token]
+        return list(self.engines)
+
+    def _escolher_para_consulta(self, contexto):
+        """ Shards de um SELECT/UPDATE/DELETE do ORM: os citados nos filtros, ou todos. """
+        mapper = contexto.bind_mapper
+        if mapper is None or mapper.local_table not in TABELAS_POR_PROFISSIONAL:
+            return [SHARD_GLOBAL]
+        carregado_de = contexto.lazy_loaded_from
+        if carregado_de is not None and carregado_de.identity_token in self.engines:
+            return [carregado_de.identity_token]
+        # session.get e os carregamentos de relacionamento passam os valores nos parâmetros da execução
+        parametros = contexto.parameters if isinstance(contexto.parameters, dict) else {}
+        shards = self._shards_dos_filtros(contexto.statement.whereclause, parametros)
+        return sorted(shards) if shards else list(self.engines)
+
+    def _shards_dos_filtros(self, clausula, parametros=None):
+        """
+        Shards citados nos filtros de primeiro nível (ligados por AND) do
+        tipo coluna == valor ou coluna IN (...). Conjunto vazio = não deu
+        para restringir.
+        """
+        if clausula is None:
+            return set()
+        if isinstance(clausula, BooleanClauseList) and clausula.operator is operators.and_:
+            filtros = clausula.clauses
+        else:
+            filtros = [clausula]
+        for filtro in filtros:
+            if not isinstance(filtro, BinaryExpression):
+                continue
+            coluna, parametro = filtro.left, filtro.right
+            if isinstance(coluna, BindParameter):
+                # Carregamento lazy: ":param = TABELA.coluna"
+                coluna, parametro = parametro, coluna
+            if not isinstance(parametro, BindParameter):
+                continue
+            tipo = _COLUNAS_ROTEAMENTO.get(getattr(coluna, "key", None))
+            if tipo is None or getattr(coluna, "table", None) not in TABELAS_POR_PROFISSIONAL:
+                continue
+            valor = (parametros or {}).get(parametro.key, parametro.effective_value)
+            if filtro.operator is operators.eq and isinstance(valor, int):
+                valores = [valor]
+            elif filtro.operator is operators.in_op and valor and all(isinstance(v, int) for v in valor):
+                valores = valor
+            else:
+                continue
+            shards = {self._shard_da_chave(tipo, v) for v in valores}
+            if None not in shards:
+                return shards
+        return set()
+
+    def fabrica_sessoes(self, **opcoes):
+        """ sessionmaker de ShardedSession roteado por profissional (opções vão para a sessão). """
+        return sessionmaker(class_=ShardedSession, shards={SHARD_GLOBAL: self.engine_global, **self.engines},
+                            shard_chooser=self._escolher_shard, identity_chooser=self._escolher_por_identidade,
+                            execute_chooser=self._escolher_para_consulta, **opcoes)
+
+    # ---------------------------------------------------------------------
+    # Consultas em todos os shards
+    # ---------------------------------------------------------------------
+
+    def consulta_global(self, consulta, chave=None, limite=None):
+        """
+        Executa a consulta (Core) em todos os shards ao mesmo tempo e
+        devolve a lista de linhas. Com `chave` (função sobre a linha, na
+        mesma ordem do ORDER BY da consulta), os resultados de cada shard
+        são intercalados com heapq.merge; `limite` é aplicado em cada shard
+        e no resultado.
+        """
+        if limite is not None:
+            consulta = consulta.limit(limite)
+
+        def executar(engine_shard):
+            with engine_shard.connect() as conn:
+                return conn.execute(consulta).all()
+
+        partes = list(self._executor.map(executar, self.engines.values()))
+        linhas = heapq.merge(*partes, key=chave) if chave is not None else (l for parte in partes for l in parte)
+        return list(islice(linhas, limite))
+
+    def contar_global(self, consulta):
+        """ Soma de um SELECT count(...) de uma linha em todos os shards. """
+        return sum(linha[0] for linha in self.consulta_global(consulta))
+
+
+def _abrir_faixa(mapper, connection, alvo):
+    """
+    Antes do primeiro INSERT de uma tabela em um shard: se ela ainda não
+    tem linha na faixa do shard, o id é definido como o início da faixa (o
+    SQLite continua a partir do maior id existente). A trava de escrita é
+    pega antes de conferir, para dois processos não escolherem o mesmo id.
+    """
+    faixa = _faixas.get(connection.engine)
+    if faixa is None or not faixa[0]:
+        return
+    inicio, abertas = faixa
+    tabela = mapper.local_table
+    if tabela.name in abertas:
+        return
+    coluna = tabela.primary_key.columns[0]
+    if getattr(alvo, coluna.key) is not None:
+        return
+    with _trava_faixas:
+        if connection.dialect.name == "sqlite" and not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        existente = connection.scalar(select(func.max(coluna)).where(coluna >= inicio))
+        if existente is None:
+            setattr(alvo, coluna.key, inicio + 1)
+        abertas.add(tabela.name)
+
+
+for _classe in CLASSES_COM_FAIXA:
+    event.listen(_classe, "before_insert", _abrir_faixa)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("quantidade", type=int)
+    parser.add_argument("--modelo", default=MODELO_ARQUIVO)
+    args = parser.parse_args()
+
+    shards = Shards.em_arquivos(args.quantidade, args.modelo)
+    shards.preparar()
+    print(f"{args.quantidade} shards prontos: " + ", ".join(args.modelo.format(n) for n in range(args.quantidade)))
+    shards.fechar()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,19 @@ from sqlalchemy.orm import sessionmaker
 
 # Importar tudo o que for necessário do arquivo de modelos
 from Model import (
-    engine, Base, DB_FILE,
+    engine, Base, DB_FILE, init_db,
     Usuario, Endereco, Paciente, Profissional, DadosBancarios,
     Pagamento, ContatoEmergencia, Agendamento, AgendaProfissional,
     Avaliacao, Notificacao
 )
+from webhooks_pagamento import ler_evento, processar_lote
 
 # --- Preparação do Ambiente de Teste ---
 
 
 
 # 2. Recriar todas as tabelas
-Base.metadata.create_all(engine)
+init_db(engine)
 print("Novas tabelas criadas.")
 
 # 3. Configurar a Sessão
@@ -145,15 +146,13 @@ try:
     session.commit()
     print(f"Pagamento gerado (ID: {pagamento.id_transacao}). Status: {pagamento.status}")
     
-    # Simula aprovação do pagamento (ex: webhook do gateway)
-    pagamento.status = "Aprovado"
-    pagamento.data_pagamento = datetime.utcnow()
-    session.commit()
-    print(f"Pagamento {pagamento.id_transacao} APROVADO.")
-    
-    # Libera a consulta (chamando o método da classe Agendamento)
-    novo_agendamento.liberar_consulta()
-    session.commit()
+    # Simula a aprovação do pagamento chegando pelo webhook do gateway
+    # (o mesmo commit aprova o pagamento e libera a consulta)
+    processar_lote([ler_evento({"id_transacao": pagamento.id_transacao, "status": "Aprovado",
+                                "ocorrido_em": datetime.utcnow().isoformat()})])
+    session.refresh(pagamento)
+    session.refresh(novo_agendamento)
+    print(f"Pagamento {pagamento.id_transacao} {pagamento.status.upper()}.")
     print(f"Status do agendamento {novo_agendamento.id_agendamento} atualizado para: {novo_agendamento.status}")
 
     # 6. Simulação: Pós-Consulta (Conclusão e Avaliação)
@@ -216,8 +215,8 @@ try:
     
     # Consultar o paciente e seus detalhes (testando FK)
     pac_consulta = session.query(Paciente).filter_by(id_paciente=usuario_paciente.id_usuario).one()
-    # Buscar o endereço separado, pois o relationship não foi definido (o que está OK)
-    endereco_pac = session.query(Endereco).filter_by(id_endereco=pac_consulta.endereco_id).one()
+    # O endereço vem junto com o paciente (relationship Paciente.endereco)
+    endereco_pac = pac_consulta.endereco
     
     print(f"Paciente: {pac_consulta.usuario.nome}")
     print(f"Endereço (via método .formatar_endereco()): {endereco_pac.formatar_endereco()}")
@@ -0,0 +1,416 @@
+"""
+Ingestão dos webhooks do gateway de pagamento.
+
+Cada evento diz que uma transação (id_transacao de PAGAMENTO) passou para um
+status. O gateway reenvia eventos e não garante a ordem, então:
+
+  - eventos repetidos são descartados pela chave (id_transacao, status), que
+    é única em EVENTO_PAGAMENTO;
+  - as transições seguem Pagamento.TRANSICOES_STATUS
+    (Pendente -> Aprovado/Falhou, Aprovado -> Reembolsado);
+  - um evento que chega antes da transição anterior (ex: Reembolsado antes
+    de Aprovado) fica "Adiado" e é aplicado quando a anterior chegar;
+  - um evento de uma transação que ainda não tem PAGAMENTO também fica
+    "Adiado"; reavaliar_adiados() (chamada periodicamente pelo
+    ProcessadorWebhooks) o aplica quando o pagamento aparecer;
+  - um evento sem caminho a partir do status atual fica registrado como
+    "Invalido";
+  - a exceção é Aprovado depois de Falhou com o agendamento já cancelado
+    (a reserva expirou antes de o pagamento ser aprovado): o evento fica
+    "Invalido", mas o valor foi cobrado, então o PAGAMENTO recebe
+    reembolso_pendente_desde e o caso vai para o log (e para
+    VarredorReservas.metricas()); o Reembolsado que o gateway mandar
+    depois é aplicado limpando a marca (o status continua Falhou);
+  - Aprovado -> Reembolsado também limpa reembolso_pendente_desde (marcada
+    por repasses.py em pagamentos de consultas canceladas);
+  - o reenvio de um evento já gravado e ainda não aplicado (Adiado ou
+    Invalido) não é descartado: o evento gravado é reavaliado.
+
+Os eventos são aplicados em lotes, uma transação por lote (commit em grupo):
+o mesmo commit atualiza PAGAMENTO, libera os AGENDAMENTOs aprovados
+(status "Confirmado"), cancela os reembolsados e grava os eventos. Depois
+do commit, as semanas dessas consultas são invalidadas nos calendários em
+memória (calendario.py).
+
+O ProcessadorWebhooks junta em lotes os eventos recebidos por várias threads
+(ex: o servidor HTTP) e devolve um Future que só termina depois do commit,
+para que a resposta ao gateway seja dada com o evento já gravado.
+
+Uso: python webhooks_pagamento.py eventos.jsonl [--lote 500]
+"""
+import argparse
+import json
+import logging
+import queue
+import threading
+import time as relogio
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import Future
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import DateTime, bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from calendario import invalidar_calendarios
+from ciclo_agendamento import transicionar
+from Model import engine, init_db, Agendamento, Pagamento, EventoPagamento
+
+logger = logging.getLogger("tcc.webhooks")
+
+TAMANHO_LOTE_PADRAO = 500
+# Quanto o processador espera (segundos) para completar um lote antes de gravar.
+# Com 0, grava o que já estiver na fila: os eventos que chegam durante um
+# commit formam o lote seguinte.
+ESPERA_LOTE = 0.0
+# Intervalo (segundos) entre as reavaliações dos eventos adiados à espera do pagamento
+INTERVALO_REAVALIACAO = 60.0
+
+EventoWebhook = namedtuple('EventoWebhook', ['id_transacao', 'status', 'ocorrido_em'])
+
+TRANSICOES = Pagamento.TRANSICOES_STATUS
+
+
+def _alcancaveis(status):
+    """ Status a que se chega a partir de `status` com uma ou mais transições. """
+    encontrados, pendentes = set(), list(TRANSICOES[status])
+    while pendentes:
+        proximo = pendentes.pop()
+        if proximo not in encontrados:
+            encontrados.add(proximo)
+            pendentes.extend(TRANSICOES[proximo])
+    return encontrados
+
+
+ALCANCAVEIS = {status: _alcancaveis(status) for status in TRANSICOES}
+# Número de transições desde "Pendente": ordena os eventos de uma mesma transação
+PROFUNDIDADE = {"Pendente": 0}
+for _status in ("Pendente", "Aprovado", "Falhou", "Reembolsado"):
+    for _proximo in TRANSICOES[_status]:
+        PROFUNDIDADE.setdefault(_proximo, PROFUNDIDADE[_status] + 1)
+
+
+def ler_evento(dados):
+    """ Converte o JSON do webhook em EventoWebhook; lança ValueError se for inválido. """
+    try:
+        id_transacao, status = str(dados["id_transacao"]), dados["status"]
+    except (KeyError, TypeError):
+        raise ValueError(f"Evento sem id_transacao/status: {dados!r}")
+    if status not in TRANSICOES:
+        raise ValueError(f"Status de pagamento desconhecido: {status!r}")
+    ocorrido_em = dados.get("ocorrido_em")
+    if ocorrido_em:
+        ocorrido_em = datetime.fromisoformat(ocorrido_em)
+    return EventoWebhook(id_transacao, status, ocorrido_em or None)
+
+
+def aplicar_lote(conn, eventos, agora=None, reavaliar=(), afetados=None):
+    """
+    Aplica uma lista de EventoWebhook dentro da transação de `conn`.
+    `reavaliar` são transações cujos eventos adiados já gravados devem ser
+    reavaliados mesmo sem evento novo (ex: o PAGAMENTO apareceu).
+    `afetados`, se passado, recebe as semanas do calendário das consultas
+    liberadas ou canceladas (ver ciclo_agendamento.transicionar).
+    Devolve um Counter com aplicados, adiados, invalidos, duplicados,
+    reenviados, adiados_resolvidos, consultas_liberadas, consultas_canceladas,
+    reembolsos_pendentes e reembolsos_confirmados.
+    """
+    agora = agora or datetime.utcnow()
+    resumo = Counter()
+    tabela_eventos = EventoPagamento.__table__
+    tabela_pagamentos = Pagamento.__table__
+    tabela_agendamentos = Agendamento.__table__
+
+    novos = {}
+    for evento in eventos:
+        chave = (evento.id_transacao, evento.status)
+        if chave in novos:
+            resumo["duplicados"] += 1
+        else:
+            novos[chave] = evento
+    transacoes = {id_transacao for id_transacao, _ in novos} | set(reavaliar)
+
+    # Eventos já gravados dessas transações: repetidos e adiados
+    registrados = {
+        (linha.id_transacao, linha.status): linha for linha in conn.execute(
+            select(tabela_eventos.c.id_evento, tabela_eventos.c.id_transacao, tabela_eventos.c.status,
+                   tabela_eventos.c.ocorrido_em, tabela_eventos.c.resultado)
+            .where(tabela_eventos.c.id_transacao.in_(transacoes)))
+    }
+    # Reenvios de eventos ainda não aplicados: o evento gravado é reavaliado
+    reenviados = set()
+    for chave in [chave for chave in novos if chave in registrados]:
+        if registrados[chave].resultado == "Aplicado":
+            resumo["duplicados"] += 1
+        else:
+            resumo["reenviados"] += 1
+            reenviados.add(chave)
+        del novos[chave]
+    transacoes = {id_transacao for id_transacao, _ in novos} | {id_transacao for id_transacao, _ in reenviados} \
+        | set(reavaliar)
+    if not transacoes:
+        return resumo
+
+    pagamentos = {
+        linha.id_transacao: linha for linha in conn.execute(
+            select(tabela_pagamentos.c.id_transacao, tabela_pagamentos.c.status,
+                   tabela_pagamentos.c.agendamento_id, tabela_pagamentos.c.reembolso_pendente_desde,
+                   tabela_agendamentos.c.status.label("status_agendamento"))
+            .join(tabela_agendamentos, tabela_agendamentos.c.id_agendamento == tabela_pagamentos.c.agendamento_id)
+            .where(tabela_pagamentos.c.id_transacao.in_(transacoes)))
+    }
+
+    # Candidatos por transação: os eventos novos (sem linha gravada), os
+    # adiados antes e os reenviados que não tinham sido aplicados
+    candidatos = defaultdict(list)
+    for evento in novos.values():
+        candidatos[evento.id_transacao].append((evento, None))
+    for chave, linha in registrados.items():
+        if linha.id_transacao in transacoes and (linha.resultado == "Adiado" or chave in reenviados):
+            candidatos[linha.id_transacao].append(
+                (EventoWebhook(linha.id_transacao, linha.status, linha.ocorrido_em), linha))
+
+    eventos_novos, eventos_resolvidos, pagamentos_alterados, liberar, cancelar = [], [], [], [], []
+    reembolsos = []
+    for id_transacao, lista in candidatos.items():
+        pagamento = pagamentos.get(id_transacao)
+        status = pagamento.status if pagamento is not None else None
+        data_aprovacao, aprovado = None, False
+        reembolso_pendente = pagamento is not None and pagamento.reembolso_pendente_desde is not None
+        pendente_antes = reembolso_pendente
+        ja_reembolsado = getattr(registrados.get((id_transacao, "Reembolsado")), "resultado", None) == "Aplicado"
+
+        lista.sort(key=lambda item: (PROFUNDIDADE[item[0].status], item[0].ocorrido_em or datetime.min))
+        for evento, gravado in lista:
+            if status is None:
+                # O PAGAMENTO ainda não existe: espera por ele
+                resultado = "Adiado"
+            elif evento.status in TRANSICOES[status]:
+                resultado, status = "Aplicado", evento.status
+                if status == "Aprovado":
+                    aprovado, data_aprovacao = True, evento.ocorrido_em or agora
+                elif status == "Reembolsado":
+                    reembolso_pendente = False
+            elif status == "Falhou" and evento.status == "Aprovado" and pagamento.status_agendamento == "Cancelado":
+                # A reserva expirou antes da aprovação, mas o valor foi cobrado: tem que ser devolvido
+                resultado = "Invalido"
+                reembolso_pendente = not ja_reembolsado
+            elif status == "Falhou" and evento.status == "Reembolsado" and reembolso_pendente:
+                resultado, reembolso_pendente = "Aplicado", False
+            elif evento.status in ALCANCAVEIS[status]:
+                resultado = "Adiado"
+            else:
+                resultado = "Invalido"
+
+            if gravado is None:
+                eventos_novos.append(dict(id_transacao=id_transacao, status=evento.status,
+                                          ocorrido_em=evento.ocorrido_em, recebido_em=agora, resultado=resultado))
+                resumo[resultado.lower() + "s"] += 1
+            elif resultado != gravado.resultado:
+                # Já foi contado no lote em que chegou
+                eventos_resolvidos.append(dict(b_id=gravado.id_evento, b_resultado=resultado))
+                resumo["adiados_resolvidos"] += 1
+
+        if reembolso_pendente != pendente_antes:
+            reembolsos.append(dict(b_id=id_transacao, b_desde=agora if reembolso_pendente else None))
+            if reembolso_pendente:
+                resumo["reembolsos_pendentes"] += 1
+                logger.warning("pagamento %s aprovado depois de o agendamento %s ser cancelado: "
+                               "reembolso pendente", id_transacao, pagamento.agendamento_id)
+            else:
+                resumo["reembolsos_confirmados"] += 1
+        if pagamento is not None and status != pagamento.status:
+            pagamentos_alterados.append(dict(b_id=id_transacao, b_status=status, b_data=data_aprovacao))
+            if status == "Reembolsado":
+                cancelar.append(pagamento.agendamento_id)
+            elif aprovado:
+                liberar.append(pagamento.agendamento_id)
+
+    if pagamentos_alterados:
+        conn.execute(
+            update(tabela_pagamentos).where(tabela_pagamentos.c.id_transacao == bindparam("b_id"))
+            .values(status=bindparam("b_status"),
+                    data_pagamento=func.coalesce(bindparam("b_data", type_=DateTime), tabela_pagamentos.c.data_pagamento)),
+            pagamentos_alterados)
+    if reembolsos:
+        conn.execute(
+            update(tabela_pagamentos).where(tabela_pagamentos.c.id_transacao == bindparam("b_id"))
+            .values(reembolso_pendente_desde=bindparam("b_desde", type_=DateTime)),
+            reembolsos)
+    # Transições guardadas por TRANSICOES_STATUS, com o histórico gravado em lote
+    if liberar:
+        alterados = transicionar(conn, liberar, "Confirmado", motivo="pagamento aprovado", quando=agora,
+                                 afetados=afetados)
+        resumo["consultas_liberadas"] += sum(map(len, alterados.values()))
+    if cancelar:
+        alterados = transicionar(conn, cancelar, "Cancelado", motivo="pagamento reembolsado", quando=agora,
+                                 afetados=afetados)
+        resumo["consultas_canceladas"] += sum(map(len, alterados.values()))
+    if eventos_resolvidos:
+        conn.execute(
+            update(tabela_eventos).where(tabela_eventos.c.id_evento == bindparam("b_id"))
+            .values(resultado=bindparam("b_resultado")),
+            eventos_resolvidos)
+    if eventos_novos:
+        conn.execute(insert(tabela_eventos), eventos_novos)
+    return resumo
+
+
+def processar_lote(eventos, bind=None):
+    """ Aplica um lote em uma transação; refaz uma vez se outro processo gravou os mesmos eventos. """
+    bind = bind or engine
+    for tentativa in range(2):
+        afetados = {}
+        try:
+            with bind.begin() as conn:
+                resumo = aplicar_lote(conn, eventos, afetados=afetados)
+        except IntegrityError:
+            if tentativa:
+                raise
+        else:
+            invalidar_calendarios(afetados)
+            return resumo
+
+
+def reavaliar_adiados(bind=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """
+    Aplica os eventos adiados das transações que já têm PAGAMENTO (o
+    pagamento foi gravado depois do webhook), um lote de transações por
+    transação do banco. Devolve o Counter total.
+    """
+    bind = bind or engine
+    tabela_eventos, tabela_pagamentos = EventoPagamento.__table__, Pagamento.__table__
+    with bind.connect() as conn:
+        transacoes = conn.execute(
+            select(tabela_eventos.c.id_transacao).distinct()
+            .join(tabela_pagamentos, tabela_pagamentos.c.id_transacao == tabela_eventos.c.id_transacao)
+            .where(tabela_eventos.c.resultado == "Adiado")).scalars().all()
+    resumo = Counter()
+    for inicio in range(0, len(transacoes), tamanho_lote):
+        afetados = {}
+        with bind.begin() as conn:
+            resumo.update(aplicar_lote(conn, [], reavaliar=transacoes[inicio:inicio + tamanho_lote],
+                                       afetados=afetados))
+        invalidar_calendarios(afetados)
+    return resumo
+
+
+def reproduzir_arquivo(caminho, bind=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """ Aplica os eventos de um arquivo JSONL gravado, em lotes. Devolve o Counter total. """
+    resumo = Counter()
+    with open(caminho, encoding="utf-8") as arquivo:
+        eventos = (ler_evento(json.loads(linha)) for linha in arquivo if linha.strip())
+        while True:
+            lote = list(islice(eventos, tamanho_lote))
+            if not lote:
+                break
+            resumo.update(processar_lote(lote, bind))
+    return resumo
+
+
+_FIM = object()
+
+
+class ProcessadorWebhooks:
+    """
+    Junta em lotes os eventos recebidos por várias threads e os grava em uma
+    thread só. A cada intervalo_reavaliacao segundos, a mesma thread chama
+    reavaliar_adiados().
+
+        processador = ProcessadorWebhooks()
+        processador.iniciar()
+        processador.receber(json_do_webhook).result()   # volta depois do commit
+        processador.parar()
+    """
+
+    def __init__(self, bind=None, tamanho_lote=TAMANHO_LOTE_PADRAO, espera_lote=ESPERA_LOTE,
+                 intervalo_reavaliacao=INTERVALO_REAVALIACAO):
+        self.bind = bind or engine
+        self.tamanho_lote = tamanho_lote
+        self.espera_lote = espera_lote
+        self.intervalo_reavaliacao = intervalo_reavaliacao
+        self.resumo = Counter()
+        self.lotes = 0
+        self._fila = queue.Queue()
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name="webhooks-pagamento", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """ Grava o que ainda estiver na fila e encerra a thread. """
+        self._fila.put(_FIM)
+        self._thread.join()
+
+    def receber(self, dados):
+        """
+        Enfileira um evento (dicionário do JSON). Lança ValueError se o
+        evento for malformado; devolve um Future concluído após o commit.
+        """
+        futuro = Future()
+        self._fila.put((ler_evento(dados), futuro))
+        return futuro
+
+    def _executar(self):
+        terminar = False
+        proxima_reavaliacao = relogio.monotonic() + self.intervalo_reavaliacao
+        while not terminar:
+            try:
+                item = self._fila.get(timeout=max(proxima_reavaliacao - relogio.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if relogio.monotonic() >= proxima_reavaliacao:
+                self._reavaliar()
+                proxima_reavaliacao = relogio.monotonic() + self.intervalo_reavaliacao
+            if item is None:
+                continue
+            if item is _FIM:
+                break
+            lote = [item]
+            prazo = relogio.monotonic() + self.espera_lote
+            while len(lote) < self.tamanho_lote:
+                try:
+                    item = self._fila.get(timeout=max(prazo - relogio.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _FIM:
+                    terminar = True
+                    break
+                lote.append(item)
+            self._gravar(lote)
+
+    def _reavaliar(self):
+        try:
+            self.resumo.update(reavaliar_adiados(self.bind, self.tamanho_lote))
+        except Exception:
+            logger.exception("falha ao reavaliar os eventos adiados")
+
+    def _gravar(self, lote):
+        try:
+            self.resumo.update(processar_lote([evento for evento, _ in lote], self.bind))
+        except Exception as erro:
+            for _, futuro in lote:
+                futuro.set_exception(erro)
+        else:
+            self.lotes += 1
+            for _, futuro in lote:
+                futuro.set_result(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arquivo", help="eventos gravados (JSONL)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO)
+    args = parser.parse_args()
+
+    init_db()
+    inicio = relogio.perf_counter()
+    resumo = reproduzir_arquivo(args.arquivo, tamanho_lote=args.lote)
+    resumo.update(reavaliar_adiados(tamanho_lote=args.lote))
+    print(f"{sum(resumo[chave] for chave in ('aplicados', 'adiados', 'invalidos', 'duplicados', 'reenviados'))} eventos "
+          f"em {relogio.perf_counter() - inicio:.2f} s: {dict(resumo)}")
+
+
+if __name__ == "__main__":
+    main()